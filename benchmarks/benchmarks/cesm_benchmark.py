@@ -0,0 +1,460 @@
+#!/usr/bin/env python
+"""Benchmark the post processing tools on synthetic CESM history files
+
+Generates synthetic history files with synthetic_history and times
+    plan     - timeseries chunk planning, cold and with a warm time index
+    reshaper - pyReshaper slice to series conversion of each stream
+    averager - pyAverager climatologies of each monthly stream
+    remap    - ocn_remap_generator on CMIP style ocean files
+serially and with mpi on localhost.  Every case runs in its own process,
+launched through the --mpirun command for more than one rank.  The results
+are written to a JSON file and can be compared against the results of an
+earlier release with --compare.
+
+Cases whose packages are not installed are recorded as skipped.
+__________________________
+Created on Oct, 2026
+
+@author: CSEG <cseg@cgd.ucar.edu>
+"""
+
+from __future__ import print_function
+import sys
+
+# check the system python version and require 3.7.x or greater
+if sys.hexversion < 0x03070000:
+    print(70 * '*')
+    print('ERROR: {0} requires python >= 3.7.x. '.format(sys.argv[0]))
+    print('It appears that you are running python {0}'.format(
+        '.'.join(str(x) for x in sys.version_info[0:3])))
+    print(70 * '*')
+    sys.exit(1)
+
+import argparse
+import datetime
+import glob
+import importlib.machinery
+import json
+import os
+import platform
+import shutil
+import subprocess
+import time
+import traceback
+import types
+
+import synthetic_history
+
+CASES = ['plan', 'reshaper', 'averager', 'remap']
+
+# averages computed for each monthly stream, the years are added at run time
+AVERAGES = {'cam.h0': ['dep_djf', 'dep_mam', 'dep_jja', 'dep_son', 'jan', 'jul'],
+            'pop.h': ['tavg'],
+            'cice.h': ['dep_djf', 'dep_jja'],
+            'clm2.h0': ['dep_ann', 'dep_djf', 'dep_jja']}
+
+# time variant metadata of each component
+TIME_VARIANT = {'cam': ['time_bnds', 'date', 'datesec'],
+                'pop': ['time_bound'],
+                'cice': ['time_bounds'],
+                'clm2': ['time_bounds', 'mcdate', 'mcsec']}
+
+PACKAGES = ['numpy', 'netCDF4', 'mpi4py', 'asaptools', 'pyreshaper', 'pyaverager']
+
+#=====================================================
+# commandline_options - parse any command line options
+#=====================================================
+def commandline_options():
+    """Process the command line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='cesm_benchmark: time the CESM post processing tools on synthetic history files.')
+
+    parser.add_argument('--workdir', required=True,
+                        help='directory for the synthetic archive, outputs and results')
+
+    parser.add_argument('--resolution', default='tiny', choices=sorted(synthetic_history.RESOLUTIONS.keys()),
+                        help='grid resolution of the synthetic files, default tiny')
+
+    parser.add_argument('--years', type=int, default=3,
+                        help='number of model years, default 3 (the averages need at least 2)')
+
+    parser.add_argument('--streams', nargs='+', default=sorted(synthetic_history.STREAMS.keys()),
+                        choices=sorted(synthetic_history.STREAMS.keys()),
+                        help='history streams to benchmark, default all')
+
+    parser.add_argument('--nvars', type=int, default=None,
+                        help='number of time variant fields per stream, default the standard list of each component')
+
+    parser.add_argument('--cases', nargs='+', default=CASES, choices=CASES,
+                        help='benchmark cases to run, default all')
+
+    parser.add_argument('--ranks', nargs='+', type=int, default=[1, 4],
+                        help='number of mpi ranks to run each case on, 1 is a serial run. default 1 4')
+
+    parser.add_argument('--mpirun', default='mpiexec -n {0}',
+                        help='mpi launch command, {0} is replaced by the number of ranks. default "mpiexec -n {0}"')
+
+    parser.add_argument('--reuse', action='store_true',
+                        help='reuse the synthetic archive in workdir if it exists')
+
+    parser.add_argument('--results', default=None,
+                        help='results JSON file, default <workdir>/benchmark_results.json')
+
+    parser.add_argument('--compare', default=None,
+                        help='results JSON file of an earlier run to compare against')
+
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='flag a case as a regression when it is this many times slower than in --compare, default 1.2')
+
+    # used internally to run a case in its own process
+    parser.add_argument('--worker', default=None, choices=CASES, help=argparse.SUPPRESS)
+    parser.add_argument('--config', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--nranks', type=int, default=1, help=argparse.SUPPRESS)
+
+    return parser.parse_args()
+
+#=====================================================
+# benchmark cases - run on every rank of scomm
+#=====================================================
+def stream_files(config, stream):
+    """ return the sorted history files of a stream in the synthetic archive
+    """
+    comp,subdir,bounds_name,freq = synthetic_history.STREAMS[stream]
+    return sorted(glob.glob('{0}/{1}/{2}/hist/{1}.{3}.*.nc'.format(config['archive'], config['case'], subdir, stream)))
+
+
+def bench_plan(config, stream, scomm):
+    """ time the timeseries chunk planning of a stream, first with an empty time index and
+        then again with the time index written by the first pass
+    """
+    from timeseries import chunking
+
+    rank = scomm.get_rank()
+    size = scomm.get_size()
+    comp,subdir,bounds_name,freq = synthetic_history.STREAMS[stream]
+    glob_str = '{0}/{1}/{2}/hist/{1}.{3}.*.nc'.format(config['archive'], config['case'], subdir, stream)
+    index_fn = '{0}/plan/ts_time_index.{1}.{2}.json'.format(config['workdir'], stream, size)
+    if rank == 0 and os.path.isfile(index_fn):
+        os.remove(index_fn)
+    scomm.sync()
+
+    seconds = dict()
+    for npass in ['cold', 'warm']:
+        start = time.time()
+        stream_times,cal,units,time_period_freq = chunking.get_input_dates(glob_str, scomm, rank, size, index_fn=index_fn)
+        files,dates,index = chunking.get_chunks('year', 0, '1', stream_times, chunking.new_log_entry(),
+                                                cal, units, 1, time_period_freq)
+        scomm.sync()
+        seconds[npass] = time.time() - start
+    return {'cold_seconds': seconds['cold'], 'warm_seconds': seconds['warm'], 'chunks': len(files),
+            'files_in': len(stream_times['files']), 'bytes_in': int(stream_times['size'].sum())}
+
+
+def bench_reshaper(config, stream, scomm):
+    """ time the pyReshaper conversion of all the files of a stream into one chunk
+    """
+    from pyreshaper import specification, reshaper
+
+    comp,subdir,bounds_name,freq = synthetic_history.STREAMS[stream]
+    files = stream_files(config, stream)
+    out_dir = '{0}/reshaper/{1}'.format(config['workdir'], scomm.get_size())
+    if scomm.get_rank() == 0 and not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    scomm.sync()
+
+    spec = specification.create_specifier()
+    spec.input_file_list = files
+    spec.netcdf_format = 'netcdf4'
+    spec.output_file_prefix = '{0}/{1}.{2}.'.format(out_dir, config['case'], stream)
+    spec.output_file_suffix = '.{0:04d}01-{1:04d}12.nc'.format(config['start_year'], config['start_year'] + config['years'] - 1)
+    spec.time_variant_metadata = TIME_VARIANT[comp]
+    spec.exclude_list = []
+    spec.backend = 'netCDF4'
+    reshpr = reshaper.create_reshaper(spec, serial=(scomm.get_size() == 1), verbosity=0, wmode='o', simplecomm=scomm)
+    reshpr.convert()
+    scomm.sync()
+    outputs = glob.glob(spec.output_file_prefix + '*' + spec.output_file_suffix)
+    return {'files_in': len(files), 'bytes_in': sum(os.path.getsize(fn) for fn in files),
+            'files_out': len(outputs), 'bytes_out': sum(os.path.getsize(fn) for fn in outputs)}
+
+
+def bench_averager(config, stream, scomm):
+    """ time the pyAverager climatologies of a monthly stream, the averages start in the
+        second year so the seasonal averages have the december before
+    """
+    from pyaverager import specification, PyAverager
+
+    files = stream_files(config, stream)
+    first_year = config['start_year'] + 1
+    last_year = config['start_year'] + config['years'] - 1
+    avg_list = ['{0}:{1}:{2}'.format(avg, first_year, last_year) for avg in AVERAGES[stream]]
+    out_dir = '{0}/averager/{1}/{2}'.format(config['workdir'], scomm.get_size(), stream)
+    if scomm.get_rank() == 0 and not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    scomm.sync()
+
+    pyAveSpecifier = specification.create_specifier(
+        in_directory = os.path.dirname(files[0]),
+        out_directory = out_dir,
+        prefix = '{0}.{1}'.format(config['case'], stream),
+        suffix = 'nc',
+        date_pattern = 'yyyy-mm',
+        hist_type = 'slice',
+        avg_list = avg_list,
+        weighted = False,
+        ncformat = 'netcdf4c',
+        varlist = [],
+        serial = (scomm.get_size() == 1),
+        clobber = True,
+        main_comm = scomm)
+    PyAverager.run_pyAverager(pyAveSpecifier)
+    scomm.sync()
+    outputs = glob.glob('{0}/*.nc'.format(out_dir))
+    return {'averages': avg_list, 'files_in': len(files), 'bytes_in': sum(os.path.getsize(fn) for fn in files),
+            'files_out': len(outputs), 'bytes_out': sum(os.path.getsize(fn) for fn in outputs)}
+
+
+def write_remap_case(caseroot, cmip_root, weights_2d, weights_3d):
+    """ write the env xml files the ocean remap generator reads
+    """
+    for d in [caseroot, '{0}/logs'.format(caseroot)]:
+        if not os.path.isdir(d):
+            os.makedirs(d)
+    cmip6_list = '{0}/cmip6_variables.txt'.format(caseroot)
+    with open(cmip6_list, 'w') as f:
+        f.write('Omon:tos\nOmon:thetao\n')
+    entries = {'env_postprocess.xml': {'CASEROOT': caseroot},
+               'env_ocn_remap.xml': {'OCNREMAP_cmip6': cmip6_list,
+                                     'OCNREMAP_filelist': '',
+                                     'OCNREMAP_matrix_2d_fname': weights_2d,
+                                     'OCNREMAP_matrix_3d_fname': weights_3d,
+                                     'OCNREMAP_indir': cmip_root,
+                                     'OCNREMAP_outdir': cmip_root,
+                                     'OCNREMAP_chunk': '12'}}
+    for fn,values in entries.items():
+        with open('{0}/{1}'.format(caseroot, fn), 'w') as f:
+            f.write('<?xml version="1.0"?>\n<config_definition>\n')
+            for k,v in sorted(values.items()):
+                f.write('<entry id="{0}" value="{1}" />\n'.format(k, v))
+            f.write('</config_definition>\n')
+
+
+def bench_remap(config, stream, scomm):
+    """ time ocn_remap_generator on CMIP style conformed ocean files of the ocean resolution.
+        Rank 0 hands out the files, or remaps its share of them with the other ranks when
+        there are few files per rank, so it runs on any number of ranks.
+    """
+    from asaptools import vprinter
+    import ocean_remap
+
+    generator = shutil.which('ocn_remap_generator.py')
+    if generator is None:
+        generator = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                                 'diagnostics', 'diagnostics', 'ocn', 'ocn_remap_generator.py')
+    loader = importlib.machinery.SourceFileLoader('ocn_remap_generator', generator)
+    ocn_remap_generator = types.ModuleType(loader.name)
+    loader.exec_module(ocn_remap_generator)
+
+    size = scomm.get_size()
+    caseroot = '{0}/remap/{1}/case'.format(config['workdir'], size)
+    cmip_root = '{0}/remap/{1}/cmip'.format(config['workdir'], size)
+    if scomm.get_rank() == 0:
+        if os.path.isdir(cmip_root):
+            shutil.rmtree(cmip_root)
+        files = synthetic_history.make_cmip_ocean(cmip_root, config['resolution'], config['start_year'], config['years'])
+        weights_2d = '{0}/remap_weights_2d.nc'.format(config['workdir'])
+        weights_3d = '{0}/remap_weights_3d.nc'.format(config['workdir'])
+        if not os.path.isfile(weights_2d):
+            synthetic_history.make_remap_weights(weights_2d, config['resolution'])
+        if not os.path.isfile(weights_3d):
+            synthetic_history.make_remap_weights(weights_3d, config['resolution'],
+                                                 nlev=synthetic_history.RESOLUTIONS[config['resolution']]['ocn'][2])
+        write_remap_case(caseroot, cmip_root, weights_2d, weights_3d)
+    scomm.sync()
+
+    options = argparse.Namespace(caseroot=[caseroot], debug=[0], standalone=False, backtrace=False)
+    debugMsg = vprinter.VPrinter(header='', verbosity=0)
+    start = time.time()
+    ocn_remap_generator.main(options, scomm, debugMsg)
+    scomm.sync()
+    info = {'generator_seconds': time.time() - start}
+    if scomm.get_rank() == 0:
+        inputs = glob.glob('{0}/Omon/*/gn/*/*.nc'.format(cmip_root))
+        outputs = glob.glob('{0}/Omon/*/gr/*/*.nc'.format(cmip_root))
+        info.update({'files_in': len(inputs), 'bytes_in': sum(os.path.getsize(fn) for fn in inputs),
+                     'files_out': len(outputs), 'bytes_out': sum(os.path.getsize(fn) for fn in outputs)})
+        summaries = sorted(glob.glob('{0}/logs/ocn_remap_generator.timing.*.json'.format(caseroot)))
+        if len(summaries) > 0:
+            with open(summaries[-1]) as f:
+                info['stages'] = json.load(f)['stages']
+    return info
+
+BENCHMARKS = {'plan': bench_plan, 'reshaper': bench_reshaper, 'averager': bench_averager, 'remap': bench_remap}
+
+def case_streams(case, streams):
+    """ return the streams a case runs on, remap runs once on the ocean resolution
+    """
+    if case == 'averager':
+        return [s for s in streams if s in AVERAGES]
+    if case == 'remap':
+        return ['Omon'] if 'pop.h' in streams else []
+    return list(streams)
+
+
+def run_worker(case, config_fn, result_fn, nranks):
+    """ run one benchmark case on all ranks and write its records on rank 0
+    """
+    from asaptools import simplecomm
+
+    with open(config_fn) as f:
+        config = json.load(f)
+    scomm = simplecomm.create_comm(serial=(nranks == 1))
+    rank = scomm.get_rank()
+    records = list()
+    for stream in case_streams(case, config['streams']):
+        record = {'case': case, 'stream': stream, 'nranks': scomm.get_size()}
+        try:
+            scomm.sync()
+            start = time.time()
+            record.update(BENCHMARKS[case](config, stream, scomm))
+            scomm.sync()
+            record['seconds'] = time.time() - start
+            record['status'] = 'ok'
+        except ImportError as error:
+            record['status'] = 'skipped: {0}'.format(error)
+        except Exception as error:
+            traceback.print_exc()
+            record['status'] = 'failed: {0}'.format(error)
+        if rank == 0:
+            print('{0} {1} on {2} ranks: {3} {4}'.format(case, stream, record['nranks'], record['status'],
+                                                       '{0:.2f} s'.format(record['seconds']) if 'seconds' in record else ''))
+        records.append(record)
+    if rank == 0:
+        with open(result_fn, 'w') as f:
+            json.dump(records, f, indent=1)
+
+#=====================================================
+# driver
+#=====================================================
+def package_versions():
+    """ return the installed versions of the packages being benchmarked
+    """
+    versions = dict()
+    for name in PACKAGES:
+        try:
+            from importlib import metadata
+            versions[name] = metadata.version(name)
+        except Exception:
+            versions[name] = None
+    try:
+        versions['postprocessing'] = subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        versions['postprocessing'] = None
+    return versions
+
+
+def compare(baseline, results, threshold):
+    """ print the time of every case against an earlier run
+
+    Arguments:
+    baseline (dictionary) - results of the earlier run
+    results (dictionary) - results of this run
+    threshold (float) - ratio of the times above which a case is a regression
+
+    Return:
+    regressions (list) - (case, stream, nranks, ratio) of the regressions
+    """
+    old = dict()
+    for r in baseline['results']:
+        if 'seconds' in r:
+            old[(r['case'], r['stream'], r['nranks'])] = r['seconds']
+    regressions = list()
+    print('{0:<10} {1:<8} {2:>6} {3:>10} {4:>10} {5:>7}'.format('case', 'stream', 'ranks', 'before', 'now', 'ratio'))
+    for r in results['results']:
+        key = (r['case'], r['stream'], r['nranks'])
+        if 'seconds' not in r or key not in old:
+            continue
+        ratio = r['seconds'] / old[key] if old[key] > 0 else float('inf')
+        flag = ' REGRESSION' if ratio > threshold else ''
+        print('{0:<10} {1:<8} {2:>6} {3:>10.2f} {4:>10.2f} {5:>7.2f}{6}'.format(key[0], key[1], key[2], old[key], r['seconds'], ratio, flag))
+        if ratio > threshold:
+            regressions.append(key + (ratio,))
+    return regressions
+
+
+def main(options):
+    """ generate the synthetic archive, run every case on every rank count and write the results
+    """
+    workdir = os.path.abspath(options.workdir)
+    archive = '{0}/archive'.format(workdir)
+    case = 'bench'
+    start_year = 1
+    results_fn = options.results if options.results is not None else '{0}/benchmark_results.json'.format(workdir)
+
+    generate = dict()
+    for stream in options.streams:
+        config = {'archive': archive, 'case': case}
+        if options.reuse and len(stream_files(config, stream)) == 12 * options.years:
+            continue
+        start = time.time()
+        files = synthetic_history.make_stream(archive, case, stream, options.resolution, start_year, options.years, options.nvars)
+        generate[stream] = time.time() - start
+        print('generated {0} {1} files in {2:.1f} s'.format(len(files), stream, generate[stream]))
+
+    config = {'workdir': workdir, 'archive': archive, 'case': case, 'resolution': options.resolution,
+              'start_year': start_year, 'years': options.years, 'nvars': options.nvars, 'streams': options.streams}
+    config_fn = '{0}/benchmark_config.json'.format(workdir)
+    with open(config_fn, 'w') as f:
+        json.dump(config, f, indent=1)
+
+    records = list()
+    for nranks in options.ranks:
+        for bench in options.cases:
+            result_fn = '{0}/result.{1}.{2}.json'.format(workdir, bench, nranks)
+            if os.path.isfile(result_fn):
+                os.remove(result_fn)
+            cmd = [sys.executable, os.path.abspath(__file__), '--workdir', workdir, '--worker', bench,
+                   '--config', config_fn, '--results', result_fn, '--nranks', str(nranks)]
+            if nranks > 1:
+                cmd = options.mpirun.format(nranks).split() + cmd
+            start = time.time()
+            rc = subprocess.call(cmd)
+            wall = time.time() - start
+            if os.path.isfile(result_fn):
+                with open(result_fn) as f:
+                    l_records = json.load(f)
+                for r in l_records:
+                    r['process_seconds'] = wall
+                records.extend(l_records)
+            else:
+                records.append({'case': bench, 'stream': None, 'nranks': nranks,
+                                'status': 'failed: exit code {0}'.format(rc), 'process_seconds': wall})
+
+    results = {'created': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+               'host': platform.node(), 'python': platform.python_version(),
+               'versions': package_versions(), 'config': config,
+               'generate_seconds': generate, 'results': records}
+    with open(results_fn, 'w') as f:
+        json.dump(results, f, indent=1)
+    print('benchmark results written to {0}'.format(results_fn))
+
+    if options.compare is not None:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, options.threshold)
+        if len(regressions) > 0:
+            print('{0} regressions slower than {1} times {2}'.format(len(regressions), options.threshold, options.compare))
+            return 1
+    return 0
+
+#===================================
+
+if __name__ == "__main__":
+    options = commandline_options()
+    if options.worker is not None:
+        run_worker(options.worker, options.config, options.results, options.nranks)
+        sys.exit(0)
+    sys.exit(main(options))
@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+"""Generate synthetic CESM history files for benchmarking
+
+Writes monthly cam.h0, pop.h, cice.h and clm2.h0 and daily cam.h1 history
+time slice files laid out like a short term archive
+(<root>/<case>/<comp>/hist/<case>.<stream>.<date>.nc) with the dimensions,
+coordinate variables, attributes and time bounds of the real components,
+on a noleap calendar.  The field values are random, only the shapes and the
+metadata matter to the post processing tools.
+
+Also writes CMIP style conformed ocean files and synthetic weight files in
+the ESMF offline weight file convention for the ocean remap benchmark.
+__________________________
+Created on Oct, 2026
+
+@author: CSEG <cseg@cgd.ucar.edu>
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+
+import netCDF4 as nc
+import numpy
+
+# grid sizes per resolution - atm and lnd (nlat, nlon, nlev), ocn (nlat, nlon, nlev) and ice (nj, ni)
+RESOLUTIONS = {
+    'tiny': {'atm': (8, 16, 4), 'lnd': (8, 16, 3), 'ocn': (12, 16, 5), 'ice': (12, 16)},
+    'f45_g37': {'atm': (46, 72, 26), 'lnd': (46, 72, 15), 'ocn': (116, 100, 60), 'ice': (116, 100)},
+    'f19_g17': {'atm': (96, 144, 32), 'lnd': (96, 144, 25), 'ocn': (384, 320, 60), 'ice': (384, 320)},
+    'f09_g17': {'atm': (192, 288, 32), 'lnd': (192, 288, 25), 'ocn': (384, 320, 60), 'ice': (384, 320)},
+}
+
+# stream -> component, archive subdirectory, time bounds variable, time_period_freq
+STREAMS = {
+    'cam.h0': ('cam', 'atm', 'time_bnds', 'month_1'),
+    'cam.h1': ('cam', 'atm', 'time_bnds', 'day_1'),
+    'pop.h': ('pop', 'ocn', 'time_bound', 'month_1'),
+    'cice.h': ('cice', 'ice', 'time_bounds', 'month_1'),
+    'clm2.h0': ('clm2', 'lnd', 'time_bounds', 'month_1'),
+}
+
+# time variant fields of each component, (name, units, is 3d)
+FIELDS = {
+    'cam': [('T', 'K', True), ('U', 'm/s', True), ('V', 'm/s', True), ('Q', 'kg/kg', True),
+            ('RELHUM', 'percent', True), ('OMEGA', 'Pa/s', True), ('Z3', 'm', True), ('CLOUD', 'fraction', True),
+            ('PS', 'Pa', False), ('TS', 'K', False), ('PRECC', 'm/s', False), ('PRECL', 'm/s', False),
+            ('FLNT', 'W/m2', False), ('FSNT', 'W/m2', False), ('LHFLX', 'W/m2', False), ('SHFLX', 'W/m2', False),
+            ('TREFHT', 'K', False), ('PSL', 'Pa', False), ('CLDTOT', 'fraction', False), ('TMQ', 'kg/m2', False)],
+    'pop': [('TEMP', 'degC', True), ('SALT', 'gram/kilogram', True), ('UVEL', 'centimeter/s', True),
+            ('VVEL', 'centimeter/s', True), ('WVEL', 'centimeter/s', True), ('RHO', 'gram/centimeter^3', True),
+            ('IAGE', 'years', True), ('SSH', 'centimeter', False), ('HMXL', 'centimeter', False),
+            ('SHF', 'watt/m^2', False), ('SFWF', 'kg/m^2/s', False), ('TAUX', 'dyne/centimeter^2', False),
+            ('TAUY', 'dyne/centimeter^2', False)],
+    'cice': [('hi', 'm', False), ('hs', 'm', False), ('aice', '%', False), ('uvel', 'm/s', False),
+             ('vvel', 'm/s', False), ('Tsfc', 'C', False), ('snow', 'cm/day', False), ('rain', 'cm/day', False)],
+    'clm2': [('TSOI', 'K', True), ('H2OSOI', 'mm3/mm3', True), ('TSA', 'K', False), ('QSOIL', 'mm/s', False),
+             ('FSH', 'W/m^2', False), ('GPP', 'gC/m^2/s', False), ('NPP', 'gC/m^2/s', False),
+             ('RAIN', 'mm/s', False), ('SNOW', 'mm/s', False), ('QRUNOFF', 'mm/s', False)],
+}
+
+DAYS_IN_MONTH = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+TIME_UNITS = 'days since 0001-01-01 00:00:00'
+
+def field_list(comp, nvars):
+    """ return nvars (name, units, is 3d) fields for a component, the real
+        names first and then numbered copies of them
+    """
+    fields = FIELDS[comp]
+    if nvars is None:
+        return list(fields)
+    out = list()
+    for i in range(nvars):
+        name,units,is3d = fields[i % len(fields)]
+        if i >= len(fields):
+            name = '{0}_{1}'.format(name, i // len(fields))
+        out.append((name, units, is3d))
+    return out
+
+
+def month_bounds(year, month):
+    """ return the noleap (start, end) of a month in days since 0001-01-01
+    """
+    start = 365.0 * (year - 1) + sum(DAYS_IN_MONTH[:month-1])
+    return start, start + DAYS_IN_MONTH[month-1]
+
+
+def file_times(stream, year, month):
+    """ return the time values and bounds of the history file of a month, CESM
+        stamps an average with the end of its interval
+    """
+    start,end = month_bounds(year, month)
+    if STREAMS[stream][3] == 'day_1':
+        lo = numpy.arange(start, end)
+    else:
+        lo = numpy.array([start])
+    hi = lo + (1.0 if STREAMS[stream][3] == 'day_1' else end - start)
+    return hi, numpy.stack([lo, hi], axis=1)
+
+
+def history_name(root, case, stream, year, month):
+    """ return the archive path of the history file of a month
+    """
+    comp,subdir,bounds_name,freq = STREAMS[stream]
+    if freq == 'day_1':
+        date = '{0:04d}-{1:02d}-01-00000'.format(year, month)
+    else:
+        date = '{0:04d}-{1:02d}'.format(year, month)
+    return '{0}/{1}/{2}/hist/{1}.{3}.{4}.nc'.format(root, case, subdir, stream, date)
+
+
+def _fill(rng, shape, base):
+    return (base + rng.standard_normal(shape, dtype=numpy.float32)).astype(numpy.float32)
+
+
+def _time_axis(f, stream, time, bounds, bnd_dim):
+    comp,subdir,bounds_name,freq = STREAMS[stream]
+    t = f.createVariable('time', 'f8', ('time',))
+    t.long_name = 'time'
+    t.units = TIME_UNITS
+    t.calendar = 'noleap'
+    t.bounds = bounds_name
+    t[:] = time
+    b = f.createVariable(bounds_name, 'f8', ('time', bnd_dim))
+    b.long_name = 'boundaries for time-averaging interval'
+    b.units = TIME_UNITS
+    b[:] = bounds
+
+
+def write_history(fn, stream, case, res, year, month, nvars=None, seed=0):
+    """ write one synthetic history file
+
+    Arguments:
+    fn (string) - the file to write
+    stream (string) - one of STREAMS
+    case (string) - case name
+    res (string) - one of RESOLUTIONS
+    year, month (int) - the month the file covers
+    nvars (int) - the number of time variant fields, None for the default list of the component
+    seed (int) - random seed
+    """
+    comp,subdir,bounds_name,freq = STREAMS[stream]
+    rng = numpy.random.default_rng(seed + 100 * year + month)
+    time,bounds = file_times(stream, year, month)
+    f = nc.Dataset(fn, 'w', format='NETCDF4_CLASSIC')
+    f.case = case
+    f.source = 'synthetic CESM history file for benchmarking'
+    f.time_period_freq = freq
+    f.createDimension('time', None)
+
+    if comp in ['cam', 'clm2']:
+        nlat,nlon,nlev = RESOLUTIONS[res]['atm' if comp == 'cam' else 'lnd']
+        lev_dim = 'lev' if comp == 'cam' else 'levgrnd'
+        bnd_dim = 'nbnd' if comp == 'cam' else 'hist_interval'
+        f.createDimension('lat', nlat)
+        f.createDimension('lon', nlon)
+        f.createDimension(lev_dim, nlev)
+        f.createDimension(bnd_dim, 2)
+        hdims = ('lat', 'lon')
+        lat = f.createVariable('lat', 'f8', ('lat',))
+        lat.units = 'degrees_north'
+        lat.long_name = 'latitude'
+        lat[:] = numpy.linspace(-90.0, 90.0, nlat)
+        lon = f.createVariable('lon', 'f8', ('lon',))
+        lon.units = 'degrees_east'
+        lon.long_name = 'longitude'
+        lon[:] = numpy.arange(nlon) * 360.0 / nlon
+        lev = f.createVariable(lev_dim, 'f8', (lev_dim,))
+        if comp == 'cam':
+            lev.units = 'hPa'
+            lev.long_name = 'hybrid level at midpoints (1000*(A+B))'
+            lev.positive = 'down'
+            lev[:] = numpy.linspace(3.6, 992.6, nlev)
+            f.createDimension('ilev', nlev+1)
+            for name,vals in [('hyam', numpy.linspace(0.0036, 0.0, nlev)), ('hybm', numpy.linspace(0.0, 0.9926, nlev))]:
+                v = f.createVariable(name, 'f8', ('lev',))
+                v.long_name = 'hybrid {0} coefficient at layer midpoints'.format('A' if name == 'hyam' else 'B')
+                v[:] = vals
+            p0 = f.createVariable('P0', 'f8', ())
+            p0.units = 'Pa'
+            p0.assignValue(100000.0)
+            gw = f.createVariable('gw', 'f8', ('lat',))
+            gw.long_name = 'latitude weights'
+            gw[:] = numpy.cos(numpy.radians(lat[:]))
+        else:
+            lev.units = 'm'
+            lev.long_name = 'coordinate soil levels'
+            lev[:] = numpy.cumsum(numpy.linspace(0.02, 3.0, nlev))
+            for name,units in [('area', 'km^2'), ('landfrac', 'unitless')]:
+                v = f.createVariable(name, 'f4', hdims)
+                v.units = units
+                v[:] = numpy.ones((nlat, nlon), dtype=numpy.float32)
+        _time_axis(f, stream, time, bounds, bnd_dim)
+        date_name,sec_name = ('date', 'datesec') if comp == 'cam' else ('mcdate', 'mcsec')
+        date = f.createVariable(date_name, 'i4', ('time',))
+        date.long_name = 'current date (YYYYMMDD)'
+        date[:] = [10000 * year + 100 * month + 1 + int(t - time[0]) for t in time]
+        sec = f.createVariable(sec_name, 'i4', ('time',))
+        sec.long_name = 'current seconds of current date'
+        sec.units = 's'
+        sec[:] = numpy.zeros(len(time), dtype=numpy.int32)
+        vdims = (lev_dim,) + hdims
+        shape2 = (nlat, nlon)
+        shape3 = (nlev, nlat, nlon)
+
+    elif comp == 'pop':
+        nlat,nlon,nlev = RESOLUTIONS[res]['ocn']
+        f.createDimension('nlat', nlat)
+        f.createDimension('nlon', nlon)
+        f.createDimension('z_t', nlev)
+        f.createDimension('d2', 2)
+        hdims = ('nlat', 'nlon')
+        z_t = f.createVariable('z_t', 'f4', ('z_t',))
+        z_t.units = 'centimeters'
+        z_t.long_name = 'depth from surface to midpoint of layer'
+        z_t.positive = 'down'
+        dz_vals = numpy.linspace(1000.0, 25000.0, nlev, dtype=numpy.float32)
+        z_t[:] = numpy.cumsum(dz_vals) - dz_vals / 2
+        dz = f.createVariable('dz', 'f4', ('z_t',))
+        dz.units = 'centimeters'
+        dz.long_name = 'thickness of layer k'
+        dz[:] = dz_vals
+        tlat,tlon = numpy.meshgrid(numpy.linspace(-79.0, 89.0, nlat), numpy.arange(nlon) * 360.0 / nlon, indexing='ij')
+        for name,units,vals in [('TLAT', 'degrees_north', tlat), ('TLONG', 'degrees_east', tlon),
+                                ('TAREA', 'centimeter^2', numpy.cos(numpy.radians(tlat)) * 1.0e13)]:
+            v = f.createVariable(name, 'f8', hdims)
+            v.units = units
+            v[:] = vals
+        kmt = f.createVariable('KMT', 'i4', hdims)
+        kmt.long_name = 'k Index of Deepest Grid Cell on T Grid'
+        kmt[:] = numpy.full((nlat, nlon), nlev, dtype=numpy.int32)
+        region = f.createVariable('REGION_MASK', 'i4', hdims)
+        region.long_name = 'basin index number (signed integers)'
+        region[:] = 1 + (numpy.arange(nlat * nlon).reshape(nlat, nlon) % 6)
+        _time_axis(f, stream, time, bounds, 'd2')
+        vdims = ('z_t',) + hdims
+        shape2 = (nlat, nlon)
+        shape3 = (nlev, nlat, nlon)
+
+    else:
+        nj,ni = RESOLUTIONS[res]['ice']
+        f.createDimension('nj', nj)
+        f.createDimension('ni', ni)
+        f.createDimension('d2', 2)
+        hdims = ('nj', 'ni')
+        tlat,tlon = numpy.meshgrid(numpy.linspace(-79.0, 89.0, nj), numpy.arange(ni) * 360.0 / ni, indexing='ij')
+        for name,units,vals in [('TLAT', 'degrees_north', tlat), ('TLON', 'degrees_east', tlon),
+                                ('tarea', 'm^2', numpy.cos(numpy.radians(tlat)) * 1.0e9),
+                                ('tmask', '', numpy.ones((nj, ni)))]:
+            v = f.createVariable(name, 'f4', hdims)
+            v.units = units
+            v[:] = vals
+        _time_axis(f, stream, time, bounds, 'd2')
+        vdims = hdims
+        shape2 = (nj, ni)
+        shape3 = shape2
+
+    for name,units,is3d in field_list(comp, nvars):
+        dims = ('time',) + (vdims if is3d else hdims)
+        v = f.createVariable(name, 'f4', dims, fill_value=numpy.float32(1.0e36))
+        v.units = units
+        v.long_name = name
+        v.cell_methods = 'time: mean'
+        v[:] = _fill(rng, (len(time),) + (shape3 if is3d else shape2), float(len(name)))
+    f.close()
+
+
+def make_stream(root, case, stream, res, start_year, nyears, nvars=None):
+    """ write all history files of a stream
+
+    Arguments:
+    root (string) - archive root, the files go in <root>/<case>/<comp>/hist
+    case (string) - case name
+    stream (string) - one of STREAMS
+    res (string) - one of RESOLUTIONS
+    start_year (int) - first model year
+    nyears (int) - number of years
+    nvars (int) - number of time variant fields, None for the default list of the component
+
+    Return:
+    files (list) - the files written, in time order
+    """
+    files = list()
+    for year in range(start_year, start_year + nyears):
+        for month in range(1, 13):
+            fn = history_name(root, case, stream, year, month)
+            if not os.path.isdir(os.path.dirname(fn)):
+                os.makedirs(os.path.dirname(fn))
+            write_history(fn, stream, case, res, year, month, nvars=nvars)
+            files.append(fn)
+    return files
+
+
+def make_cmip_ocean(root, res, start_year, nyears, variables=('tos', 'thetao')):
+    """ write CMIP style conformed monthly ocean time series on the native grid, one
+        file per variable in <root>/Omon/<var>/gn/v20260101 as the ocean remap generator expects
+
+    Return:
+    files (list) - the files written
+    """
+    nlat,nlon,nlev = RESOLUTIONS[res]['ocn']
+    nt = 12 * nyears
+    files = list()
+    rng = numpy.random.default_rng(1)
+    hi = numpy.array([month_bounds(y, m)[1] for y in range(start_year, start_year + nyears) for m in range(1, 13)])
+    lo = numpy.array([month_bounds(y, m)[0] for y in range(start_year, start_year + nyears) for m in range(1, 13)])
+    for var in variables:
+        is3d = var in ['thetao', 'so', 'uo', 'vo']
+        out_dir = '{0}/Omon/{1}/gn/v20260101'.format(root, var)
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        fn = '{0}/{1}_Omon_CESM2_synthetic_r1i1p1f1_gn_{2:04d}01-{3:04d}12.nc'.format(out_dir, var, start_year, start_year + nyears - 1)
+        f = nc.Dataset(fn, 'w', format='NETCDF4_CLASSIC')
+        f.table_id = 'Omon'
+        f.variable_id = var
+        f.grid_label = 'gn'
+        f.createDimension('time', None)
+        f.createDimension('nlat', nlat)
+        f.createDimension('nlon', nlon)
+        f.createDimension('d2', 2)
+        t = f.createVariable('time', 'f8', ('time',))
+        t.units = TIME_UNITS
+        t.calendar = 'noleap'
+        t.bounds = 'time_bnds'
+        t[:] = (lo + hi) / 2
+        tb = f.createVariable('time_bnds', 'f8', ('time', 'd2'))
+        tb[:] = numpy.stack([lo, hi], axis=1)
+        dims = ('time', 'nlat', 'nlon')
+        shape = (nt, nlat, nlon)
+        if is3d:
+            f.createDimension('lev', nlev)
+            lev = f.createVariable('lev', 'f8', ('lev',))
+            lev.units = 'centimeters'
+            lev.positive = 'down'
+            lev[:] = numpy.linspace(500.0, 537500.0, nlev)
+            dims = ('time', 'lev', 'nlat', 'nlon')
+            shape = (nt, nlev, nlat, nlon)
+        v = f.createVariable(var, 'f4', dims, fill_value=numpy.float32(1.0e20))
+        v.units = 'degC'
+        v[:] = _fill(rng, shape, 10.0)
+        f.close()
+        files.append(fn)
+    return files
+
+
+def make_remap_weights(fn, res, dst_nlat=None, dst_nlon=None, nlev=None):
+    """ write a synthetic weight file in the ESMF offline weight file convention from
+        the ocean grid of res to a regular lat-lon grid.  Each destination cell takes
+        the mean of the source cells that fall in it.  With nlev the matrix maps the
+        full depth, one block per level.
+    """
+    nlat,nlon,ocn_nlev = RESOLUTIONS[res]['ocn']
+    dst_nlat = dst_nlat if dst_nlat is not None else max(nlat // 2, 2)
+    dst_nlon = dst_nlon if dst_nlon is not None else max(nlon // 2, 2)
+    nz = nlev if nlev is not None else 1
+
+    src_j,src_i = numpy.meshgrid(numpy.arange(nlat), numpy.arange(nlon), indexing='ij')
+    dst = (src_j * dst_nlat // nlat) * dst_nlon + (src_i * dst_nlon // nlon)
+    count = numpy.bincount(dst.ravel(), minlength=dst_nlat * dst_nlon)
+    n_a = nlat * nlon
+    n_b = dst_nlat * dst_nlon
+    col = numpy.concatenate([numpy.arange(n_a) + k * n_a for k in range(nz)]) + 1
+    row = numpy.concatenate([dst.ravel() + k * n_b for k in range(nz)]) + 1
+    S = numpy.tile(1.0 / count[dst.ravel()], nz)
+
+    lat_b = numpy.linspace(-90.0 + 90.0 / dst_nlat, 90.0 - 90.0 / dst_nlat, dst_nlat)
+    lon_b = (numpy.arange(dst_nlon) + 0.5) * 360.0 / dst_nlon
+    yc_b,xc_b = numpy.meshgrid(lat_b, lon_b, indexing='ij')
+    f = nc.Dataset(fn, 'w', format='NETCDF4_CLASSIC')
+    f.title = 'synthetic ocean remap weights for benchmarking'
+    f.map_method = 'Conservative remapping'
+    f.createDimension('n_a', n_a * nz)
+    f.createDimension('n_b', n_b * nz)
+    f.createDimension('n_s', len(S))
+    f.createDimension('nv_b', 4)
+    f.createDimension('src_grid_rank', 3 if nlev is not None else 2)
+    f.createDimension('dst_grid_rank', 3 if nlev is not None else 2)
+    sdims = [nlon, nlat] + ([nz] if nlev is not None else [])
+    ddims = [dst_nlon, dst_nlat] + ([nz] if nlev is not None else [])
+    for name,vals,dim in [('src_grid_dims', sdims, 'src_grid_rank'), ('dst_grid_dims', ddims, 'dst_grid_rank')]:
+        v = f.createVariable(name, 'i4', (dim,))
+        v[:] = vals
+    for name,vals in [('row', row), ('col', col)]:
+        v = f.createVariable(name, 'i4', ('n_s',))
+        v[:] = vals
+    v = f.createVariable('S', 'f8', ('n_s',))
+    v[:] = S
+    for name,vals,units in [('yc_b', numpy.tile(yc_b.ravel(), nz), 'degrees'),
+                            ('xc_b', numpy.tile(xc_b.ravel(), nz), 'degrees'),
+                            ('area_b', numpy.ones(n_b * nz), 'square radians'),
+                            ('frac_b', numpy.ones(n_b * nz), '')]:
+        v = f.createVariable(name, 'f8', ('n_b',))
+        v.units = units
+        v[:] = vals
+    dlat = 90.0 / dst_nlat
+    dlon = 180.0 / dst_nlon
+    for name,center,offsets in [('yv_b', yc_b, [-dlat, -dlat, dlat, dlat]), ('xv_b', xc_b, [-dlon, dlon, dlon, -dlon])]:
+        v = f.createVariable(name, 'f8', ('n_b', 'nv_b'))
+        v.units = 'degrees'
+        v[:] = numpy.tile(center.ravel()[:,None] + numpy.array(offsets)[None,:], (nz, 1))
+    for name,n in [('mask_a', n_a * nz), ('mask_b', n_b * nz)]:
+        v = f.createVariable(name, 'i4', ('n_a' if name == 'mask_a' else 'n_b',))
+        v[:] = numpy.ones(n, dtype=numpy.int32)
+    f.close()
+
+
+#=====================================================
+# commandline_options - parse any command line options
+#=====================================================
+def commandline_options():
+    """Process the command line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='synthetic_history: write synthetic CESM history files for benchmarking.')
+
+    parser.add_argument('--root', required=True,
+                        help='archive root directory to write the files to')
+
+    parser.add_argument('--case', default='bench',
+                        help='case name, default bench')
+
+    parser.add_argument('--resolution', default='tiny', choices=sorted(RESOLUTIONS.keys()),
+                        help='grid resolution, default tiny')
+
+    parser.add_argument('--streams', nargs='+', default=sorted(STREAMS.keys()), choices=sorted(STREAMS.keys()),
+                        help='history streams to write, default all')
+
+    parser.add_argument('--start-year', dest='start_year', type=int, default=1,
+                        help='first model year, default 1')
+
+    parser.add_argument('--years', type=int, default=2,
+                        help='number of model years, default 2')
+
+    parser.add_argument('--nvars', type=int, default=None,
+                        help='number of time variant fields per stream, default the standard list of each component')
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    options = commandline_options()
+    for stream in options.streams:
+        files = make_stream(options.root, options.case, stream, options.resolution,
+                            options.start_year, options.years, options.nvars)
+        print('{0}: wrote {1} files'.format(stream, len(files)))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Unit test suite for the synthetic history file generator
+
+"""
+
+from __future__ import print_function
+
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+import netCDF4 as nc
+import numpy
+
+from benchmarks import synthetic_history
+
+class test_synthetic_history(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_makeStream(self):
+        """ test to see if a stream has one file per month laid out like the short term archive
+        """
+        files = synthetic_history.make_stream(self.tmp_dir, 'bench', 'pop.h', 'tiny', 1, 1)
+        self.assertEqual(len(files), 12)
+        self.assertEqual(sorted(glob.glob(os.path.join(self.tmp_dir, 'bench', 'ocn', 'hist', 'bench.pop.h.*.nc'))), files)
+        self.assertEqual(os.path.basename(files[0]), 'bench.pop.h.0001-01.nc')
+
+    def test_timeBounds(self):
+        """ test to see if the time is the end of the month and the bounds span the month
+        """
+        fn = synthetic_history.history_name(self.tmp_dir, 'bench', 'cam.h0', 2, 3)
+        os.makedirs(os.path.dirname(fn))
+        synthetic_history.write_history(fn, 'cam.h0', 'bench', 'tiny', 2, 3)
+        with nc.Dataset(fn) as f:
+            self.assertEqual(f.time_period_freq, 'month_1')
+            self.assertEqual(f.variables['time'].calendar, 'noleap')
+            bounds = f.variables['time_bnds'][0]
+            self.assertEqual(bounds[1] - bounds[0], 31)
+            self.assertEqual(f.variables['time'][0], bounds[1])
+            self.assertEqual(bounds[0], 365 + 31 + 28)
+
+    def test_nvars(self):
+        """ test to see if nvars sets the number of time variant fields
+        """
+        fn = os.path.join(self.tmp_dir, 'test.nc')
+        synthetic_history.write_history(fn, 'cice.h', 'bench', 'tiny', 1, 1, nvars=30)
+        with nc.Dataset(fn) as f:
+            fields = [v for v in f.variables if 'time' in f.variables[v].dimensions and
+                      len(f.variables[v].dimensions) > 2]
+        self.assertEqual(len(fields), 30)
+
+    def test_remapWeights(self):
+        """ test to see if every destination cell of the weight file sums to one
+        """
+        fn = os.path.join(self.tmp_dir, 'weights.nc')
+        synthetic_history.make_remap_weights(fn, 'tiny')
+        with nc.Dataset(fn) as f:
+            n_b = f.dimensions['n_b'].size
+            row = f.variables['row'][:]
+            S = f.variables['S'][:]
+        sums = numpy.bincount(row - 1, weights=S, minlength=n_b)
+        self.assertTrue(numpy.allclose(sums[sums > 0], 1.0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+"""Archive discovery shared by the post processing generators
+
+Walks a directory tree once with os.scandir, scanning directories on a pool
+of threads as they are found and, when a communicator is given, sharing the
+subdirectories out over the ranks.  Rank 0 scans the tree breadth first
+until there are a few directories per rank, so the ranks still share the
+work when one component holds most of the files.  Levels of directory name
+patterns prune the walk, so only <component>/proc/tseries is descended in a
+short term archive instead of every history and restart directory.
+
+The files found are returned in a FileTable that indexes them by the fields
+of their names (variable, table, frequency, ...) so they can be queried as
+often as needed without walking the tree again.
+
+Usage:
+    files = archiveLib.find(dout_s_root, levels=archiveLib.TSERIES_LEVELS, comm=scomm)
+    table = archiveLib.FileTable(files, archiveLib.cmip_fields)
+    table.query(variable='thetao', table='Omon')
+__________________________
+Created on Oct, 2026
+
+@author: CSEG <cseg@cgd.ucar.edu>
+"""
+
+from __future__ import print_function
+
+import fnmatch
+import os
+from concurrent import futures
+
+# simplecomm tag used to gather the files on rank 0
+ARCHIVE_TAG = 96
+
+# threads scanning directories on each rank
+THREADS = 8
+
+# directories per rank to scan down to before sharing them out
+DIRS_PER_RANK = 4
+
+# <component>/proc/tseries/<frequency> in a short term archive
+TSERIES_LEVELS = ['*', 'proc', 'tseries']
+
+def scan_dir(path):
+    """ list one directory
+
+    Arguments:
+    path (string) - the directory
+
+    Return:
+    path (string) - the directory
+    dirs (list) - the names of the subdirectories to descend, symbolic links are not followed
+    names (list) - the names of the other entries
+    """
+    dirs = []
+    names = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            dirs.append(entry.name)
+                    else:
+                        names.append(entry.name)
+                except OSError:
+                    names.append(entry.name)
+    except OSError:
+        # removed or unreadable while walking, as os.walk does
+        pass
+    return path, dirs, names
+
+
+def keep_files(path, names, pattern, exclude):
+    """ the full names of the files in a directory that match pattern and none of exclude
+    """
+    return [os.path.join(path, n) for n in fnmatch.filter(names, pattern)
+            if not any(fnmatch.fnmatch(n, x) for x in exclude)]
+
+
+def frontier(root_dir, pattern='*.nc', levels=None, exclude=None, ndirs=1, threads=THREADS):
+    """ scan a directory tree breadth first until a depth has at least ndirs directories
+    to descend, or there are none left
+
+    Arguments:
+    root_dir (string) - the directory to search
+    pattern, levels, exclude, threads - as for walk
+    ndirs (int) - the number of directories wanted
+
+    Return:
+    files (list) - the files found above the frontier
+    dirs (list) - the directories of the frontier, all at the same depth
+    depth (int) - the depth of the frontier below root_dir
+    """
+    levels = levels if levels is not None else []
+    exclude = exclude if exclude is not None else []
+    files = []
+    dirs = [root_dir]
+    depth = 0
+    with futures.ThreadPoolExecutor(max_workers=max(threads, 1)) as pool:
+        while 0 < len(dirs) < ndirs:
+            next_dirs = []
+            for path,subdirs,names in pool.map(scan_dir, dirs):
+                if depth >= len(levels):
+                    files.extend(keep_files(path, names, pattern, exclude))
+                next_dirs.extend(os.path.join(path, d) for d in subdirs
+                                 if depth >= len(levels) or fnmatch.fnmatch(d, levels[depth]))
+            dirs = sorted(next_dirs)
+            depth = depth + 1
+    return files, dirs, depth
+
+
+def walk(root_dirs, pattern='*.nc', levels=None, exclude=None, threads=THREADS):
+    """ find the files under directories
+
+    Arguments:
+    root_dirs (list) - the directories to search
+    pattern (string) - fnmatch pattern of the file names to keep
+    levels (list) - fnmatch patterns of the directory names to descend at each depth below
+                    the roots, files are only kept below the last level.  None to descend everything
+    exclude (list) - fnmatch patterns of file names to drop (optional)
+    threads (int) - the number of threads scanning directories
+
+    Return:
+    files (list) - the sorted full file names
+    """
+    levels = levels if levels is not None else []
+    exclude = exclude if exclude is not None else []
+    files = []
+    with futures.ThreadPoolExecutor(max_workers=max(threads, 1)) as pool:
+        pending = dict((pool.submit(scan_dir, d), 0) for d in root_dirs)
+        while pending:
+            done, _ = futures.wait(list(pending.keys()), return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                depth = pending.pop(future)
+                path,dirs,names = future.result()
+                if depth >= len(levels):
+                    files.extend(keep_files(path, names, pattern, exclude))
+                for d in dirs:
+                    if depth < len(levels) and not fnmatch.fnmatch(d, levels[depth]):
+                        continue
+                    pending[pool.submit(scan_dir, os.path.join(path, d))] = depth + 1
+    return sorted(files)
+
+
+def find(root_dir, pattern='*.nc', levels=None, exclude=None, comm=None, threads=THREADS):
+    """ find the files under a directory, sharing the subdirectories over the ranks of comm.
+    Rank 0 scans down to the first depth with DIRS_PER_RANK directories per rank, or to
+    the bottom of the tree, and the directories of that depth are shared out.  Every rank
+    of comm must call this and gets the same list.
+
+    Arguments:
+    root_dir (string) - the directory to search
+    pattern, levels, exclude, threads - as for walk
+    comm (simplecomm) - the communicator to share the walk over, None to walk on this rank only
+
+    Return:
+    files (list) - the sorted full file names
+    """
+    if comm is None or comm.get_size() == 1:
+        return walk([root_dir], pattern, levels, exclude, threads)
+
+    from asaptools import partition
+
+    levels = levels if levels is not None else []
+    rank = comm.get_rank()
+    top_files = []
+    top = ([], 0)
+    if rank == 0:
+        top_files,dirs,depth = frontier(root_dir, pattern, levels, exclude,
+                                        DIRS_PER_RANK * comm.get_size(), threads)
+        top = (dirs, depth)
+    dirs,depth = comm.partition(top, func=partition.Duplicate(), involved=True)
+    l_dirs = comm.partition(dirs, func=partition.EqualStride(), involved=True)
+    files = walk(l_dirs, pattern, levels[depth:], exclude, threads)
+
+    if rank == 0:
+        files.extend(top_files)
+        for i in range(1, comm.get_size()):
+            r,r_files = comm.collect(data=None, tag=ARCHIVE_TAG)
+            files.extend(r_files)
+        files = sorted(files)
+    else:
+        comm.collect(data=files, tag=ARCHIVE_TAG)
+    return comm.partition(files, func=partition.Duplicate(), involved=True)
+
+
+def tseries_fields(path):
+    """ the fields of a time series file name, <case>.<stream>.<variable>.<date>.nc
+    in <component>/proc/tseries/<frequency>
+    """
+    parts = os.path.basename(path).split('.')
+    fields = {'frequency': os.path.basename(os.path.dirname(path))}
+    if len(parts) >= 4:
+        fields['variable'] = parts[-3]
+        fields['date'] = parts[-2]
+    return fields
+
+
+def cmip_fields(path):
+    """ the fields of a CMIP file name, <variable>_<table>_<source>_<experiment>_<member>_<grid>_<date>.nc
+    """
+    parts = os.path.basename(path).split('_')
+    fields = {'variable': parts[0]}
+    if len(parts) >= 2:
+        fields['table'] = parts[1]
+    if len(parts) >= 6:
+        fields['grid'] = parts[5].split('.')[0]
+    return fields
+
+
+class FileTable(object):
+    """ the files found in an archive, indexed by the fields of their names
+    """
+
+    def __init__(self, files, fields):
+        """
+        Arguments:
+        files (list) - full file names
+        fields (function) - returns a dictionary of field name -> value for a file name,
+                            such as tseries_fields or cmip_fields
+        """
+        self._files = sorted(files)
+        self._fields = [fields(fn) for fn in self._files]
+        self._index = dict()
+
+    def __len__(self):
+        return len(self._files)
+
+    def __iter__(self):
+        return iter(self._files)
+
+    @property
+    def files(self):
+        return list(self._files)
+
+    def values(self, field):
+        """ return the sorted values of a field over all files
+        """
+        return sorted(self._field_index(field).keys())
+
+    def _field_index(self, field):
+        """ field value -> positions of the files, built the first time a field is queried
+        """
+        if field not in self._index:
+            index = dict()
+            for n,f in enumerate(self._fields):
+                if field in f:
+                    index.setdefault(f[field], []).append(n)
+            self._index[field] = index
+        return self._index[field]
+
+    def query(self, **fields):
+        """ return the sorted files whose fields have all of the given values,
+        e.g. query(variable='TEMP', frequency='month_1')
+        """
+        found = None
+        for field,value in fields.items():
+            positions = set(self._field_index(field).get(value, []))
+            found = positions if found is None else found & positions
+        if found is None:
+            return list(self._files)
+        return [self._files[n] for n in sorted(found)]
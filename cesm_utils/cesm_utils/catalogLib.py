@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""Persistent catalog of the headers of the single variable time series files
+
+The catalog is an SQLite database with the dimensions, variables (with their
+dimensions and coordinates attribute) and the time_period_freq attribute of
+every time series file, keyed by the file name and checked against the file
+modification time and size.  cesm_tseries_generator adds the files it writes
+as each specifier is converted, and cesm_conform_generator only opens the
+files that are missing from the catalog or have changed since they were
+added, so the headers of an archive are read once.
+
+Only one process should write to a catalog at a time; the generators write
+from rank 0 only.  Readers that do not own the catalog, such as the
+diagnostics averagers, open it read-only and never add to it.
+
+Usage:
+    catalog = catalogLib.Catalog('{0}/logs/tseries_catalog.db'.format(caseroot))
+    headers,new_headers = catalogLib.get_headers(catalog, files)
+    catalog.add(new_headers)
+    catalog.close()
+__________________________
+Created on Oct, 2026
+
+@author: CSEG <cseg@cgd.ucar.edu>
+"""
+
+from __future__ import print_function
+
+import os
+import sqlite3
+import urllib.parse
+
+import netCDF4 as nc
+
+# bump when the tables change, older catalogs are rebuilt
+SCHEMA_VERSION = 1
+
+SCHEMA = ['CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL, size INTEGER, time_period_freq TEXT)',
+          'CREATE TABLE IF NOT EXISTS dims (path TEXT, name TEXT, size INTEGER)',
+          'CREATE TABLE IF NOT EXISTS variables (path TEXT, name TEXT, dims TEXT, coordinates TEXT)',
+          'CREATE INDEX IF NOT EXISTS dims_path ON dims (path)',
+          'CREATE INDEX IF NOT EXISTS variables_path ON variables (path)']
+
+# number of paths per query
+BATCH = 500
+
+def read_header(fn):
+    """ read the header of a netcdf file without reading any data
+
+    Arguments:
+    fn (string) - the file name
+
+    Return:
+    header (dictionary) - 'path', 'mtime', 'size', the 'time_period_freq' attribute or None,
+                          'dimensions' name -> length and 'variables' name ->
+                          {'dimensions': list of names, 'coordinates': attribute or None}
+    """
+    st = os.stat(fn)
+    header = {'path': fn, 'mtime': st.st_mtime, 'size': st.st_size,
+              'time_period_freq': None, 'dimensions': dict(), 'variables': dict()}
+    f = nc.Dataset(fn, 'r')
+    try:
+        if hasattr(f, 'time_period_freq'):
+            header['time_period_freq'] = str(f.time_period_freq)
+        for name,d in f.dimensions.items():
+            header['dimensions'][name] = len(d)
+        for name,v in f.variables.items():
+            coordinates = str(v.coordinates) if hasattr(v, 'coordinates') else None
+            header['variables'][name] = {'dimensions': list(v.dimensions), 'coordinates': coordinates}
+    finally:
+        f.close()
+    return header
+
+
+class Catalog(object):
+    """ the time series header catalog
+    """
+
+    def __init__(self, db_fn, readonly=False):
+        """
+        Arguments:
+        db_fn (string) - the SQLite database file, created if it does not exist
+        readonly (boolean) - open an existing catalog for lookups only, without
+                             creating or changing it
+        """
+        self._db_fn = db_fn
+        if readonly:
+            uri = 'file:{0}?mode=ro'.format(urllib.parse.quote(os.path.abspath(db_fn)))
+            self._db = sqlite3.connect(uri, uri=True, timeout=300)
+            version = self._db.execute('PRAGMA user_version').fetchone()[0]
+            if version != SCHEMA_VERSION:
+                self._db.close()
+                raise sqlite3.DatabaseError('{0} has schema version {1}, expected {2}'.format(db_fn, version, SCHEMA_VERSION))
+            return
+        d = os.path.dirname(db_fn)
+        if d and not os.path.isdir(d):
+            os.makedirs(d)
+        self._db = sqlite3.connect(db_fn, timeout=300)
+        version = self._db.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            with self._db:
+                for table in ['files', 'dims', 'variables']:
+                    self._db.execute('DROP TABLE IF EXISTS {0}'.format(table))
+                self._db.execute('PRAGMA user_version = {0}'.format(SCHEMA_VERSION))
+        with self._db:
+            for statement in SCHEMA:
+                self._db.execute(statement)
+
+    def close(self):
+        self._db.close()
+
+    def _select(self, query, paths):
+        """ run query with the paths bound to its ? placeholders, BATCH paths at a time
+        """
+        rows = []
+        for n in range(0, len(paths), BATCH):
+            batch = paths[n:n+BATCH]
+            rows.extend(self._db.execute(query.format(','.join('?' * len(batch))), batch).fetchall())
+        return rows
+
+    def lookup(self, paths):
+        """ return the catalogued headers of the files that have not changed since they were added
+
+        Arguments:
+        paths (list) - file names
+
+        Return:
+        headers (dictionary) - file name -> header, as from read_header
+        """
+        headers = dict()
+        for path,mtime,size,freq in self._select('SELECT path, mtime, size, time_period_freq FROM files WHERE path IN ({0})', paths):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if st.st_mtime == mtime and st.st_size == size:
+                headers[path] = {'path': path, 'mtime': mtime, 'size': size,
+                                 'time_period_freq': freq, 'dimensions': dict(), 'variables': dict()}
+        found = list(headers.keys())
+        for path,name,size in self._select('SELECT path, name, size FROM dims WHERE path IN ({0})', found):
+            headers[path]['dimensions'][name] = size
+        for path,name,dims,coordinates in self._select('SELECT path, name, dims, coordinates FROM variables WHERE path IN ({0})', found):
+            headers[path]['variables'][name] = {'dimensions': dims.split(',') if dims else [],
+                                                'coordinates': coordinates}
+        return headers
+
+    def add(self, headers):
+        """ add or replace the headers of files in one transaction
+
+        Arguments:
+        headers (list) - headers from read_header
+        """
+        if len(headers) < 1:
+            return
+        paths = [h['path'] for h in headers]
+        with self._db:
+            for table in ['files', 'dims', 'variables']:
+                for n in range(0, len(paths), BATCH):
+                    batch = paths[n:n+BATCH]
+                    self._db.execute('DELETE FROM {0} WHERE path IN ({1})'.format(table, ','.join('?' * len(batch))), batch)
+            self._db.executemany('INSERT INTO files VALUES (?, ?, ?, ?)',
+                                 [(h['path'], h['mtime'], h['size'], h['time_period_freq']) for h in headers])
+            self._db.executemany('INSERT INTO dims VALUES (?, ?, ?)',
+                                 [(h['path'], name, size) for h in headers for name,size in h['dimensions'].items()])
+            self._db.executemany('INSERT INTO variables VALUES (?, ?, ?, ?)',
+                                 [(h['path'], name, ','.join(v['dimensions']), v['coordinates'])
+                                  for h in headers for name,v in h['variables'].items()])
+
+    def prune(self, root_dir, keep):
+        """ remove the files under root_dir that are not in keep, the ones deleted from the archive
+
+        Arguments:
+        root_dir (string) - the directory that was searched
+        keep (list) - the file names found under root_dir
+
+        Return:
+        removed (int) - the number of files removed from the catalog
+        """
+        keep = set(keep)
+        prefix = root_dir.rstrip('/') + '/'
+        gone = [path for (path,) in self._db.execute('SELECT path FROM files') if path.startswith(prefix) and path not in keep]
+        with self._db:
+            for table in ['files', 'dims', 'variables']:
+                for n in range(0, len(gone), BATCH):
+                    batch = gone[n:n+BATCH]
+                    self._db.execute('DELETE FROM {0} WHERE path IN ({1})'.format(table, ','.join('?' * len(batch))), batch)
+        return len(gone)
+
+
+def get_headers(catalog, paths):
+    """ return the headers of files from the catalog, reading the ones that are missing or changed
+
+    Arguments:
+    catalog (Catalog) - the catalog, None to read every file
+    paths (list) - file names
+
+    Return:
+    headers (list) - the header of every file in paths, in the same order
+    new_headers (list) - the headers that were read from the files and should be added to the catalog
+    """
+    known = catalog.lookup(paths) if catalog is not None else dict()
+    headers = []
+    new_headers = []
+    for fn in paths:
+        if fn in known:
+            headers.append(known[fn])
+        else:
+            h = read_header(fn)
+            headers.append(h)
+            new_headers.append(h)
+    return headers,new_headers
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+"""Per-stage timing and I/O instrumentation shared by the post processing generators
+
+Each rank records the wall time, MPI wait time, bytes read and written and
+files opened for every stage of a run and every work item within a stage
+(a specifier, a json table, a remap file, ...).  At the end of the run the
+records of all ranks are gathered on rank 0 and written to a JSON summary
+and a CSV file with one row per record.
+
+Bytes are taken from the process I/O counters in /proc/self/io where they
+exist, so reads and writes made inside the netCDF library are counted.  On
+systems without them, the bytes declared by the caller with add_files are
+used instead.
+
+Usage:
+    timing = perfLib.Instrument('ocn_avg_generator', main_comm)
+    with timing.stage('average', item='tavg:1:10'):
+        ...
+        with timing.wait():
+            main_comm.sync()
+    timing.write_summary('{0}/logs'.format(caseroot))
+__________________________
+Created on Oct, 2026
+
+@author: CSEG <cseg@cgd.ucar.edu>
+"""
+
+from __future__ import print_function
+
+import contextlib
+import csv
+import datetime
+import json
+import os
+import time
+
+# simplecomm tag used to gather the records on rank 0
+PERF_TAG = 97
+
+# columns of the csv file, in order
+FIELDS = ['rank', 'stage', 'item', 'depth', 'start', 'wall', 'wait',
+          'bytes_read', 'bytes_written', 'files_read', 'files_written']
+
+_active = None
+
+def io_counters():
+    """ return the (bytes read, bytes written) by this process so far from /proc/self/io,
+        or None if the counters are not available
+    """
+    try:
+        with open('/proc/self/io', 'r') as f:
+            counters = dict(line.split(':') for line in f if ':' in line)
+        return int(counters['rchar']), int(counters['wchar'])
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+
+
+def file_bytes(files):
+    """ return the total size in bytes of the files that exist
+    """
+    nbytes = 0
+    for fn in files:
+        try:
+            nbytes = nbytes + os.path.getsize(fn)
+        except OSError:
+            pass
+    return nbytes
+
+
+def active():
+    """ return the instrument of this run, a disabled one if none was created
+    """
+    global _active
+    if _active is None:
+        _active = Instrument(None)
+    return _active
+
+
+class Instrument(object):
+    """ records the stages of a run on one rank
+    """
+
+    def __init__(self, name, comm=None):
+        """
+        Arguments:
+        name (string) - the name of the generator, None to disable the instrument
+        comm (simplecomm) - the communicator of all ranks taking part in the run
+        """
+        global _active
+        self._name = name
+        self._comm = comm
+        self._rank = comm.get_rank() if comm is not None else 0
+        self._t0 = time.time()
+        self._records = list()
+        self._open = list()
+        if name is not None:
+            _active = self
+
+    def enabled(self):
+        return self._name is not None
+
+    def start(self, stage, item=''):
+        """ start timing a stage, stages may be nested
+        """
+        if not self.enabled():
+            return
+        self._open.append({'rank': self._rank, 'stage': stage, 'item': str(item),
+                           'depth': len(self._open), 'start': time.time() - self._t0,
+                           'wait': 0.0, 'files_read': 0, 'files_written': 0,
+                           'declared_read': 0, 'declared_written': 0,
+                           'io': io_counters()})
+
+    def stop(self):
+        """ stop timing the innermost open stage and keep its record
+        """
+        if not self.enabled() or len(self._open) < 1:
+            return
+        r = self._open.pop()
+        r['wall'] = time.time() - self._t0 - r['start']
+        io = io_counters()
+        if r['io'] is not None and io is not None:
+            r['bytes_read'] = io[0] - r['io'][0]
+            r['bytes_written'] = io[1] - r['io'][1]
+        else:
+            r['bytes_read'] = r['declared_read']
+            r['bytes_written'] = r['declared_written']
+        self._records.append(dict((k, r[k]) for k in FIELDS))
+
+    @contextlib.contextmanager
+    def stage(self, stage, item=''):
+        """ time the body of a with statement as a stage
+        """
+        self.start(stage, item)
+        try:
+            yield self
+        finally:
+            self.stop()
+
+    @contextlib.contextmanager
+    def wait(self):
+        """ count the body of a with statement as MPI wait time in all open stages
+        """
+        start = time.time()
+        try:
+            yield self
+        finally:
+            waited = time.time() - start
+            for r in self._open:
+                r['wait'] = r['wait'] + waited
+
+    def sync(self, comm):
+        """ barrier on comm, counted as wait time
+        """
+        with self.wait():
+            comm.sync()
+
+    def add_files(self, read=None, written=None):
+        """ count the files opened in all open stages
+
+        Arguments:
+        read (list) - names of the files opened for reading
+        written (list) - names of the files written
+        """
+        read = read if read is not None else []
+        written = written if written is not None else []
+        nread = file_bytes(read) if len(read) > 0 else 0
+        nwritten = file_bytes(written) if len(written) > 0 else 0
+        for r in self._open:
+            r['files_read'] = r['files_read'] + len(read)
+            r['files_written'] = r['files_written'] + len(written)
+            r['declared_read'] = r['declared_read'] + nread
+            r['declared_written'] = r['declared_written'] + nwritten
+
+    def records(self):
+        return list(self._records)
+
+    def write_summary(self, log_dir):
+        """ gather the records of all ranks and write the summary files on rank 0.
+            Every rank of the communicator must call this.
+
+        Arguments:
+        log_dir (string) - directory to write <name>.timing.<date>.json and .csv to
+
+        Return:
+        summary (dictionary) - the summary on rank 0, None on the other ranks
+        """
+        if not self.enabled():
+            return None
+        while len(self._open) > 0:
+            self.stop()
+        self._records.append({'rank': self._rank, 'stage': 'total', 'item': '', 'depth': -1,
+                              'start': 0.0, 'wall': time.time() - self._t0, 'wait': 0.0,
+                              'bytes_read': 0, 'bytes_written': 0, 'files_read': 0, 'files_written': 0})
+
+        records = list(self._records)
+        size = self._comm.get_size() if self._comm is not None else 1
+        if size > 1:
+            if self._rank == 0:
+                for i in range(1, size):
+                    r,l_records = self._comm.collect(data=None, tag=PERF_TAG)
+                    records.extend(l_records)
+            else:
+                self._comm.collect(data=self._records, tag=PERF_TAG)
+                return None
+
+        summary = summarize(self._name, size, records)
+        stamp = datetime.datetime.now().strftime('%Y-%m-%d_%H%M%S')
+        prefix = '{0}/{1}.timing.{2}'.format(log_dir, self._name, stamp)
+        try:
+            if not os.path.isdir(log_dir):
+                os.makedirs(log_dir)
+            with open(prefix+'.json', 'w') as f:
+                json.dump(summary, f, indent=1)
+            with open(prefix+'.csv', 'w') as f:
+                writer = csv.DictWriter(f, fieldnames=FIELDS)
+                writer.writeheader()
+                for r in sorted(records, key=lambda r: (r['rank'], r['start'])):
+                    writer.writerow(r)
+            print('{0} timing summary written to {1}.json and .csv'.format(self._name, prefix))
+        except (IOError, OSError) as error:
+            print('WARNING: unable to write timing summary {0}: {1}'.format(prefix, error))
+        print_summary(summary)
+        return summary
+
+
+def summarize(name, size, records):
+    """ reduce the records of all ranks to per rank and per stage totals
+
+    Arguments:
+    name (string) - the name of the generator
+    size (int) - the number of ranks
+    records (list) - the records of all ranks
+
+    Return:
+    summary (dictionary) - 'ranks' totals of the top level stages of each rank,
+                           'stages' totals over all ranks of each stage name, with the
+                           imbalance as the slowest rank over the mean rank time,
+                           and all the 'records'
+    """
+    ranks = dict()
+    for n in range(size):
+        ranks[n] = {'rank': n, 'wall': 0.0, 'busy': 0.0, 'wait': 0.0, 'bytes_read': 0, 'bytes_written': 0,
+                    'files_read': 0, 'files_written': 0}
+    stages = dict()
+    for r in records:
+        t = ranks.setdefault(r['rank'], {'rank': r['rank'], 'wall': 0.0, 'busy': 0.0, 'wait': 0.0, 'bytes_read': 0,
+                                         'bytes_written': 0, 'files_read': 0, 'files_written': 0})
+        if r['depth'] == -1:
+            t['wall'] = r['wall']
+            continue
+        if r['depth'] == 0:
+            t['busy'] = t['busy'] + r['wall'] - r['wait']
+            for key in ['wait', 'bytes_read', 'bytes_written', 'files_read', 'files_written']:
+                t[key] = t[key] + r[key]
+        s = stages.setdefault(r['stage'], {'count': 0, 'wall': 0.0, 'wait': 0.0, 'bytes_read': 0,
+                                           'bytes_written': 0, 'files_read': 0, 'files_written': 0,
+                                           'rank_wall': dict()})
+        s['count'] = s['count'] + 1
+        for key in ['wall', 'wait', 'bytes_read', 'bytes_written', 'files_read', 'files_written']:
+            s[key] = s[key] + r[key]
+        s['rank_wall'][r['rank']] = s['rank_wall'].get(r['rank'], 0.0) + r['wall']
+
+    for name_s,s in stages.items():
+        rank_wall = list(s.pop('rank_wall').values())
+        mean = s['wall'] / max(len(rank_wall), 1)
+        s['ranks'] = len(rank_wall)
+        s['max_rank_wall'] = max(rank_wall) if len(rank_wall) > 0 else 0.0
+        s['imbalance'] = s['max_rank_wall'] / mean if mean > 0 else 1.0
+        s['wait_fraction'] = s['wait'] / s['wall'] if s['wall'] > 0 else 0.0
+        s['read_rate'] = s['bytes_read'] / s['wall'] if s['wall'] > 0 else 0.0
+
+    return {'name': name, 'size': size,
+            'wall': max([t['wall'] for t in ranks.values()] + [0.0]),
+            'ranks': [ranks[n] for n in sorted(ranks)],
+            'stages': stages,
+            'records': records}
+
+
+def print_summary(summary):
+    """ print the per stage totals of a summary
+    """
+    print('{0:<24} {1:>7} {2:>12} {3:>10} {4:>10} {5:>14} {6:>14}'.format(
+        'stage', 'count', 'wall (s)', 'wait %', 'imbalance', 'bytes read', 'bytes written'))
+    for stage,s in sorted(summary['stages'].items()):
+        print('{0:<24} {1:>7} {2:>12.1f} {3:>10.1f} {4:>10.2f} {5:>14} {6:>14}'.format(
+            stage, s['count'], s['wall'], 100.0 * s['wait_fraction'], s['imbalance'],
+            s['bytes_read'], s['bytes_written']))
+    print('{0} wall time {1:.1f} seconds on {2} ranks'.format(summary['name'], summary['wall'], summary['size']))
@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+"""Load large read-only objects once per node into shared memory
+
+Objects built from a file, such as the remap weight matrices, are loaded by
+one rank on each node.  Their large numpy arrays (including the data,
+indices and indptr arrays of sparse matrices) are copied into one MPI shared
+memory window, and every rank on the node gets the same object with its
+arrays mapped read-only from the window instead of its own copy.
+
+The arrays and the rest of the object are also cached next to the source
+file as <file>.cache.npz, checked against the modification time and size of
+the source, so later runs skip parsing it.  The cache holds only plain arrays
+and a JSON description of the object, it is read without pickle and the
+object is rebuilt only from classes of modules that are already imported.
+On a miss the first rank of the communicator writes the cache while the
+other nodes load the source themselves.
+
+Usage:
+    matrix = shmLib.load_shared(weights_fname, remap.ocean_remap, main_comm)
+__________________________
+Created on Oct, 2026
+
+@author: CSEG <cseg@cgd.ucar.edu>
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import sys
+import zipfile
+
+import numpy as np
+
+CACHE_SUFFIX = '.cache.npz'
+
+# bump when the cache layout changes
+CACHE_VERSION = 2
+
+# smaller arrays stay with the rest of the object
+MIN_BYTES = 1 << 16
+
+# offsets of the arrays in the shared window
+ALIGN = 64
+
+# the shared windows stay allocated while their arrays are in use
+_windows = []
+
+class SharedArray(object):
+    """ placeholder for an array detached from an object
+    """
+    __slots__ = ['index']
+
+    def __init__(self, index):
+        self.index = index
+
+
+def _walk(obj, replace, visited):
+    """ replace the values of the dictionaries, lists and object attributes under obj
+    """
+    if isinstance(obj, dict):
+        for k,v in list(obj.items()):
+            obj[k] = replace(v)
+            _walk(obj[k], replace, visited)
+    elif isinstance(obj, list):
+        for i,v in enumerate(obj):
+            obj[i] = replace(v)
+            _walk(obj[i], replace, visited)
+    elif hasattr(obj, '__dict__') and not isinstance(obj, type) and id(obj) not in visited:
+        visited.add(id(obj))
+        try:
+            attributes = vars(obj)
+        except TypeError:
+            return
+        _walk(attributes, replace, visited)
+
+
+def detach(obj, min_bytes=MIN_BYTES):
+    """ replace the large numpy arrays in an object with SharedArray placeholders
+
+    Arguments:
+    obj (object) - the object, changed in place
+    min_bytes (int) - the smallest array to detach
+
+    Return:
+    obj (object) - the object with placeholders
+    arrays (list) - the detached arrays, by placeholder index
+    """
+    arrays = []
+    found = dict()
+    def replace(v):
+        if type(v) is np.ndarray and not v.dtype.hasobject and v.nbytes >= min_bytes:
+            if id(v) not in found:
+                arrays.append(v)
+                found[id(v)] = SharedArray(len(arrays) - 1)
+            return found[id(v)]
+        return v
+    _walk(obj, replace, set())
+    return obj, arrays
+
+
+def attach(obj, arrays):
+    """ put the arrays back in place of their SharedArray placeholders
+    """
+    def replace(v):
+        if isinstance(v, SharedArray):
+            return arrays[v.index]
+        return v
+    _walk(obj, replace, set())
+    return obj
+
+
+def encode(obj, small):
+    """ the JSON form of an object with placeholders.  Dictionaries, lists, tuples,
+    numbers, strings and the attributes of plain objects are kept, the arrays left
+    in the object are appended to small.
+
+    Arguments:
+    obj (object) - the object with placeholders
+    small (list) - the arrays that stay with the object, appended to
+
+    Return:
+    value - the JSON value
+    """
+    return _encode(obj, small, set())
+
+
+def _encode(obj, small, parents):
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, SharedArray):
+        return {'shared': obj.index}
+    if isinstance(obj, np.generic) and not obj.dtype.hasobject:
+        small.append(np.asarray(obj))
+        return {'array': len(small) - 1, 'scalar': True}
+    if isinstance(obj, np.ndarray):
+        if type(obj) is not np.ndarray or obj.dtype.hasobject:
+            raise TypeError('{0} arrays can not be cached'.format(type(obj).__name__))
+        small.append(obj)
+        return {'array': len(small) - 1}
+    if id(obj) in parents:
+        raise TypeError('{0} refers to itself'.format(type(obj).__name__))
+    parents.add(id(obj))
+    if isinstance(obj, list):
+        value = [_encode(v, small, parents) for v in obj]
+    elif isinstance(obj, tuple):
+        value = {'tuple': [_encode(v, small, parents) for v in obj]}
+    elif isinstance(obj, dict):
+        value = {'dict': [[_encode(k, small, parents), _encode(v, small, parents)] for k,v in obj.items()]}
+    elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+        cls = type(obj)
+        value = {'object': '{0}:{1}'.format(cls.__module__, cls.__qualname__),
+                 'attributes': _encode(vars(obj), small, parents)}
+    else:
+        raise TypeError('{0} can not be cached'.format(type(obj).__name__))
+    parents.remove(id(obj))
+    return value
+
+
+def find_class(name):
+    """ the class of an encoded object.  Only classes of modules this process has
+    already imported are used, nothing is imported or called to rebuild a cache.
+    """
+    module,qualname = name.split(':')
+    cls = sys.modules.get(module)
+    if cls is None:
+        raise ValueError('module {0} is not imported'.format(module))
+    for attr in qualname.split('.'):
+        cls = getattr(cls, attr)
+    if not isinstance(cls, type):
+        raise ValueError('{0} is not a class'.format(name))
+    return cls
+
+
+def decode(value, small, arrays):
+    """ rebuild an object from its JSON form, its small arrays and the detached arrays
+    """
+    if isinstance(value, list):
+        return [decode(v, small, arrays) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if 'shared' in value:
+        return arrays[value['shared']]
+    if 'array' in value:
+        a = small[value['array']]
+        return a[()] if value.get('scalar') else a
+    if 'tuple' in value:
+        return tuple(decode(v, small, arrays) for v in value['tuple'])
+    if 'dict' in value:
+        return dict((decode(k, small, arrays), decode(v, small, arrays)) for k,v in value['dict'])
+    obj = object.__new__(find_class(value['object']))
+    obj.__dict__.update(decode(value['attributes'], small, arrays))
+    return obj
+
+
+def read_cache(fn):
+    """ read the cached object of a file
+
+    Arguments:
+    fn (string) - the source file name
+
+    Return:
+    (skeleton, small, arrays) - the JSON form of the object, its small arrays and its detached arrays,
+                                None if there is no cache or the source changed since it was written
+    """
+    cache_fn = fn + CACHE_SUFFIX
+    if not os.path.isfile(cache_fn):
+        return None
+    try:
+        st = os.stat(fn)
+        with np.load(cache_fn, allow_pickle=False) as z:
+            meta = json.loads(z['meta'].tobytes().decode('utf-8'))
+            if meta['version'] != CACHE_VERSION or meta['mtime'] != st.st_mtime or meta['size'] != st.st_size:
+                return None
+            arrays = [z['a{0}'.format(i)] for i in range(meta['narrays'])]
+            small = [z['s{0}'.format(i)] for i in range(meta['nsmall'])]
+            skeleton = z['skeleton'].tobytes().decode('utf-8')
+    except (IOError, OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+        print('WARNING: unable to read {0} - {1}'.format(cache_fn, e))
+        return None
+    return skeleton, small, arrays
+
+
+def write_cache(fn, skeleton, small, arrays):
+    """ write the object of a file next to it through a temporary file, a read-only
+    directory is not an error
+    """
+    cache_fn = fn + CACHE_SUFFIX
+    st = os.stat(fn)
+    meta = {'version': CACHE_VERSION, 'mtime': st.st_mtime, 'size': st.st_size,
+            'narrays': len(arrays), 'nsmall': len(small)}
+    data = dict(('a{0}'.format(i), a) for i,a in enumerate(arrays))
+    data.update(('s{0}'.format(i), a) for i,a in enumerate(small))
+    data['meta'] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+    data['skeleton'] = np.frombuffer(skeleton.encode('utf-8'), dtype=np.uint8)
+    tmp_fn = '{0}.tmp.{1}.npz'.format(cache_fn, os.getpid())
+    try:
+        np.savez(tmp_fn, **data)
+        os.replace(tmp_fn, cache_fn)
+    except (IOError, OSError) as e:
+        print('WARNING: unable to write {0} - {1}'.format(cache_fn, e))
+        if os.path.isfile(tmp_fn):
+            os.remove(tmp_fn)
+
+
+def load_cached(fn, loader, write=True):
+    """ load the object of a file from its cache, or with loader and cache it
+
+    Arguments:
+    fn (string) - the source file name
+    loader (function) - builds the object from fn
+    write (bool) - write the cache if it is missing or out of date
+
+    Return:
+    skeleton (string) - the JSON form of the object, None if it can not be encoded
+    small (list) - the arrays that stay with the object
+    arrays (list) - the detached arrays
+    obj (object) - the object if it could not be encoded, else None
+    """
+    cached = read_cache(fn)
+    if cached is not None:
+        skeleton,small,arrays = cached
+        try:
+            decode(json.loads(skeleton), small, arrays)
+            return skeleton, small, arrays, None
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+            print('WARNING: unable to rebuild {0} from its cache - {1}'.format(fn, e))
+    obj,arrays = detach(loader(fn))
+    small = []
+    try:
+        skeleton = json.dumps(encode(obj, small))
+    except (TypeError, ValueError) as e:
+        print('WARNING: {0} can not be cached or shared - {1}'.format(fn, e))
+        return None, None, None, attach(obj, arrays)
+    if write:
+        write_cache(fn, skeleton, small, arrays)
+    return skeleton, small, arrays, None
+
+
+def load_shared(fn, loader, comm=None):
+    """ load the object of a file once per node and share its arrays with the ranks on the node.
+    Every rank of comm must call this.
+
+    Arguments:
+    fn (string) - the source file name
+    loader (function) - builds the object from fn, called on one rank per node if there is no cache
+    comm (simplecomm) - the communicator, None to load on this rank only
+
+    Return:
+    obj (object) - the object, its large arrays are read-only
+    """
+    if comm is None or comm.get_size() == 1:
+        skeleton,small,arrays,obj = load_cached(fn, loader)
+        if obj is not None:
+            return obj
+        return decode(json.loads(skeleton), small, arrays)
+
+    from mpi4py import MPI
+
+    # simplecomm does not split by node, use its mpi4py communicator
+    node = comm._comm.Split_type(MPI.COMM_TYPE_SHARED)
+    node_rank = node.Get_rank()
+    layout = None
+    if node_rank == 0:
+        # rank 0 of comm is the first rank of its node, only it writes the cache
+        # so the nodes do not all write the same file
+        skeleton,small,arrays,obj = load_cached(fn, loader, write=comm.get_rank() == 0)
+        if obj is None:
+            offsets = []
+            total = 0
+            for a in arrays:
+                offsets.append((total, a.shape, a.dtype.str))
+                total = total + (a.nbytes + ALIGN - 1) // ALIGN * ALIGN
+            layout = (skeleton, small, offsets, total)
+    layout = node.bcast(layout, root=0)
+    if layout is None:
+        # the object can not be shared, every rank loads its own
+        node.Free()
+        return obj if node_rank == 0 else loader(fn)
+
+    skeleton,small,offsets,total = layout
+    if total == 0:
+        node.Free()
+        return decode(json.loads(skeleton), small, [])
+    win = MPI.Win.Allocate_shared(total if node_rank == 0 else 0, 1, comm=node)
+    buf,itemsize = win.Shared_query(0)
+    mem = np.ndarray(buffer=buf, dtype=np.uint8, shape=(total,))
+    views = []
+    for offset,shape,dtype in offsets:
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        views.append(mem[offset:offset+nbytes].view(dtype).reshape(shape))
+    win.Fence()
+    if node_rank == 0:
+        for v,a in zip(views, arrays):
+            v[...] = a
+        del arrays
+    win.Fence()
+    for v in views:
+        v.flags.writeable = False
+    _windows.append(win)
+    return decode(json.loads(skeleton), small, views)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Unit test suite for the archive walker and file table
+"""
+from __future__ import print_function
+
+import fnmatch
+import os
+import shutil
+import tempfile
+import unittest
+
+from asaptools import simplecomm
+
+from cesm_utils import archiveLib
+
+def touch(fn):
+    if not os.path.isdir(os.path.dirname(fn)):
+        os.makedirs(os.path.dirname(fn))
+    open(fn, 'w').close()
+
+
+class test_archiveLib(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for comp,stream,var in [('ocn', 'pop.h', 'TEMP'), ('ocn', 'pop.h', 'SALT'), ('atm', 'cam.h0', 'TS')]:
+            touch(os.path.join(self.tmp_dir, comp, 'proc', 'tseries', 'month_1',
+                               'case.{0}.{1}.000101-001012.nc'.format(stream, var)))
+            touch(os.path.join(self.tmp_dir, comp, 'hist', 'case.{0}.0001-01.nc'.format(stream)))
+        touch(os.path.join(self.tmp_dir, 'atm', 'proc', 'tseries', 'day_1', 'case.cam.h1.TS.00010101-00101231.nc'))
+        touch(os.path.join(self.tmp_dir, 'atm', 'proc', 'tseries', 'day_1', 'notes.txt'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_walk(self):
+        """ test to see if the walk finds the files os.walk finds and prunes to the time series
+        """
+        expected = []
+        for root,dirs,fns in os.walk(self.tmp_dir):
+            for fn in fnmatch.filter(fns, '*.nc'):
+                expected.append(os.path.join(root, fn))
+        self.assertEqual(archiveLib.walk([self.tmp_dir], threads=3), sorted(expected))
+
+        comm = simplecomm.create_comm(serial=True)
+        files = archiveLib.find(self.tmp_dir, levels=archiveLib.TSERIES_LEVELS, comm=comm)
+        self.assertEqual(files, sorted(fn for fn in expected if 'tseries' in fn))
+        self.assertEqual(len(files), 4)
+        self.assertEqual(archiveLib.find(self.tmp_dir, levels=['ocn', 'proc', 'tseries'], exclude=['*SALT*']),
+                         [fn for fn in files if 'TEMP' in fn])
+
+    def test_frontier(self):
+        """ test to see if the scan goes down to the depth with enough directories to share
+        """
+        files,dirs,depth = archiveLib.frontier(self.tmp_dir, levels=archiveLib.TSERIES_LEVELS, ndirs=3)
+        self.assertEqual(depth, 4)
+        self.assertEqual([os.path.basename(d) for d in dirs], ['day_1', 'month_1', 'month_1'])
+        self.assertEqual(files, [])
+
+        files,dirs,depth = archiveLib.frontier(self.tmp_dir, levels=archiveLib.TSERIES_LEVELS, ndirs=100)
+        self.assertEqual(dirs, [])
+        self.assertEqual(len(files), 4)
+
+    def test_fileTable(self):
+        """ test to see if the file table is queried by the fields of the file names
+        """
+        table = archiveLib.FileTable(archiveLib.find(self.tmp_dir, levels=archiveLib.TSERIES_LEVELS),
+                                     archiveLib.tseries_fields)
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table.values('frequency'), ['day_1', 'month_1'])
+        self.assertEqual([os.path.basename(fn) for fn in table.query(variable='TS', frequency='month_1')],
+                         ['case.cam.h0.TS.000101-001012.nc'])
+        self.assertEqual(len(table.query(variable='TS')), 2)
+        self.assertEqual(table.query(variable='PS'), [])
+        self.assertEqual(table.query(), table.files)
+
+        cmip = archiveLib.FileTable(['/a/thetao_Omon_CESM2_historical_r1i1p1f1_gn_185001-201412.nc',
+                                     '/a/tos_Omon_CESM2_historical_r1i1p1f1_gn_185001-201412.nc',
+                                     '/b/thetao_Oyr_CESM2_historical_r1i1p1f1_gn_1850-2014.nc'],
+                                    archiveLib.cmip_fields)
+        self.assertEqual(cmip.query(variable='thetao', table='Omon'),
+                         ['/a/thetao_Omon_CESM2_historical_r1i1p1f1_gn_185001-201412.nc'])
+        self.assertEqual(cmip.values('grid'), ['gn'])
+
+if __name__ == '__main__':
+    unittest.main()
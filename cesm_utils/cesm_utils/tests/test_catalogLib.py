@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Unit test suite for the time series header catalog
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+import netCDF4 as nc
+
+from cesm_utils import catalogLib
+
+def write_tseries(fn, var, nlat=3):
+    f = nc.Dataset(fn, 'w')
+    f.time_period_freq = 'month_1'
+    f.createDimension('time', None)
+    f.createDimension('nlat', nlat)
+    f.createDimension('nlon', 4)
+    f.createVariable('time', 'f8', ('time',))
+    v = f.createVariable(var, 'f4', ('time', 'nlat', 'nlon'))
+    v.coordinates = 'TLONG TLAT time'
+    f.close()
+
+
+class test_catalogLib(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_fn = os.path.join(self.tmp_dir, 'logs', 'tseries_catalog.db')
+        self.files = [os.path.join(self.tmp_dir, 'case.pop.h.{0}.000101-000112.nc'.format(v)) for v in ['TEMP', 'SALT']]
+        for fn in self.files:
+            write_tseries(fn, fn.split('.')[-3])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_roundTrip(self):
+        """ test to see if the catalogued header is the same as the one read from the file
+        """
+        catalog = catalogLib.Catalog(self.db_fn)
+        headers,new_headers = catalogLib.get_headers(catalog, self.files)
+        self.assertEqual(len(new_headers), 2)
+        catalog.add(new_headers)
+        catalog.close()
+
+        catalog = catalogLib.Catalog(self.db_fn)
+        cached,new_headers = catalogLib.get_headers(catalog, self.files)
+        catalog.close()
+        self.assertEqual(new_headers, [])
+        self.assertEqual(cached, headers)
+        self.assertEqual(cached[0]['variables']['TEMP'], {'dimensions': ['time', 'nlat', 'nlon'],
+                                                          'coordinates': 'TLONG TLAT time'})
+        self.assertEqual(cached[0]['variables']['time']['coordinates'], None)
+        self.assertEqual(cached[1]['dimensions'], {'time': 0, 'nlat': 3, 'nlon': 4})
+        self.assertEqual(cached[1]['time_period_freq'], 'month_1')
+
+    def test_changedFiles(self):
+        """ test to see if rewritten files are read again and deleted files are pruned
+        """
+        catalog = catalogLib.Catalog(self.db_fn)
+        catalog.add(catalogLib.get_headers(catalog, self.files)[1])
+        time.sleep(0.01)
+        write_tseries(self.files[0], 'TEMP', nlat=5)
+        headers,new_headers = catalogLib.get_headers(catalog, self.files)
+        self.assertEqual([h['path'] for h in new_headers], [self.files[0]])
+        self.assertEqual(headers[0]['dimensions']['nlat'], 5)
+        catalog.add(new_headers)
+
+        self.assertEqual(catalog.prune(self.tmp_dir, self.files[:1]), 1)
+        self.assertEqual(list(catalog.lookup(self.files).keys()), [self.files[0]])
+        catalog.close()
+    def test_readonly(self):
+        """ test to see if a read-only catalog is used for lookups and is not changed
+        """
+        self.assertRaises(sqlite3.Error, catalogLib.Catalog, self.db_fn, readonly=True)
+        self.assertFalse(os.path.exists(self.db_fn))
+
+        catalog = catalogLib.Catalog(self.db_fn)
+        catalog.add(catalogLib.get_headers(catalog, self.files[:1])[1])
+        catalog.close()
+        mtime = os.stat(self.db_fn).st_mtime
+
+        catalog = catalogLib.Catalog(self.db_fn, readonly=True)
+        headers,new_headers = catalogLib.get_headers(catalog, self.files)
+        self.assertEqual([h['path'] for h in new_headers], [self.files[1]])
+        self.assertEqual(len(headers), 2)
+        self.assertRaises(sqlite3.OperationalError, catalog.add, new_headers)
+        catalog.close()
+        self.assertEqual(os.stat(self.db_fn).st_mtime, mtime)
+
+        # a catalog of another schema is not rebuilt
+        db = sqlite3.connect(self.db_fn)
+        db.execute('PRAGMA user_version = {0}'.format(catalogLib.SCHEMA_VERSION + 1))
+        db.close()
+        self.assertRaises(sqlite3.DatabaseError, catalogLib.Catalog, self.db_fn, readonly=True)
+
+if __name__ == '__main__':
+    unittest.main()
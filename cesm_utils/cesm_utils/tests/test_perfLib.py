@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Unit test suite for the per-stage timing instrumentation
+"""
+from __future__ import print_function
+
+import csv
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from cesm_utils import perfLib
+
+class test_perfLib(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_nestedStages(self):
+        """ test to see if wait time and files are counted in all open stages
+        """
+        timing = perfLib.Instrument('test')
+        with timing.stage('outer'):
+            with timing.stage('inner', item='a'):
+                with timing.wait():
+                    time.sleep(0.05)
+                timing.add_files(read=[__file__])
+        records = timing.records()
+        self.assertEqual([r['stage'] for r in records], ['inner', 'outer'])
+        self.assertEqual([r['depth'] for r in records], [1, 0])
+        for r in records:
+            self.assertGreaterEqual(r['wait'], 0.05)
+            self.assertGreaterEqual(r['wall'], r['wait'])
+            self.assertEqual(r['files_read'], 1)
+        self.assertEqual(records[0]['item'], 'a')
+
+    def test_summary(self):
+        """ test to see if the summary adds up the top level stages of each rank
+        """
+        def record(rank, stage, depth, wall, wait, nbytes):
+            return {'rank': rank, 'stage': stage, 'item': '', 'depth': depth, 'start': 0.0,
+                    'wall': wall, 'wait': wait, 'bytes_read': nbytes, 'bytes_written': 0,
+                    'files_read': 1, 'files_written': 0}
+        records = [record(0, 'convert', 0, 10.0, 1.0, 100),
+                   record(0, 'convert', 0, 20.0, 0.0, 100),
+                   record(1, 'convert', 0, 10.0, 9.0, 100),
+                   record(1, 'read', 1, 5.0, 0.0, 50),
+                   record(0, 'total', -1, 31.0, 0.0, 0),
+                   record(1, 'total', -1, 32.0, 0.0, 0)]
+        summary = perfLib.summarize('test', 2, records)
+        self.assertEqual(summary['wall'], 32.0)
+        self.assertEqual(summary['ranks'][0]['busy'], 29.0)
+        self.assertEqual(summary['ranks'][1]['wait'], 9.0)
+        self.assertEqual(summary['ranks'][1]['bytes_read'], 100)
+        convert = summary['stages']['convert']
+        self.assertEqual(convert['count'], 3)
+        self.assertEqual(convert['ranks'], 2)
+        self.assertAlmostEqual(convert['imbalance'], 1.5)
+        self.assertAlmostEqual(convert['wait_fraction'], 0.25)
+        self.assertEqual(summary['stages']['read']['bytes_read'], 50)
+
+    def test_writeSummary(self):
+        """ test to see if the json and csv files are written
+        """
+        timing = perfLib.Instrument('test')
+        with timing.stage('work'):
+            pass
+        timing.write_summary(self.tmp_dir)
+        json_files = glob.glob(os.path.join(self.tmp_dir, 'test.timing.*.json'))
+        csv_files = glob.glob(os.path.join(self.tmp_dir, 'test.timing.*.csv'))
+        self.assertEqual(len(json_files), 1)
+        self.assertEqual(len(csv_files), 1)
+        with open(json_files[0]) as f:
+            summary = json.load(f)
+        self.assertIn('work', summary['stages'])
+        with open(csv_files[0]) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([r['stage'] for r in rows], ['total', 'work'])
+
+if __name__ == '__main__':
+    unittest.main()
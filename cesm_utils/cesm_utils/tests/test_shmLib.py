@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Unit test suite for the shared and cached read-only objects
+"""
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from cesm_utils import shmLib
+
+class Weights(object):
+    """ stands in for a remap matrix read from a weight file
+    """
+    loads = 0
+
+    def __init__(self, fn):
+        Weights.loads = Weights.loads + 1
+        with open(fn, 'r') as f:
+            n = int(f.read())
+        self.matrix = {'data': np.arange(n, dtype='f8'), 'indptr': np.arange(n + 1, dtype='i4')}
+        self.alias = self.matrix['data']
+        self.grid = [np.zeros(3), 'gx1v7']
+
+
+class test_shmLib(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.tmp_dir, 'map_gx1v7_to_1x1.nc')
+        with open(self.fn, 'w') as f:
+            f.write('20000')
+        Weights.loads = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_detach(self):
+        """ test to see if only the large arrays are detached, once each, and attached back
+        """
+        w = Weights(self.fn)
+        data = w.matrix['data']
+        obj,arrays = shmLib.detach(w)
+        self.assertEqual(len(arrays), 2)
+        self.assertIs(obj.matrix['data'], obj.alias)
+        self.assertIsInstance(obj.alias, shmLib.SharedArray)
+        self.assertEqual(obj.grid[0].shape, (3,))
+        shmLib.attach(obj, arrays)
+        self.assertIs(obj.alias, data)
+
+    def test_encode(self):
+        """ test to see if an object goes through its JSON form and only known classes are rebuilt
+        """
+        w = Weights(self.fn)
+        w.shape = (4, np.int32(5))
+        w.scale = np.float32(0.5)
+        obj,arrays = shmLib.detach(w)
+        small = []
+        skeleton = json.dumps(shmLib.encode(obj, small))
+        self.assertEqual(len(small), 3)
+        v = shmLib.decode(json.loads(skeleton), small, arrays)
+        self.assertIsInstance(v, Weights)
+        self.assertIs(v.alias, v.matrix['data'])
+        self.assertEqual(v.shape, (4, 5))
+        self.assertEqual(v.scale.dtype, np.float32)
+        self.assertEqual(v.grid[1], 'gx1v7')
+
+        self.assertRaises(ValueError, shmLib.find_class, 'os:system')
+        self.assertRaises(ValueError, shmLib.find_class, 'not_imported_module:Weights')
+        w.parent = w
+        self.assertRaises(TypeError, shmLib.encode, w, [])
+
+    def test_cache(self):
+        """ test to see if the second load comes from the cache and a changed source is loaded again
+        """
+        w = shmLib.load_shared(self.fn, Weights)
+        self.assertTrue(os.path.isfile(self.fn + shmLib.CACHE_SUFFIX))
+        w = shmLib.load_shared(self.fn, Weights)
+        self.assertEqual(Weights.loads, 1)
+        self.assertEqual(w.matrix['data'][-1], 19999.0)
+        self.assertIs(w.alias, w.matrix['data'])
+        self.assertEqual(w.grid[1], 'gx1v7')
+        with np.load(self.fn + shmLib.CACHE_SUFFIX, allow_pickle=False) as z:
+            self.assertEqual(z['skeleton'].dtype, np.uint8)
+
+        time.sleep(0.01)
+        with open(self.fn, 'w') as f:
+            f.write('30000')
+        w = shmLib.load_shared(self.fn, Weights)
+        self.assertEqual(Weights.loads, 2)
+        self.assertEqual(len(w.matrix['indptr']), 30001)
+
+if __name__ == '__main__':
+    unittest.main()
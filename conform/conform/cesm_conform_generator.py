@@ -34,13 +34,17 @@ import sys
 import traceback
 import xml.etree.ElementTree as ET
 import fnmatch
-import subprocess
+import time
 import netCDF4 as nc
 from collections import OrderedDict
 import importlib.util
 from warnings import simplefilter
 
-from cesm_utils import cesmEnvLib
+from cesm_utils import archiveLib, cesmEnvLib, perfLib, catalogLib
+import conform_chunks
+import conform_scheduler
+import conform_vardeps
+import conform_varlist
 
 import json
 from pyconform.datasets import InputDatasetDesc, OutputDatasetDesc
@@ -223,22 +227,84 @@ def readArchiveXML(caseroot, dout_s_root, casename, debug):
                             tseries_output_dir = tseries_output_dir + chunk + '*'
 
 
-def find_nc_files(root_dir):
+def find_nc_files(root_dir, comm=None):
 
-    nc_files = []
-    #streams = []
-    for root, dirs, filenames in os.walk(root_dir):
-       for fn in fnmatch.filter(filenames, '*.nc'):
-           #if 'hist' in root:
-           #    if fn.split('.')[:-2] not in streams:
-           #streams.append(fn.split('.')[:-2])
-           if 'tseries' in root:
-               nc_files.append(os.path.join(root, fn))
-    print ('Found {} in {}'.format(len(nc_files), root_dir))
+    '''
+    Find the time series files, <component>/proc/tseries/<frequency>/*.nc, under root_dir.
+    The walk is shared over the ranks of comm and every rank gets the list.
+    '''
+    nc_files = archiveLib.find(root_dir, levels=archiveLib.TSERIES_LEVELS, comm=comm)
+    if comm is None or comm.get_rank() == 0:
+        print ('Found {} in {}'.format(len(nc_files), root_dir))
     return nc_files
 
-def fill_list(nc_files, root_dir, extra_dir, comm, rank, size):
+def match_dims(header, mt, fvn, v_dims):
+
+    '''
+    Find the names and lengths of the lat, lon and lev coordinates of a variable
+
+    Input:
+    header(dictionary) - the file header from catalogLib
+    mt(string) - the model type, a key of grids
+    fvn(string) - the time series variable of the file, its coordinates attribute names TLAT/ULAT etc.
+    v_dims(list) - the dimensions of the variable
+
+    Output:
+    (lat_name, lon_name, lev_name, lt, ln, lv) - the coordinate names, None if not found,
+                                                 and lengths, "none" if not found
+    '''
+    lt = "none"
+    ln = "none"
+    lv = "none"
+    lat_name = None
+    lon_name = None
+    lev_name = None
+    coordinates = header['variables'][fvn]['coordinates'] if fvn in header['variables'] else None
+    for i in grids[mt]['lat']:
+      if i in v_dims:
+          if 'nlat' in i or 'nj' in i:
+              if coordinates is not None:
+                  if 'LAT' in str(coordinates.split()[1]):
+                      lat_name = str(coordinates.split()[1])
+                  else:
+                      lat_name = 'TLAT'
+              else:
+                  lat_name = 'TLAT'
+          else:
+              lat_name = i
+          lt = header['dimensions'][i]
+    for i in grids[mt]['lon']:
+      if i in v_dims:
+          if 'nlon' in i or 'ni' in i:
+              if coordinates is not None:
+                  if 'LON' in str(coordinates.split()[0]):
+                      lon_name = str(coordinates.split()[0])
+                  else:
+                      lon_name = 'TLONG'
+              else:
+                  lon_name = 'TLONG'
+              if 'ULON' in lon_name:
+                  ln = str(header['dimensions'][i])+"_UGRID"
+              else:
+                  ln = str(header['dimensions'][i])+"_TGRID"
+          else:
+              lon_name = i
+              ln = header['dimensions'][i]
+    for i in grids[mt]['lev']:
+      if i in v_dims:
+          lev_name = i
+          lv = header['dimensions'][i]
+    return lat_name,lon_name,lev_name,lt,ln,lv
+
+def fill_list(nc_files, root_dir, extra_dir, comm, rank, size, catalog_fn=None):
 
+    '''
+    Build the nested dictionary of the time series variables found in the archive,
+    model type -> variable -> time_period_freq -> date -> files and coordinate names.
+    The file headers come from the catalog in catalog_fn, only the files that are not
+    in it or have changed are opened, and rank 0 adds those to the catalog.  Only rank 0
+    opens the catalog, it hands the catalogued headers out with the files.
+    '''
     grds = {
         'atm':'192x288',
         'lnd':'192x288',
@@ -254,9 +320,23 @@ def fill_list(nc_files, root_dir, extra_dir, comm, rank, size):
     gridfile = None
     nc_files.append(extra_dir+"/ocn_constants.nc")
     nc_files.append(extra_dir+"/glc_constants.nc")
-    nc_files_l = comm.partition(nc_files,func=partition.EqualLength(),involved=True)
-    for fn in nc_files_l:
-        f = nc.Dataset(fn, "r")
+    catalog = None
+    known = {}
+    if rank == 0 and catalog_fn is not None:
+        catalog = catalogLib.Catalog(catalog_fn)
+        known = catalog.lookup(nc_files)
+    items = comm.partition([(fn,known.get(fn)) for fn in nc_files],func=partition.EqualLength(),involved=True)
+    nc_files_l = []
+    headers = []
+    new_headers = []
+    for fn,h in items:
+        if h is None:
+            h = catalogLib.read_header(fn)
+            new_headers.append(h)
+        nc_files_l.append(fn)
+        headers.append(h)
+    print('{} of {} file headers read from the catalog'.format(len(headers)-len(new_headers), len(headers)))
+    for fn,h in zip(nc_files_l, headers):
         mt = fn.replace(root_dir,"").split("/")[-5]
         stri = fn
         model_type = mt
@@ -269,7 +349,7 @@ def fill_list(nc_files, root_dir, extra_dir, comm, rank, size):
                 fvn = fvn.replace('_nh','')
         else:
             for c in constants:
-                if c in f.variables.keys():
+                if c in h['variables'].keys():
                     fvn = c
         if "ocn_constants" in fn:
             model_type = "ocn"
@@ -281,56 +361,13 @@ def fill_list(nc_files, root_dir, extra_dir, comm, rank, size):
             model_type = 'lnd,rof'
         if "glc" in model_type:
             model_type = 'glc,lnd'
-        if ("time" not in f.variables.keys() and "tseries" not in fn and "_constants" not in fn):
+        if ("time" not in h['variables'].keys() and "tseries" not in fn and "_constants" not in fn):
             variablelist["skip"] = {}
         else:
-            lt = "none"
-            ln = "none"
-            lv = "none"
-            lat_name = None
-            lon_name = None
-            lev_name = None
             time_name = None
             # Find which dim variables to use
-            v_dims = f.variables[fvn].dimensions
-            for i in grids[mt]['lat']:
-              if i in v_dims:
-                  if 'nlat' in i or 'nj' in i:
-                      if hasattr(f.variables[fvn], 'coordinates'):
-                          if 'LAT' in str(f.variables[fvn].coordinates.split()[1]):
-                              lat_name = str(f.variables[fvn].coordinates.split()[1])
-                          else:
-                              lat_name = 'TLAT'
-                      else:
-                          lat_name = 'TLAT'
-                  else:
-                      lat_name = i
-                  lt = len(f.dimensions[i])
-            for i in grids[mt]['lon']:
-              if i in v_dims:
-                  if 'nlon' in i or 'ni' in i:
-                      if hasattr(f.variables[fvn], 'coordinates'):
-                          if 'LON' in str(f.variables[fvn].coordinates.split()[0]):
-                              lon_name = str(f.variables[fvn].coordinates.split()[0])
-                          else:
-                              lon_name = 'TLONG'
-                      else:
-                          lon_name = 'TLONG'
-                      if 'ULON' in lon_name:
-                          ln = str(len(f.dimensions[i]))+"_UGRID"
-                      else:
-                          ln = str(len(f.dimensions[i]))+"_TGRID"
-                  else:
-                      lon_name = i
-                      ln = len(f.dimensions[i])
-            for i in grids[mt]['lev']:
-              if i in v_dims:
-                  lev_name = i
-                  lv = len(f.dimensions[i])
-#            for i in grids[mt]['time']:
-#              if i in v_dims:
-#                  time_name = i
-#                  lv = len(f.dimensions[i])
+            v_dims = h['variables'][fvn]['dimensions']
+            lat_name,lon_name,lev_name,lt,ln,lv = match_dims(h, mt, fvn, v_dims)
             if 'none' == lt or 'none' == ln:
                 gridfile = '{0}/{1}x{2}.nc'.format(extra_dir,mt,grds[mt])
             else:
@@ -343,68 +380,34 @@ def fill_list(nc_files, root_dir, extra_dir, comm, rank, size):
                     print( 'not found: {}'.format(gridfile))
                     gridfile = None
 
-            for vn,ob in f.variables.items():
-
-
-                lt = "none"
-                ln = "none"
-                lv = "none"
-                lat_name = None
-                lon_name = None
-                lev_name = None
-                time_name = None
-                # Find which dim variables to use
-                v_dims = f.variables[vn].dimensions
-                for i in grids[mt]['lat']:
-                  if i in v_dims:
-                      if 'nlat' in i or 'nj' in i:
-                          if hasattr(f.variables[fvn], 'coordinates'):
-                              if 'LAT' in str(f.variables[fvn].coordinates.split()[1]):
-                                  lat_name = str(f.variables[fvn].coordinates.split()[1])
-                              else:
-                                  lat_name = 'TLAT'
-                          else:
-                              lat_name = 'TLAT'
-                      else:
-                          lat_name = i
-                      lt = len(f.dimensions[i])
-                for i in grids[mt]['lon']:
-                  if i in v_dims:
-                      if 'nlon' in i or 'ni' in i:
-                          if hasattr(f.variables[fvn], 'coordinates'):
-                              if 'LON' in str(f.variables[fvn].coordinates.split()[0]):
-                                  lon_name = str(f.variables[fvn].coordinates.split()[0])
-                              else:
-                                  lon_name = 'TLONG'
-                          else:
-                              lon_name = 'TLONG'
-                          if 'ULON' in lon_name:
-                              ln = str(len(f.dimensions[i]))+"_UGRID"
-                          else:
-                              ln = str(len(f.dimensions[i]))+"_TGRID"
-                      else:
-                          lon_name = i
-                          ln = len(f.dimensions[i])
-                for i in grids[mt]['lev']:
-                  if i in v_dims:
-                      lev_name = i
-                      lv = len(f.dimensions[i])
+            if h['time_period_freq'] is not None:
+                if 'day_365' in h['time_period_freq']:
+                    time_period_freq = 'year_1'
+                else:
+                    time_period_freq = h['time_period_freq']
+            else:
+                # Modified for decadals
+                time_period_freq = fn.split("/")[-2]
+            if 'ocn_constants' in stri or 'glc_constants' in stri:
+                date = "0000"
+            else:
+                date = stri.split('.')[-2]
+
+            # all the variables of a file share its coordinates, so match the dimensions once per shape
+            matched = {}
+            for vn,ob in h['variables'].items():
+                v_dims = tuple(ob['dimensions'])
+                if v_dims not in matched:
+                    matched[v_dims] = match_dims(h, mt, fvn, v_dims)
+                lat_name,lon_name,lev_name,lt,ln,lv = matched[v_dims]
 
                 if model_type not in variablelist.keys():
                     variablelist[model_type] = {}
                 if vn not in variablelist[model_type].keys():
                      variablelist[model_type][vn] = {}
-                if hasattr(f,"time_period_freq"):
-                    if 'day_365' in f.time_period_freq:
-                        time_period_freq = 'year_1'
-                    else:
-                        time_period_freq = f.time_period_freq
+                if h['time_period_freq'] is not None:
                     if time_period_freq not in variablelist[model_type][vn].keys():
                         variablelist[model_type][vn][time_period_freq] = {}
-                    if 'ocn_constants' in stri or 'glc_constants' in stri:
-                        date = "0000"
-                    else:
-                        date = stri.split('.')[-2]
                     if date not in variablelist[model_type][vn][time_period_freq].keys():
                         variablelist[model_type][vn][time_period_freq][date] = {}
                     if 'files' not in variablelist[model_type][vn][time_period_freq][date].keys():
@@ -419,15 +422,6 @@ def fill_list(nc_files, root_dir, extra_dir, comm, rank, size):
                     if stri not in variablelist[model_type][vn]["unknown"]:
                         # Modified for decadals
                         #variablelist[model_type][vn]["unknown"]["unknown"] = {}
-                        time_period_freq = fn.split("/")[-2]
-                        if 'ocn_constants' in stri or 'glc_constants' in stri:
-                            date = "0000"
-                        else:
-                            date = stri.split('.')[-2]
-                        if model_type not in variablelist.keys():
-                            variablelist[model_type] = {}
-                        if vn not in variablelist[model_type].keys():
-                            variablelist[model_type][vn] = {}
                         if time_period_freq not in variablelist[model_type][vn].keys():
                             variablelist[model_type][vn][time_period_freq] = {}
                         if date not in variablelist[model_type][vn][time_period_freq].keys():
@@ -437,42 +431,32 @@ def fill_list(nc_files, root_dir, extra_dir, comm, rank, size):
                         variablelist[model_type][vn][time_period_freq][date]['lon']=lon_name
                         variablelist[model_type][vn][time_period_freq][date]['lev']=lev_name
                         variablelist[model_type][vn][time_period_freq][date]['time']=time_name
-        f.close()
-    VL_TAG = 30
-    variable_list = {}
-    if size > 1:
-        if rank==0:
-            variable_list = variablelist
-            for i in range(0,size-1):
-                r,lvarList = comm.collect(data=None, tag=VL_TAG)
-                for model_type,d1 in lvarList.items():
-                    if model_type not in variable_list.keys():
-                        variable_list[model_type] = {}
-                    for vn,d2 in d1.items():
-                        if vn not in variable_list[model_type].keys():
-                            variable_list[model_type][vn] = {}
-                        for tp,d3 in d2.items():
-                            if tp not in variable_list[model_type][vn].keys():
-                                variable_list[model_type][vn][tp] = {}
-                            for date,l in d3.items():
-                                if date not in variable_list[model_type][vn][tp].keys():
-                                    variable_list[model_type][vn][tp][date] = {}
-                                if 'files' in variable_list[model_type][vn][tp][date].keys():
-                                    if len(lvarList[model_type][vn][tp][date]['files'])>0:
-                                        if lvarList[model_type][vn][tp][date]['files'][0] is not None:
-                                            variable_list[model_type][vn][tp][date]['files'].append(lvarList[model_type][vn][tp][date]['files'][0])
-                                else:
-                                    variable_list[model_type][vn][tp][date] = lvarList[model_type][vn][tp][date]
-
-#                variable_list.update(lvarList)
-            comm.partition(variable_list, func=partition.Duplicate(), involved=True)
-        else:
-            comm.collect(data=variablelist, tag=VL_TAG)
-            variable_list = comm.partition(func=partition.Duplicate(), involved=True)
-        comm.sync()
+    # merge the lists of all ranks up a tree and share the result, rank 0 gets all of the headers
+    variable_list,new_headers = conform_varlist.tree_merge(comm, variablelist, new_headers)
+
+    # rank 0 keeps the headers that were read for the next run
+    if catalog is not None:
+        catalog.add(new_headers)
+        print('{} file headers added to the catalog {}'.format(len(new_headers), catalog_fn))
+        catalog.close()
     return variable_list
 
-def match_tableSpec_to_stream(ts_dir, variable_list, dout_s_root, case):
+def match_tableSpec_to_stream(vardeps, variable_list, dout_s_root, case, generated_dir):
+
+    '''
+    Match the input variables each json specification needs to the time series files found
+
+    Input:
+    vardeps(dictionary) - keys->json file name, values->output variable dependencies from conform_vardeps.resolve
+    variable_list(dictionary) - the time series variables found by fill_list
+    dout_s_root(string) - the time series output root directory
+    case(string) - the case name
+    generated_dir(string) - the directory to write the resolved json specifications to,
+                            the json files in vardeps are not changed
+
+    Output:
+    spec_streams(dictionary) - keys->'<resolved json file>>><date>', values->input file names
+    '''
 
     spec_streams = {}
     var_defs = {}
@@ -497,12 +481,13 @@ def match_tableSpec_to_stream(ts_dir, variable_list, dout_s_root, case):
                         }
     }
 
-    js = glob.glob(ts_dir+"/*.json")
-    for j in js:
+    for j in sorted(vardeps.keys()):
 
         # Read in the json file and add the correct dimension definitions
         js_fo = json.load(open(j,'r'))
         js_f = js_fo.copy()
+        gen_fn = os.path.join(generated_dir, os.path.basename(j))
+        matched = False
 
         var_defs[j] = {}
         missing = {}
@@ -513,56 +498,52 @@ def match_tableSpec_to_stream(ts_dir, variable_list, dout_s_root, case):
         dates = []
 
         # get the cesm var names from the defs in json file
-        cmd = "vardeps -f -n "+j
         print( '---------------------------------------')
-        print("{}".format( cmd))
-        p = subprocess.Popen([cmd], stderr=subprocess.PIPE, stdout=subprocess.PIPE, shell=True)
-        end = False
+        print("{}".format(j))
         found_all = True
         missing_vars = []
-        output = p.stdout.read().decode('utf8').split('\n')
-        for l in output:
-            if '[' in l and ']' in l and ':' in l:
-                split = l.split();
-                var_defs[j][split[0]] = {}
-                var_defs[j][split[0]]["freq"] = split[1].replace("[","").replace("]","").replace(":","").split(",")[0]
-                if 'fx' in var_defs[j][split[0]]["freq"]:
-                    var_defs[j][split[0]]["freq"] = 'month_1'
-                elif 'mon' in var_defs[j][split[0]]["freq"]:
-                    var_defs[j][split[0]]["freq"] = 'month_1'
-                elif 'day' in var_defs[j][split[0]]["freq"]:
-                    var_defs[j][split[0]]["freq"] = 'day_1'
-                elif '6hr' in var_defs[j][split[0]]["freq"]:
-                    var_defs[j][split[0]]["freq"] = 'hour_6'
-                elif '3hr' in var_defs[j][split[0]]["freq"]:
-                    var_defs[j][split[0]]["freq"] = 'hour_3'
-                elif '1hr' in var_defs[j][split[0]]["freq"]:
-                    var_defs[j][split[0]]["freq"] = 'hour_1'
-                elif 'subhr' in var_defs[j][split[0]]["freq"]:
-                    var_defs[j][split[0]]["freq"] = 'min_30'
-                elif 'yr' in var_defs[j][split[0]]["freq"]:
+        for d in vardeps[j]:
+            if d['freq'] is not None and d['deps'] is not None:
+                name = d['name']
+                var_defs[j][name] = {}
+                var_defs[j][name]["freq"] = d['freq']
+                if 'fx' in var_defs[j][name]["freq"]:
+                    var_defs[j][name]["freq"] = 'month_1'
+                elif 'mon' in var_defs[j][name]["freq"]:
+                    var_defs[j][name]["freq"] = 'month_1'
+                elif 'day' in var_defs[j][name]["freq"]:
+                    var_defs[j][name]["freq"] = 'day_1'
+                elif '6hr' in var_defs[j][name]["freq"]:
+                    var_defs[j][name]["freq"] = 'hour_6'
+                elif '3hr' in var_defs[j][name]["freq"]:
+                    var_defs[j][name]["freq"] = 'hour_3'
+                elif '1hr' in var_defs[j][name]["freq"]:
+                    var_defs[j][name]["freq"] = 'hour_1'
+                elif 'subhr' in var_defs[j][name]["freq"]:
+                    var_defs[j][name]["freq"] = 'min_30'
+                elif 'yr' in var_defs[j][name]["freq"]:
                     if 'Eyr' in j and 'land' in j:
-                        var_defs[j][split[0]]["freq"] = 'year_1'
+                        var_defs[j][name]["freq"] = 'year_1'
                     else:
-                        var_defs[j][split[0]]["freq"] = 'year_1'
-                var_defs[j][split[0]]["realm"] = split[1].replace("[","").replace("]","").replace(":","").split(",")[1]
-                var_defs[j][split[0]]["vars"] = l.split(":")[1].split()
-                var_defs[j][split[0]]["var_check"] = {}
-                if 'landUse' in var_defs[j][split[0]]["vars"]:
-                    var_defs[j][split[0]]["vars"].remove('landUse')
-                elif 'levsoi' in var_defs[j][split[0]]["vars"]:
-                    var_defs[j][split[0]]["vars"].remove('levsoi')
-                elif 'siline' in var_defs[j][split[0]]["vars"]:
-                    var_defs[j][split[0]]["vars"].remove('siline')
-                elif 'basin'  in var_defs[j][split[0]]["vars"]:
-                    var_defs[j][split[0]]["vars"].remove('basin')
-                elif 'iceband'  in var_defs[j][split[0]]["vars"]:
-                    var_defs[j][split[0]]["vars"].remove('iceband')
-                elif 'soilpools' in var_defs[j][split[0]]["vars"]:
-                    var_defs[j][split[0]]["vars"].remove('soilpools')
+                        var_defs[j][name]["freq"] = 'year_1'
+                var_defs[j][name]["realm"] = d['realm']
+                var_defs[j][name]["vars"] = list(d['deps'])
+                var_defs[j][name]["var_check"] = {}
+                if 'landUse' in var_defs[j][name]["vars"]:
+                    var_defs[j][name]["vars"].remove('landUse')
+                elif 'levsoi' in var_defs[j][name]["vars"]:
+                    var_defs[j][name]["vars"].remove('levsoi')
+                elif 'siline' in var_defs[j][name]["vars"]:
+                    var_defs[j][name]["vars"].remove('siline')
+                elif 'basin'  in var_defs[j][name]["vars"]:
+                    var_defs[j][name]["vars"].remove('basin')
+                elif 'iceband'  in var_defs[j][name]["vars"]:
+                    var_defs[j][name]["vars"].remove('iceband')
+                elif 'soilpools' in var_defs[j][name]["vars"]:
+                    var_defs[j][name]["vars"].remove('soilpools')
                 # check to see if we have all before we start
-                for v in var_defs[j][split[0]]["vars"]:
-                    var_defs[j][split[0]]["var_check"][v] = []
+                for v in var_defs[j][name]["vars"]:
+                    var_defs[j][name]["var_check"][v] = []
                     var_name = j.split("_")[-2]
                     if "input_glob" in js_fo[var_name].keys():
                         stream = js_fo[var_name]["input_glob"].split(".")
@@ -575,15 +556,15 @@ def match_tableSpec_to_stream(ts_dir, variable_list, dout_s_root, case):
                             elif 'pop' in stream:
                                 f = 'month_1'
                             else:
-                                f = var_defs[j][split[0]]["freq"]
+                                f = var_defs[j][name]["freq"]
                     elif 'Odec' in j:
                         f = 'month_1'
                         r = 'ocean'
                         stream = None
                     else:
                         stream = None
-                        r = var_defs[j][split[0]]["realm"]
-                        f = var_defs[j][split[0]]["freq"]
+                        r = var_defs[j][name]["realm"]
+                        f = var_defs[j][name]["freq"]
                     if cmip6_realms[r] not in variable_list.keys():
                         found_all = False
                         missing_vars.append(v)
@@ -625,9 +606,9 @@ def match_tableSpec_to_stream(ts_dir, variable_list, dout_s_root, case):
                             found_all = False
                             missing_vars.append(v)
                 #Look up
-                for v in var_defs[j][split[0]]["vars"]:
+                for v in var_defs[j][name]["vars"]:
                     print("TRYING TO FIND: {}".format(v))
-                    var_defs[j][split[0]]["var_check"][v] = []
+                    var_defs[j][name]["var_check"][v] = []
                     var_name = j.split("_")[-2]
                     if "input_glob" in js_fo[var_name].keys():
                         stream = js_fo[var_name]["input_glob"].split(".")
@@ -640,13 +621,13 @@ def match_tableSpec_to_stream(ts_dir, variable_list, dout_s_root, case):
                             elif 'pop' in stream:
                                 f = 'month_1'
                             else:
-                                f = var_defs[j][split[0]]["freq"]
+                                f = var_defs[j][name]["freq"]
                     elif 'Odec' in j:
                         f = 'month_1'
                     else:
                         stream = None
-                        r = var_defs[j][split[0]]["realm"]
-                        f = var_defs[j][split[0]]["freq"]
+                        r = var_defs[j][name]["realm"]
+                        f = var_defs[j][name]["freq"]
                     if "mon" in f:
                         f = "month_1"
                     if "day" in f and 'day_365' not in f:
@@ -674,7 +655,7 @@ def match_tableSpec_to_stream(ts_dir, variable_list, dout_s_root, case):
                             if f in freq:
                                 var_name = j.split("_")[-2]
 
-                                var_defs[j][split[0]]["var_check"][v] = variable_list[found_r][v][freq]
+                                var_defs[j][name]["var_check"][v] = variable_list[found_r][v][freq]
                                 rl = r
                                 freql = freq
                                 for date in variable_list[found_r][v][freq].keys():
@@ -699,20 +680,21 @@ def match_tableSpec_to_stream(ts_dir, variable_list, dout_s_root, case):
 #                                        if 'atm' in cesm_realms[stream[0]]:
 #                                            ps_fn = dout_s_root+"/"+cesm_realms[stream[0]]+"/proc/tseries/"+freq_n+"/"+case+"."+stream[0]+"."+stream[1]+".PS."+date+".nc"
 #                                            if os.path.exists(ps_fn):
-#                                                spec_streams[j+">>"+date].append(ps_fn)
+#                                                spec_streams[gen_fn+">>"+date].append(ps_fn)
                                     if os.path.exists(fl1[0]):
-                                        if (j+">>"+date) not in spec_streams.keys():
-                                            spec_streams[j+">>"+date] = []
+                                        if (gen_fn+">>"+date) not in spec_streams.keys():
+                                            spec_streams[gen_fn+">>"+date] = []
+                                            matched = True
                                         # Add input file name
-                                        if fl1[0] not in spec_streams[j+">>"+date]:
-                                            spec_streams[j+">>"+date].append(fl1[0])
+                                        if fl1[0] not in spec_streams[gen_fn+">>"+date]:
+                                            spec_streams[gen_fn+">>"+date].append(fl1[0])
                                         # Add the grid file name
-                                        if fl1[1] not in spec_streams[j+">>"+date] and fl1[1] is not None:
-                                            spec_streams[j+">>"+date].append(fl1[1])
+                                        if fl1[1] not in spec_streams[gen_fn+">>"+date] and fl1[1] is not None:
+                                            spec_streams[gen_fn+">>"+date].append(fl1[1])
                                         if 'atm' in fl1[0].split('/')[-5]:
                                             ps_fn = fl1[0].replace(v,'PS')
                                             if os.path.exists(ps_fn):
-                                                spec_streams[j+">>"+date].append(ps_fn)
+                                                spec_streams[gen_fn+">>"+date].append(ps_fn)
                                     # Add the correct dimension definitions
                                     for k,var in js_fo.items():
                                         if ('ocean' in j or 'ocn' in j) and 'seaIce' not in j:
@@ -800,28 +782,25 @@ def match_tableSpec_to_stream(ts_dir, variable_list, dout_s_root, case):
                                                 js_f['lev']['definition'] = "z_t"
                                                 js_f['lev_bnds']['definition'] = "bounds(z_t, bdim=\"d2\")"
 
-                                    with open(j,'w') as fp:
-                                        json.dump(js_f, fp, sort_keys=True, indent=4)
 
-                    if len(var_defs[j][split[0]]["var_check"][v]) < 1:
+                    if len(var_defs[j][name]["var_check"][v]) < 1:
                         if v not in missing.keys():
                             missing[v] = "(",f,",",r,")"
 
-            elif len(l.split(':')) > 1:
-                if 'No dependencies' in l:
-                    if len(js_fo[l.split(':')[0].strip()]["definition"])>0:
-                        print("PROBLEM DEFINITION: {} : {}".format(l.split(':')[0].strip(),js_fo[l.split(':')[0].strip()]["definition"]))
-                    else:
-                        print("NO DEFINITION FOUND: {} : {}".format(l.split(':')[0].strip(),js_fo[l.split(':')[0].strip()]["definition"]))
-                    found_all = False
-                    no_def.append(l.split(':')[0].strip())
+            elif d['deps'] is None:
+                if len(js_fo[d['name']]["definition"])>0:
+                    print("PROBLEM DEFINITION: {} : {}".format(d['name'],js_fo[d['name']]["definition"]))
                 else:
-                    if l.split(':')[1] != '':
-                        dims.append(l.split(':')[1].strip())
-            #if end:
-            #    print l
-            if 'Complete Specification Requires the Following Input Variables:' in l:
-                end = True
+                    print("NO DEFINITION FOUND: {} : {}".format(d['name'],js_fo[d['name']]["definition"]))
+                found_all = False
+                no_def.append(d['name'])
+            else:
+                dims.append(' '.join(d['deps']))
+
+        # the definitions are resolved from the first date matched, so one resolved
+        # specification is written for all of the dates of a table
+        if matched:
+            write_spec(gen_fn, js_f)
 
         if not found_all:
             print ('Missing these variables: {}'.format(missing_vars))
@@ -832,58 +811,65 @@ def match_tableSpec_to_stream(ts_dir, variable_list, dout_s_root, case):
     return spec_streams
 
 
+def write_spec(spec_fn, dsdict):
+
+    '''
+    Write a resolved json specification through a temporary file, so the ranks reading it
+    never see a partial file.  An unchanged file is left alone.
+    '''
+    text = json.dumps(dsdict, sort_keys=True, indent=4)
+    if os.path.isfile(spec_fn):
+        with open(spec_fn, 'r') as fp:
+            if fp.read() == text:
+                return
+    tmp_fn = '{0}.tmp.{1}'.format(spec_fn, os.getpid())
+    with open(tmp_fn, 'w') as fp:
+        fp.write(text)
+    os.replace(tmp_fn, spec_fn)
+
+
 def divide_comm(scomm, l_spec, ind):
 
     '''
-    Divide the communicator into subcommunicators, leaving rank one to hand out reshaper jobs to run.
-    The part of the parallelization will be handled by this script, with the parallelization now over
-    CESM output streams and chunks.  The reshaper will the compute the variables in parallel.
+    Divide the communicator into subcommunicators, leaving rank zero to hand out the work units to run.
+    The units are handed out one at a time to whichever subcommunicator asks first, and PyConform
+    then works on each unit in parallel within the subcommunicator.
 
     Input:
     scomm (simplecomm) - communicator to be divided (currently MIP_COMM_WORLD)
-    l_spec(int) - the number of reshaper specifiers(# of output stream and # of chunks)
+    l_spec(int) - the number of work units
+    ind(string) - 'True' to give every rank its own subcommunicator
 
     Output:
     inter_comm(simplecomm) - this rank's subcommunicator it belongs to
-    num_of_groups(int) - the total number of subcommunicators
+    num_of_groups(int) - the number of subcommunicators doing work, not counting the global master's
     '''
     size = scomm.get_size()
     rank = scomm.get_rank()
     if 'True' in ind:
-        num_of_groups = size
+        num_of_groups = size - 1
     else:
         min_procs_per_spec = 16
-        if size < min_procs_per_spec:
-            min_procs_per_spec = size
-
-        if l_spec == 1:
-            num_of_groups = 1
-        else:
-            num_of_groups = size/min_procs_per_spec
-        if l_spec < num_of_groups:
-            num_of_groups = l_spec
-
+        num_of_groups = (size - 1) // min_procs_per_spec
+    num_of_groups = max(min(num_of_groups, l_spec, size - 1), 1)
 
     # the global master needs to be in its own subcommunicator
     # ideally it would not be in any, but the divide function
     # requires all ranks to participate in the call
     if rank == 0:
-        temp_color = 0
+        group = 0
     else:
-        temp_color = (rank % num_of_groups)+1
-    groups = []
-    for g in range(0,num_of_groups+1):
-        groups.append(g)
-    group = groups[temp_color]
+        group = ((rank - 1) % num_of_groups) + 1
 
     inter_comm,multi_comm = scomm.divide(group)
 
     return inter_comm,num_of_groups
 
 
-def run_PyConform(spec, file_glob, comm):
+def run_PyConform(spec, file_glob, comm, variable=None, budget=None):
 
     failures = 0
+    outputs = []
     ## Used the main function in pyconform to prepare the call
 
     spec_fn = spec.split(">>")[0]
@@ -894,9 +880,14 @@ def run_PyConform(spec, file_glob, comm):
     for v in sorted(file_glob):
         infiles.append(v)
 
+    perfLib.active().add_files(read=infiles)
+
     # load spec json file
     dsdict = json.load(open(spec_fn,'r'), object_pairs_hook=OrderedDict)
 
+    # only write one output variable if the specification was split into work units
+    dsdict = conform_scheduler.split_spec(dsdict, variable)
+
     # look through each file to see if there are any functions in defs we can't chunk over
     chunking_ok = True
     for v in dsdict.keys():
@@ -913,21 +904,17 @@ def run_PyConform(spec, file_glob, comm):
 
         # Setup the PyConform data flow
         dataflow = DataFlow(inpds, outds)
+        outputs = list(dataflow._filesizes.keys())
 
-        # Execute
+        # Size the chunks to the memory budget of a rank and execute
         time = None
         for k in dsdict.keys():
             if 'time'==k or 'time1'==k or 'time2'==k or 'time3'==k:
                 time = k
-        if time is not None:
-            if "Oclim" in spec_fn or "oclim" in spec_fn or "Oyr" in spec_fn or "oyr" in spec_fn:
-                dataflow.execute(chunks={'nlat':10}, serial=True, debug=True, scomm=comm)
-            elif not chunking_ok:
-                dataflow.execute(chunks={'lat':10}, serial=True, debug=True, scomm=comm)
-            else:
-                dataflow.execute(chunks={time:48},serial=True, debug=True, scomm=comm)
-        else:
-            dataflow.execute(serial=True, debug=True, scomm=comm)
+        chunks,info = conform_chunks.plan(spec_fn, conform_vardeps.definition_inputs(dsdict), inpds, dataflow._o2imap, time, chunking_ok, budget)
+        if comm.is_manager():
+            print("CHUNK PLAN {} {}: {}".format(os.path.basename(spec_fn), variable, conform_chunks.describe(info)))
+        dataflow.execute(chunks=chunks, serial=True, debug=True, scomm=comm)
 
     except UnitsError as e:
         print ("ooo ERROR IN {} {}".format(os.path.basename(spec_fn),str(e)))
@@ -953,7 +940,48 @@ def run_PyConform(spec, file_glob, comm):
     except TypeError as e:
         print ("ooo ERROR IN {} {}".format(os.path.basename(spec_fn),str(e)))
         failures = failures+1
-    return failures
+    return failures,outputs
+
+
+def conform_unit(unit, mappings, comm, rank, lrank, budget=None, ledger_dir=None):
+
+    '''
+    Conform one work unit and time it
+
+    Input:
+    unit(dictionary) - the work unit from conform_scheduler.work_units
+    mappings(dictionary) - keys->'<json file>>><date>', values->input file names
+    comm(simplecomm) - the subcommunicator running the unit
+    rank(int) - the global rank, for the report
+    lrank(int) - the rank within comm
+    budget(int) - the memory budget of a rank in bytes for the chunk plan, None for the default chunks
+    ledger_dir(string) - the directory to record the unit in when it finishes without failures (optional)
+
+    Output:
+    result(dictionary) - the unit with the 'rank', 'seconds' and number of 'failures'
+    '''
+    timing = perfLib.active()
+    name = conform_scheduler.unit_name(unit)
+    print("({}/{}) start running {}".format(rank,lrank,name))
+    start = time.time()
+    with timing.stage('conform', name):
+        failures,outputs = run_PyConform(unit['spec'], mappings[unit['spec']], comm, unit['variable'], budget)
+    # PyConform renames each output file from its .tmp.nc name once it is complete, the unit
+    # is finished when every rank of comm wrote its files
+    failures = comm.allreduce(failures, 'sum')
+    if failures == 0 and ledger_dir is not None and comm.is_manager():
+        # only record the unit if every file it was expected to write is there
+        missing = [fn for fn in outputs if not os.path.isfile(fn)]
+        if len(outputs) > 0 and len(missing) == 0:
+            conform_scheduler.mark_finished(ledger_dir, unit, outputs)
+        else:
+            print("({}/{}) {} not recorded as finished, {} of {} outputs missing".format(rank,lrank,name,len(missing),len(outputs)))
+    result = dict(unit)
+    result.update({'rank': rank, 'seconds': time.time() - start, 'failures': failures})
+    print("({}/{}) finished running {} in {:.1f} seconds".format(rank,lrank,name,result['seconds']))
+    print("({}/{}) failures {}".format(rank,lrank,failures))
+    return result
+
 #======
 # main
 #======
@@ -965,6 +993,9 @@ def main(options, scomm, rank, size):
     timer = timekeeper.TimeKeeper()
     timer.start("Total Time")
 
+    # record the time and I/O of each stage on every rank
+    timing = perfLib.Instrument('cesm_conform_generator', scomm)
+
     # initialize the CASEROOT environment dictionary
     cesmEnv = dict()
 
@@ -999,28 +1030,76 @@ def main(options, scomm, rank, size):
     case = cesmEnv['CASE']
     pc_inpur_dir = cesmEnv['CONFORM_JSON_DIRECTORY']+'/PyConform_input/'
     #readArchiveXML(caseroot, dout_s_root, case, debug)
-    nc_files = find_nc_files(dout_s_root)
-    variable_list = fill_list(nc_files, pc_inpur_dir, cesmEnv["CONFORM_EXTRA_FIELD_NETCDF_DIR"], scomm, rank, size)
+    with timing.stage('find_nc_files'):
+        nc_files = find_nc_files(dout_s_root, scomm)
+    catalog_fn = '{0}/logs/tseries_catalog.db'.format(caseroot)
+    with timing.stage('fill_list'):
+        if rank == 0:
+            # forget the files that have been removed from the archive since the last run
+            catalog = catalogLib.Catalog(catalog_fn)
+            print('{} files removed from the catalog {}'.format(catalog.prune(dout_s_root, nc_files), catalog_fn))
+            catalog.close()
+        timing.sync(scomm)
+        variable_list = fill_list(nc_files, pc_inpur_dir, cesmEnv["CONFORM_EXTRA_FIELD_NETCDF_DIR"], scomm, rank, size, catalog_fn)
+
+    # find the input variables of every json specification on all ranks
+    with timing.stage('vardeps'):
+        vardeps = conform_vardeps.resolve(sorted(glob.glob(pc_inpur_dir+"/*.json")), scomm,
+                                          '{0}/logs/conform_vardeps.json'.format(caseroot))
 
     mappings = {}
     if rank == 0:
-        mappings = match_tableSpec_to_stream(pc_inpur_dir, variable_list, dout_s_root, case)
+        generated_dir = cesmEnv['CONFORM_JSON_DIRECTORY']+'/PyConform_generated/'
+        if not os.path.isdir(generated_dir):
+            os.makedirs(generated_dir)
+        with timing.stage('match_tables'):
+            mappings = match_tableSpec_to_stream(vardeps, variable_list, dout_s_root, case, generated_dir)
         for k,v in sorted(mappings.items()):
             print(k)
             for f in sorted(v):
                 print(f)
             print("{}".format(len(v)))
-    scomm.sync()
+    timing.sync(scomm)
 
     # Pass the stream and mapping information to the other procs
-    mappings = scomm.partition(mappings, func=partition.Duplicate(), involved=True)
+    with timing.wait():
+        mappings = scomm.partition(mappings, func=partition.Duplicate(), involved=True)
     print("I CAN RUN {} json files".format(len(mappings.keys())))
-    failures = 0
 
-    if len(mappings.keys()) > 0:
-        # setup subcommunicators to do streams and chunks in parallel
+    # memory budget of each rank for the chunk sizes, from env_conform.xml or the memory on the node
+    ranks_on_node = conform_chunks.node_ranks() if size > 1 else 1
+    budget = None
+    if rank == 0:
+        budget,source = conform_chunks.memory_budget(cesmEnv.get('CONFORM_MEMORY_BUDGET', ''), ranks_on_node)
+        if budget is None:
+            print("Memory budget unknown, using the fixed chunk sizes")
+        else:
+            print("Memory budget {:.0f} MB per rank from {}".format(budget/float(conform_chunks.MB), source))
+    # every rank of a subcommunicator must use the same chunks
+    budget = scomm.partition(budget, func=partition.Duplicate(), involved=True)
+
+    # split the json files into work units, longest first
+    units = []
+    results = []
+    times_fn = '{0}/logs/conform_unit_times.json'.format(caseroot)
+    ledger_dir = '{0}/logs/conform_ledger'.format(caseroot)
+    if rank == 0:
+        units = conform_scheduler.work_units(mappings, conform_scheduler.read_unit_times(times_fn))
+        print("{} work units in {} tables".format(len(units), len(set(u['table'] for u in units))))
+        # skip the units finished by an earlier run that have not changed
+        units,done = conform_scheduler.pending_units(units, mappings, ledger_dir)
+        print("{} work units finished in an earlier run, {} to do".format(len(done), len(units)))
+    with timing.wait():
+        units = scomm.partition(units, func=partition.Duplicate(), involved=True)
+
+    if len(units) > 0 and size == 1:
+        for unit in units:
+            results.append(conform_unit(unit, mappings, scomm, rank, 0, budget, ledger_dir))
+
+    elif len(units) > 0:
+        # setup subcommunicators to do the work units in parallel
         # everyone participates except for root
-        inter_comm, lsubcomms = divide_comm(scomm, len(mappings.keys()), ind)
+        inter_comm, lsubcomms = divide_comm(scomm, len(units), ind)
         color = inter_comm.get_color()
         lsize = inter_comm.get_size()
         lrank = inter_comm.get_rank()
@@ -1028,44 +1107,53 @@ def main(options, scomm, rank, size):
 
         GWORK_TAG = 10 # global comm mpi tag
         LWORK_TAG = 20 # local comm mpi tag
-        # global root - hands out mappings to work on.  When complete, it must tell each subcomm all work is done.
+        RESULT_TAG = 30 # unit times sent back to the global root
+        # global root - hands out the units to whichever subcomm asks first.  When complete, it must tell each subcomm
+        # all work is done and collect the unit times.
         if (rank == 0):
-            #for i in range(0,len(mappings.keys())): # hand out all mappings
-            for i in mappings.keys():
-                scomm.ration(data=i, tag=GWORK_TAG)
-            for i in range(1,lsubcomms): # complete, signal this to all subcomms
-                scomm.ration(data=-99, tag=GWORK_TAG)
-
-        # subcomm root - performs the same tasks as other subcomm ranks, but also gets the specifier to work on and sends
+            with timing.stage('dispatch'), timing.wait():
+                for unit in units:
+                    scomm.ration(data=unit['id'], tag=GWORK_TAG)
+                for i in range(0,lsubcomms): # complete, signal this to all subcomms
+                    scomm.ration(data=-99, tag=GWORK_TAG)
+                for i in range(0,lsubcomms):
+                    r,l_results = scomm.collect(data=None, tag=RESULT_TAG)
+                    results.extend(l_results)
+
+        # subcomm root - performs the same tasks as other subcomm ranks, but also gets the unit to work on and sends
         # this information to all ranks within subcomm
         elif (lrank == 0):
             i = -999
             while i != -99:
-                i = scomm.ration(tag=GWORK_TAG) # recv from global
-                for x in range(1,lsize):
-                    inter_comm.ration(i, LWORK_TAG) # send to local ranks
+                with timing.wait():
+                    i = scomm.ration(tag=GWORK_TAG) # recv from global
+                    for x in range(1,lsize):
+                        inter_comm.ration(i, LWORK_TAG) # send to local ranks
                 if i != -99:
-                    print("({}/{}) start running {}".format(rank,lrank,i))
-                    failures += run_PyConform(i, mappings[i], inter_comm)
-                    print("({}/{}) finished running {}".format(rank,lrank,i))
-                    print("({}/{}) failures {}".format(rank,lrank,failures))
-                inter_comm.sync()
+                    results.append(conform_unit(units[i], mappings, inter_comm, rank, lrank, budget, ledger_dir))
+                timing.sync(inter_comm)
+            scomm.collect(data=results, tag=RESULT_TAG)
 
-        # all subcomm ranks - recv the specifier to work on and call the reshaper
+        # all subcomm ranks - recv the unit to work on and call PyConform
         else:
             i = -999
             while i != -99:
-                i = inter_comm.ration(tag=LWORK_TAG) # recv from local root
+                with timing.wait():
+                    i = inter_comm.ration(tag=LWORK_TAG) # recv from local root
                 if i != -99:
-                    print("({}/{}) start running {}".format(rank,lrank,i))
-                    failures += run_PyConform(i, mappings[i], inter_comm)
-                    print("({}/{}) finished running {}".format(rank,lrank,i))
-                    print("({}/{}) failures {}".format(rank,lrank,failures))
-
-                inter_comm.sync()
+                    conform_unit(units[i], mappings, inter_comm, rank, lrank, budget, ledger_dir)
+                timing.sync(inter_comm)
         print("({}/{}) FINISHED".format(rank,lrank))
 
-    scomm.sync()
+    # report the time spent on each table and keep the unit times for the next run
+    if rank == 0 and len(results) > 0:
+        tables = conform_scheduler.table_report(results)
+        if not os.path.isdir(os.path.dirname(times_fn)):
+            os.makedirs(os.path.dirname(times_fn))
+        conform_scheduler.save_unit_times(times_fn, results, tables)
+
+    timing.sync(scomm)
+    timing.write_summary('{0}/logs'.format(caseroot))
 
     timer.stop("Total Time")
     if rank == 0:
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""Chunk sizes for the PyConform data flows from a per-rank memory budget
+
+A chunk of 48 time steps of a 3-D hourly field and one of a 2-D monthly
+field need very different amounts of memory.  The planner works out the
+bytes one index of the chunk dimension costs from the shapes and types of
+the input variables a specification reads, and picks the largest chunk that
+fits the memory budget of a rank, allowing for the copies PyConform holds
+at once (the data read, the intermediate results and the data written).
+
+The budget comes from CONFORM_MEMORY_BUDGET in env_conform.xml, in MB per
+rank.  If it is not set, the memory available on the node is divided by the
+number of ranks on the node.
+__________________________
+Created on Oct, 2026
+
+@author: CSEG <cseg@cgd.ucar.edu>
+"""
+
+from __future__ import print_function
+
+import os
+
+# copies of a chunk held at once - input, intermediate results and output
+WORKING_COPIES = 4
+
+# part of the available node memory given to the ranks when the budget is auto-detected
+AUTO_FRACTION = 0.8
+
+MB = 1024 * 1024
+
+def available_memory():
+
+    '''
+    Return the memory available on this node in bytes, None if it can not be found
+    '''
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def node_ranks():
+
+    '''
+    Return the number of MPI ranks on this node, 1 if MPI is not running.
+    Every rank must call this.
+    '''
+    try:
+        from mpi4py import MPI
+    except ImportError:
+        return 1
+    node_comm = MPI.COMM_WORLD.Split_type(MPI.COMM_TYPE_SHARED)
+    n = node_comm.Get_size()
+    node_comm.Free()
+    return n
+
+
+def memory_budget(setting, ranks_on_node):
+
+    '''
+    Return the memory budget of one rank
+
+    Input:
+    setting(string) - CONFORM_MEMORY_BUDGET in MB per rank, empty or 0 to auto-detect
+    ranks_on_node(int) - the number of ranks sharing the node
+
+    Output:
+    budget(int) - bytes per rank, None if it could not be found
+    source(string) - where the budget came from, for the log
+    '''
+    if setting is not None and str(setting).strip() not in ['', '0']:
+        return int(float(setting) * MB), 'CONFORM_MEMORY_BUDGET'
+    avail = available_memory()
+    if avail is None:
+        return None, 'unknown'
+    return int(avail * AUTO_FRACTION / max(ranks_on_node, 1)), 'auto ({0} ranks on node)'.format(ranks_on_node)
+
+
+def index_bytes(inpds, in_dim, names=None):
+
+    '''
+    Return the bytes one index of an input dimension costs over the input variables that use it
+
+    Input:
+    inpds(InputDatasetDesc) - the input dataset
+    in_dim(string) - the input dimension name
+    names(set) - the input variables to count, None for all of them
+
+    Output:
+    nbytes(int) - the bytes per index of in_dim
+    length(int) - the length of in_dim, None if no variable uses it
+    '''
+    nbytes = 0
+    length = None
+    for name,var in inpds.variables.items():
+        if names is not None and name not in names:
+            continue
+        if in_dim not in var.dimensions:
+            continue
+        n = var.dtype.itemsize if var.dtype is not None else 8
+        for d,dim in var.dimensions.items():
+            if d == in_dim:
+                length = dim.size
+            else:
+                n = n * max(dim.size or 1, 1)
+        nbytes = nbytes + n
+    return nbytes, length
+
+
+def candidates(spec_fn, time_dim, chunking_ok):
+
+    '''
+    Return the output dimensions a specification may be chunked over, in order of preference.
+    As before, a specification without a time dimension is not chunked at all.
+    '''
+    if time_dim is None:
+        return []
+    name = os.path.basename(spec_fn)
+    if "Oclim" in name or "oclim" in name or "Oyr" in name or "oyr" in name:
+        return ['nlat', 'lat']
+    if not chunking_ok:
+        return ['lat', 'nlat']
+    return [time_dim]
+
+
+def plan(spec_fn, names, inpds, o2imap, time_dim, chunking_ok, budget):
+
+    '''
+    Pick the chunk dimension and size for a data flow
+
+    Input:
+    spec_fn(string) - the json specification, for the table name
+    names(set) - the input variables the specification reads, None for all of them
+    inpds(InputDatasetDesc) - the input dataset
+    o2imap(dictionary) - output dimension name -> input dimension name of the data flow
+    time_dim(string) - the output time dimension, None if there is none
+    chunking_ok(bool) - False if a definition can not be chunked over time
+    budget(int) - bytes per rank, None for the fixed chunks, 48 times or 10 latitudes
+
+    Output:
+    chunks(dictionary) - output dimension name -> chunk size, for DataFlow.execute
+    info(dictionary) - the 'dim', 'size', 'length', 'chunk_mb' and 'budget_mb' of the plan
+    '''
+    for out_dim in candidates(spec_fn, time_dim, chunking_ok):
+        if out_dim not in o2imap:
+            continue
+        nbytes,length = index_bytes(inpds, o2imap[out_dim], names)
+        if length is None or nbytes < 1:
+            continue
+        if budget is None:
+            size = 48 if out_dim == time_dim else 10
+        else:
+            size = int(budget // (WORKING_COPIES * nbytes))
+        size = max(1, min(size, length))
+        info = {'dim': out_dim, 'size': size, 'length': length,
+                'chunk_mb': WORKING_COPIES * nbytes * size / float(MB),
+                'budget_mb': budget / float(MB) if budget is not None else None}
+        return {out_dim: size}, info
+    return {}, {'dim': None, 'size': None, 'length': None, 'chunk_mb': None,
+                'budget_mb': budget / float(MB) if budget is not None else None}
+
+
+def describe(info):
+
+    '''
+    Return the chunk plan as a line for the log
+    '''
+    budget = 'no budget' if info['budget_mb'] is None else 'budget {0:.0f} MB'.format(info['budget_mb'])
+    if info['dim'] is None:
+        return 'not chunked, {0}'.format(budget)
+    return '{0}={1} of {2}, {3:.1f} MB per chunk, {4}'.format(info['dim'], info['size'], info['length'],
+                                                             info['chunk_mb'], budget)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+"""Work units and scheduling of the PyConform json specifications
+
+Every json specification and date found by cesm_conform_generator is a work
+unit.  A specification that defines more than one output file is split into
+one unit per output variable, each carrying all of the coordinate and
+auxiliary definitions of the specification, so one large MIP table does not
+hold a rank for hours.  The units are handed out from a single queue on the
+global master, longest predicted first, and every rank asks for a new unit
+as soon as it is idle.  The cost of a unit is the time it took in the last
+run, or an estimate from the size of its input files if it has not been run
+before.  The measured times are written to a per-table report and kept for
+the next run.
+
+Finished units are recorded in a ledger, one marker file per unit keyed by
+the sha1 of its part of the specification, its date and the names,
+modification times and sizes of its input files.  A rerun after a job hits
+its wall-clock limit skips the units whose marker and output files are
+unchanged, and redoes the ones that were partial or whose inputs changed.
+__________________________
+Created on Oct, 2026
+
+@author: CSEG <cseg@cgd.ucar.edu>
+"""
+
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+# default model - seconds = t0 + sec_per_byte * input bytes / number of output variables
+DEFAULT_MODEL = {'t0': 2.0,
+                 'sec_per_byte': 5.0e-8}
+
+def spec_table(spec_fn):
+
+    '''
+    Return the MIP table of a json specification from its file name,
+    <experiment>_<table>_<variable>_<realm>.json as written by iconform
+    '''
+    parts = os.path.basename(spec_fn).replace('.json', '').split('_')
+    if len(parts) < 3:
+        return os.path.basename(spec_fn)
+    return parts[-3]
+
+
+def output_variables(dsdict):
+
+    '''
+    Return the names of the variables in a specification that define an output file
+    '''
+    return [k for k,v in dsdict.items() if isinstance(v, dict) and 'file' in v]
+
+
+def split_spec(dsdict, variable):
+
+    '''
+    Return the part of a specification needed to write one output variable
+
+    Input:
+    dsdict(dictionary) - the whole json specification
+    variable(string) - the output variable to keep, None to keep all of them
+
+    Output:
+    dsdict(dictionary) - the definitions without an output file and the one of variable
+    '''
+    if variable is None:
+        return dsdict
+    return OrderedDict((k,v) for k,v in dsdict.items()
+                       if not (isinstance(v, dict) and 'file' in v) or k == variable)
+
+
+def unit_name(unit):
+
+    '''
+    Return the name a unit is reported and remembered by, the json file name,
+    the date and the output variable if the specification was split
+    '''
+    spec_fn,date = unit['spec'].split('>>')
+    name = '{0}>>{1}'.format(os.path.basename(spec_fn), date)
+    if unit['variable'] is not None:
+        name = '{0}:{1}'.format(name, unit['variable'])
+    return name
+
+
+def predict_time(nbytes, nsplit, model):
+
+    '''
+    Predicted seconds to conform one unit of a specification split nsplit ways
+    '''
+    return model['t0'] + model['sec_per_byte'] * nbytes / max(nsplit, 1)
+
+
+def work_units(mappings, unit_times=None, model=None):
+
+    '''
+    Split the specifications into work units and order them longest first
+
+    Input:
+    mappings(dictionary) - keys->'<json file>>><date>', values->input file names
+    unit_times(dictionary) - keys->unit_name, values->seconds measured in the last run (optional)
+    model(dictionary) - cost model coefficients for units that have not been measured (optional)
+
+    Output:
+    units(list) - dictionaries with the 'spec' key, the output 'variable' or None,
+                  the 'table' and the predicted 'cost' in seconds, longest first
+    '''
+    unit_times = unit_times if unit_times is not None else {}
+    model = model if model is not None else DEFAULT_MODEL
+    units = []
+    for spec in sorted(mappings.keys()):
+        spec_fn = spec.split('>>')[0]
+        try:
+            with open(spec_fn, 'r') as f:
+                variables = output_variables(json.load(f, object_pairs_hook=OrderedDict))
+        except (IOError, OSError, ValueError):
+            variables = []
+        if len(variables) < 2:
+            variables = [None]
+        nbytes = 0
+        for fn in mappings[spec]:
+            try:
+                nbytes = nbytes + os.path.getsize(fn)
+            except OSError:
+                pass
+        for v in variables:
+            unit = {'spec': spec, 'variable': v, 'table': spec_table(spec_fn)}
+            unit['cost'] = unit_times.get(unit_name(unit), predict_time(nbytes, len(variables), model))
+            units.append(unit)
+    # stable sort, so units of equal cost keep the order of their specification
+    units.sort(key=lambda u: -u['cost'])
+    for n,unit in enumerate(units):
+        unit['id'] = n
+    return units
+
+
+def table_report(results):
+
+    '''
+    Print the time spent on every MIP table, slowest first
+
+    Input:
+    results(list) - one dictionary per conformed unit with the unit keys and the
+                    'rank' it ran on, the 'seconds' it took and its 'failures'
+
+    Output:
+    tables(dictionary) - keys->table, values->number of 'units', total 'seconds',
+                         'longest' unit seconds, 'failures' and number of 'ranks'
+    '''
+    tables = {}
+    for r in results:
+        t = tables.setdefault(r['table'], {'units': 0, 'seconds': 0.0, 'longest': 0.0,
+                                           'failures': 0, 'ranks': set()})
+        t['units'] = t['units'] + 1
+        t['seconds'] = t['seconds'] + r['seconds']
+        t['longest'] = max(t['longest'], r['seconds'])
+        t['failures'] = t['failures'] + r['failures']
+        t['ranks'].add(r['rank'])
+    for t in tables.values():
+        t['ranks'] = len(t['ranks'])
+
+    print('{0:<20} {1:>7} {2:>7} {3:>12} {4:>12} {5:>9}'.format('table', 'units', 'ranks', 'seconds', 'longest', 'failures'))
+    for table,t in sorted(tables.items(), key=lambda item: -item[1]['seconds']):
+        print('{0:<20} {1:>7} {2:>7} {3:>12.1f} {4:>12.1f} {5:>9}'.format(
+            table, t['units'], t['ranks'], t['seconds'], t['longest'], t['failures']))
+    return tables
+
+
+def read_unit_times(times_fn):
+
+    '''
+    Read the seconds each unit took the last time it was conformed
+
+    Input:
+    times_fn(string) - the name of the json file written by save_unit_times
+
+    Output:
+    unit_times(dictionary) - keys->unit_name, values->seconds
+    '''
+    unit_times = {}
+    if os.path.isfile(times_fn):
+        try:
+            with open(times_fn, 'r') as f:
+                unit_times = json.load(f)
+        except ValueError:
+            print('WARNING: unable to parse {0} - estimating all unit times'.format(times_fn))
+    return unit_times
+
+
+def save_unit_times(times_fn, results, tables=None):
+
+    '''
+    Update the measured unit times and write the per-table report.  The times
+    file is replaced through a temporary file.
+
+    Input:
+    times_fn(string) - the name of the json file with the time of every unit
+    results(list) - one dictionary per conformed unit, as for table_report
+    tables(dictionary) - the table_report totals, written next to times_fn (optional)
+    '''
+    unit_times = read_unit_times(times_fn)
+    for r in results:
+        if r['failures'] == 0:
+            unit_times[unit_name(r)] = r['seconds']
+
+    outputs = [(times_fn, unit_times)]
+    if tables is not None:
+        outputs.append((times_fn.replace('.json', '') + '_tables.json', tables))
+    for fn,data in outputs:
+        tmp_fn = '{0}.tmp.{1}'.format(fn, os.getpid())
+        with open(tmp_fn, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp_fn, fn)
+
+
+def unit_key(unit, inputs):
+
+    '''
+    Return the ledger key of a unit, the sha1 of its part of the specification,
+    its date and the name, modification time and size of each of its input files
+    '''
+    spec_fn,date = unit['spec'].split('>>')
+    with open(spec_fn, 'r') as f:
+        dsdict = split_spec(json.load(f, object_pairs_hook=OrderedDict), unit['variable'])
+    stats = []
+    for fn in sorted(inputs):
+        try:
+            st = os.stat(fn)
+            stats.append([fn, st.st_mtime, st.st_size])
+        except OSError:
+            stats.append([fn, None, None])
+    key = json.dumps([dsdict, date, unit['variable'], stats], sort_keys=True)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def unit_finished(ledger_dir, key):
+
+    '''
+    Return True if the unit with key finished in an earlier run and none of its
+    output files have changed since.  A unit recorded without outputs is not finished.
+    '''
+    marker = os.path.join(ledger_dir, key + '.json')
+    if not os.path.isfile(marker):
+        return False
+    try:
+        with open(marker, 'r') as f:
+            record = json.load(f)
+    except ValueError:
+        return False
+    if len(record.get('outputs', [])) == 0:
+        return False
+    for output in record['outputs']:
+        try:
+            st = os.stat(output['path'])
+        except OSError:
+            return False
+        if st.st_mtime != output['mtime'] or st.st_size != output['size']:
+            return False
+    return True
+
+
+def mark_finished(ledger_dir, unit, outputs):
+
+    '''
+    Record a unit as finished.  The marker is written through a temporary file.
+
+    Input:
+    ledger_dir(string) - the ledger directory
+    unit(dictionary) - the work unit, with the 'key' from pending_units
+    outputs(list) - the output file names the unit wrote, all of them must exist
+    '''
+    if not os.path.isdir(ledger_dir):
+        os.makedirs(ledger_dir)
+    record = {'unit': unit_name(unit), 'finished': time.time(), 'outputs': []}
+    for fn in sorted(outputs):
+        st = os.stat(fn)
+        record['outputs'].append({'path': fn, 'mtime': st.st_mtime, 'size': st.st_size})
+    marker = os.path.join(ledger_dir, unit['key'] + '.json')
+    tmp_fn = '{0}.tmp.{1}'.format(marker, os.getpid())
+    with open(tmp_fn, 'w') as f:
+        json.dump(record, f, indent=1, sort_keys=True)
+    os.replace(tmp_fn, marker)
+
+
+def pending_units(units, mappings, ledger_dir):
+
+    '''
+    Drop the units that finished in an earlier run
+
+    Input:
+    units(list) - the work units from work_units
+    mappings(dictionary) - keys->'<json file>>><date>', values->input file names
+    ledger_dir(string) - the ledger directory
+
+    Output:
+    todo(list) - the units left to run, with their ledger 'key' and the 'id' renumbered, longest first
+    done(list) - the units that are skipped
+    '''
+    todo = []
+    done = []
+    for unit in units:
+        unit['key'] = unit_key(unit, mappings[unit['spec']])
+        if unit_finished(ledger_dir, unit['key']):
+            done.append(unit)
+        else:
+            todo.append(unit)
+    for n,unit in enumerate(todo):
+        unit['id'] = n
+    return todo, done
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""Output variable dependencies of the PyConform json specifications
+
+Does what `vardeps -f -n <json>` prints, through the PyConform definition
+parser in the calling process.  The json files are shared out over all
+ranks and the results are cached by the sha1 of each json file, so tables
+that have not changed since the last run are not parsed again.
+__________________________
+Created on Oct, 2026
+
+@author: CSEG <cseg@cgd.ucar.edu>
+"""
+
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from asaptools import partition
+from pyconform import parsing
+
+# bump when the cached entries change
+CACHE_VERSION = 1
+
+def variable_search(obj, found=None):
+
+    '''
+    Return the set of variable names used in a parsed definition
+    '''
+    if found is None:
+        found = set()
+    if isinstance(obj, parsing.VarType):
+        found.add(obj.key)
+    elif isinstance(obj, parsing.OpType):
+        for arg in obj.args:
+            variable_search(arg, found)
+    elif isinstance(obj, parsing.FuncType):
+        for arg in obj.args:
+            variable_search(arg, found)
+        for kwd in obj.kwds:
+            variable_search(obj.kwds[kwd], found)
+    return found
+
+
+def definition_inputs(dsdict):
+
+    '''
+    Return the set of variables all of the definitions of a specification read,
+    None if a definition can not be parsed
+    '''
+    names = set()
+    for var in dsdict.values():
+        definition = var.get('definition', None) if isinstance(var, dict) else None
+        if not isinstance(definition, str):
+            continue
+        try:
+            variable_search(parsing.parse_definition(definition), names)
+        except Exception:
+            return None
+    return names
+
+
+def spec_deps(spec_fn):
+
+    '''
+    Find the dependencies of every variable defined in a json specification
+
+    Input:
+    spec_fn(string) - the json file name
+
+    Output:
+    deps(list) - one dictionary per variable with a string definition, sorted by 'name'.
+                 'deps' is the sorted list of variables the definition needs, or None if the
+                 definition can not be parsed or needs no variables.  'freq' and 'realm' are
+                 the frequency and the first word of the realm attributes of the variable,
+                 None if it has no frequency attribute.
+    '''
+    with open(spec_fn, 'r') as f:
+        stddict = json.load(f, object_pairs_hook=OrderedDict)
+    deps = []
+    for name in sorted(stddict.keys()):
+        var = stddict[name]
+        if not isinstance(var.get('definition', None), str):
+            continue
+        attributes = var.get('attributes', {})
+        d = {'name': name, 'freq': None, 'realm': None, 'deps': None}
+        try:
+            found = sorted(variable_search(parsing.parse_definition(var['definition'])))
+            if 'frequency' in attributes:
+                d['freq'] = str(attributes['frequency'])
+                realm = str(attributes['realm']).split()
+                d['realm'] = realm[0] if len(realm) > 0 else ''
+            if len(found) > 0:
+                d['deps'] = found
+        except Exception:
+            d['freq'] = None
+            d['realm'] = None
+        deps.append(d)
+    return deps
+
+
+def file_hash(fn):
+
+    '''
+    Return the sha1 hex digest of the contents of a file
+    '''
+    sha = hashlib.sha1()
+    with open(fn, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def read_cache(cache_fn):
+
+    '''
+    Read the cached dependencies, keys->json file sha1, values->spec_deps
+    '''
+    cache = {}
+    if cache_fn is not None and os.path.isfile(cache_fn):
+        try:
+            with open(cache_fn, 'r') as f:
+                data = json.load(f)
+            if data.get('version', None) == CACHE_VERSION:
+                cache = data['tables']
+        except ValueError:
+            print('WARNING: unable to parse {0} - finding all dependencies'.format(cache_fn))
+    return cache
+
+
+def save_cache(cache_fn, cache):
+
+    '''
+    Write the cached dependencies through a temporary file
+    '''
+    if not os.path.isdir(os.path.dirname(cache_fn)):
+        os.makedirs(os.path.dirname(cache_fn))
+    tmp_fn = '{0}.tmp.{1}'.format(cache_fn, os.getpid())
+    with open(tmp_fn, 'w') as f:
+        json.dump({'version': CACHE_VERSION, 'tables': cache}, f)
+    os.replace(tmp_fn, cache_fn)
+
+
+def resolve(spec_files, comm, cache_fn=None):
+
+    '''
+    Find the dependencies of the json specifications on all ranks of comm.
+    Every rank must call this.
+
+    Input:
+    spec_files(list) - the json file names, the same on every rank
+    comm(simplecomm) - the communicator to share the work over
+    cache_fn(string) - the json cache file, read and written on rank 0 (optional)
+
+    Output:
+    vardeps(dictionary) - keys->json file name, values->spec_deps, on every rank
+    '''
+    rank = comm.get_rank()
+    size = comm.get_size()
+    VD_TAG = 40
+
+    # rank 0 hashes the tables and keeps the cached ones, the others are shared out
+    todo = []
+    vardeps = {}
+    cache = {}
+    hashes = {}
+    if rank == 0:
+        cache = read_cache(cache_fn)
+        for fn in spec_files:
+            hashes[fn] = file_hash(fn)
+            if hashes[fn] in cache:
+                vardeps[fn] = cache[hashes[fn]]
+            else:
+                todo.append(fn)
+        print('{0} of {1} json specifications found in the dependency cache'.format(len(spec_files)-len(todo), len(spec_files)))
+    l_vardeps = {}
+    for fn in comm.partition(todo, func=partition.EqualStride(), involved=True):
+        l_vardeps[fn] = spec_deps(fn)
+
+    if size > 1:
+        if rank == 0:
+            for i in range(1, size):
+                r,r_vardeps = comm.collect(data=None, tag=VD_TAG)
+                l_vardeps.update(r_vardeps)
+        else:
+            comm.collect(data=l_vardeps, tag=VD_TAG)
+
+    if rank == 0:
+        vardeps.update(l_vardeps)
+        if cache_fn is not None:
+            for fn,deps in l_vardeps.items():
+                cache[hashes[fn]] = deps
+            # only keep the tables of the current json files, the old versions are not used again
+            current = set(hashes.values())
+            stale = [h for h in cache if h not in current]
+            for h in stale:
+                del cache[h]
+            if len(l_vardeps) > 0 or len(stale) > 0:
+                save_cache(cache_fn, cache)
+    return comm.partition(vardeps, func=partition.Duplicate(), involved=True)
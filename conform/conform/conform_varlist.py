@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""Merge of the time series variable lists built by fill_list on every rank
+
+fill_list builds a nested dictionary on each rank, model type -> variable ->
+time_period_freq -> date -> {'files', 'lat', 'lon', 'lev', 'time'}.  Instead
+of rank 0 collecting and merging every nested dictionary in turn, the lists
+are flattened to one entry per (model type, variable, time_period_freq, date)
+key and merged pairwise up a binomial tree in log2(size) steps.  The merged
+table is broadcast once and nested again on every rank.
+__________________________
+Created on Oct, 2026
+
+@author: CSEG <cseg@cgd.ucar.edu>
+"""
+
+from __future__ import print_function
+
+# tag of the messages up the merge tree
+VL_TAG = 31
+
+# order of the values of a flattened entry
+FIELDS = ['files', 'lat', 'lon', 'lev', 'time']
+
+def flatten(variablelist):
+
+    '''
+    Flatten a nested variable list
+
+    Input:
+    variablelist(dictionary) - model type -> variable -> time_period_freq -> date -> entry
+
+    Output:
+    flat(dictionary) - 'skip' True if any file was skipped and 'entries',
+                       (model type, variable, time_period_freq, date) -> [files, lat, lon, lev, time]
+    '''
+    entries = {}
+    for mt,d1 in variablelist.items():
+        for vn,d2 in d1.items():
+            for tp,d3 in d2.items():
+                for date,e in d3.items():
+                    entries[(mt,vn,tp,date)] = [list(e.get('files', []))] + [e.get(f, None) for f in FIELDS[1:]]
+    return {'skip': 'skip' in variablelist, 'entries': entries}
+
+
+def merge(flat, other):
+
+    '''
+    Merge the flattened list of a higher rank into flat, in place.  A key found in
+    both keeps the entry of flat and gets the time series files of the other entry
+    appended, the first file and any appended to it, as the serial merge did.
+
+    Output:
+    flat(dictionary) - the merged list
+    '''
+    flat['skip'] = flat['skip'] or other['skip']
+    entries = flat['entries']
+    for key,e in other['entries'].items():
+        if key in entries:
+            files = e[0][:1] + e[0][2:]
+            entries[key][0].extend(fn for fn in files if fn is not None)
+        else:
+            entries[key] = e
+    return flat
+
+
+def nest(flat):
+
+    '''
+    Return the nested variable list of a flattened one
+    '''
+    variablelist = {}
+    if flat['skip']:
+        variablelist['skip'] = {}
+    for (mt,vn,tp,date),e in flat['entries'].items():
+        d = variablelist.setdefault(mt, {}).setdefault(vn, {}).setdefault(tp, {})
+        d[date] = dict(zip(FIELDS, e))
+    return variablelist
+
+
+def tree_merge(comm, variablelist, headers):
+
+    '''
+    Merge the variable lists of all ranks and give the result to every rank.
+    Every rank must call this.
+
+    Input:
+    comm(simplecomm) - the communicator
+    variablelist(dictionary) - the nested list of this rank
+    headers(list) - the file headers this rank read, gathered on rank 0 only
+
+    Output:
+    variable_list(dictionary) - the merged nested list, on every rank
+    headers(list) - the headers of all ranks on rank 0, this rank's elsewhere
+    '''
+    flat = flatten(variablelist)
+    size = comm.get_size()
+    if size < 2:
+        return nest(flat), headers
+
+    # simplecomm has no point to point messages between workers, use its mpi4py communicator
+    mpi_comm = comm._comm
+    rank = comm.get_rank()
+    step = 1
+    while step < size:
+        if rank % (2*step) != 0:
+            mpi_comm.send((flat,headers), dest=rank-step, tag=VL_TAG)
+            break
+        if rank+step < size:
+            other,other_headers = mpi_comm.recv(source=rank+step, tag=VL_TAG)
+            flat = merge(flat, other)
+            headers = headers + other_headers
+        step = step * 2
+    flat = mpi_comm.bcast(flat if rank == 0 else None, root=0)
+    return nest(flat), headers
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Unit test suite for the conform chunk planner
+
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import netCDF4 as nc
+import numpy as np
+
+from pyconform.datasets import InputDatasetDesc
+
+from conform import conform_chunks, conform_vardeps
+
+def write_history(fn, ntime, nlev, nlat=8, nlon=16):
+    f = nc.Dataset(fn, 'w')
+    f.createDimension('time', None)
+    f.createDimension('lev', nlev)
+    f.createDimension('lat', nlat)
+    f.createDimension('lon', nlon)
+    t = f.createVariable('time', 'f8', ('time',))
+    t.units = 'days since 0001-01-01'
+    t[:] = np.arange(ntime)
+    f.createVariable('lat', 'f8', ('lat',))[:] = np.arange(nlat)
+    f.createVariable('lon', 'f8', ('lon',))[:] = np.arange(nlon)
+    f.createVariable('T', 'f4', ('time', 'lev', 'lat', 'lon'))[:] = np.zeros((ntime, nlev, nlat, nlon))
+    f.createVariable('PS', 'f8', ('time', 'lat', 'lon'))[:] = np.zeros((ntime, nlat, nlon))
+    f.close()
+
+
+class test_conform_chunks(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.tmp_dir, 'case.cam.h0.T.000101-001012.nc')
+        write_history(self.fn, 120, 30)
+        self.inpds = InputDatasetDesc(filenames=[self.fn])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_budget(self):
+        """ test to see if the chunk size follows the budget and the variables the specification reads
+        """
+        dsdict = {'time': {'definition': 'time'}, 'ta': {'definition': 'T'}}
+        o2imap = {'time': 'time'}
+        # a time step of T and of time, read, computed and written at once
+        step = 30*8*16*4 + 8
+        budget = conform_chunks.WORKING_COPIES * step * 10
+        names = conform_vardeps.definition_inputs(dsdict)
+        self.assertEqual(names, set(['time', 'T']))
+        chunks,info = conform_chunks.plan('exp_Amon_ta_atmos.json', names, self.inpds, o2imap, 'time', True, budget)
+        self.assertEqual(chunks, {'time': 10})
+        self.assertEqual(info['length'], 120)
+
+        # reading PS as well makes each time step bigger
+        dsdict['ps'] = {'definition': 'PS'}
+        names = conform_vardeps.definition_inputs(dsdict)
+        chunks,info = conform_chunks.plan('exp_Amon_ta_atmos.json', names, self.inpds, o2imap, 'time', True, budget)
+        self.assertEqual(chunks, {'time': (step * 10) // (step + 8*16*8)})
+
+        # a big budget takes the whole dimension and a tiny one still moves one index
+        self.assertEqual(conform_chunks.plan('t.json', names, self.inpds, o2imap, 'time', True, 1 << 40)[0], {'time': 120})
+        chunks,info = conform_chunks.plan('t.json', names, self.inpds, o2imap, 'time', True, 1)
+        self.assertEqual(chunks, {'time': 1})
+        self.assertIn('time=1 of 120', conform_chunks.describe(info))
+
+    def test_dimension(self):
+        """ test to see if the chunk dimension follows the table and the definitions
+        """
+        dsdict = {'time': {'definition': 'time'}, 'ta': {'definition': 'T'}}
+        o2imap = {'time': 'time', 'lat': 'lat'}
+        names = conform_vardeps.definition_inputs(dsdict)
+        chunks,info = conform_chunks.plan('exp_Amon_ta_atmos.json', names, self.inpds, o2imap, 'time', False, None)
+        self.assertEqual(chunks, {'lat': 8})
+        chunks,info = conform_chunks.plan('exp_Oyr_ta_ocean.json', None, self.inpds, o2imap, 'time', True, None)
+        self.assertEqual(chunks, {'lat': 8})
+        chunks,info = conform_chunks.plan('exp_Amon_ta_atmos.json', names, self.inpds, o2imap, 'time', True, None)
+        self.assertEqual(chunks, {'time': 48})
+        chunks,info = conform_chunks.plan('exp_fx_ta_atmos.json', None, self.inpds, {}, None, True, None)
+        self.assertEqual(chunks, {})
+
+        # without a time dimension nothing is chunked, not even over latitude
+        o2imap = {'lat': 'lat'}
+        for spec_fn,chunking_ok in [('exp_Oyr_ta_ocean.json', True), ('exp_Oclim_ta_ocean.json', True),
+                                    ('exp_Amon_ta_atmos.json', False)]:
+            chunks,info = conform_chunks.plan(spec_fn, None, self.inpds, o2imap, None, chunking_ok, None)
+            self.assertEqual(chunks, {})
+            self.assertEqual(info['dim'], None)
+        self.assertEqual(conform_chunks.memory_budget('512', 4), (512*conform_chunks.MB, 'CONFORM_MEMORY_BUDGET'))
+
+if __name__ == '__main__':
+    unittest.main()
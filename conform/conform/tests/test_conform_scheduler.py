@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+Unit test suite for the conform work unit scheduler
+
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+
+from conform import conform_scheduler
+
+def write_spec(fn, outputs):
+    dsdict = OrderedDict()
+    dsdict['time'] = {'definition': 'time', 'dimensions': ['time']}
+    dsdict['lat'] = {'definition': 'lat', 'dimensions': ['lat']}
+    for v in outputs:
+        dsdict[v] = {'definition': v.upper(), 'dimensions': ['time', 'lat'],
+                     'file': {'filename': '{0}.nc'.format(v)}}
+    with open(fn, 'w') as f:
+        json.dump(dsdict, f)
+
+
+class test_conform_scheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def input_file(self, name, nbytes):
+        fn = os.path.join(self.tmp_dir, name)
+        with open(fn, 'wb') as f:
+            f.write(b'0' * nbytes)
+        return fn
+
+    def test_split(self):
+        """ test to see if a table with several output files is split into one unit per variable
+            that keeps the coordinates
+        """
+        amon = os.path.join(self.tmp_dir, 'exp_Amon_all_atmos.json')
+        fx = os.path.join(self.tmp_dir, 'exp_fx_areacella_atmos.json')
+        write_spec(amon, ['tas', 'pr', 'ts'])
+        write_spec(fx, ['areacella'])
+        mappings = {amon+'>>000101-001012': [self.input_file('a.nc', 3000000)],
+                    fx+'>>000101-001012': [self.input_file('b.nc', 10)]}
+        units = conform_scheduler.work_units(mappings)
+        self.assertEqual(len(units), 4)
+        self.assertEqual([u['variable'] for u in units], ['tas', 'pr', 'ts', None])
+        self.assertEqual([u['id'] for u in units], [0, 1, 2, 3])
+        self.assertEqual(units[0]['table'], 'Amon')
+
+        with open(amon) as f:
+            dsdict = json.load(f, object_pairs_hook=OrderedDict)
+        part = conform_scheduler.split_spec(dsdict, 'pr')
+        self.assertEqual(list(part.keys()), ['time', 'lat', 'pr'])
+        self.assertEqual(conform_scheduler.output_variables(part), ['pr'])
+
+    def test_measured_times(self):
+        """ test to see if the times of the last run order the units and are saved per unit
+        """
+        specs = [os.path.join(self.tmp_dir, 'exp_Omon_{0}_ocean.json'.format(v)) for v in ['so', 'thetao']]
+        mappings = dict()
+        for fn in specs:
+            write_spec(fn, [os.path.basename(fn).split('_')[2]])
+            mappings[fn+'>>185001-201412'] = [self.input_file(os.path.basename(fn)+'.nc', 1000)]
+        times_fn = os.path.join(self.tmp_dir, 'conform_unit_times.json')
+        units = conform_scheduler.work_units(mappings, conform_scheduler.read_unit_times(times_fn))
+        self.assertEqual(units[0]['cost'], units[1]['cost'])
+
+        results = []
+        for unit,seconds in zip(units, [10.0, 500.0]):
+            result = dict(unit)
+            result.update({'rank': 1, 'seconds': seconds, 'failures': 0})
+            results.append(result)
+        tables = conform_scheduler.table_report(results)
+        self.assertEqual(tables['Omon']['units'], 2)
+        self.assertEqual(tables['Omon']['longest'], 500.0)
+        conform_scheduler.save_unit_times(times_fn, results, tables)
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp_dir, 'conform_unit_times_tables.json')))
+
+        units = conform_scheduler.work_units(mappings, conform_scheduler.read_unit_times(times_fn))
+        self.assertEqual([u['cost'] for u in units], [500.0, 10.0])
+        self.assertEqual(units[0]['spec'], results[1]['spec'])
+
+    def test_ledger(self):
+        """ test to see if finished units are skipped and are redone when an input or output changes
+        """
+        amon = os.path.join(self.tmp_dir, 'exp_Amon_all_atmos.json')
+        write_spec(amon, ['tas', 'pr'])
+        inputs = [self.input_file('a.nc', 100)]
+        mappings = {amon+'>>000101-001012': inputs}
+        ledger_dir = os.path.join(self.tmp_dir, 'conform_ledger')
+        units,done = conform_scheduler.pending_units(conform_scheduler.work_units(mappings), mappings, ledger_dir)
+        self.assertEqual((len(units), len(done)), (2, 0))
+
+        outputs = [self.input_file('{0}.nc'.format(u['variable']), 10) for u in units]
+        first = units[0]['variable']
+        for unit,fn in zip(units, outputs):
+            conform_scheduler.mark_finished(ledger_dir, unit, [fn])
+        units,done = conform_scheduler.pending_units(conform_scheduler.work_units(mappings), mappings, ledger_dir)
+        self.assertEqual((len(units), len(done)), (0, 2))
+
+        # a partial output and a changed input make the units run again
+        os.remove(outputs[0])
+        units,done = conform_scheduler.pending_units(conform_scheduler.work_units(mappings), mappings, ledger_dir)
+        self.assertEqual([u['variable'] for u in units], [first])
+        self.assertEqual(units[0]['id'], 0)
+        self.input_file('a.nc', 200)
+        units,done = conform_scheduler.pending_units(conform_scheduler.work_units(mappings), mappings, ledger_dir)
+        self.assertEqual((len(units), len(done)), (2, 0))
+
+        # a unit recorded without any outputs is never finished
+        conform_scheduler.mark_finished(ledger_dir, units[0], [])
+        self.assertFalse(conform_scheduler.unit_finished(ledger_dir, units[0]['key']))
+
+if __name__ == '__main__':
+    unittest.main()
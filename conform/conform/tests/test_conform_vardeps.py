@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Unit test suite for the in-process json specification dependencies
+
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from asaptools import simplecomm
+from conform import conform_vardeps
+
+SPEC = {'tas': {'definition': 'TREFHT', 'attributes': {'frequency': 'mon', 'realm': 'atmos'}},
+        'pr': {'definition': '(PRECC + PRECL)*1000.0', 'attributes': {'frequency': 'mon', 'realm': 'atmos land'}},
+        'sic': {'definition': 'yeartomonth_data(aice, time, var=hi)', 'attributes': {'frequency': 'day', 'realm': 'seaIce'}},
+        'time_bnds': {'definition': 'bounds(time, bdim="hist_interval")'},
+        'const': {'definition': '2.0', 'attributes': {'frequency': 'fx', 'realm': 'atmos'}},
+        'lev': {'definition': [1.0, 2.0]}}
+
+class test_conform_vardeps(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.spec_fn = os.path.join(self.tmp_dir, 'exp_Amon_tas_atmos.json')
+        with open(self.spec_fn, 'w') as f:
+            json.dump(SPEC, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_specDeps(self):
+        """ test to see if the dependencies match what vardeps -f prints
+        """
+        deps = dict((d['name'], d) for d in conform_vardeps.spec_deps(self.spec_fn))
+        self.assertEqual(sorted(deps.keys()), ['const', 'pr', 'sic', 'tas', 'time_bnds'])
+        self.assertEqual(deps['pr'], {'name': 'pr', 'freq': 'mon', 'realm': 'atmos', 'deps': ['PRECC', 'PRECL']})
+        self.assertEqual(deps['sic']['deps'], ['aice', 'hi', 'time'])
+        self.assertEqual(deps['time_bnds']['freq'], None)
+        self.assertEqual(deps['time_bnds']['deps'], ['time'])
+        self.assertEqual(deps['const']['deps'], None)
+
+    def test_cache(self):
+        """ test to see if an unchanged json file is taken from the cache and a changed one is parsed again
+        """
+        comm = simplecomm.create_comm(serial=True)
+        cache_fn = os.path.join(self.tmp_dir, 'logs', 'conform_vardeps.json')
+        vardeps = conform_vardeps.resolve([self.spec_fn], comm, cache_fn)
+        self.assertTrue(os.path.isfile(cache_fn))
+
+        # poison the cache entry to see that it is used
+        cache = conform_vardeps.read_cache(cache_fn)
+        cache[conform_vardeps.file_hash(self.spec_fn)] = []
+        conform_vardeps.save_cache(cache_fn, cache)
+        self.assertEqual(conform_vardeps.resolve([self.spec_fn], comm, cache_fn)[self.spec_fn], [])
+
+        spec = json.loads(json.dumps(SPEC))
+        spec['tas']['definition'] = 'TS'
+        with open(self.spec_fn, 'w') as f:
+            json.dump(spec, f)
+        vardeps = conform_vardeps.resolve([self.spec_fn], comm, cache_fn)
+        self.assertIn({'name': 'tas', 'freq': 'mon', 'realm': 'atmos', 'deps': ['TS']}, vardeps[self.spec_fn])
+        self.assertEqual(list(conform_vardeps.read_cache(cache_fn).keys()), [conform_vardeps.file_hash(self.spec_fn)])
+
+if __name__ == '__main__':
+    unittest.main()
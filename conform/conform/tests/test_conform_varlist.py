@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Unit test suite for the tree merge of the conform variable lists
+
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from asaptools import simplecomm
+
+from conform import conform_varlist
+
+def entry(fn, grid='/grids/ocn.nc'):
+    return {'files': [fn, grid], 'lat': 'nlat', 'lon': 'nlon', 'lev': None, 'time': None}
+
+
+def mpirun():
+    """ the mpirun command, from MPIRUN if it is set
+    """
+    return os.environ.get('MPIRUN', 'mpirun').split()
+
+
+class test_conform_varlist(unittest.TestCase):
+
+    def test_merge(self):
+        """ test to see if the merged list keeps the first entry of a key and appends the files of the others
+        """
+        lists = [{'ocn': {'TEMP': {'month_1': {'000101-001012': entry('a0.nc')}}}},
+                 {'ocn': {'TEMP': {'month_1': {'000101-001012': entry('a1.nc'), '001101-002012': entry('b1.nc')}}},
+                  'skip': {}},
+                 {'ocn': {'TEMP': {'month_1': {'000101-001012': entry('a2.nc', None)}},
+                          'SALT': {'month_1': {'000101-001012': entry('c2.nc')}}}}]
+        comm = simplecomm.create_comm(serial=True)
+        variable_list,headers = conform_varlist.tree_merge(comm, lists[0], ['h0'])
+        self.assertEqual(variable_list, lists[0])
+        self.assertEqual(headers, ['h0'])
+
+        # pairs merged up the tree give the same list as merging in rank order
+        left = conform_varlist.merge(conform_varlist.flatten(lists[0]), conform_varlist.flatten(lists[1]))
+        variable_list = conform_varlist.nest(conform_varlist.merge(left, conform_varlist.flatten(lists[2])))
+        self.assertEqual(variable_list['ocn']['TEMP']['month_1']['000101-001012']['files'],
+                         ['a0.nc', '/grids/ocn.nc', 'a1.nc', 'a2.nc'])
+        self.assertEqual(variable_list['ocn']['TEMP']['month_1']['001101-002012'], entry('b1.nc'))
+        self.assertEqual(variable_list['ocn']['SALT']['month_1']['000101-001012']['lat'], 'nlat')
+        self.assertEqual(variable_list['skip'], {})
+
+        right = conform_varlist.merge(conform_varlist.flatten(lists[1]), conform_varlist.flatten(lists[2]))
+        tree = conform_varlist.nest(conform_varlist.merge(conform_varlist.flatten(lists[0]), right))
+        self.assertEqual(tree, variable_list)
+
+    def test_scaling(self):
+        """ test to see if the tree merge on localhost MPI gives every rank the serial merge, and print its times
+        """
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'varlist_mpi.py')
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.dirname(script)))] +
+                                            [p for p in [env.get('PYTHONPATH')] if p])
+        # let open mpi run more ranks than cores, and as root in containers
+        env.setdefault('OMPI_MCA_rmaps_base_oversubscribe', '1')
+        env.setdefault('OMPI_ALLOW_RUN_AS_ROOT', '1')
+        env.setdefault('OMPI_ALLOW_RUN_AS_ROOT_CONFIRM', '1')
+        for np in [1, 2, 4, 8]:
+            try:
+                out = subprocess.check_output(mpirun() + ['-np', str(np), sys.executable, script, '1000'],
+                                              env=env, stderr=subprocess.STDOUT)
+            except OSError:
+                self.skipTest('mpirun not found')
+            result = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+            print('{0} ranks, {1} files: {2:.3f} seconds'.format(result['size'], result['files'], result['seconds']))
+            self.assertEqual(result['size'], np)
+            self.assertTrue(result['ok'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+Run the tree merge of synthetic variable lists on every rank of MPI_COMM_WORLD,
+check it against the serial merge and print the time on rank 0
+
+    mpirun -np 4 python varlist_mpi.py <files per rank>
+"""
+
+from __future__ import print_function
+
+import json
+import sys
+import time
+
+from asaptools import simplecomm
+
+from conform import conform_varlist
+
+def synthetic_list(rank, nfiles):
+    """ the list fill_list would build from nfiles time series files, with the files of
+        rank r shared by rank r+1 so keys meet in the merge
+    """
+    variablelist = {}
+    for n in range(nfiles):
+        mt = ['atm', 'ocn', 'lnd,rof', 'ice'][n % 4]
+        vn = 'V{0}'.format((rank * nfiles + n) // 2)
+        date = '{0:04d}01-{0:04d}12'.format(n % 10)
+        fn = '/archive/{0}/proc/tseries/month_1/case.h.{1}.{2}.nc'.format(mt, vn, date)
+        entry = {'files': [fn, '/grids/{0}.nc'.format(mt)], 'lat': 'lat', 'lon': 'lon', 'lev': None, 'time': None}
+        variablelist.setdefault(mt, {}).setdefault(vn, {}).setdefault('month_1', {})[date] = entry
+    if rank == 1:
+        variablelist['skip'] = {}
+    return variablelist
+
+
+if __name__ == '__main__':
+    nfiles = int(sys.argv[1])
+    comm = simplecomm.create_comm(serial=False)
+    rank = comm.get_rank()
+    size = comm.get_size()
+
+    comm.sync()
+    start = time.time()
+    variable_list,headers = conform_varlist.tree_merge(comm, synthetic_list(rank, nfiles), [rank])
+    comm.sync()
+    seconds = time.time() - start
+
+    flat = conform_varlist.flatten(synthetic_list(0, nfiles))
+    for r in range(1, size):
+        flat = conform_varlist.merge(flat, conform_varlist.flatten(synthetic_list(r, nfiles)))
+    ok = json.dumps(variable_list, sort_keys=True) == json.dumps(conform_varlist.nest(flat), sort_keys=True)
+    ok = comm.allreduce(1 if ok else 0, 'min') == 1
+    if rank == 0:
+        print(json.dumps({'size': size, 'files': nfiles * size, 'seconds': seconds,
+                          'ok': ok and headers == list(range(size))}))
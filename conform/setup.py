@@ -50,7 +50,9 @@ setup(
     author_email="mickelson@ucar.edu",
     packages=['conform'],
     version=get_version(),
-    scripts=['conform/cesm_conform_generator.py','conform/cesm_conform_initialize.py','conform/cesm_extras'],
+    scripts=['conform/cesm_conform_generator.py','conform/cesm_conform_initialize.py','conform/cesm_extras',
+             'conform/conform_scheduler.py','conform/conform_vardeps.py','conform/conform_chunks.py',
+             'conform/conform_varlist.py'],
     install_requires=get_requires(),
     include_package_data=True,
     zip_safe=True,
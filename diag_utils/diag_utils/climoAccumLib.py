@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+"""Extend existing climatologies instead of recomputing them
+
+Each climatology file of an average that is linear in the years it covers
+(monthly, seasonal and annual means, the ocean tavg and mavg) gets a sidecar
+accumulator file, <climo>.acc.nc, holding the float64 running sum of every
+averaged variable and the number of years summed.
+
+When a climatology is requested for start_year-stop_year and one exists for
+start_year-prev_year, only the years prev_year+1 to stop_year are averaged
+by the pyAverager.  The new partial average is added to the stored sums and
+the climatology for the whole range is written with its own sidecar.  A
+climatology without a sidecar, e.g. from an earlier version, is used with
+its mean times its number of years.  Only a stored climatology with all the
+variables being averaged is extended, and a dependent seasonal average is
+extended together with its months or not at all.
+
+Usage:
+    averageList, extensions = climoAccumLib.plan_extensions(averageList, climo_name, out_dir, varList)
+    ... call the pyAverager with averageList ...
+    climoAccumLib.finish(averageList, extensions, climo_name, out_dir, main_comm)
+__________________________
+Created on Oct, 2026
+
+@author: CSEG <cseg@cgd.ucar.edu>
+"""
+
+from __future__ import print_function
+
+import os
+
+import netCDF4 as nc
+import numpy as np
+
+ACC_SUFFIX = '.acc.nc'
+
+MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+# averages that are a mean over years of the same quantity, so the averages of
+# consecutive year ranges combine weighted by their number of years
+COMBINABLE = MONTHS + ['ann', 'mam', 'jja', 'son', 'tavg', 'mavg']
+
+# the months a dependent seasonal average (dep_ann, djf_sig, ...) is computed
+# from, by the pyAverager in the same pass over the same years
+SEASON_MONTHS = {'ann': MONTHS, 'djf': ['dec', 'jan', 'feb'], 'mam': ['mar', 'apr', 'may'],
+                 'jja': ['jun', 'jul', 'aug'], 'son': ['sep', 'oct', 'nov']}
+
+# the time coordinate and its bounds and labels are not averaged, a combined
+# climatology takes its bounds from the first and last year ranges and its
+# labels from the last
+TIME_BOUNDS = ['time_bnds', 'time_bound']
+TIME_LABELS = ['date', 'datesec']
+
+def avg_parts(avg):
+    """ split a pyAverager average, e.g. 'dep_ann:1:50', into ('dep_', 'ann', '1', '50')
+    """
+    descr = avg.split(':')
+    prefix = 'dep_' if descr[0].startswith('dep_') else ''
+    stop = descr[2] if len(descr) > 2 else descr[1]
+    return prefix, descr[0][len(prefix):], descr[1], stop
+
+
+def year_string(year, like):
+    """ format a year with the zero padding of another year string
+    """
+    return str(int(year)).zfill(len(str(like)))
+
+
+def is_averaged(var):
+    """ variables that are averaged in time, the others are copied
+    """
+    return 'time' in var.dimensions and var.dtype.kind in 'fiu' and \
+        var.name not in ['time'] + TIME_BOUNDS + TIME_LABELS
+
+
+def covers(climo_fn, varList):
+    """ the climatology has every variable of varList
+    """
+    with nc.Dataset(climo_fn, 'r') as climo:
+        return set(varList).issubset(climo.variables)
+
+
+def sidecar_name(climo_fn):
+    return climo_fn + ACC_SUFFIX
+
+
+def read_sums(climo_fn, years):
+    """ read the running sums of a climatology
+
+    Arguments:
+    climo_fn (string) - the climatology file
+    years (int) - the number of years in the climatology, used without a valid sidecar
+
+    Return:
+    sums (dictionary) - variable name -> float64 sum, from the mean of the climatology
+                        for the variables the sidecar does not have
+    years (int) - the number of years summed
+    """
+    acc_fn = sidecar_name(climo_fn)
+    st = os.stat(climo_fn)
+    if os.path.isfile(acc_fn):
+        with nc.Dataset(acc_fn, 'r') as acc:
+            if acc.getncattr('climo_size') == st.st_size and acc.getncattr('climo_mtime') == st.st_mtime:
+                sums = dict((v, acc.variables[v][:]) for v in acc.variables)
+                years = int(acc.getncattr('years'))
+                sums.update(mean_sums(climo_fn, years, skip=sums))
+                return sums, years
+        print('WARNING: {0} does not match {1}, using its mean'.format(acc_fn, climo_fn))
+    return mean_sums(climo_fn, years), years
+
+
+def mean_sums(climo_fn, years, skip=()):
+    """ the sums of a climatology from its means, except for the variables in skip
+    """
+    sums = dict()
+    with nc.Dataset(climo_fn, 'r') as climo:
+        for v, var in climo.variables.items():
+            if is_averaged(var) and v not in skip:
+                sums[v] = np.ma.asarray(var[:], dtype=np.float64) * years
+    return sums
+
+
+def write_sidecar(climo_fn, sums, years):
+    """ write the running sums of a climatology next to it through a temporary file
+    """
+    acc_fn = sidecar_name(climo_fn)
+    tmp_fn = '{0}.tmp.{1}'.format(acc_fn, os.getpid())
+    st = os.stat(climo_fn)
+    with nc.Dataset(climo_fn, 'r') as climo, nc.Dataset(tmp_fn, 'w', format='NETCDF4') as acc:
+        acc.setncattr('climo', os.path.basename(climo_fn))
+        acc.setncattr('climo_size', st.st_size)
+        acc.setncattr('climo_mtime', st.st_mtime)
+        acc.setncattr('years', years)
+        for v in sorted(sums.keys()):
+            for d in climo.variables[v].dimensions:
+                if d not in acc.dimensions:
+                    dim = climo.dimensions[d]
+                    acc.createDimension(d, None if dim.isunlimited() else len(dim))
+            var = acc.createVariable(v, 'f8', climo.variables[v].dimensions, fill_value=nc.default_fillvals['f8'])
+            var[:] = sums[v]
+    os.replace(tmp_fn, acc_fn)
+
+
+def combine(prev_fn, prev_years, part_fn, part_years, out_fn):
+    """ write the climatology of two consecutive year ranges and its sidecar
+
+    Arguments:
+    prev_fn (string) - the stored climatology of the first years
+    prev_years (int) - its number of years
+    part_fn (string) - the pyAverager climatology of the following years
+    part_years (int) - its number of years
+    out_fn (string) - the climatology of all the years
+    """
+    sums, years = read_sums(prev_fn, prev_years)
+    years = years + part_years
+    combined = dict()
+    tmp_fn = '{0}.tmp.{1}'.format(out_fn, os.getpid())
+    with nc.Dataset(prev_fn, 'r') as prev, nc.Dataset(part_fn, 'r') as part, \
+         nc.Dataset(tmp_fn, 'w', format=part.data_model) as out:
+        for a in part.ncattrs():
+            out.setncattr(a, part.getncattr(a))
+        history = 'combined {0} and {1}'.format(os.path.basename(prev_fn), os.path.basename(part_fn))
+        if 'history' in part.ncattrs():
+            history = '{0}\n{1}'.format(part.getncattr('history'), history)
+        out.setncattr('history', history)
+        for d, dim in part.dimensions.items():
+            out.createDimension(d, None if dim.isunlimited() else len(dim))
+        bounds = None
+        for v, var in part.variables.items():
+            attrs = dict((a, var.getncattr(a)) for a in var.ncattrs())
+            fill_value = attrs.pop('_FillValue', None)
+            new_var = out.createVariable(v, var.dtype, var.dimensions, fill_value=fill_value)
+            new_var.setncatts(attrs)
+            if is_averaged(var):
+                if v not in sums:
+                    raise KeyError('{0} is not in {1}'.format(v, prev_fn))
+                combined[v] = sums[v] + np.ma.asarray(var[:], dtype=np.float64) * part_years
+                mean = combined[v] / years
+                if var.dtype.kind in 'iu':
+                    mean = np.ma.round(mean)
+                new_var[:] = mean.astype(var.dtype)
+            elif v in TIME_BOUNDS and v in prev.variables:
+                # from the start of the first years to the end of the last
+                bounds = np.ma.array(var[:])
+                bounds[..., 0] = prev.variables[v][..., 0]
+                new_var[:] = bounds
+            else:
+                new_var[:] = var[:]
+        if bounds is not None and 'time' in out.variables:
+            out.variables['time'][:] = bounds.mean(axis=-1).astype(out.variables['time'].dtype)
+    os.replace(tmp_fn, out_fn)
+    write_sidecar(out_fn, combined, years)
+
+
+def plan_extensions(averageList, climo_name, out_dir, varList):
+    """ replace the averages in a pyAverager list that extend a stored climatology
+    by the average of just the new years
+
+    A stored climatology is only extended if it has every variable of varList.
+    A dependent seasonal average and the months it is computed from in the same
+    pass are either all extended from the same year or all computed in full.
+
+    Arguments:
+    averageList (list) - the averages to compute, e.g. 'tavg:1:60'
+    climo_name (function) - (average type, start year, stop year) -> climatology file name
+    out_dir (string) - the pyAverager output directory
+    varList (list) - the variables the pyAverager averages.  An empty list, all variables,
+                     is not known before the pyAverager runs, so nothing is extended
+
+    Return:
+    averageList (list) - the averages for the pyAverager to compute
+    extensions (list) - dictionaries of the climatologies to combine after the pyAverager
+    """
+    parts = dict((avg, avg_parts(avg)) for avg in averageList)
+    prev = dict((avg, None) for avg in averageList)
+    for avg in averageList:
+        prefix, avg_type, start_year, stop_year = parts[avg]
+        if avg_type not in COMBINABLE or len(varList) == 0:
+            continue
+        # the longest stored range with the same start and all the variables
+        for y in range(int(stop_year) - 1, int(start_year) - 1, -1):
+            prev_fn = climo_name(avg_type, start_year, year_string(y, start_year))
+            if os.path.isfile(prev_fn) and covers(prev_fn, varList):
+                prev[avg] = (y, prev_fn)
+                break
+
+    # a dependent average and its months must cover the same years
+    changed = True
+    while changed:
+        changed = False
+        for avg in averageList:
+            prefix, avg_type, start_year, stop_year = parts[avg]
+            season = avg_type.split('_')[0]
+            if season not in SEASON_MONTHS or (prefix != 'dep_' and avg_type == season):
+                continue
+            group = [avg] + [a for a in averageList if parts[a][1] in SEASON_MONTHS[season] and
+                             parts[a][2:] == (start_year, stop_year)]
+            if len(set(prev[a][0] if prev[a] else None for a in group)) > 1:
+                for a in group:
+                    prev[a] = None
+                changed = True
+
+    newList = []
+    extensions = []
+    for avg in averageList:
+        prefix, avg_type, start_year, stop_year = parts[avg]
+        if prev[avg] is None:
+            newList.append(avg)
+            continue
+        y, prev_fn = prev[avg]
+        part_start = year_string(y + 1, start_year)
+        part_fn = os.path.join(out_dir, os.path.basename(climo_name(avg_type, part_start, stop_year)))
+        newList.append('{0}{1}:{2}:{3}'.format(prefix, avg_type, part_start, stop_year))
+        extensions.append({'prev': prev_fn, 'prev_years': y - int(start_year) + 1,
+                           'part': part_fn, 'part_years': int(stop_year) - y,
+                           'out': climo_name(avg_type, start_year, stop_year)})
+    return newList, extensions
+
+
+def finish(averageList, extensions, climo_name, out_dir, comm=None):
+    """ combine the extended climatologies and write the sidecars of the new ones,
+    shared over the ranks of comm.  Every rank of comm must call this.
+
+    Arguments:
+    averageList (list) - the averages the pyAverager computed, as returned by plan_extensions
+    extensions (list) - the climatologies to combine, as returned by plan_extensions
+    climo_name (function) - (average type, start year, stop year) -> climatology file name
+    out_dir (string) - the pyAverager output directory
+    comm (simplecomm) - the communicator, None to do everything on this rank
+    """
+    parts = [e['part'] for e in extensions]
+    tasks = [('combine', e) for e in extensions]
+    for avg in averageList:
+        prefix, avg_type, start_year, stop_year = avg_parts(avg)
+        fn = os.path.join(out_dir, os.path.basename(climo_name(avg_type, start_year, stop_year)))
+        if avg_type in COMBINABLE and fn not in parts:
+            tasks.append(('sidecar', (fn, int(stop_year) - int(start_year) + 1)))
+
+    if comm is not None and comm.get_size() > 1:
+        from asaptools import partition
+        tasks = comm.partition(tasks, func=partition.EqualStride(), involved=True)
+
+    failed = []
+    for task, args in tasks:
+        if task == 'combine':
+            # the pyAverager only averaged the new years, a climatology not combined is missing
+            try:
+                combine(args['prev'], args['prev_years'], args['part'], args['part_years'], args['out'])
+                os.remove(args['part'])
+            except (IOError, OSError, RuntimeError, KeyError) as e:
+                print('ERROR: climoAccumLib.finish unable to write {0} - {1}'.format(args['out'], e))
+                failed.append(args['out'])
+        elif os.path.isfile(args[0]):
+            try:
+                write_sidecar(args[0], mean_sums(args[0], args[1]), args[1])
+            except (IOError, OSError, RuntimeError) as e:
+                print('WARNING: climoAccumLib.finish unable to write the sums of {0} - {1}'.format(args[0], e))
+
+    if comm is not None:
+        comm.sync()
+    if len(failed) > 0:
+        raise RuntimeError('climatologies not written: {0}'.format(', '.join(failed)))
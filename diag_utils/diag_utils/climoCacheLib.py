@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+"""Content-addressed cache of climatology files shared by the averaging generators
+
+The atm, lnd, ice and ocn averaging generators look up each pyAverager call
+in a cache before running it.  The key is a hash of what the call reads and
+how it averages: the input files of the years averaged with their sizes and
+modification times, the variable list, the averages, the weights, the
+netCDF format and any component settings.  On a hit the climatology files
+are copied into the output directory and the pyAverager is skipped; on a
+miss the files the call writes are stored under the key.
+
+The cache is a directory, set by CLIMO_CACHE_ROOT in env_postprocess.xml,
+that can be shared by users and diagnostic packages on the same case.  An
+index.json records every entry with its size and last use, and entries are
+evicted least recently used first when the cache grows beyond
+CLIMO_CACHE_MAX_GB.  Updates to the index are serialised by a lock file.
+The directories, lock and index are made group writable, so the users of a
+shared cache need to be in the group of its root.  A cache that can not be
+read or written only means the pyAverager is run.
+
+Query the cache with:
+    python -m diag_utils.climoCacheLib --root <cache> list [--case CASE] [--average tavg]
+    python -m diag_utils.climoCacheLib --root <cache> show <key>
+    python -m diag_utils.climoCacheLib --root <cache> evict --max-gb 100
+__________________________
+Created on Oct, 2026
+
+@author: CSEG <cseg@cgd.ucar.edu>
+"""
+
+from __future__ import print_function
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import stat
+import sys
+import time
+from contextlib import contextmanager
+
+# bump when the key or the layout of an entry changes
+CACHE_VERSION = 1
+
+# size cap when CLIMO_CACHE_MAX_GB is not set
+DEFAULT_MAX_GB = 500
+
+GB = 1024 * 1024 * 1024
+
+# the permissions added for the group of a shared cache, directories keep their group
+GROUP_DIR = stat.S_IRWXG | stat.S_ISGID
+GROUP_FILE = stat.S_IRGRP | stat.S_IWGRP
+
+# years in the date of a time slice (yyyy-mm) or time series (yyyymm-yyyymm) file name
+SLICE_DATE = re.compile(r'\.(\d{4})-\d{2}(-\d{2})?(-\d{5})?\.nc$')
+SERIES_DATE = re.compile(r'\.(\d{4})\d{2,4}-(\d{4})\d{2,4}\.nc$')
+
+def average_years(averages):
+    """ the first and last year of a list of pyAverager averages such as 'tavg:1:50'
+    """
+    years = []
+    for avg in averages:
+        for y in avg.split(':')[1:3]:
+            if y.isdigit():
+                years.append(int(y))
+    if len(years) == 0:
+        return None
+    return min(years), max(years)
+
+
+def input_files(in_dir, prefix, years=None):
+    """ the input files of a pyAverager call with their sizes and modification times
+
+    Arguments:
+    in_dir (string) - the input directory
+    prefix (string) - the input file name prefix, e.g. case.pop.h
+    years (tuple) - the first and last year averaged, the files of the years
+                    around them are included for the averages across a year end.
+                    None for all files
+
+    Return:
+    inputs (list) - sorted (file name, size, mtime)
+    """
+    inputs = []
+    try:
+        entries = list(os.scandir(in_dir))
+    except OSError:
+        return inputs
+    for entry in entries:
+        if not entry.name.startswith(prefix) or not entry.name.endswith('.nc'):
+            continue
+        if years is not None:
+            m = SLICE_DATE.search(entry.name)
+            if m:
+                first = last = int(m.group(1))
+            else:
+                m = SERIES_DATE.search(entry.name)
+                first, last = (int(m.group(1)), int(m.group(2))) if m else (years[0], years[1])
+            if last < years[0] - 1 or first > years[1] + 1:
+                continue
+        st = entry.stat()
+        inputs.append((entry.name, st.st_size, st.st_mtime))
+    return sorted(inputs)
+
+
+def share(path, mode):
+    """ add the group permissions to what this user created in the cache, the rest
+    is left to its owner
+    """
+    try:
+        st = os.stat(path)
+        if st.st_uid == os.getuid() and st.st_mode & mode != mode:
+            os.chmod(path, stat.S_IMODE(st.st_mode) | mode)
+    except OSError:
+        pass
+
+
+def snapshot(out_dir):
+    """ the files in a directory with their sizes and modification times
+    """
+    files = dict()
+    if os.path.isdir(out_dir):
+        for entry in os.scandir(out_dir):
+            if entry.is_file():
+                st = entry.stat()
+                files[entry.name] = (st.st_size, st.st_mtime)
+    return files
+
+
+class ClimoCache(object):
+    """ a climatology cache directory
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_GB*GB):
+        """
+        Arguments:
+        root (string) - the cache directory, created if needed
+        max_bytes (int) - the size cap of the cache
+        """
+        self._root = root
+        self._max_bytes = max_bytes
+        self._index_fn = os.path.join(root, 'index.json')
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        share(root, GROUP_DIR)
+        share(os.path.join(root, 'objects'), GROUP_DIR)
+
+    @contextmanager
+    def _locked(self):
+        """ hold the cache lock and give the index, written back if it was changed
+        """
+        with open(os.path.join(self._root, '.lock'), 'a') as f:
+            share(f.name, GROUP_FILE)
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                index = self.index()
+                before = json.dumps(index, sort_keys=True)
+                yield index
+                if json.dumps(index, sort_keys=True) != before:
+                    tmp_fn = '{0}.tmp.{1}'.format(self._index_fn, os.getpid())
+                    with open(tmp_fn, 'w') as out:
+                        json.dump(index, out, indent=1, sort_keys=True)
+                    share(tmp_fn, GROUP_FILE)
+                    os.replace(tmp_fn, self._index_fn)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def index(self):
+        """ key -> entry of every climatology in the cache
+        """
+        try:
+            with open(self._index_fn) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return dict()
+
+    def entry_dir(self, key):
+        return os.path.join(self._root, 'objects', key[:2], key)
+
+    def key(self, inputs, varlist, averages, **options):
+        """ the key of a pyAverager call
+
+        Arguments:
+        inputs (list) - (file name, size, mtime) of the input files, from input_files
+        varlist (list) - the variables averaged, empty for all
+        averages (list) - the pyAverager averages
+        options - the weights, netCDF format and component settings of the call
+
+        Return:
+        key (string) - the hex digest
+        desc (dictionary) - what the key was built from, without the inputs
+        """
+        desc = {'version': CACHE_VERSION, 'varlist': sorted(varlist), 'averages': sorted(averages)}
+        desc.update(options)
+        h = hashlib.sha1(json.dumps(desc, sort_keys=True, default=str).encode('utf-8'))
+        h.update(json.dumps(inputs).encode('utf-8'))
+        return h.hexdigest(), desc
+
+    def fetch(self, key, out_dir):
+        """ copy the climatology files of a key into out_dir
+
+        Return:
+        found (bool) - True if every file of the key was copied
+        """
+        with self._locked() as index:
+            if key not in index:
+                return False
+            index[key]['last_used'] = time.time()
+            index[key]['hits'] = index[key].get('hits', 0) + 1
+            files = index[key]['files']
+        try:
+            os.makedirs(out_dir, exist_ok=True)
+            for fn in files:
+                tmp_fn = '{0}/{1}.tmp.{2}'.format(out_dir, fn, os.getpid())
+                shutil.copyfile(os.path.join(self.entry_dir(key), fn), tmp_fn)
+                os.replace(tmp_fn, os.path.join(out_dir, fn))
+        except (IOError, OSError) as e:
+            # evicted while copying
+            print('WARNING: climoCacheLib unable to copy {0} - {1}'.format(key, e))
+            return False
+        return True
+
+    def store(self, key, desc, out_dir, files):
+        """ store the climatology files a pyAverager call wrote and evict the least
+        recently used entries beyond the size cap
+        """
+        if len(files) == 0:
+            return
+        entry_dir = self.entry_dir(key)
+        tmp_dir = '{0}.tmp.{1}'.format(entry_dir, os.getpid())
+        try:
+            os.makedirs(tmp_dir)
+            share(os.path.dirname(entry_dir), GROUP_DIR)
+            share(tmp_dir, GROUP_DIR)
+            nbytes = 0
+            for fn in files:
+                shutil.copyfile(os.path.join(out_dir, fn), os.path.join(tmp_dir, fn))
+                share(os.path.join(tmp_dir, fn), GROUP_FILE)
+                nbytes = nbytes + os.path.getsize(os.path.join(tmp_dir, fn))
+        except (IOError, OSError) as e:
+            print('WARNING: climoCacheLib unable to store {0} - {1}'.format(key, e))
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        now = time.time()
+        with self._locked() as index:
+            if key in index or os.path.isdir(entry_dir):
+                # stored meanwhile by another run
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                return
+            os.rename(tmp_dir, entry_dir)
+            index[key] = {'files': sorted(files), 'bytes': nbytes, 'created': now, 'last_used': now,
+                          'hits': 0, 'out_dir': out_dir, 'desc': desc}
+            self._evict(index, self._max_bytes)
+
+    def evict(self, max_bytes):
+        """ remove the least recently used entries until the cache is at most max_bytes
+        """
+        with self._locked() as index:
+            return self._evict(index, max_bytes)
+
+    def _evict(self, index, max_bytes):
+        total = sum(e['bytes'] for e in index.values())
+        evicted = []
+        for key in sorted(index.keys(), key=lambda k: index[k]['last_used']):
+            if total <= max_bytes:
+                break
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            total = total - index[key]['bytes']
+            evicted.append(key)
+            del index[key]
+        return evicted
+
+    def query(self, **fields):
+        """ the entries whose description has all of the given values, e.g.
+        query(prefix='case.pop.h'), an average type matches any of its averages
+        """
+        found = []
+        for key, e in sorted(self.index().items(), key=lambda kv: -kv[1]['last_used']):
+            desc = e['desc']
+            match = True
+            for field, value in fields.items():
+                if field == 'average':
+                    match = match and any(a.split(':')[0].replace('dep_', '') == value for a in desc['averages'])
+                else:
+                    match = match and str(desc.get(field)) == str(value)
+            if match:
+                found.append((key, e))
+        return found
+
+
+def from_env(envDict):
+    """ the cache set in env_postprocess.xml, None if CLIMO_CACHE_ROOT is not set
+    """
+    root = envDict.get('CLIMO_CACHE_ROOT', '')
+    if not root:
+        return None
+    max_gb = float(envDict.get('CLIMO_CACHE_MAX_GB') or DEFAULT_MAX_GB)
+    try:
+        return ClimoCache(root, int(max_gb * GB))
+    except (IOError, OSError) as e:
+        print('WARNING: climoCacheLib unable to use {0} - {1}'.format(root, e))
+        return None
+
+
+def run_cached(cache, run, comm, out_dir, in_dir, prefix, averages, varlist, years=None, **options):
+    """ run a pyAverager call unless the cache has its climatology files.
+    Every rank of comm must call this.
+
+    Arguments:
+    cache (ClimoCache) - the cache, None to always run
+    run (function) - runs the pyAverager call on every rank
+    comm (simplecomm) - the communicator
+    out_dir (string) - the pyAverager output directory
+    in_dir, prefix (string) - the pyAverager input directory and file name prefix
+    averages (list) - the pyAverager averages
+    varlist (list) - the variables averaged, empty for all
+    years (tuple) - the first and last year read, the years of the averages if None
+    options - the weights, netCDF format and component settings that change the result
+
+    Return:
+    hit (bool) - True if the files came from the cache
+    """
+    if cache is None:
+        run()
+        return False
+
+    from asaptools import partition
+
+    # a cache that can not be used, e.g. a root owned by another group, is a miss
+    # that is not stored, the hit is still shared so no rank is left waiting
+    key = None
+    hit = False
+    if comm.is_manager():
+        try:
+            key, desc = cache.key(input_files(in_dir, prefix, years or average_years(averages)),
+                                  varlist, averages, prefix=prefix, **options)
+            hit = cache.fetch(key, out_dir)
+            if hit:
+                print('climoCacheLib: {0} from the cache {1}'.format(','.join(averages), key))
+            before = snapshot(out_dir)
+        except (IOError, OSError) as e:
+            print('WARNING: climoCacheLib unable to look up {0} - {1}'.format(','.join(averages), e))
+            key = None
+            hit = False
+    hit = comm.partition(hit, func=partition.Duplicate(), involved=True)
+    if hit:
+        return True
+
+    run()
+    comm.sync()
+    if comm.is_manager() and key is not None:
+        try:
+            after = snapshot(out_dir)
+            cache.store(key, desc, out_dir, [fn for fn, st in after.items() if before.get(fn) != st])
+        except (IOError, OSError) as e:
+            print('WARNING: climoCacheLib unable to store {0} - {1}'.format(key, e))
+    return False
+
+#=====================================================
+# commandline_options - parse any command line options
+#=====================================================
+def commandline_options():
+    """Process the command line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='climoCacheLib: query and trim a shared climatology cache.')
+
+    parser.add_argument('--root', nargs=1, required=True,
+                        help='the cache directory, CLIMO_CACHE_ROOT in env_postprocess.xml')
+
+    subparsers = parser.add_subparsers(dest='command')
+
+    list_parser = subparsers.add_parser('list', help='list the entries, most recently used first')
+    list_parser.add_argument('--prefix', help='input file prefix, e.g. case.pop.h')
+    list_parser.add_argument('--case', help='case name, matches the prefixes that start with it')
+    list_parser.add_argument('--average', help='average type, e.g. tavg or ann')
+
+    show_parser = subparsers.add_parser('show', help='show an entry')
+    show_parser.add_argument('key', help='the entry key or the start of it')
+
+    evict_parser = subparsers.add_parser('evict', help='evict the least recently used entries')
+    evict_parser.add_argument('--max-gb', type=float, required=True, help='the size to trim the cache to')
+
+    options = parser.parse_args()
+    if options.command is None:
+        parser.error('a command is required')
+    return options
+
+#======
+# main
+#======
+
+def main(options):
+    """ query the climatology cache
+    """
+    cache = ClimoCache(options.root[0])
+    if options.command == 'list':
+        fields = dict()
+        if options.prefix:
+            fields['prefix'] = options.prefix
+        if options.average:
+            fields['average'] = options.average
+        entries = cache.query(**fields)
+        if options.case:
+            entries = [(k, e) for k, e in entries if e['desc'].get('prefix', '').startswith(options.case + '.')]
+        total = 0
+        for key, e in entries:
+            total = total + e['bytes']
+            print('{0} {1:10.1f} MB {2} hits {3} {4} {5}'.format(
+                key[:12], e['bytes'] / 1048576.0, e.get('hits', 0),
+                time.strftime('%Y-%m-%d %H:%M', time.localtime(e['last_used'])),
+                e['desc'].get('prefix', ''), ','.join(e['desc']['averages'])))
+        print('{0} entries, {1:.2f} GB'.format(len(entries), total / float(GB)))
+    elif options.command == 'show':
+        found = [(k, e) for k, e in cache.index().items() if k.startswith(options.key)]
+        if len(found) != 1:
+            print('{0} entries match {1}'.format(len(found), options.key))
+            return 1
+        print(json.dumps({found[0][0]: found[0][1]}, indent=1, sort_keys=True))
+    elif options.command == 'evict':
+        evicted = cache.evict(int(options.max_gb * GB))
+        print('evicted {0} entries'.format(len(evicted)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(commandline_options()))
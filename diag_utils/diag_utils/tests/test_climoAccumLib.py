@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""
+Unit test suite for extending the stored climatologies
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import netCDF4 as nc
+import numpy as np
+
+from diag_utils import climoAccumLib
+
+def year_values(y):
+    """ the TS field of year y
+    """
+    return np.array([[280.0 + y, 290.0 + 2 * y]], dtype=np.float32)
+
+
+def write_climo(fn, y0, y1, varList=('TS', 'PS')):
+    """ write the climatology of years y0 to y1 the way the pyAverager does
+    """
+    years = range(y0, y1 + 1)
+    with nc.Dataset(fn, 'w') as f:
+        f.createDimension('time', None)
+        f.createDimension('nbnd', 2)
+        f.createDimension('lat', 2)
+        f.createVariable('lat', 'f8', ('lat',))[:] = [-45.0, 45.0]
+        f.createVariable('time_bnds', 'f8', ('time', 'nbnd'))[:] = [[365.0 * (y0 - 1), 365.0 * y1]]
+        f.createVariable('time', 'f8', ('time',))[:] = [365.0 * (y0 + y1 - 1) / 2.0]
+        f.createVariable('date', 'i4', ('time',))[:] = [y1 * 10000 + 101]
+        if 'TS' in varList:
+            f.createVariable('TS', 'f4', ('time', 'lat'))[:] = np.mean([year_values(y) for y in years], axis=0)
+        if 'PS' in varList:
+            f.createVariable('PS', 'f4', ('time', 'lat'))[:] = np.mean([year_values(y) * 10 for y in years], axis=0)
+
+
+class test_climoAccumLib(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def climo_name(self, avg_type, y0, y1):
+        return os.path.join(self.tmp_dir, '{0}.{1}-{2}.nc'.format(avg_type, y0, y1))
+
+    def test_combine(self):
+        """ test to see if a climatology extended twice is the mean of all its years and
+            its time bounds span them
+        """
+        write_climo(self.climo_name('ann', '0001', '0003'), 1, 3)
+        write_climo(self.climo_name('ann', '0004', '0005'), 4, 5)
+        climoAccumLib.combine(self.climo_name('ann', '0001', '0003'), 3, self.climo_name('ann', '0004', '0005'), 2,
+                              self.climo_name('ann', '0001', '0005'))
+        write_climo(self.climo_name('ann', '0006', '0006'), 6, 6)
+        climoAccumLib.combine(self.climo_name('ann', '0001', '0005'), 5, self.climo_name('ann', '0006', '0006'), 1,
+                              self.climo_name('ann', '0001', '0006'))
+
+        with nc.Dataset(self.climo_name('ann', '0001', '0006')) as f:
+            np.testing.assert_allclose(f.variables['TS'][:], np.mean([year_values(y) for y in range(1, 7)], axis=0))
+            np.testing.assert_allclose(f.variables['PS'][:], np.mean([year_values(y) * 10 for y in range(1, 7)], axis=0))
+            self.assertEqual(f.variables['TS'].dtype, np.float32)
+            np.testing.assert_array_equal(f.variables['time_bnds'][:], [[0.0, 365.0 * 6]])
+            np.testing.assert_array_equal(f.variables['time'][:], [365.0 * 3])
+            np.testing.assert_array_equal(f.variables['date'][:], [60101])
+            np.testing.assert_array_equal(f.variables['lat'][:], [-45.0, 45.0])
+
+        sums, years = climoAccumLib.read_sums(self.climo_name('ann', '0001', '0006'), 6)
+        self.assertEqual(years, 6)
+        self.assertEqual(sorted(sums.keys()), ['PS', 'TS'])
+        self.assertEqual(sums['TS'].dtype, np.float64)
+        np.testing.assert_allclose(sums['TS'], np.sum([year_values(y) for y in range(1, 7)], axis=0))
+
+    def test_sidecar(self):
+        """ test to see if the sums come from a matching sidecar, and from the means otherwise
+        """
+        fn = self.climo_name('jan', '0001', '0004')
+        write_climo(fn, 1, 4)
+        exact = np.sum([year_values(y) for y in range(1, 5)], axis=0).astype(np.float64) + 0.25
+        climoAccumLib.write_sidecar(fn, {'TS': exact}, 4)
+        sums, years = climoAccumLib.read_sums(fn, 3)
+        self.assertEqual(years, 4)
+        np.testing.assert_array_equal(sums['TS'], exact)
+        np.testing.assert_allclose(sums['PS'], np.sum([year_values(y) * 10 for y in range(1, 5)], axis=0))
+
+        # the climatology changed after its sidecar was written
+        write_climo(fn, 1, 4, varList=['TS'])
+        sums, years = climoAccumLib.read_sums(fn, 4)
+        self.assertEqual(sorted(sums.keys()), ['TS'])
+        np.testing.assert_allclose(sums['TS'], exact - 0.25)
+
+    def test_plan_extensions(self):
+        """ test to see if only the stored climatologies with all the variables are extended
+        """
+        for avg_type in ['jan', 'feb', 'mar', 'dec']:
+            write_climo(self.climo_name(avg_type, '0001', '0003'), 1, 3)
+        write_climo(self.climo_name('apr', '0001', '0004'), 1, 4, varList=['TS'])
+        averageList = ['jan:0001:0006', 'feb:0001:0006', 'mar:0001:0006', 'apr:0001:0006']
+
+        newList, extensions = climoAccumLib.plan_extensions(averageList, self.climo_name, self.tmp_dir, ['TS', 'PS'])
+        self.assertEqual(newList, ['jan:0004:0006', 'feb:0004:0006', 'mar:0004:0006', 'apr:0001:0006'])
+        self.assertEqual(extensions[0], {'prev': self.climo_name('jan', '0001', '0003'), 'prev_years': 3,
+                                         'part': self.climo_name('jan', '0004', '0006'), 'part_years': 3,
+                                         'out': self.climo_name('jan', '0001', '0006')})
+
+        newList, extensions = climoAccumLib.plan_extensions(averageList, self.climo_name, self.tmp_dir, ['TS'])
+        self.assertEqual(newList[3], 'apr:0005:0006')
+        self.assertEqual(climoAccumLib.plan_extensions(averageList, self.climo_name, self.tmp_dir, []),
+                         (averageList, []))
+
+    def test_dependent_averages(self):
+        """ test to see if a dependent average and its months are extended together or not at all
+        """
+        for avg_type in ['jan', 'feb', 'mar', 'apr', 'may', 'dec', 'mam']:
+            write_climo(self.climo_name(avg_type, '0001', '0003'), 1, 3)
+        months = ['jan:0001:0006', 'feb:0001:0006', 'mar:0001:0006', 'apr:0001:0006', 'may:0001:0006',
+                  'dec:0001:0006']
+
+        # DJF is not combined, so its months are computed in full
+        newList, extensions = climoAccumLib.plan_extensions(['dep_djf:0001:0006'] + months, self.climo_name,
+                                                            self.tmp_dir, ['TS'])
+        self.assertEqual(newList, ['dep_djf:0001:0006', 'jan:0001:0006', 'feb:0001:0006', 'mar:0004:0006',
+                                   'apr:0004:0006', 'may:0004:0006', 'dec:0001:0006'])
+        self.assertEqual(len(extensions), 3)
+        newList, extensions = climoAccumLib.plan_extensions(['djf_sig:0001:0006'] + months, self.climo_name,
+                                                            self.tmp_dir, ['TS'])
+        self.assertEqual(newList[1:3], ['jan:0001:0006', 'feb:0001:0006'])
+
+        # MAM and its months are extended from the same year
+        newList, extensions = climoAccumLib.plan_extensions(['dep_mam:0001:0006'] + months[2:5], self.climo_name,
+                                                            self.tmp_dir, ['TS'])
+        self.assertEqual(newList, ['dep_mam:0004:0006', 'mar:0004:0006', 'apr:0004:0006', 'may:0004:0006'])
+
+        # not when a month was stored for a different range
+        write_climo(self.climo_name('apr', '0001', '0004'), 1, 4)
+        newList, extensions = climoAccumLib.plan_extensions(['dep_mam:0001:0006'] + months[2:5], self.climo_name,
+                                                            self.tmp_dir, ['TS'])
+        self.assertEqual(newList, ['dep_mam:0001:0006', 'mar:0001:0006', 'apr:0001:0006', 'may:0001:0006'])
+        self.assertEqual(extensions, [])
+
+    def test_finish(self):
+        """ test to see if the extensions are combined, the new climatologies get sidecars
+            and a climatology that can not be combined is an error
+        """
+        write_climo(self.climo_name('jan', '0001', '0003'), 1, 3)
+        newList, extensions = climoAccumLib.plan_extensions(['jan:0001:0005', 'feb:0001:0005'], self.climo_name,
+                                                            self.tmp_dir, ['TS'])
+        write_climo(self.climo_name('jan', '0004', '0005'), 4, 5)
+        write_climo(self.climo_name('feb', '0001', '0005'), 1, 5)
+        climoAccumLib.finish(newList, extensions, self.climo_name, self.tmp_dir)
+        self.assertFalse(os.path.exists(self.climo_name('jan', '0004', '0005')))
+        for avg_type in ['jan', 'feb']:
+            self.assertTrue(os.path.isfile(climoAccumLib.sidecar_name(self.climo_name(avg_type, '0001', '0005'))))
+
+        newList, extensions = climoAccumLib.plan_extensions(['jan:0001:0007'], self.climo_name, self.tmp_dir, ['TS'])
+        self.assertEqual(newList, ['jan:0006:0007'])
+        self.assertRaises(RuntimeError, climoAccumLib.finish, newList, extensions, self.climo_name, self.tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+Unit test suite for the shared climatology cache
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from asaptools import simplecomm
+
+from diag_utils import climoCacheLib
+
+def write(fn, text):
+    with open(fn, 'w') as f:
+        f.write(text)
+
+
+class test_climoCacheLib(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp_dir, 'cache')
+        self.in_dir = os.path.join(self.tmp_dir, 'hist')
+        self.out_dir = os.path.join(self.tmp_dir, 'climo')
+        os.makedirs(self.in_dir)
+        for y in range(1, 6):
+            for m in range(1, 13):
+                write(os.path.join(self.in_dir, 'case.pop.h.{0:04d}-{1:02d}.nc'.format(y, m)), 'x' * y)
+        self.cache = climoCacheLib.ClimoCache(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_key(self):
+        """ test to see if the key follows the inputs and settings of a call but not their order
+        """
+        inputs = climoCacheLib.input_files(self.in_dir, 'case.pop.h', (2, 3))
+        self.assertEqual([fn for fn, size, mtime in inputs][0], 'case.pop.h.0001-01.nc')
+        self.assertEqual(len(inputs), 4 * 12)
+        key, desc = self.cache.key(inputs, ['TEMP', 'SALT'], ['tavg:2:3', 'mavg:2:3'], weighted=True)
+        self.assertEqual(self.cache.key(inputs, ['SALT', 'TEMP'], ['mavg:2:3', 'tavg:2:3'], weighted=True)[0], key)
+        self.assertEqual(desc['varlist'], ['SALT', 'TEMP'])
+        self.assertNotEqual(self.cache.key(inputs, ['SALT'], ['tavg:2:3', 'mavg:2:3'], weighted=True)[0], key)
+        self.assertNotEqual(self.cache.key(inputs, ['SALT', 'TEMP'], ['tavg:2:3', 'mavg:2:3'], weighted=False)[0], key)
+        inputs[0] = (inputs[0][0], inputs[0][1] + 1, inputs[0][2])
+        self.assertNotEqual(self.cache.key(inputs, ['SALT', 'TEMP'], ['tavg:2:3', 'mavg:2:3'], weighted=True)[0], key)
+        self.assertEqual(climoCacheLib.average_years(['tavg:2:3', 'ya:5']), (2, 5))
+
+    def test_fetch_store(self):
+        """ test to see if the stored files of a key are fetched into another directory
+        """
+        os.makedirs(self.out_dir)
+        write(os.path.join(self.out_dir, 'tavg.2-3.nc'), 'tavg')
+        key, desc = self.cache.key([], [], ['tavg:2:3'])
+        self.assertFalse(self.cache.fetch(key, self.out_dir))
+        self.cache.store(key, desc, self.out_dir, ['tavg.2-3.nc'])
+        self.assertEqual(self.cache.index()[key]['bytes'], 4)
+
+        other_dir = os.path.join(self.tmp_dir, 'other')
+        self.assertTrue(self.cache.fetch(key, other_dir))
+        with open(os.path.join(other_dir, 'tavg.2-3.nc')) as f:
+            self.assertEqual(f.read(), 'tavg')
+        self.assertEqual(self.cache.index()[key]['hits'], 1)
+
+        # the cache can be shared by the group
+        for path in [self.root, os.path.dirname(self.cache.entry_dir(key)), self.cache.entry_dir(key)]:
+            self.assertEqual(os.stat(path).st_mode & climoCacheLib.GROUP_DIR, climoCacheLib.GROUP_DIR)
+        for path in [os.path.join(self.root, '.lock'), os.path.join(self.root, 'index.json')]:
+            self.assertEqual(os.stat(path).st_mode & climoCacheLib.GROUP_FILE, climoCacheLib.GROUP_FILE)
+
+    def test_evict(self):
+        """ test to see if the least recently used entries are evicted first
+        """
+        index = dict()
+        for key, nbytes, last_used in [('aa1', 10, 3.0), ('bb2', 20, 1.0), ('cc3', 30, 2.0)]:
+            os.makedirs(self.cache.entry_dir(key))
+            index[key] = {'bytes': nbytes, 'last_used': last_used}
+        self.assertEqual(self.cache._evict(index, 60), [])
+        self.assertEqual(self.cache._evict(index, 30), ['bb2', 'cc3'])
+        self.assertEqual(sorted(index.keys()), ['aa1'])
+        self.assertFalse(os.path.isdir(self.cache.entry_dir('bb2')))
+        self.assertTrue(os.path.isdir(self.cache.entry_dir('aa1')))
+
+    def test_query(self):
+        """ test to see if the entries are found by their description and average type
+        """
+        os.makedirs(self.out_dir)
+        write(os.path.join(self.out_dir, 'a.nc'), 'a')
+        for prefix, averages in [('case.pop.h', ['dep_tavg:1:5']), ('case.cam.h0', ['jan:1:5', 'dep_ann:1:5'])]:
+            key, desc = self.cache.key([], [], averages, prefix=prefix)
+            self.cache.store(key, desc, self.out_dir, ['a.nc'])
+        self.assertEqual(len(self.cache.query()), 2)
+        self.assertEqual([e['desc']['prefix'] for k, e in self.cache.query(average='tavg')], ['case.pop.h'])
+        self.assertEqual([e['desc']['prefix'] for k, e in self.cache.query(average='ann')], ['case.cam.h0'])
+        self.assertEqual(len(self.cache.query(prefix='case.cam.h0', average='tavg')), 0)
+
+    def test_run_cached(self):
+        """ test to see if a call runs once, comes from the cache after, and runs
+            when the cache can not be used
+        """
+        comm = simplecomm.create_comm(serial=True)
+        runs = []
+        def run():
+            runs.append(1)
+            if not os.path.isdir(self.out_dir):
+                os.makedirs(self.out_dir)
+            write(os.path.join(self.out_dir, 'tavg.1-5.nc'), 'tavg')
+        args = (comm, self.out_dir, self.in_dir, 'case.pop.h', ['tavg:1:5'], [])
+        self.assertFalse(climoCacheLib.run_cached(self.cache, run, *args))
+        shutil.rmtree(self.out_dir)
+        self.assertTrue(climoCacheLib.run_cached(self.cache, run, *args))
+        self.assertEqual(len(runs), 1)
+        self.assertTrue(os.path.isfile(os.path.join(self.out_dir, 'tavg.1-5.nc')))
+
+        # a lock that can not be opened
+        os.remove(os.path.join(self.root, '.lock'))
+        os.makedirs(os.path.join(self.root, '.lock'))
+        self.assertFalse(climoCacheLib.run_cached(self.cache, run, *args))
+        self.assertEqual(len(runs), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -30,11 +30,12 @@ import argparse
 import getopt
 import os
 import re
+import sqlite3
 import traceback
 
 # import local modules for postprocessing
-from cesm_utils import cesmEnvLib
-from diag_utils import diagUtilsLib
+from cesm_utils import catalogLib, cesmEnvLib, perfLib
+from diag_utils import climoAccumLib, climoCacheLib, diagUtilsLib
 
 # import the MPI related modules
 from asaptools import partition, simplecomm, vprinter, timekeeper
@@ -42,6 +43,76 @@ from asaptools import partition, simplecomm, vprinter, timekeeper
 # import the pyaverager
 from pyaverager import specification, PyAverager
 
+# the variables the plot sets read from the climatology files, by family of plot sets.
+# The chemistry and WACCM sets also read the standard variables.
+STANDARD_VARS = frozenset(['AODVIS','AODDUST','AODDUST1','AODDUST2','AODDUST3','ANRAIN','ANSNOW','AQRAIN','AQSNOW',
+                           'AREI','AREL','AWNC','AWNI','CCN3','CDNUMC','CLDHGH','CLDICE','CLDLIQ','CLDMED','CLDLOW',
+                           'CLDTOT','CLOUD','DCQ','DTCOND','DTV','FICE','FLDS','FLNS','FLNSC','FLNT','FLNTC','FLUT',
+                           'FLUTC','FREQI','FREQL','FREQR','FREQS','FSDS','FSDSC','FSNS','FSNSC','FSNTC','FSNTOA',
+                           'FSNTOAC','FSNT','ICEFRAC','ICIMR','ICWMR','IWC','LANDFRAC','LHFLX','LWCF','NUMICE','NUMLIQ',
+                           'OCNFRAC','OMEGA','OMEGAT','PBLH','PRECC','PRECL','PRECSC','PRECSL','PS','PSL','Q',
+                           'QFLX','QRL','QRS','RELHUM','SHFLX','SNOWHICE','SNOWHLND','SOLIN','SWCF','T','TAUX','TAUY',
+                           'TGCLDIWP','TGCLDLWP','TMQ','TREFHT','TS','U','UU','V','VD01','VQ','VT','VU','VV','WSUB','Z3',
+                           'CLD_MISR','FMISR1','FISCCP1_COSP','FISCCP1','CLDTOT_ISCCP','MEANPTOP_ISCCP','MEANCLDALB_ISCCP',
+                           'CLMODIS','FMODIS1','CLTMODIS','CLLMODIS','CLMMODIS','CLHMODIS','CLWMODIS','CLIMODIS','IWPMODIS',
+                           'LWPMODIS','REFFCLIMODIS','REFFCLWMODIS','TAUILOGMODIS','TAUWLOGMODIS','TAUTLOGMODIS','TAUIMODIS',
+                           'TAUWMODIS','TAUTMODIS','PCTMODIS','CFAD_DBZE94_CS','CFAD_SR532_CAL','CLDTOT_CAL','CLDLOW_CAL',
+                           'CLDMED_CAL','CLDHGH_CAL','CLDTOT_CS2','U10','ICLDTWP','ICLDIWP'])
+
+CAM_CHEM_VARS = frozenset(['CH4','CH4_CHML','SFCH4','CO','CO_CHMP','CO_CHML','SFCO','DCOCHM','DF_CO','O3','O3_Prod','O3_Loss',
+                           'O3_CHMP','O3_CHML','DF_O3','CH3CCL3','CH3CCL3_CHML','ISOP','C10H16','LNO_COL_PROD','SFISOP','SFC10H16',
+                           'SFCH3OH','SFC2H2','SFCH3COCH3','PHIS','ODV_DST01','ODV_DST02','ODV_DST03','ODV_DST04','AODDUST1',
+                           'AODDUST2','AODDUST3','AEROD_v','SFO3','DO3CHM','NO','NO2','NOX','NOY','H2O','Q','OH','H2O2','N2O','HNO3',
+                           'PAN','C3H8','CH3COCH3','CH2O','CH3OH','C2H2','C2H6','C3H6','SO2','SO4','CB1','CB2','OC1','OC2','SOA',
+                           'SOAI','SOAM','SOAX','SOAB','SOAT','NH4NO3','SOAI_PROD','SOAM_PROD','SOAX_PROD','SOAB_PROD','SOAT_PROD',
+                           'CB2SFWET','OC2SFWET','OC2WET','SO4SFWET','SOAISFWET','SOATSFWET','SOABSFWET','SOAXSFWET','SOAMSFWET',
+                           'DST01','DST02','DST03','DST04','SSLT01','SSLT02','SSLT03','SSLT04','SAD_TROP','SAD_ICE','SAD_LNAT',
+                           'SAD_SULFC','SAD_SO4NIT','SAD_SOA','SAD_BC','jo3_a','jno2','jpan','jh2o2','SFSSLT01','SFSSLT02','SFSSLT03',
+                           'SFSSLT04','SFDST01','SFDST02','SFDST03','SFDST04','DST01SFWET','DST02SFWET','DST03SFWET',
+                           'DST04SFWET','SSLT01SFWET','SSLT02SFWET','SSLT03SFWET','SSLT04SFWET','SFSO4','SO4_CHMP','SO4_CHML','DSO4CHM',
+                           'DTWR_SO2','DF_DST01','DF_DST02','DF_DST03','DF_DST04','DF_SSLT01','DF_SSLT02','DF_SSLT03','DF_SSLT04','DF_OC1',
+                           'DF_OC2','DF_CB1','DF_CB2','DF_SOAM','DF_SOAI','DF_SOAT','DF_SOAB','DF_SOAX','DF_SO4','a2x_DSTWET1',
+                           'a2x_DSTWET2','a2x_DSTWET3','a2x_DSTWET4','CB1_CLXF','SFCB1','SFCB2','SFOC1','SFOC2','AQSO4_H2O2',
+                           'AQSO4_O3','soa_a1','soa_a2','soa_c1','soa_c2','dst_a1','dst_a3','dst_a5','dst_a7','dst_c1','dst_c3','dst_c5',
+                           'dst_c7','ncl_a1','ncl_a2','ncl_a3','ncl_a4','ncl_a6','ncl_c1','ncl_a2','ncl_c3','ncl_c4','ncl_c6','pom_a1',
+                           'pom_c1','pom_a3','pom_c3','pom_a4','pom_c4','bc_a1','bc_a3','bc_a4','bc_c1','bc_c3','bc_c4','so4_a1','so4_a2',
+                           'so4_a3','so4_a4','so4_a5','so4_a6','so4_a7','so4_c1','so4_c2','so4_c3','so4_c4','so4_c5','so4_c6','so4_c7',
+                           'SFpom_a1','SFpom_a3','SFpom_a4','pom_a1_CLXF','pom_a2_CLXF','pom_a4_CLXF','pom_a1DDF','pom_a2DDF','pom_a4DDF',
+                           'pom_a1SFWET','pom_a2SFWET','pom_a4SFWET','pom_c1DDF','pom_c2DDF','pom_c4DDF','pom_c1SFWET','pom_c2SFWET',
+                           'pom_c4SFWET','SFbc_a1','SFbc_a3','SFbc_a4','bc_a1_CLXF','bc_a2_CLXF','bc_a4_CLXF','bc_a1DDF',
+                           'bc_a2DDF','bc_a4DDF','bc_a1SFWET','bc_a2SFWET','bc_a4SFWET','bc_c1DDF','bc_c2DDF','bc_c4DDF','bc_c1SFWET',
+                           'bc_c2SFWET','bc_c4SFWET','soa_a1_sfgaex1','soa_a2_sfgaex1','soa_a1DDF','soa_a2DDF','soa_a1SFWET',
+                           'soa_a2SFWET','soa_c1DDF','soa_c2DDF','soa_c1SFWET','soa_c2SFWET','dst_a1SFWET','dst_a3SFWET','dst_a5SFWET',
+                           'dst_a7SFWET','dst_a1DDF','dst_a3DDF','dst_a5DDF','dst_a7DDF','dst_c1SFWET','dst_c3SFWET','dst_c5SFWET',
+                           'dst_c7SFWET','dst_c1DDF','dst_c3DDF','dst_c5DDF','dst_c7DDF','ncl_a1SFWET','ncl_a2SFWET','ncl_a3SFWET',
+                           'ncl_a4SFWET','ncl_a6SFWET','ncl_a1DDF','ncl_a3DDF','ncl_a4DDF','ncl_a6DDF','ncl_c1SFWET','ncl_c2SFWET',
+                           'ncl_c3SFWET','ncl_c4SFWET','ncl_c6SFWET','ncl_c1DDF','ncl_c3DDF','ncl_c4DDF','ncl_c6DDF','SFdst_a1',
+                           'SFdst_a3','SFdst_a5','SFdst_a7','SFncl_a1','SFncl_a2','SFncl_a3','SFncl_a4','SFncl_a6','so4_a1_CHMP','so4_a2_CHMP',
+                           'so4_a3_CHMP','so4_a4_CHMP','so4_a5_CHMP','so4_a6_CHMP','so4_a7_CHMP','SFso4_a1','SFso4_a2','SFso4_a3','SFso4_a4',
+                           'SFso4_a5','SFso4_a6','SFso4_a7','so4_a1_CLXF','so4_a2_CLXF','so4_a3_CLXF','so4_a4_CLXF','so4_a5_CLXF','so4_a6_CLXF',
+                           'so4_a7_CLXF','so4_a1_sfgaex1','so4_a2_sfgaex1','so4_a3_sfgaex1','so4_a4_sfgaex1','so4_a5_sfgaex1','so4_a6_sfgaex1',
+                           'so4_a7_sfgaex1','so4_a1_sfnnuc1','so4_a2_sfnnuc1','so4_a3_sfnnuc1','so4_a4_sfnnuc1','so4_a5_sfnnuc1','so4_a6_sfnnuc1',
+                           'so4_a7_sfnnuc1','so4_a1DDF','so4_a2DDF','so4_a3DDF','so4_a4DDF','so4_a5DDF','so4_a6DDF','so4_a7DDF','so4_a1SFWET',
+                           'so4_a2SFWET','so4_a3SFWET','so4_a4SFWET','so4_a5SFWET','so4_a6SFWET','so4_a7SFWET','so4_c1DDF','so4_c2DDF',
+                           'so4_c3DDF','so4_c4DDF','so4_c5DDF','so4_c6DDF','so4_c7DDF','so4_c1SFWET','so4_c2SFWET','so4_c3SFWET','so4_c4SFWET',
+                           'so4_c5SFWET','so4_c6SFWET','so4_c7SFWET','SOAG0_CHMP', 'SOAG1_CHMP','SOAG2_CHMP','SOAG3_CHMP','SOAG4_CHMP','SOAG0_CHML',
+                           'SOAG1_CHML','SOAG2_CHML','SOAG3_CHML','SOAG4_CHML','soa1_a1','soa2_a1','soa3_a1','soa4_a1','soa5_a1','soa1_a2',
+                           'soa2_a2','soa3_a2','soa4_a2','soa5_a2','soa1_c1','soa2_c1','soa3_c1','soa4_c1','soa5_c1','soa1_c2','soa2_c2',
+                           'soa3_c2','soa4_c2','soa5_c2','soa1_a1SFWET','soa1_a2SFWET','soa2_a1SFWET','soa2_a2SFWET','soa3_a1SFWET','soa3_a2SFWET',
+                           'soa4_a1SFWET','soa4_a2SFWET','soa5_a1SFWET','soa5_a2SFWET','soa1_c1SFWET','soa1_c2SFWET','soa2_c1SFWET','soa2_c2SFWET',
+                           'soa3_c1SFWET','soa3_c2SFWET','soa4_c1SFWET','soa4_c2SFWET','soa5_c1SFWET','soa5_c2SFWET','soa1_a2DDF','soa2_a1DDF',
+                           'soa2_a2DDF','soa3_a1DDF','soa3_a2DDF','soa4_a1DDF','soa4_a2DDF','soa5_a1DDF','soa5_a2DDF','soa1_c1DDF','soa1_c2DDF',
+                           'soa2_c1DDF','soa2_c2DDF','soa3_c1DDF','soa3_c2DDF','soa4_c1DDF','soa4_c2DDF','soa5_c1DDF','soa5_c2DDF','r_jsoa1_a1',
+                           'r_jsoa2_a1','r_jsoa3_a1','r_jsoa4_a1','r_jsoa5_a1','r_jsoa1_a2','r_jsoa2_a2','r_jsoa3_a2','r_jsoa4_a2','r_jsoa5_a2',
+                           'soa1_a1_sfgaex1','soa1_a2_sfgaex1','soa2_a1_sfgaex1','soa2_a2_sfgaex1','soa3_a1_sfgaex1','soa3_a2_sfgaex1',
+                           'soa4_a1_sfgaex1','soa4_a2_sfgaex1','soa5_a1_sfgaex1','soa5_a2_sfgaex1','so4_a2_sfnnuc1','so4_c1AQH2SO4',
+                           'so4_c2AQH2SO4','so4_c3AQH2SO4','so4_c1AQSO4','so4_c2AQSO4','so4_c3AQSO4'])
+
+WACCM_VARS = frozenset(['BRO','CH3CL','CLO','CO2','HCL','HO2','HOCL','QRL_TOT','QRS_TOT'])
+
+# bytes per value of the history fields, which are single precision
+WORD_BYTES = 4
+
 #=====================================================
 # commandline_options - parse any command line options
 #=====================================================
@@ -132,120 +203,174 @@ def buildAtmAvgList(start_year, stop_year, avgFileBaseName, out_dir, envDict, de
 
     return avgList
 
+#=========================================================================
+# stream_index - index the variables a history stream has input data for
+#=========================================================================
+def stream_index(in_dir, case_prefix, key_infile, htype, catalog_fn=None):
+    """stream_index - index the variables of a history stream from the file
+    names and headers, without reading any data.
+
+    Arguments:
+    in_dir (string) - input directory
+    case_prefix (string) - the input file name prefix, case.stream
+    key_infile (string) - a time slice file with all the variables of the stream
+    htype (string) - 'series' or 'slice' depending on input history file type
+    catalog_fn (string) - the time series header catalog, opened read-only,
+                          None to read the headers
+
+    Return:
+    index (dictionary) - variable name -> {'dims': dimension names, 'sizes': dimension lengths,
+                         'years': (first, last) year of the input files or None,
+                         'files': number of input files}
+    """
+    prefix = '{0}.'.format(case_prefix)
+    var_files = dict()
+    slice_years = set()
+    nslices = 0
+    try:
+        entries = list(os.scandir(in_dir))
+    except OSError:
+        entries = []
+    for entry in entries:
+        if not entry.name.startswith(prefix) or not entry.name.endswith('.nc'):
+            continue
+        if htype == 'slice':
+            nslices += 1
+            m = climoCacheLib.SLICE_DATE.search(entry.name)
+            if m:
+                slice_years.add(int(m.group(1)))
+        else:
+            # case.stream.VAR.yyyymm-yyyymm.nc
+            var = entry.name[len(prefix):].split('.')[0]
+            m = climoCacheLib.SERIES_DATE.search(entry.name)
+            years = (int(m.group(1)), int(m.group(2))) if m else None
+            var_files.setdefault(var, []).append((entry.path, years))
+
+    index = dict()
+    if htype == 'slice':
+        # every slice file has the variables of the key file
+        header = catalogLib.read_header(key_infile)
+        years = (min(slice_years), max(slice_years)) if slice_years else None
+        for var, v in header['variables'].items():
+            index[var] = {'dims': v['dimensions'], 'sizes': [header['dimensions'][d] for d in v['dimensions']],
+                          'years': years, 'files': nslices}
+        return index
+
+    # one header per variable, from the catalog the timeseries generator keeps if possible,
+    # the files missing from it are read but not added, the timeseries generator owns it
+    catalog = None
+    if catalog_fn is not None and os.path.isfile(catalog_fn):
+        try:
+            catalog = catalogLib.Catalog(catalog_fn, readonly=True)
+        except (OSError, sqlite3.Error) as e:
+            print('WARNING: stream_index unable to open {0} - {1}'.format(catalog_fn, e))
+    try:
+        variables = sorted(var_files.keys())
+        headers, new_headers = catalogLib.get_headers(catalog, [sorted(var_files[var])[-1][0] for var in variables])
+    finally:
+        if catalog is not None:
+            catalog.close()
+    for var, header in zip(variables, headers):
+        if var not in header['variables']:
+            continue
+        dims = header['variables'][var]['dimensions']
+        years = [y for fn, y in var_files[var] if y is not None]
+        index[var] = {'dims': dims, 'sizes': [header['dimensions'][d] for d in dims],
+                      'years': (min(y[0] for y in years), max(y[1] for y in years)) if years else None,
+                      'files': len(var_files[var])}
+    return index
+
+
+#=========================================================================
+# requested_vars - the variables the requested plot sets read
+#=========================================================================
+def requested_vars(envDict):
+    """requested_vars - the variables read by the plot sets turned on in
+    env_diags_atm.xml. The standard variables are always kept.
+
+    Arguments:
+    envDict (dictionary) - list of all env variables
+
+    Return:
+    wanted (set) - variable names
+    """
+    def requested(family, all_sets):
+        return envDict.get(all_sets) == 'True' or \
+            any(value == 'True' for key, value in envDict.items() if key.startswith(family))
+
+    wanted = set(STANDARD_VARS)
+    if requested('cset_', 'all_chem_sets'):
+        wanted |= CAM_CHEM_VARS
+    if requested('wset_', 'all_waccm_sets'):
+        wanted |= WACCM_VARS
+    return wanted
+
+
+#=========================================================================
+# climo_bytes - estimated size of the climatologies of a variable
+#=========================================================================
+def climo_bytes(entry, nclimo):
+    """climo_bytes - the estimated bytes of a variable in nclimo climatology files
+
+    Arguments:
+    entry (dictionary) - the variable entry from stream_index
+    nclimo (integer) - number of climatology files
+    """
+    nbytes = WORD_BYTES * nclimo
+    for dim, size in zip(entry['dims'], entry['sizes']):
+        if dim != 'time':
+            nbytes *= size
+    return nbytes
+
+
 #=========================================================================
 # Get a shortened variable list
 #=========================================================================
-def get_variable_list(envDict,in_dir,case_prefix, key_infile, htype, stream):
+def get_variable_list(envDict,in_dir,case_prefix, key_infile, htype, stream, averageList=None, debugMsg=None):
     """get_variable_list - build a list of variables to compute climatologies for.
     This is only done if the users set the 'strip_off_vars' option to True.
+    Only the variables that the input files have and that the requested plot
+    sets read are kept.
 
     Arguments:
     envDict (dictionary) - list of all env variables
     in_dir (string) - input directory
     case_prefix (string) - the name of the case
+    averageList (list) - list of averages to be created, for the size estimates
+    debugMsg (object) - vprinter object for printing debugging messages
 
     Return:
     var_list (list) - a list of the variables to compute climatologies for
     """   
-
-    required_vars =    ['AODVIS','AODDUST','AODDUST1','AODDUST2','AODDUST3','ANRAIN','ANSNOW','AQRAIN','AQSNOW',
-                        'AREI','AREL','AWNC','AWNI','CCN3','CDNUMC','CLDHGH','CLDICE','CLDLIQ','CLDMED','CLDLOW',
-                        'CLDTOT','CLOUD','DCQ','DTCOND','DTV','FICE','FLDS','FLNS','FLNSC','FLNT','FLNTC','FLUT',
-                        'FLUTC','FREQI','FREQL','FREQR','FREQS','FSDS','FSDSC','FSNS','FSNSC','FSNTC','FSNTOA',
-                        'FSNTOAC','FSNT','ICEFRAC','ICIMR','ICWMR','IWC','LANDFRAC','LHFLX','LWCF','NUMICE','NUMLIQ',
-                        'OCNFRAC','OMEGA','OMEGAT','PBLH','PRECC','PRECL','PRECSC','PRECSL','PS','PSL','Q',
-                        'QFLX','QRL','QRS','RELHUM','SHFLX','SNOWHICE','SNOWHLND','SOLIN','SWCF','T','TAUX','TAUY',
-                        'TGCLDIWP','TGCLDLWP','TMQ','TREFHT','TS','U','UU','V','VD01','VQ','VT','VU','VV','WSUB','Z3',
-                        'CLD_MISR','FMISR1','FISCCP1_COSP','FISCCP1','CLDTOT_ISCCP','MEANPTOP_ISCCP','MEANCLDALB_ISCCP',
-                        'CLMODIS','FMODIS1','CLTMODIS','CLLMODIS','CLMMODIS','CLHMODIS','CLWMODIS','CLIMODIS','IWPMODIS',
-                        'LWPMODIS','REFFCLIMODIS','REFFCLWMODIS','TAUILOGMODIS','TAUWLOGMODIS','TAUTLOGMODIS','TAUIMODIS',
-                        'TAUWMODIS','TAUTMODIS','PCTMODIS','CFAD_DBZE94_CS','CFAD_SR532_CAL','CLDTOT_CAL','CLDLOW_CAL',
-                        'CLDMED_CAL','CLDHGH_CAL','CLDTOT_CS2','U10','ICLDTWP','ICLDIWP']
-    cam_chem_vars =    ['CH4','CH4_CHML','SFCH4','CO','CO_CHMP','CO_CHML','SFCO','DCOCHM','DF_CO','O3','O3_Prod','O3_Loss',
-                        'O3_CHMP','O3_CHML','DF_O3','CH3CCL3','CH3CCL3_CHML','ISOP','C10H16','LNO_COL_PROD','SFISOP','SFC10H16',
-                        'SFCH3OH','SFC2H2','SFCH3COCH3','PHIS','ODV_DST01','ODV_DST02','ODV_DST03','ODV_DST04','AODDUST1',
-                        'AODDUST2','AODDUST3','AEROD_v','SFO3','DO3CHM','NO','NO2','NOX','NOY','H2O','Q','OH','H2O2','N2O','HNO3',
-                        'PAN','C3H8','CH3COCH3','CH2O','CH3OH','C2H2','C2H6','C3H6','SO2','SO4','CB1','CB2','OC1','OC2','SOA',
-                        'SOAI','SOAM','SOAX','SOAB','SOAT','NH4NO3','SOAI_PROD','SOAM_PROD','SOAX_PROD','SOAB_PROD','SOAT_PROD',
-                        'CB2SFWET','OC2SFWET','OC2WET','SO4SFWET','SOAISFWET','SOATSFWET','SOABSFWET','SOAXSFWET','SOAMSFWET',
-                        'DST01','DST02','DST03','DST04','SSLT01','SSLT02','SSLT03','SSLT04','SAD_TROP','SAD_ICE','SAD_LNAT',
-                        'SAD_SULFC','SAD_SO4NIT','SAD_SOA','SAD_BC','jo3_a','jno2','jpan','jh2o2','SFSSLT01','SFSSLT02','SFSSLT03',
-                        'SFSSLT04','SFDST01','SFDST02','SFDST03','SFDST04','DST01SFWET','','DST02SFWET','','DST03SFWET','',
-                        'DST04SFWET','SSLT01SFWET','SSLT02SFWET','SSLT03SFWET','SSLT04SFWET','SFSO4','SO4_CHMP','SO4_CHML','DSO4CHM',
-                        'DTWR_SO2','DF_DST01','DF_DST02','DF_DST03','DF_DST04','DF_SSLT01','DF_SSLT02','DF_SSLT03','DF_SSLT04','DF_OC1',
-                        'DF_OC2','DF_CB1','DF_CB2','DF_SOAM','DF_SOAI','DF_SOAT','DF_SOAB','DF_SOAX','DF_SO4','a2x_DSTWET1',
-                        'a2x_DSTWET2','a2x_DSTWET3','a2x_DSTWET4','CB1_CLXF','SFCB1','SFCB2','SFOC1','SFOC2','AQSO4_H2O2',
-                        'AQSO4_O3','soa_a1','soa_a2','soa_c1','soa_c2','dst_a1','dst_a3','dst_a5','dst_a7','dst_c1','dst_c3','dst_c5',
-                        'dst_c7','ncl_a1','ncl_a2','ncl_a3','ncl_a4','ncl_a6','ncl_c1','ncl_a2','ncl_c3','ncl_c4','ncl_c6','pom_a1',
-                        'pom_c1','pom_a3','pom_c3','pom_a4','pom_c4','bc_a1','bc_a3','bc_a4','bc_c1','bc_c3','bc_c4','so4_a1','so4_a2',
-                        'so4_a3','so4_a4','so4_a5','so4_a6','so4_a7','so4_c1','so4_c2','so4_c3','so4_c4','so4_c5','so4_c6','so4_c7',
-                        'SFpom_a1','SFpom_a3','SFpom_a4','pom_a1_CLXF','pom_a2_CLXF','pom_a4_CLXF','pom_a1DDF','pom_a2DDF','pom_a4DDF',
-                        'pom_a1SFWET','pom_a2SFWET','pom_a4SFWET','pom_c1DDF','pom_c2DDF','pom_c4DDF','','pom_c1SFWET','pom_c2SFWET',
-                        'pom_c4SFWET','SFbc_a1','SFbc_a3','SFbc_a4','bc_a1_CLXF','bc_a2_CLXF','bc_a4_CLXF','bc_a1DDF',
-                        'bc_a2DDF','bc_a4DDF','','bc_a1SFWET','bc_a2SFWET','bc_a4SFWET','bc_c1DDF','bc_c2DDF','bc_c4DDF','bc_c1SFWET',
-                        'bc_c2SFWET','bc_c4SFWET','soa_a1_sfgaex1','soa_a2_sfgaex1','','soa_a1DDF','soa_a2DDF','soa_a1SFWET',
-                        'soa_a2SFWET','soa_c1DDF','soa_c2DDF','soa_c1SFWET','soa_c2SFWET','dst_a1SFWET','dst_a3SFWET','dst_a5SFWET',
-                        'dst_a7SFWET','dst_a1DDF','dst_a3DDF','dst_a5DDF','dst_a7DDF','dst_c1SFWET','dst_c3SFWET','dst_c5SFWET',
-                        'dst_c7SFWET','dst_c1DDF','dst_c3DDF','dst_c5DDF','dst_c7DDF','ncl_a1SFWET','ncl_a2SFWET','ncl_a3SFWET',
-                        'ncl_a4SFWET','ncl_a6SFWET','ncl_a1DDF','ncl_a3DDF','ncl_a4DDF','ncl_a6DDF','ncl_c1SFWET','ncl_c2SFWET',
-                        'ncl_c3SFWET','ncl_c4SFWET','ncl_c6SFWET','ncl_c1DDF','ncl_c3DDF','ncl_c4DDF','ncl_c6DDF','SFdst_a1',
-                        'SFdst_a3','SFdst_a5','SFdst_a7','SFncl_a1','SFncl_a2','SFncl_a3','SFncl_a4','SFncl_a6','so4_a1_CHMP','so4_a2_CHMP',
-                        'so4_a3_CHMP','so4_a4_CHMP','so4_a5_CHMP','so4_a6_CHMP','so4_a7_CHMP','SFso4_a1','SFso4_a2','SFso4_a3','SFso4_a4',
-                        'SFso4_a5','SFso4_a6','SFso4_a7','so4_a1_CLXF','so4_a2_CLXF','so4_a3_CLXF','so4_a4_CLXF','so4_a5_CLXF','so4_a6_CLXF',
-                        'so4_a7_CLXF','so4_a1_sfgaex1','so4_a2_sfgaex1','so4_a3_sfgaex1','so4_a4_sfgaex1','so4_a5_sfgaex1','so4_a6_sfgaex1',
-                        'so4_a7_sfgaex1','so4_a1_sfnnuc1','so4_a2_sfnnuc1','so4_a3_sfnnuc1','so4_a4_sfnnuc1','so4_a5_sfnnuc1','so4_a6_sfnnuc1',
-                        'so4_a7_sfnnuc1','so4_a1DDF','so4_a2DDF','so4_a3DDF','so4_a4DDF','so4_a5DDF','so4_a6DDF','so4_a7DDF','so4_a1SFWET',
-                        'so4_a2SFWET','so4_a3SFWET','so4_a4SFWET','so4_a5SFWET','so4_a6SFWET','so4_a7SFWET','so4_c1DDF','so4_c2DDF',
-                        'so4_c3DDF','so4_c4DDF','so4_c5DDF','so4_c6DDF','so4_c7DDF','so4_c1SFWET','so4_c2SFWET','so4_c3SFWET','so4_c4SFWET',
-                        'so4_c5SFWET','so4_c6SFWET','so4_c7SFWET','SOAG0_CHMP', 'SOAG1_CHMP','SOAG2_CHMP','SOAG3_CHMP','SOAG4_CHMP','SOAG0_CHML',
-                        'SOAG1_CHML','SOAG2_CHML','SOAG3_CHML','SOAG4_CHML','soa1_a1','soa2_a1','soa3_a1','soa4_a1','soa5_a1','soa1_a2',
-                        'soa2_a2','soa3_a2','soa4_a2','soa5_a2','soa1_c1','soa2_c1','soa3_c1','soa4_c1','soa5_c1','soa1_c2','soa2_c2',
-                        'soa3_c2','soa4_c2','soa5_c2','soa1_a1SFWET','soa1_a2SFWET','soa2_a1SFWET','soa2_a2SFWET','soa3_a1SFWET','soa3_a2SFWET',
-                        'soa4_a1SFWET','soa4_a2SFWET','soa5_a1SFWET','soa5_a2SFWET','soa1_c1SFWET','soa1_c2SFWET','soa2_c1SFWET','soa2_c2SFWET',
-                        'soa3_c1SFWET','soa3_c2SFWET','soa4_c1SFWET','soa4_c2SFWET','soa5_c1SFWET','soa5_c2SFWET','soa1_a2DDF','soa2_a1DDF',
-                        'soa2_a2DDF','soa3_a1DDF','soa3_a2DDF','soa4_a1DDF','soa4_a2DDF','soa5_a1DDF','soa5_a2DDF','soa1_c1DDF','soa1_c2DDF',
-                        'soa2_c1DDF','soa2_c2DDF','soa3_c1DDF','soa3_c2DDF','soa4_c1DDF','soa4_c2DDF','soa5_c1DDF','soa5_c2DDF','r_jsoa1_a1',
-                        'r_jsoa2_a1','r_jsoa3_a1','r_jsoa4_a1','r_jsoa5_a1','r_jsoa1_a2','r_jsoa2_a2','r_jsoa3_a2','r_jsoa4_a2','r_jsoa5_a2',
-                        'soa1_a1_sfgaex1','soa1_a2_sfgaex1','soa2_a1_sfgaex1','soa2_a2_sfgaex1','soa3_a1_sfgaex1','soa3_a2_sfgaex1',
-                        'soa4_a1_sfgaex1','soa4_a2_sfgaex1','soa5_a1_sfgaex1','soa5_a2_sfgaex1','so4_a2_sfnnuc1','so4_c1AQH2SO4',
-                        'so4_c2AQH2SO4','so4_c3AQH2SO4','so4_c1AQSO4','so4_c2AQSO4','so4_c3AQSO4']
-    waccm_vars =       ['BRO','CH3CL','CLO','CO2','HCL','HO2','HOCL','QRL_TOT','QRS_TOT']
-    #waccm_vars =       ['QRS_TOT','QRL_TOT']
-
-    var_list = []
-    fileVars = []
-   
-    # Get a list of variables that we have input data for
-    if (htype == 'slice'):
-         import Nio
-
-         # Open file and get all variable names 
-         f = Nio.open_file(key_infile,'r')
-         fileVars = f.variables.keys()
-
-    else: # htype == series
-        import glob
-        glob_string = '{0}/{1}.'.format(in_dir,case_prefix)
-        file_list = glob.glob(glob_string+'*')
-        print (glob_string,'File list:',file_list)
-        for f in file_list:
-            f_suffix = f.split(glob_string) # remove case name
-            suffix_split =  f_suffix[1].split('.') # separate the suffix into pieces, the first will be variable name
-            fileVars.append(suffix_split[0])
-
-    # Loop through the requried vars to see which are located in the files
-    for var in required_vars:
-        if var in fileVars:
-            var_list.append(var) # Found in in_files, add to the var_list
-    # Loop through cam_chem_vars if users are plotting these sets, then add those variables to the list if we have data for them
-    #if all_chem_sets or cset_1 or cset_2 or cset_3 or cset_4 or cset_5 or cset_6 or cset_7:
-    for var in cam_chem_vars:
-        if var in fileVars:
-            var_list.append(var) # Found in in_files, add to the var_list 
-
-    for var in waccm_vars:
-        if var in fileVars:
-            var_list.append(var) # Found in in_files, add to the var_list 
+    catalog_fn = None
+    if htype == 'series':
+        catalog_fn = '{0}/logs/tseries_catalog.db'.format(envDict['CASEROOT'])
+    index = stream_index(in_dir, case_prefix, key_infile, htype, catalog_fn)
+
+    wanted = requested_vars(envDict)
+    var_list = sorted(wanted.intersection(index))
+    skipped = sorted((CAM_CHEM_VARS | WACCM_VARS).intersection(index).difference(wanted))
+
+    # report the estimated climatology size of each variable and the input years missing
+    if averageList is None:
+        averageList = []
+    nclimo = len(averageList)
+    years = climoCacheLib.average_years(averageList)
+    total = 0
+    for var in var_list:
+        nbytes = climo_bytes(index[var], nclimo)
+        total += nbytes
+        if debugMsg is not None:
+            debugMsg('{0} {1} {2} {3:.1f} MB'.format(case_prefix, var, index[var]['sizes'], nbytes / 1048576.0),
+                     header=True, verbosity=2)
+        have = index[var]['years']
+        if years is not None and have is not None and (have[0] > years[0] or have[1] < years[1]):
+            print('WARNING: {0} {1} has input for years {2}-{3} only'.format(case_prefix, var, have[0], have[1]))
+    if debugMsg is not None:
+        debugMsg('{0}: averaging {1} of {2} variables, about {3:.2f} GB in {4} climatology files, '
+                 '{5} variables not read by the requested plot sets skipped'.format(
+                     case_prefix, len(var_list), len(index), total / 1073741824.0, nclimo, len(skipped)),
+                 header=True)
 
     return var_list
 
@@ -267,6 +392,7 @@ def callPyAverager(start_year, stop_year, in_dir, htype, key_infile, out_dir, ca
        averageList (list) - list of averages to be created
        varList (list) - list of variables. Note: an empty list implies all variables.
     """
+    timing = perfLib.active()
     wght = envDict['weight_months']
     if wght == 'True':
        wght = True
@@ -285,13 +411,7 @@ def callPyAverager(start_year, stop_year, in_dir, htype, key_infile, out_dir, ca
         date_pattern = 'yyyy-mm'
     suffix = 'nc'
 
-    main_comm.sync()
-
-    varList = []
-    if envDict['strip_off_vars'].lower() in ['t','true']:
-        varList = get_variable_list(envDict,in_dir,case_prefix,key_infile,htype,stream)
-
-    main_comm.sync()
+    timing.sync(main_comm)
 
     if main_comm.is_manager():
         debugMsg('calling specification.create_specifier with following args', header=True)
@@ -333,7 +453,11 @@ def callPyAverager(start_year, stop_year, in_dir, htype, key_infile, out_dir, ca
     try:
         if main_comm.is_manager():
             debugMsg("calling run_pyAverager", header=True)
-        PyAverager.run_pyAverager(pyAveSpecifier)
+        with timing.stage('pyaverager', ','.join(averageList)):
+            # reuse the climatologies of an identical earlier call from the shared cache
+            climoCacheLib.run_cached(climoCacheLib.from_env(envDict), lambda: PyAverager.run_pyAverager(pyAveSpecifier),
+                                     main_comm, out_dir, in_dir, case_prefix, averageList, varList,
+                                     hist_type=htype, weighted=wght, ncformat=ncfrmt, collapse_dim=collapse_dim)
     except Exception as error:
         print(str(error))
         traceback.print_exc()
@@ -355,21 +479,57 @@ def createClimFiles(start_year, stop_year, in_dir, htype, key_infile, out_dir, c
        case (string) - case name
        inVarList (list) - if empty, then create climatology files for all vars
     """
+    timing = perfLib.active()
+
     # create the list of averages to be computed
+    climo_dir = out_dir
     out_dir = out_dir+'/'+case+'.'+str(start_year)+'-'+str(stop_year)
     avgFileBaseName = '{0}/{1}.{2}'.format(out_dir,case,stream)
     case_prefix = '{0}.{1}'.format(case,stream)
     averageList = []
 
+    # the climatology file of an average, in the directory of its years
+    m_names = ['jan','feb','mar','apr','may','jun','jul','aug','sep','oct','nov','dec']
+    def climo_name(avg_type, y0, y1):
+        if avg_type in m_names:
+            label = str(m_names.index(avg_type)+1).zfill(2)
+        else:
+            label = avg_type.upper()
+        return '{0}/{1}.{2}-{3}/{1}.{4}.{2}-{3}.{5}_climo.nc'.format(climo_dir, case, y0, y1, stream, label)
+
     # create the list of averages to be computed by the pyAverager
     averageList = buildAtmAvgList(start_year, stop_year, avgFileBaseName, out_dir, envDict, debugMsg)
 
-    main_comm.sync()
+    # the variables to average, an empty list is all of them, and the averages extending
+    # a stored climatology with those variables, only computed for the new years
+    plan = None
+    if main_comm.is_manager() and len(averageList) > 0:
+        with timing.stage('get_variable_list', case_prefix):
+            varList = []
+            catalog_fn = None
+            if htype == 'series':
+                catalog_fn = '{0}/logs/tseries_catalog.db'.format(envDict['CASEROOT'])
+            if envDict['strip_off_vars'].lower() in ['t','true']:
+                varList = get_variable_list(envDict,in_dir,case_prefix,key_infile,htype,stream,averageList,debugMsg)
+                stored_vars = varList
+            else:
+                stored_vars = sorted(stream_index(in_dir, case_prefix, key_infile, htype, catalog_fn))
+            plan = (varList,) + climoAccumLib.plan_extensions(averageList, climo_name, out_dir, stored_vars)
+        if len(plan[2]) > 0:
+            debugMsg('extending stored climatologies {0}'.format([e['prev'] for e in plan[2]]))
+    if len(averageList) > 0:
+        varList, averageList, extensions = main_comm.partition(plan, func=partition.Duplicate(), involved=True)
+
+    timing.sync(main_comm)
 
     # if the averageList is empty, then all the climatology files exist with all variables
     if len(averageList) > 0:
-        # call the pyAverager with the inVarList
-        callPyAverager(start_year, stop_year, in_dir, htype, key_infile, out_dir, case_prefix, averageList, inVarList, envDict, stream, main_comm, debugMsg)
+        # call the pyAverager with the variable list
+        callPyAverager(start_year, stop_year, in_dir, htype, key_infile, out_dir, case_prefix, averageList, varList, envDict, stream, main_comm, debugMsg)
+
+        # add the new years to the stored climatologies and keep the sums of the new ones
+        with timing.stage('climo_sums'):
+            climoAccumLib.finish(averageList, extensions, climo_name, out_dir, main_comm)
 
 
 #============================================
@@ -446,13 +606,16 @@ def main(options, main_comm, debugMsg):
 
     # CASEROOT is given on the command line as required option --caseroot
     caseroot = options.caseroot[0]
+
+    # record the time and I/O of each stage on every rank
+    timing = perfLib.Instrument('atm_avg_generator', main_comm)
     if main_comm.is_manager():
         debugMsg('caseroot = {0}'.format(caseroot), header=True)
         debugMsg('calling initialize_envDict', header=True)
 
     envDict = initialize_envDict(envDict, caseroot, debugMsg, options.standalone)
 
-    main_comm.sync()
+    timing.sync(main_comm)
     # specify variables to include in the averages, empty list implies get them all
     varList = []
 
@@ -478,10 +641,11 @@ def main(options, main_comm, debugMsg):
             if main_comm.is_manager():
                 debugMsg('calling createClimFiles', header=True)
 
-            createClimFiles(envDict['test_first_yr'], test_end_year, h_path,
-                            envDict['test_htype'], envDict['test_key_infile'], 
-                            envDict['test_path_climo'], envDict['test_casename'], 
-                            envDict['test_modelstream'], varList, envDict, main_comm, debugMsg)
+            with timing.stage('climo', envDict['test_casename']):
+                createClimFiles(envDict['test_first_yr'], test_end_year, h_path,
+                                envDict['test_htype'], envDict['test_key_infile'], 
+                                envDict['test_path_climo'], envDict['test_casename'], 
+                                envDict['test_modelstream'], varList, envDict, main_comm, debugMsg)
         except Exception as error:
             print(str(error))
             traceback.print_exc()
@@ -504,15 +668,19 @@ def main(options, main_comm, debugMsg):
             # generate the climatology files used for all plotting types using the pyAverager
             debugMsg('calling createClimFiles', header=True)
 
-            createClimFiles(envDict['cntl_first_yr'], cntl_end_year, h_path,
-                            envDict['cntl_htype'], envDict['cntl_key_infile'], 
-                            envDict['cntl_path_climo'], envDict['cntl_casename'], 
-                            envDict['cntl_modelstream'], varList, envDict, main_comm, debugMsg)
+            with timing.stage('climo', envDict['cntl_casename']):
+                createClimFiles(envDict['cntl_first_yr'], cntl_end_year, h_path,
+                                envDict['cntl_htype'], envDict['cntl_key_infile'], 
+                                envDict['cntl_path_climo'], envDict['cntl_casename'], 
+                                envDict['cntl_modelstream'], varList, envDict, main_comm, debugMsg)
         except Exception as error:
             print(str(error))
             traceback.print_exc()
             sys.exit(1)
 
+    timing.sync(main_comm)
+    timing.write_summary('{0}/logs'.format(caseroot))
+
 
 #===================================
 
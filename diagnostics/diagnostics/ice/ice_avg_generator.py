@@ -27,14 +27,15 @@ if sys.hexversion < 0x03070000:
 
 # import core python modules
 import argparse
+import copy
 import getopt
 import os
 import re
 import traceback
 
 # import local modules for postprocessing
-from cesm_utils import cesmEnvLib
-from diag_utils import diagUtilsLib
+from cesm_utils import catalogLib, cesmEnvLib
+from diag_utils import climoCacheLib, diagUtilsLib
 
 # import the MPI related modules
 from asaptools import partition, simplecomm, vprinter, timekeeper
@@ -42,6 +43,11 @@ from asaptools import partition, simplecomm, vprinter, timekeeper
 # import the pyaverager and preproc
 from pyaverager import specification, PyAverager, PreProc
 
+# the variables of the pre_proc file, the sums of 4 variables over 18 regions and
+# time, each reads one history slice for every month.  The pre_proc partitions them
+# over its workers, so it has no use for more ranks than these and a manager.
+PRE_PROC_VARS = 18 * 4 + 1
+
 #=====================================================
 # commandline_options - parse any command line options
 #=====================================================
@@ -125,6 +131,37 @@ def get_variable_list(envDict,in_dir,case_prefix, key_infile, htype, stream):
     return var_list
 
 
+#========================================================================
+# dividePipeline - split the ranks between the averages and the pre_proc
+#========================================================================
+def dividePipeline(main_comm, avg_cost, pre_cost):
+    """dividePipeline - divide the ranks of main_comm into a group that computes
+       the climatology files and a group that computes the pre_proc file at the
+       same time, sized by their costs. Each group needs a manager and a worker,
+       and the pre_proc group gets at most a worker per pre_proc variable.
+
+       Arguments:
+       main_comm (object) - simple MPI communicator object
+       avg_cost (float) - cost of the climatology files, in variable monthly slices read
+       pre_cost (float) - cost of the pre_proc file, in variable monthly slices read
+
+       Return:
+       pre_proc (boolean) - True on the ranks of the pre_proc group, None if not divided
+       local_comm (object) - simple MPI communicator of the group of this rank,
+                             main_comm if there are too few ranks to divide
+    """
+    size = main_comm.get_size()
+    if size < 4:
+        return None, main_comm
+
+    npre = int(round(size * pre_cost / float(avg_cost + pre_cost)))
+    npre = min(max(npre, 2), size - 2, PRE_PROC_VARS + 1)
+
+    # the pre_proc group takes the last ranks so the averages keep the global manager
+    pre_proc = main_comm.get_rank() >= size - npre
+    local_comm, multi_comm = main_comm.divide(int(pre_proc))
+    return pre_proc, local_comm
+
 #========================================================================
 # callPyAverager - create the climatology files by calling the pyAverager
 #========================================================================
@@ -212,18 +249,62 @@ def callPyAverager(avg_start_year, avg_stop_year, in_dir, htype, key_infile,
         traceback.print_exc()
         sys.exit(1)
 
+    # the pre_proc file is computed from the history files for year0 to year1, it does not read
+    # the climatology files.  The run_pyAverager changes the split settings of its specifier
+    # so the pre_proc gets its own copy.
+    preProcSpecifier = copy.copy(pyAveSpecifier)
+    preProcSpecifier.year0 = year0
+    preProcSpecifier.year1 = year1
+    preProcSpecifier.split=split
+    preProcSpecifier.split_files=split_fn
+    preProcSpecifier.split_orig_size=split_size
+
+    # the costs of the two as the number of variable monthly slices read from the history files
+    nvars = len(varList)
+    if nvars == 0:
+        try:
+            header = catalogLib.read_header(key_infile)
+            nvars = len([v for v in header['variables'].values() if 'time' in v['dimensions']])
+        except (IOError, OSError, RuntimeError):
+            nvars = PRE_PROC_VARS
+    avg_cost = nvars * 12 * (int(avg_stop_year) - int(avg_start_year) + 1)
+    pre_cost = PRE_PROC_VARS * 12 * (int(year1) - int(year0) + 1)
+
     try:
         if main_comm.is_manager():
             debugMsg("calling run_pyAverager")
+            if not os.path.isdir(out_dir):
+                os.makedirs(out_dir)
         main_comm.sync()
-        PyAverager.run_pyAverager(pyAveSpecifier)
-        pyAveSpecifier.year0 = year0
-        pyAveSpecifier.year1 = year1
-        pyAveSpecifier.split=split
-        pyAveSpecifier.split_files=split_fn
-        pyAveSpecifier.split_orig_size=split_size
-        debugMsg("calling run_pre_proc")
-        PreProc.run_pre_proc(pyAveSpecifier)
+
+        def run():
+            # run the pre_proc on a group of ranks while the others compute the averages
+            # and stitch the NH and SH files, or one after the other on a few ranks
+            pre_proc, local_comm = dividePipeline(main_comm, avg_cost, pre_cost)
+            if pre_proc is None:
+                PyAverager.run_pyAverager(pyAveSpecifier)
+                debugMsg("calling run_pre_proc")
+                PreProc.run_pre_proc(preProcSpecifier)
+            elif pre_proc:
+                if local_comm.is_manager():
+                    debugMsg("calling run_pre_proc on {0} ranks".format(local_comm.get_size()), header=True)
+                preProcSpecifier.main_comm = local_comm
+                PreProc.run_pre_proc(preProcSpecifier)
+            else:
+                if local_comm.is_manager():
+                    debugMsg("calling run_pyAverager on {0} ranks".format(local_comm.get_size()), header=True)
+                pyAveSpecifier.main_comm = local_comm
+                PyAverager.run_pyAverager(pyAveSpecifier)
+
+        # reuse the climatologies and pre_proc file of an identical earlier call from the shared cache,
+        # the pre_proc file covers year0 to year1
+        years = climoCacheLib.average_years(averageList)
+        years = (min(years[0], int(year0)), max(years[1], int(year1)))
+        climoCacheLib.run_cached(climoCacheLib.from_env(envDict), run, main_comm, out_dir, in_dir,
+                                 case_prefix, averageList, varList, years=years,
+                                 hist_type=htype, weighted=wght, ncformat=ncfrmt, split=split_fn,
+                                 split_size=split_size, ice_obs_file=ice_obs_file, reg_file=reg_file,
+                                 year0=year0, year1=year1)
     except Exception as error:
         print(str(error))
         traceback.print_exc()
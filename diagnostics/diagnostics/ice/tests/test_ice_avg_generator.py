@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Unit test suite for dividing the ranks between the ice averages and the pre_proc
+"""
+from __future__ import print_function
+
+import unittest
+
+try:
+    from diagnostics.ice import ice_avg_generator
+except ImportError:
+    # the generator needs the pyaverager package
+    ice_avg_generator = None
+
+class Comm(object):
+    """ stands in for one rank of a simple MPI communicator
+    """
+    def __init__(self, size, rank):
+        self.size = size
+        self.rank = rank
+
+    def get_size(self):
+        return self.size
+
+    def get_rank(self):
+        return self.rank
+
+    def divide(self, group):
+        return 'group{0}'.format(group), 'multi'
+
+
+def group_sizes(size, avg_cost, pre_cost):
+    """ the number of ranks of the averaging and pre_proc groups
+    """
+    groups = [ice_avg_generator.dividePipeline(Comm(size, rank), avg_cost, pre_cost)[0] for rank in range(size)]
+    return groups.count(False), groups.count(True)
+
+
+@unittest.skipIf(ice_avg_generator is None, 'the pyaverager package is not installed')
+class test_dividePipeline(unittest.TestCase):
+
+    def test_few_ranks(self):
+        """ test to see if fewer than 4 ranks are not divided
+        """
+        comm = Comm(3, 0)
+        self.assertEqual(ice_avg_generator.dividePipeline(comm, 1.0, 1.0), (None, comm))
+
+    def test_sizes(self):
+        """ test to see if the groups are sized by their costs and the averages keep the manager
+        """
+        self.assertEqual(group_sizes(16, 3.0, 1.0), (12, 4))
+        self.assertEqual(group_sizes(16, 1.0, 1.0), (8, 8))
+        self.assertEqual(ice_avg_generator.dividePipeline(Comm(16, 0), 3.0, 1.0), (False, 'group0'))
+        self.assertEqual(ice_avg_generator.dividePipeline(Comm(16, 15), 3.0, 1.0), (True, 'group1'))
+
+    def test_limits(self):
+        """ test to see if each group has a manager and a worker and the pre_proc
+            has no more ranks than it can use
+        """
+        self.assertEqual(group_sizes(4, 100.0, 1.0), (2, 2))
+        self.assertEqual(group_sizes(4, 1.0, 100.0), (2, 2))
+        self.assertEqual(group_sizes(200, 1.0, 1.0), (200 - ice_avg_generator.PRE_PROC_VARS - 1,
+                                                      ice_avg_generator.PRE_PROC_VARS + 1))
+
+        # 10 variables averaged over 20 years against the pre_proc of 50 years
+        avg_cost = 10 * 12 * 20
+        pre_cost = ice_avg_generator.PRE_PROC_VARS * 12 * 50
+        self.assertEqual(group_sizes(64, avg_cost, pre_cost), (3, 61))
+        self.assertEqual(group_sizes(512, avg_cost, pre_cost), (512 - 74, 74))
+
+if __name__ == '__main__':
+    unittest.main()
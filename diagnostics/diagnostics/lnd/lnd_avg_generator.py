@@ -34,7 +34,7 @@ import traceback
 
 # import local modules for postprocessing
 from cesm_utils import cesmEnvLib
-from diag_utils import diagUtilsLib
+from diag_utils import climoCacheLib, diagUtilsLib
 
 # import the MPI related modules
 from asaptools import partition, simplecomm, vprinter, timekeeper
@@ -226,7 +226,10 @@ def callPyAverager(avg_start_year, avg_stop_year, in_dir, htype, key_infile,
     try:
         if main_comm.is_manager():
             debugMsg("calling run_pyAverager")
-        PyAverager.run_pyAverager(pyAveSpecifier)
+        # reuse the climatologies of an identical earlier call from the shared cache
+        climoCacheLib.run_cached(climoCacheLib.from_env(envDict), lambda: PyAverager.run_pyAverager(pyAveSpecifier),
+                                 main_comm, out_dir, in_dir, case_prefix, averageList, varList,
+                                 hist_type=htype, weighted=wght, ncformat=ncfrmt)
     except Exception as error:
         print(str(error))
         traceback.print_exc()
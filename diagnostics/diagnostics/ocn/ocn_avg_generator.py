@@ -33,8 +33,8 @@ import re
 import traceback
 
 # import local modules for postprocessing
-from cesm_utils import cesmEnvLib
-from diag_utils import diagUtilsLib
+from cesm_utils import cesmEnvLib, perfLib
+from diag_utils import climoAccumLib, climoCacheLib, diagUtilsLib
 
 # import the MPI related modules
 from asaptools import partition, simplecomm, vprinter, timekeeper
@@ -162,7 +162,7 @@ def buildOcnAvgList(start_year, stop_year, tavgdir, main_comm, debugMsg):
 #========================================================================
 def callPyAverager(in_dir, htype, tavgdir, case_prefix, averageList, varList,
                    diag_obs_root, netcdf_format, nlev, timeseries_obspath, 
-                   main_comm, debugMsg):
+                   main_comm, debugMsg, cache=None):
     """setup the pyAverager specifier class with specifications to create
        the climatology files in parallel.
 
@@ -179,8 +179,11 @@ def callPyAverager(in_dir, htype, tavgdir, case_prefix, averageList, varList,
        nlev (integer) - Number of ocean vertical levels
        timeseries_obspath (string) - timeseries observation files path
        main_comm (object) - simple MPI communicator object
+       cache (object) - climoCacheLib.ClimoCache shared climatology cache, None to always compute
 
     """
+    timing = perfLib.active()
+
     # the following are used for timeseries averages and ignored otherwise
 ##    mean_diff_rms_obs_dir = '{0}/omwg/timeseries_obs'.format(diag_obs_root)
     mean_diff_rms_obs_dir = timeseries_obspath
@@ -202,7 +205,7 @@ def callPyAverager(in_dir, htype, tavgdir, case_prefix, averageList, varList,
     date_pattern = 'yyyymm-yyyymm'
     suffix = 'nc'
 
-    main_comm.sync();
+    timing.sync(main_comm)
 
     if main_comm.is_manager():
         debugMsg('calling specification.create_specifier with following args', header=True)
@@ -227,7 +230,7 @@ def callPyAverager(in_dir, htype, tavgdir, case_prefix, averageList, varList,
         debugMsg('... reg_obs_file_suffix = {0}'.format(reg_obs_file_suffix), header=True)
         debugMsg('... nlev = {0}'.format(nlev), header=True)
 
-    main_comm.sync();
+    timing.sync(main_comm)
 
     try: 
         pyAveSpecifier = specification.create_specifier(
@@ -261,21 +264,54 @@ def callPyAverager(in_dir, htype, tavgdir, case_prefix, averageList, varList,
         if main_comm.is_manager():
             debugMsg("calling run_pyAverager")
 
-        PyAverager.run_pyAverager(pyAveSpecifier)
-
-        main_comm.sync();
+        with timing.stage('pyaverager', ','.join(averageList)):
+            # reuse the climatologies of an identical earlier call from the shared cache
+            climoCacheLib.run_cached(cache, lambda: PyAverager.run_pyAverager(pyAveSpecifier),
+                                     main_comm, tavgdir, in_dir, case_prefix, averageList, varList,
+                                     hist_type=htype, weighted=wght, ncformat=ncfrmt, vertical_levels=nlev,
+                                     regions=regions, obs_dir=obs_dir)
+            timing.sync(main_comm)
 
     except Exception as error:
         print(str(error))
         traceback.print_exc()
         sys.exit(1)
 
+#=====================================================================
+# fuseAverages - merge the pyAverager passes over the same variables
+#=====================================================================
+def fuseAverages(passes):
+    """fuseAverages - merge the pyAverager passes over the same variable list
+    into one pass, so its averages run in one run_pyAverager call instead of
+    in serial passes with a sync between them. The pyAverager still gives each
+    average its own sub-communicator that reads the history files itself, so
+    the files are not read any fewer times. The output files are the same.
+
+    Arguments:
+    passes (list) - (averageList, varList) in the order they would be run,
+                    an empty varList is all variables
+
+    Return:
+    fused (list) - (averageList, varList) with one entry per distinct variable list
+    """
+    fused = []
+    for avgList, varList in passes:
+        if len(avgList) == 0:
+            continue
+        for fusedList, fusedVars in fused:
+            if sorted(fusedVars) == sorted(varList):
+                fusedList.extend(avg for avg in avgList if avg not in fusedList)
+                break
+        else:
+            fused.append((list(avgList), list(varList)))
+    return fused
+
 #=========================================================================
 # createClimFiles - create the climatology files by calling the pyAverager
 #=========================================================================
 def createClimFiles(start_year, stop_year, in_dir, htype, tavgdir, case, tseries, inVarList,
                     tseries_start_year, tseries_stop_year, diag_obs_root, netcdf_format, 
-                    nlev, timeseries_obspath, main_comm, debugMsg):
+                    nlev, timeseries_obspath, main_comm, debugMsg, cache=None):
     """setup the pyAverager specifier class with specifications to create
        the climatology files in parallel.
 
@@ -295,37 +331,68 @@ def createClimFiles(start_year, stop_year, in_dir, htype, tavgdir, case, tseries
        nlev (integer) - Number of ocean vertical levels
        timeseries_obspath (string) - timeseries observation files path
        main_comm (object) - simple MPI communicator object
+       cache (object) - climoCacheLib.ClimoCache shared climatology cache, None to always compute
 
     """
+    timing = perfLib.active()
+
     # create the list of averages to be computed
     avgFileBaseName = '{0}/{1}.pop.h'.format(tavgdir,case)
     case_prefix = '{0}.pop.h'.format(case)
-    averageList = []
-    avgList = []
+
+    # the averages to compute, each with the variables it is computed for
+    passes = []
+    climoList = []
+    extensions = []
+
+    # the climatology file of an average.  With the default TAVGDIR, climo.$YEAR0.$YEAR1,
+    # every year range has its own directory next to tavgdir
+    climo_root = os.path.normpath(tavgdir)
+    per_range = os.path.basename(climo_root) == 'climo.{0}.{1}'.format(start_year, stop_year)
+    def climo_name(avg_type, y0, y1):
+        climo_dir = tavgdir
+        if per_range:
+            climo_dir = os.path.join(os.path.dirname(climo_root), 'climo.{0}.{1}'.format(y0, y1))
+        return '{0}/{1}.{2}-{3}.nc'.format(climo_dir, avg_type, y0, y1)
 
     # create the list of averages to be computed by the pyAverager
     averageList = buildOcnAvgList(start_year, stop_year, tavgdir, main_comm, debugMsg)
 
     # if the averageList is empty, then all the climatology files exist with all variables
     if len(averageList) > 0:
+        # a tavg or mavg extending a stored one is only computed for the new years
+        for avg, avgVarList in [('tavg', inVarList), ('mavg', ['SALT', 'TEMP'])]:
+            avgList, avgExtensions = climoAccumLib.plan_extensions(['{0}:{1}:{2}'.format(avg, start_year, stop_year)],
+                                                                   climo_name, tavgdir, avgVarList)
+            climoList.extend(avgList)
+            extensions.extend(avgExtensions)
+        if main_comm.is_manager() and len(extensions) > 0:
+            debugMsg('extending stored climatologies {0}'.format([e['prev'] for e in extensions]), header=True, verbosity=1)
+
+        # tavg for the inVarList - all variables, and mavg for just SALT and TEMP
+        passes.append((climoList[:1], inVarList))
+        passes.append((climoList[1:], ['SALT', 'TEMP']))
 
-        # call the pyAverager with the inVarList for tavg only - all variables
-        avgList.append('tavg:{0}:{1}'.format(start_year, stop_year))        
-        if main_comm.is_manager():
-            debugMsg('Calling callPyAverager with averageList = {0}'.format(avgList), header=True, verbosity=1)
-            debugMsg(' and inVarList = {0}'.format(inVarList), header=True, verbosity=1)
-        callPyAverager(in_dir=in_dir, htype=htype, tavgdir=tavgdir, 
-                       case_prefix=case_prefix, averageList=avgList, 
-                       varList=inVarList, diag_obs_root=diag_obs_root, 
-                       netcdf_format=netcdf_format, nlev=nlev, 
-                       timeseries_obspath=timeseries_obspath, 
-                       main_comm=main_comm, debugMsg=debugMsg)
-        main_comm.sync()
+    # check if timeseries diagnostics is requested
+    if tseries:
+        # create the list of averages to be computed by the pyAverager
+        averageList, averageListMoc = buildOcnTseriesAvgList(start_year=tseries_start_year, 
+                                                             stop_year=tseries_stop_year, 
+                                                             avgFileBaseName=avgFileBaseName, 
+                                                             moc=('MOC' in inVarList), 
+                                                             main_comm=main_comm, debugMsg=debugMsg)
 
-        # call the pyAverager with the just SALT and TEMP for mavg only
-        avgList = []
-        avgList.append('mavg:{0}:{1}'.format(start_year, stop_year))
-        tmpInVarList = ['SALT', 'TEMP']
+        # the annual timeseries files and MOC file with TEMP, SALT, MOC variables
+        if 'MOC' in inVarList:
+            passes.append((averageListMoc, ['MOC', 'SALT', 'TEMP']))
+        else:
+            passes.append((averageListMoc, ['SALT', 'TEMP']))
+
+        # the horizontal mean files with just SALT and TEMP
+        passes.append((averageList, ['SALT', 'TEMP']))
+
+    # one pyAverager pass over the history files per distinct variable list
+    for avgList, tmpInVarList in fuseAverages(passes):
         if main_comm.is_manager():
             debugMsg('Calling callPyAverager with averageList = {0}'.format(avgList), header=True, verbosity=1)
             debugMsg(' and inVarList = {0}'.format(tmpInVarList), header=True, verbosity=1)
@@ -334,59 +401,13 @@ def createClimFiles(start_year, stop_year, in_dir, htype, tavgdir, case, tseries
                        varList=tmpInVarList, diag_obs_root=diag_obs_root, 
                        netcdf_format=netcdf_format, nlev=nlev, 
                        timeseries_obspath=timeseries_obspath, 
-                       main_comm=main_comm, debugMsg=debugMsg)
-    main_comm.sync()
+                       main_comm=main_comm, debugMsg=debugMsg, cache=cache)
+    timing.sync(main_comm)
 
-    # check if timeseries diagnostics is requested
-    if tseries:
-        # create the list of averages to be computed by the pyAverager
-        if 'MOC' in inVarList:
-            averageList, averageListMoc = buildOcnTseriesAvgList(start_year=tseries_start_year, 
-                                                                 stop_year=tseries_stop_year, 
-                                                                 avgFileBaseName=avgFileBaseName, 
-                                                                 moc=True, 
-                                                                 main_comm=main_comm, debugMsg=debugMsg)
-        else:
-            averageList, averageListMoc = buildOcnTseriesAvgList(start_year=tseries_start_year, 
-                                                                 stop_year=tseries_stop_year, 
-                                                                 avgFileBaseName=avgFileBaseName, 
-                                                                 moc=False, 
-                                                                 main_comm=main_comm, debugMsg=debugMsg)
-        main_comm.sync()
-
-        # generate the annual timeseries files and MOC file with TEMP, SALT, MOC variables
-        if len(averageListMoc) > 0:
-            # call the pyAverager with the inVarList
-            if 'MOC' in inVarList:
-                tmpInVarList = ['MOC','SALT', 'TEMP']
-            else:
-                tmpInVarList = ['SALT', 'TEMP']
-            if main_comm.is_manager():
-                debugMsg('Calling callPyAverager with averageListMoc = {0}'.format(averageListMoc), header=True, verbosity=1)
-                debugMsg(' and inVarList = {0}'.format(tmpInVarList), header=True, verbosity=1)
-
-            callPyAverager(in_dir=in_dir, htype=htype, tavgdir=tavgdir, 
-                           case_prefix=case_prefix, averageList=averageListMoc, 
-                           varList=tmpInVarList, diag_obs_root=diag_obs_root, 
-                           netcdf_format=netcdf_format, nlev=nlev, 
-                           timeseries_obspath=timeseries_obspath, 
-                           main_comm=main_comm, debugMsg=debugMsg)
-        main_comm.sync()
-
-        # generate the horizontal mean files with just SALT and TEMP
-        if len(averageList) > 0:
-            # call the pyAverager with the inVarList
-            tmpInVarList = ['SALT', 'TEMP']
-            if main_comm.is_manager():
-                debugMsg('Calling callPyAverager with averageList = {0}'.format(averageList), header=True, verbosity=1)
-                debugMsg(' and inVarList = {0}'.format(tmpInVarList), header=True, verbosity=1)
-            callPyAverager(in_dir=in_dir, htype=htype, tavgdir=tavgdir, 
-                           case_prefix=case_prefix, averageList=averageList,
-                           varList=tmpInVarList, diag_obs_root=diag_obs_root, 
-                           netcdf_format=netcdf_format, nlev=nlev, 
-                           timeseries_obspath=timeseries_obspath, 
-                           main_comm=main_comm, debugMsg=debugMsg)
-        main_comm.sync()
+    # add the new years to the stored climatologies and keep the sums of the new ones
+    if len(climoList) > 0:
+        with timing.stage('climo_sums'):
+            climoAccumLib.finish(climoList, extensions, climo_name, tavgdir, main_comm)
 
 #============================================
 # initialize_envDict - initialization envDict
@@ -452,6 +473,10 @@ def main(options, main_comm, debugMsg):
     # initialize the environment dictionary
     envDict = dict()
 
+    # record the time and I/O of each stage on every rank
+    timing = perfLib.Instrument('ocn_avg_generator', main_comm)
+    timing.start('setup')
+
     # CASEROOT is given on the command line as required option --caseroot
     if main_comm.is_manager():
         caseroot = options.caseroot[0]
@@ -462,7 +487,7 @@ def main(options, main_comm, debugMsg):
     # broadcast envDict to all tasks
     envDict = main_comm.partition(data=envDict, func=partition.Duplicate(), involved=True)
     sys.path.append(envDict['PATH'])
-    main_comm.sync()
+    timing.sync(main_comm)
 
     # generate the climatology files used for all plotting types using the pyAverager
     if main_comm.is_manager():
@@ -477,10 +502,10 @@ def main(options, main_comm, debugMsg):
         envDict['in_dir'] = in_dir
         envDict['htype'] = htype
 
-    main_comm.sync()
+    timing.sync(main_comm)
 
     envDict = main_comm.partition(data=envDict, func=partition.Duplicate(), involved=True)
-    main_comm.sync()
+    timing.sync(main_comm)
 
 
     # MODEL_TIMESERIES denotes the plotting diagnostic type requested and whether or
@@ -498,27 +523,32 @@ def main(options, main_comm, debugMsg):
             envDict['TSERIES_YEAR0'] = tseries_start_year
             envDict['TSERIES_YEAR1'] = tseries_stop_year
 
-        main_comm.sync()
+        timing.sync(main_comm)
         tseries = True
         envDict = main_comm.partition(data=envDict, func=partition.Duplicate(), involved=True)
-        main_comm.sync()
+        timing.sync(main_comm)
 
+    # the climatology cache shared with other runs on the case, if CLIMO_CACHE_ROOT is set
+    cache = climoCacheLib.from_env(envDict)
+
+    timing.stop()
     try:
         if main_comm.is_manager():
             debugMsg('calling createClimFiles for model and timeseries', header=True)
 
-        createClimFiles(envDict['YEAR0'], envDict['YEAR1'], envDict['in_dir'],
-                        envDict['htype'], envDict['TAVGDIR'], envDict['CASE'], 
-                        tseries, envDict['MODEL_VARLIST'], envDict['TSERIES_YEAR0'], 
-                        envDict['TSERIES_YEAR1'], envDict['DIAGOBSROOT'], 
-                        envDict['netcdf_format'], int(envDict['VERTICAL']), 
-                        envDict['TIMESERIES_OBSPATH'], main_comm, debugMsg)
+        with timing.stage('climo', envDict['CASE']):
+            createClimFiles(envDict['YEAR0'], envDict['YEAR1'], envDict['in_dir'],
+                            envDict['htype'], envDict['TAVGDIR'], envDict['CASE'], 
+                            tseries, envDict['MODEL_VARLIST'], envDict['TSERIES_YEAR0'], 
+                            envDict['TSERIES_YEAR1'], envDict['DIAGOBSROOT'], 
+                            envDict['netcdf_format'], int(envDict['VERTICAL']), 
+                            envDict['TIMESERIES_OBSPATH'], main_comm, debugMsg, cache=cache)
     except Exception as error:
         print(str(error))
         traceback.print_exc()
         sys.exit(1)
 
-    main_comm.sync()
+    timing.sync(main_comm)
 
     # check that the necessary control climotology files exist
     if envDict['MODEL_VS_CONTROL'].upper() == 'TRUE':
@@ -536,9 +566,9 @@ def main(options, main_comm, debugMsg):
             envDict['cntrl_in_dir'] = in_dir
             envDict['cntrl_htype'] = htype
 
-        main_comm.sync()
+        timing.sync(main_comm)
         envDict = main_comm.partition(data=envDict, func=partition.Duplicate(), involved=True)
-        main_comm.sync()
+        timing.sync(main_comm)
 
         if main_comm.is_manager():
             debugMsg('before createClimFiles call for control', header=True)
@@ -555,16 +585,20 @@ def main(options, main_comm, debugMsg):
         # don't create timeseries averages for the control case so set to False and set the
         # tseries_start_year and tseries_stop_year to 0
         try:
-            createClimFiles(envDict['CNTRLYEAR0'], envDict['CNTRLYEAR1'], envDict['cntrl_in_dir'],
-                            envDict['cntrl_htype'], envDict['CNTRLTAVGDIR'], envDict['CNTRLCASE'], 
-                            False, envDict['CNTRL_VARLIST'], 0, 0, envDict['DIAGOBSROOT'],
-                            envDict['netcdf_format'], int(envDict['VERTICAL']), 
-                            envDict['TIMESERIES_OBSPATH'], main_comm, debugMsg)
+            with timing.stage('climo', envDict['CNTRLCASE']):
+                createClimFiles(envDict['CNTRLYEAR0'], envDict['CNTRLYEAR1'], envDict['cntrl_in_dir'],
+                                envDict['cntrl_htype'], envDict['CNTRLTAVGDIR'], envDict['CNTRLCASE'], 
+                                False, envDict['CNTRL_VARLIST'], 0, 0, envDict['DIAGOBSROOT'],
+                                envDict['netcdf_format'], int(envDict['VERTICAL']), 
+                                envDict['TIMESERIES_OBSPATH'], main_comm, debugMsg, cache=cache)
         except Exception as error:
             print(str(error))
             traceback.print_exc()
             sys.exit(1)
 
+    timing.sync(main_comm)
+    timing.write_summary('{0}/logs'.format(options.caseroot[0]))
+
 #===================================
 
 if __name__ == "__main__":
@@ -16,10 +16,12 @@ if sys.hexversion < 0x03070000:
 
 import argparse
 import glob, sys, os, fnmatch
+import math
 import netCDF4 as nc
+import numpy as np
 
 from asaptools import partition, simplecomm, vprinter, timekeeper
-from cesm_utils import cesmEnvLib
+from cesm_utils import archiveLib, cesmEnvLib, perfLib, shmLib
 from diag_utils import diagUtilsLib
 
 from ocean_remap import ocean_remap as remap
@@ -56,6 +58,225 @@ def commandline_options():
 
     return options
 
+#=====================================================
+# remap_batches - remap the fields of a file in batches
+#=====================================================
+
+# copies of a batch held at once - read, stacked, remapped and written
+BATCH_COPIES = 4
+
+def batch_groups(fptr_in, field_names, depth_name):
+    """group the fields that share a source shape and the same (2d or 3d) matrix,
+    so they can be stacked into one batch
+    """
+    groups = dict()
+    for field_name in field_names:
+        key = (depth_name in fptr_in.variables[field_name].dimensions, fptr_in.variables[field_name].shape[1:])
+        groups.setdefault(key, []).append(field_name)
+    return [(key[0], names) for key, names in sorted(groups.items(), key=lambda kv: kv[1][0])]
+
+
+def batch_steps(level_bytes, nfields, ntime, budget, max_steps=None):
+    """the number of time levels of every field in a group that fit in the memory budget
+    """
+    steps = int(budget // max(BATCH_COPIES * level_bytes * nfields, 1))
+    if max_steps is not None:
+        steps = min(steps, max_steps)
+    return max(1, min(steps, ntime))
+
+
+def remap_batches(fptr_in, write, field_names, matrix_2d, matrix_3d, depth_name, budget, max_steps=None,
+                  start=0, stop=None):
+    """remap time levels start to stop of the fields of a file.  The fields sharing a grid
+    and depth axis are stacked with as many time levels as fit in the memory budget along
+    the leading axis, remapped by the weight matrix in one call and passed to write as a
+    list of (field name, first time level, remapped levels) per batch.
+    """
+    stop = fptr_in.dimensions['time'].size if stop is None else stop
+    for is_3d, names in batch_groups(fptr_in, field_names, depth_name):
+        matrix = matrix_3d if is_3d else matrix_2d
+        level_bytes = 8 * int(np.prod(fptr_in.variables[names[0]].shape[1:]))
+        steps = batch_steps(level_bytes, len(names), stop - start, budget, max_steps)
+        for b in range(start, stop, steps):
+            c = min(steps, stop - b)
+            batch = []
+            try:
+                stacked = np.ma.concatenate([fptr_in.variables[n][b:(b+c)] for n in names], axis=0)
+                remapped = matrix.remap_var(stacked)
+                batch = [(n, b, remapped[k*c:(k+1)*c]) for k, n in enumerate(names)]
+            except TypeError:
+                # remap one field at a time to find the one that can not be remapped
+                for n in names:
+                    try:
+                        batch.append((n, b, matrix.remap_var(fptr_in.variables[n][b:(b+c)])))
+                    except TypeError as e:
+                        print ('Type Error for variable {0} '.format(n))
+            write(batch)
+
+#=====================================================
+# work queue - files ordered by cost, large files split by time
+#=====================================================
+
+# coordinates copied to the output, not remapped
+COORD_NAMES = ['lat', 'lat_bnds', 'lon', 'lon_bnds', 'lev', 'lev_bnds', 'time', 'time_bnds', 'nlat', 'nlon']
+
+# with fewer files per rank than this, all ranks, rank 0 included, remap a
+# precomputed share of the queue instead of rank 0 handing it out
+QUEUE_PER_RANK = 2
+
+def output_name(fname):
+    """the remapped file name of a conformed file, on the gr grid
+    """
+    return fname.replace(fname.split('/')[-3], 'gr')
+
+
+def file_cost(fname):
+    """estimate the cost of remapping a file from its header
+
+    Return:
+    (cost, ntime) - the values of all fields, dims x time length, and the time length,
+                    None if the file is not remapped
+    """
+    try:
+        with nc.Dataset(fname, 'r') as fptr_in: # pylint: disable=E1101
+            var_name = fname.split('/')[-4]
+            if var_name not in fptr_in.variables or len(fptr_in[var_name].dimensions) not in (3, 4):
+                return None
+            ntime = fptr_in.dimensions['time'].size if 'time' in fptr_in.dimensions else 1
+            cost = 0
+            for v in fptr_in.variables:
+                if v not in COORD_NAMES:
+                    cost = cost + int(np.prod(fptr_in.variables[v].shape))
+    except (IOError, OSError, IndexError) as e:
+        print ('Could not read {0} - {1}'.format(fname, e))
+        return None
+    return (cost, ntime)
+
+
+def piece_range(p, npieces, ntime):
+    """the time levels of piece p of a file split into npieces
+    """
+    return p * ntime // npieces, (p + 1) * ntime // npieces
+
+
+def work_pieces(costs, nworkers):
+    """build the work queue.  A file costing more than an even share of the whole queue
+    is split into time ranges, each written by its worker into a part of the output.
+
+    Arguments:
+    costs (dict) - file name -> (cost, ntime)
+    nworkers (int) - the ranks remapping
+
+    Return:
+    pieces (list) - (file name, start, stop, piece, npieces, cost), largest cost first
+    """
+    total = sum(c for c, t in costs.values())
+    share = max(float(total) / max(nworkers, 1), 1.0)
+    pieces = []
+    for fname, (cost, ntime) in costs.items():
+        npieces = max(1, min(int(math.ceil(cost / share)), ntime, nworkers))
+        for p in range(npieces):
+            start, stop = piece_range(p, npieces, ntime)
+            pieces.append((fname, start, stop, p, npieces, cost * (stop - start) // max(ntime, 1)))
+    return sorted(pieces, key=lambda x: (-x[5], x[0], x[1]))
+
+
+def assign_pieces(pieces, size):
+    """share the pieces over all ranks, each to the least loaded rank, largest first
+    """
+    loads = [0] * size
+    assigned = [[] for r in range(size)]
+    for piece in pieces:
+        r = loads.index(min(loads))
+        assigned[r].append(piece)
+        loads[r] = loads[r] + piece[5]
+    return assigned
+
+
+def part_name(out_fname, p):
+    """the file piece p of an output is written to
+    """
+    return '{0}.part{1}'.format(out_fname, p)
+
+
+def remap_piece(piece, matrix_2d, matrix_3d, dim_names, budget, max_steps=None):
+    """remap the time range of a file in piece.  A file in one piece is written to
+    its output, otherwise each piece writes its own part, a complete output with only
+    its time levels filled, left for stitch_pieces.  Every file is written as .tmp
+    and renamed when it is complete.
+
+    Return:
+    finished (bool) - the output is complete
+    """
+    fname, start, stop, p, npieces = piece[:5]
+    out_fname = output_name(fname) if npieces == 1 else part_name(output_name(fname), p)
+    tmp_fname = out_fname + '.tmp'
+
+    fptr_in = nc.Dataset(fname, 'r') # pylint: disable=E1101
+    field_names = [v for v in fptr_in.variables if v not in COORD_NAMES]
+
+    fptr_out = nc.Dataset(tmp_fname, 'w') # pylint: disable=E1101
+    remap.copy_time(fptr_in, fptr_out)
+    remap.copy_gAttr(fptr_in, fptr_out)
+    matrix = matrix_3d if dim_names['depth'] in fptr_in.dimensions else matrix_2d
+    matrix.dst_grid.def_dims_common(fptr_out, dim_names)
+    matrix.dst_grid.write_vars_common(fptr_out, dim_names)
+    for field_name in field_names:
+        remap.def_var(field_name, fptr_in, fptr_out, dim_names)
+
+    def write(batch):
+        for n, b, data in batch:
+            fptr_out.variables[n][b:(b+len(data))] = data
+
+    remap_batches(fptr_in, write, field_names, matrix_2d, matrix_3d, dim_names['depth'],
+                  budget, max_steps, start, stop)
+    fptr_in.close()
+    fptr_out.close()
+    try:
+        os.rename(tmp_fname, out_fname)
+    except OSError as e:
+        print ('Could not create {0}'.format(out_fname))
+        return False
+    return npieces == 1
+
+
+def stitch_pieces(fname, npieces, budget):
+    """copy the time levels of parts 1 to npieces-1 of an output into part 0 and
+    rename it to the output.  Only one rank stitches an output.
+
+    Return:
+    finished (bool) - the output is complete, False if a part is missing
+    """
+    out_fname = output_name(fname)
+    parts = [part_name(out_fname, p) for p in range(npieces)]
+    missing = [f for f in parts if not os.path.exists(f)]
+    if len(missing) > 0:
+        print ('Could not create {0}, missing {1}'.format(out_fname, ', '.join(missing)))
+        return False
+    with nc.Dataset(parts[0], 'a') as fptr_out: # pylint: disable=E1101
+        ntime = fptr_out.dimensions['time'].size
+        for p in range(1, npieces):
+            start, stop = piece_range(p, npieces, ntime)
+            with nc.Dataset(parts[p], 'r') as fptr_part: # pylint: disable=E1101
+                for n, v in fptr_part.variables.items():
+                    if n in COORD_NAMES or len(v.dimensions) == 0 or v.dimensions[0] != 'time':
+                        continue
+                    steps = batch_steps(v.dtype.itemsize * int(np.prod(v.shape[1:])), 1, stop - start, budget)
+                    for b in range(start, stop, steps):
+                        fptr_out.variables[n][b:min(b+steps, stop)] = v[b:min(b+steps, stop)]
+    os.rename(parts[0], out_fname)
+    for f in parts[1:]:
+        os.remove(f)
+    return True
+
+
+def clear_partial(out_fname):
+    """remove what an interrupted run left of an output
+    """
+    for f in [out_fname + '.tmp'] + glob.glob(glob.escape(out_fname) + '.part*'):
+        if os.path.exists(f):
+            os.remove(f)
+
 #======
 # main
 #======
@@ -72,6 +293,10 @@ def main(options, main_comm, debugMsg):
     rank = main_comm.get_rank()
     size = main_comm.get_size()
 
+    # record the time and I/O of each stage on every rank
+    timing = perfLib.Instrument('ocn_remap_generator', main_comm)
+    timing.start('setup')
+
     # CASEROOT is given on the command line as required option --caseroot
     if rank == 0:
         caseroot = options.caseroot[0]
@@ -92,11 +317,18 @@ def main(options, main_comm, debugMsg):
         print ("indir: {0}".format(envDict['indir']))
         print ("outdir: {0}".format(envDict['outdir']))
         print ("chunk size: {0}".format(envDict['chunk']))
+        print ("memory budget: {0} MB".format(envDict.get('memory_budget')))
 
     # broadcast envDict to all tasks
     envDict = main_comm.partition(data=envDict, func=partition.Duplicate(), involved=True)
     main_comm.sync()
 
+    # walk indir once, shared over all ranks, and look the cmip6 variables up in the file table
+    archive = None
+    if envDict['indir'] is not None and (envDict['cmip6'] is not None or envDict['filelist'] is None):
+        with timing.stage('find_files'):
+            archive = archiveLib.FileTable(archiveLib.find(envDict['indir'], comm=main_comm), archiveLib.cmip_fields)
+
     files = []
     if rank == 0:
         # Find files to regrid
@@ -108,11 +340,10 @@ def main(options, main_comm, debugMsg):
                         t = l.strip().split(':')[0]
                         v = l.strip().split(':')[1]
                         print ("Trying to find: {0}_{1}*.nc".format(v,t))
-                        for root, dirs, fns in os.walk(envDict['indir']):
-                            for fn in fnmatch.filter(fns, v+'_'+t+"*.nc"):
-                                if 'tmp.nc' not in fn and 'gr' not in fn.split('_'):
-                                    print ("Found: {0}".format(fn.split('/')))
-                                    files.append(os.path.join(root, fn))
+                        for fn in archive.query(variable=v, table=t):
+                            if 'tmp.nc' not in os.path.basename(fn) and 'gr' not in os.path.basename(fn).split('_'):
+                                print ("Found: {0}".format(fn.split('/')))
+                                files.append(fn)
             else:
                 print ("You need to specify an indir argument with the cmip6 argument")
                 file = None
@@ -121,30 +352,35 @@ def main(options, main_comm, debugMsg):
                 for l in f:
                     files.append(l.strip())
         elif envDict['indir'] is not None:
-            for root, dirs, fns in os.walk(envDict['indir']):
-                for fn in fnmatch.filter(fns, "*.nc"):
-                    files.append(os.path.join(root, fn))
+            files = archive.files
         else:
             print ('Exiting because no input path or files where given')
             files = None
 
     # All call this
-    main_comm.sync()
-    files = main_comm.partition(files, func=partition.Duplicate(), involved=True)
+    timing.sync(main_comm)
+    with timing.wait():
+        files = main_comm.partition(files, func=partition.Duplicate(), involved=True)
+    timing.stop()
     if files is None:
         sys.exit()
 
+    timing.start('read_weights')
+    # one rank per node reads each weight file (or its cache) into shared memory
     #matrix_2d_fname = 'POP_gx1v7_to_latlon_1x1_0E_mask_conserve_20181015.nc'
-    matrix_2d = remap.ocean_remap(envDict['matrix_2d_fname'])
+    matrix_2d = shmLib.load_shared(envDict['matrix_2d_fname'], remap.ocean_remap, main_comm)
 
     #matrix_3d_fname = 'POP_gx1v7_to_latlon_1x1_0E_fulldepth_conserve_20181015.nc'
-    matrix_3d = remap.ocean_remap(envDict['matrix_3d_fname'])
+    matrix_3d = shmLib.load_shared(envDict['matrix_3d_fname'], remap.ocean_remap, main_comm)
 
     # names of coordinate dimensions in output files
     dim_names = {'depth': 'olevel', 'lat': 'latitude', 'lon': 'longitude'}
     dim_names = {'depth': 'lev', 'lat': 'lat', 'lon': 'lon'}
 
-    main_comm.sync()
+    timing.add_files(read=[envDict['matrix_2d_fname'], envDict['matrix_3d_fname']])
+    timing.stop()
+
+    timing.sync(main_comm)
     # Have only root create these files
     if rank == 0:
         if len(files) > 0 and envDict['cmip6'] is not None:
@@ -160,84 +396,88 @@ def main(options, main_comm, debugMsg):
                 matrix_3d.dst_grid.write_vars_common(fptr_out, dim_names)
                 matrix_3d.dst_grid.write_var_CMIP_Ofx(fptr_out, dim_names, var_name)
 
+    # the memory each rank may use for a batch and the most time levels in one
+    budget = float(envDict.get('memory_budget') or 1024) * 1024 * 1024
+    max_steps = int(envDict['chunk']) if envDict.get('chunk') else None
+
+    # estimate the cost of each file left to remap from its header, the headers shared over the ranks
+    COST_TAG = 11
+    with timing.stage('cost'):
+        todo = [f for f in files if not os.path.exists(output_name(f))]
+        l_costs = dict()
+        for f in main_comm.partition(todo, func=partition.EqualStride(), involved=True):
+            l_costs[f] = file_cost(f)
+        if rank == 0:
+            costs = l_costs
+            for i in range(1,size):
+                r,r_costs = main_comm.collect(data=None, tag=COST_TAG)
+                costs.update(r_costs)
+        else:
+            main_comm.collect(data=l_costs, tag=COST_TAG)
+
+    # rank 0 hands the pieces out largest first, or when there are few every rank takes its share
+    static = size == 1 or len(todo) < QUEUE_PER_RANK * size
+    pieces = None
+    if rank == 0:
+        for f in todo:
+            if costs[f] is None:
+                print ("Not creating {0}".format(output_name(f)))
+            else:
+                clear_partial(output_name(f))
+                d = os.path.dirname(output_name(f))
+                if not os.path.exists(d):
+                    os.makedirs(d)
+        costs = dict((f, c) for f, c in costs.items() if c is not None)
+        pieces = work_pieces(costs, size if static else size - 1)
+        print ("{0} files to remap in {1} pieces, {2}".format(len(costs), len(pieces),
+               'shared over all ranks' if static else 'handed out by rank 0'))
+        if static:
+            pieces = assign_pieces(pieces, size)
+    with timing.wait():
+        pieces = main_comm.partition(pieces, func=partition.Duplicate(), involved=True)
+
+    def work(piece):
+        timing.start('remap', '{0}:{1}-{2}'.format(os.path.basename(piece[0]), piece[1], piece[2]))
+        print ("working on: {0} time levels {1} to {2}".format(piece[0], piece[1], piece[2]))
+        if remap_piece(piece, matrix_2d, matrix_3d, dim_names, budget, max_steps):
+            timing.add_files(written=[output_name(piece[0])])
+        timing.add_files(read=[piece[0]])
+        timing.stop()
+
     # Create a master slave parallel protocol
     GWORK_TAG = 10 # global comm mpi tag
-    if (rank == 0):
-        for i in files:
-            main_comm.ration(data=i, tag=GWORK_TAG)
-        for i in range(1,size):
-            main_comm.ration(data=-99, tag=GWORK_TAG)
+    if static:
+        for piece in pieces[rank]:
+            work(piece)
+    elif (rank == 0):
+        with timing.stage('dispatch'), timing.wait():
+            for i in pieces:
+                main_comm.ration(data=i, tag=GWORK_TAG)
+            for i in range(1,size):
+                main_comm.ration(data=-99, tag=GWORK_TAG)
     else:
         f = -999
         while f != -99:
-            f = main_comm.ration(tag=GWORK_TAG)
+            with timing.wait():
+                f = main_comm.ration(tag=GWORK_TAG)
             if f != -99:
-                print ("working on: {0}".format(f))
-                testfile_in_fname = f
-                testfile_out_fname = f.replace(f.split('/')[-3],'gr')
-                if not os.path.exists(testfile_out_fname):
-                  d = os.path.dirname(testfile_out_fname)
-                  if not os.path.exists(d): 
-                      os.makedirs(d) 
-                  fptr_in = nc.Dataset(testfile_in_fname, 'r') # pylint: disable=E1101
-                  if (len(fptr_in[f.split('/')[-4]].dimensions) == 4 or len(fptr_in[f.split('/')[-4]].dimensions) == 3):
-                    fptr_out = nc.Dataset(testfile_out_fname+'.tmp', 'w') # pylint: disable=E1101
-
-                    remap.copy_time(fptr_in, fptr_out)
-                    remap.copy_gAttr(fptr_in, fptr_out)
-
-                    if dim_names['depth'] in fptr_in.dimensions:
-                        matrix_3d.dst_grid.def_dims_common(fptr_out, dim_names)
-                        matrix_3d.dst_grid.write_vars_common(fptr_out, dim_names)
-                    else:
-                        matrix_2d.dst_grid.def_dims_common(fptr_out, dim_names)
-                        matrix_2d.dst_grid.write_vars_common(fptr_out, dim_names)
-
-                    field_names = []
-                    for v in fptr_in.variables:
-                        if v not in ['lat', 'lat_bnds', 'lon', 'lon_bnds', 'lev', 'lev_bnds', 'time', 'time_bnds', 'nlat', 'nlon']:
-                            field_names.append(v)            
-
-                    for field_name in field_names:
-
-                        varid_out = remap.def_var(field_name, fptr_in, fptr_out, dim_names)
-
-                        # use appropriate matrix for regridding
-                        c = envDict['chunk']
-                        if c is None:
-                            c = 1
-                        else:
-                            c = int(c)  
-                        try: 
-                            if dim_names['depth'] in varid_out.dimensions:
-                                #print ("Running a 3D variable")
-                                b = 0
-                                for i in range(0,fptr_in.dimensions['time'].size,c):
-                                    if b+c >= fptr_in.dimensions['time'].size:
-                                        c = fptr_in.dimensions['time'].size - b
-                                    varid_out[b:(b+c),:,:,:] = matrix_3d.remap_var(fptr_in.variables[field_name][b:(b+c),:,:,:])#,
-                                                                       #fill_value=getattr(varid_out, 'missing_value'))
-                                    b = b+c
-                            else:
-                                #print ("Running a 2D variable")
-                                b = 0
-                                for i in range(0,fptr_in.dimensions['time'].size,c):
-                                    if b+c >= fptr_in.dimensions['time'].size:
-                                        c = fptr_in.dimensions['time'].size - b
-                                    varid_out[b:(b+c),:,:] = matrix_2d.remap_var(fptr_in.variables[field_name][b:(b+c),:,:])#,
-                                                                   #fill_value=getattr(varid_out, 'missing_value'))
-                                    b = b+c
-                        except TypeError as e:
-                            print ('Type Error for variable {0} '.format(field_name))
-                    fptr_in.close()
-                    fptr_out.close()
-                    try:
-                        os.rename(testfile_out_fname+'.tmp',testfile_out_fname)
-                    except OSError as e:
-                        print ('Could not create {0}'.format(testfile_out_fname))
-                  else: 
-                    print ("Not creating {0}".format(testfile_out_fname))
-    main_comm.sync()
+                work(f)
+
+    # one rank stitches each output written in parts
+    timing.sync(main_comm)
+    split = None
+    if rank == 0:
+        split = sorted(set((piece[0], piece[4]) for piece in (sum(pieces, []) if static else pieces)
+                           if piece[4] > 1))
+    with timing.wait():
+        split = main_comm.partition(split, func=partition.EqualStride(), involved=True)
+    for fname, npieces in split:
+        timing.start('stitch', os.path.basename(fname))
+        if stitch_pieces(fname, npieces, budget):
+            timing.add_files(written=[output_name(fname)])
+        timing.stop()
+    timing.sync(main_comm)
+    timing.write_summary('{0}/logs'.format(options.caseroot[0]))
 
 #===================================================================================================
 if __name__ == "__main__":
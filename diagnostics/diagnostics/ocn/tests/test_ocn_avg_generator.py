@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Unit test suite for the fusing of the ocean pyAverager passes
+"""
+from __future__ import print_function
+
+import unittest
+
+try:
+    from diagnostics.ocn import ocn_avg_generator
+except ImportError:
+    # the generator needs the pyaverager package
+    ocn_avg_generator = None
+
+TAVG = ['tavg:1:10']
+MAVG = ['mavg:1:10']
+MOC_AVGS = ['ya:1', 'ya:2']
+HOR_AVGS = ['hor.meanConcat:1:2']
+
+def averaged_vars(passes):
+    """ the sorted variables each average is computed for, and how often it is computed
+    """
+    avgs = dict()
+    for avgList, varList in passes:
+        for avg in avgList:
+            avgs.setdefault(avg, []).append(sorted(varList))
+    return avgs
+
+
+@unittest.skipIf(ocn_avg_generator is None, 'the pyaverager package is not installed')
+class test_fuseAverages(unittest.TestCase):
+
+    def check_outputs(self, passes, fused):
+        """ every average is computed once, for the variables of its pass before fusing
+        """
+        self.assertEqual(averaged_vars(fused), dict((avg, vars[:1]) for avg, vars in averaged_vars(passes).items()))
+
+    def test_moc(self):
+        """ test to see if mavg, the MOC averages and the horizontal means are not fused with MOC
+        """
+        passes = [(TAVG, ['MOC', 'SALT', 'TEMP', 'UVEL']), (MAVG, ['SALT', 'TEMP']),
+                  (MOC_AVGS, ['MOC', 'SALT', 'TEMP']), (HOR_AVGS, ['SALT', 'TEMP'])]
+        fused = ocn_avg_generator.fuseAverages(passes)
+        self.assertEqual(fused, [(TAVG, ['MOC', 'SALT', 'TEMP', 'UVEL']), (MAVG + HOR_AVGS, ['SALT', 'TEMP']),
+                                 (MOC_AVGS, ['MOC', 'SALT', 'TEMP'])])
+        self.check_outputs(passes, fused)
+
+    def test_no_moc(self):
+        """ test to see if everything over SALT and TEMP is one pass without MOC
+        """
+        passes = [(TAVG, ['SALT', 'TEMP', 'UVEL']), (MAVG, ['SALT', 'TEMP']),
+                  (MOC_AVGS, ['SALT', 'TEMP']), (HOR_AVGS, ['TEMP', 'SALT'])]
+        fused = ocn_avg_generator.fuseAverages(passes)
+        self.assertEqual(fused, [(TAVG, ['SALT', 'TEMP', 'UVEL']), (MAVG + MOC_AVGS + HOR_AVGS, ['SALT', 'TEMP'])])
+        self.check_outputs(passes, fused)
+
+    def test_empty(self):
+        """ test to see if the empty average lists are dropped and nothing is left of none
+        """
+        self.assertEqual(ocn_avg_generator.fuseAverages([]), [])
+        self.assertEqual(ocn_avg_generator.fuseAverages([([], ['SALT', 'TEMP']), ([], [])]), [])
+        passes = [([], ['SALT', 'TEMP']), (MOC_AVGS, ['MOC', 'SALT', 'TEMP']), ([], ['SALT', 'TEMP'])]
+        self.assertEqual(ocn_avg_generator.fuseAverages(passes), [(MOC_AVGS, ['MOC', 'SALT', 'TEMP'])])
+
+    def test_tavg_salt_temp(self):
+        """ test to see if tavg joins the SALT and TEMP pass when inVarList is just SALT and TEMP,
+            and an average in two passes is computed once
+        """
+        passes = [(TAVG, ['SALT', 'TEMP']), (MAVG, ['SALT', 'TEMP']), (HOR_AVGS + MAVG, ['SALT', 'TEMP'])]
+        fused = ocn_avg_generator.fuseAverages(passes)
+        self.assertEqual(fused, [(TAVG + MAVG + HOR_AVGS, ['SALT', 'TEMP'])])
+        self.check_outputs(passes, fused)
+
+        # the lists passed in are not changed
+        self.assertEqual(passes[0], (TAVG, ['SALT', 'TEMP']))
+        self.assertEqual(TAVG, ['tavg:1:10'])
+
+if __name__ == '__main__':
+    unittest.main()
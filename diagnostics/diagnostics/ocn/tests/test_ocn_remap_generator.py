@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+"""
+Unit test suite for the batching of the ocean remap generator
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import netCDF4 as nc
+import numpy as np
+
+try:
+    from diagnostics.ocn import ocn_remap_generator
+except ImportError:
+    # the generator needs the ocean_remap package
+    ocn_remap_generator = None
+
+def write_input(fn):
+    """ write two 2d and two 3d fields on a 4x5 grid with 7 time levels
+    """
+    with nc.Dataset(fn, 'w') as f:
+        f.createDimension('time', None)
+        f.createDimension('lev', 3)
+        f.createDimension('nlat', 4)
+        f.createDimension('nlon', 5)
+        t = f.createVariable('time', 'f8', ('time',))
+        for n, dims, offset in [('A', ('time', 'nlat', 'nlon'), 0), ('B', ('time', 'nlat', 'nlon'), 1000),
+                                ('T', ('time', 'lev', 'nlat', 'nlon'), 2000), ('S', ('time', 'lev', 'nlat', 'nlon'), 3000)]:
+            v = f.createVariable(n, 'f8', dims)
+            shape = (7,) + tuple(len(f.dimensions[d]) for d in dims[1:])
+            v[:] = offset + np.arange(np.prod(shape), dtype='f8').reshape(shape)
+        t[:] = np.arange(7) + 0.5
+
+
+class Scale(object):
+    """ stands in for a remap matrix, multiplies by a factor and refuses the negative fields
+    """
+    def __init__(self, factor):
+        self.factor = factor
+        self.calls = 0
+
+    def remap_var(self, data):
+        self.calls = self.calls + 1
+        if np.ma.min(data) < 0:
+            raise TypeError('negative field')
+        return np.ma.asarray(data) * self.factor
+
+
+class Grid(object):
+    """ stands in for the destination grid of a remap matrix
+    """
+    def def_dims_common(self, fptr_out, dim_names):
+        fptr_out.createDimension(dim_names['lat'], 2)
+        fptr_out.createDimension(dim_names['lon'], 2)
+        if dim_names['depth'] not in fptr_out.dimensions:
+            fptr_out.createDimension(dim_names['depth'], 3)
+
+    def write_vars_common(self, fptr_out, dim_names):
+        pass
+
+
+class Crop(Scale):
+    """ remaps to the 2x2 corner of the source grid
+    """
+    dst_grid = Grid()
+
+    def remap_var(self, data):
+        return Scale.remap_var(self, data)[..., :2, :2]
+
+
+@unittest.skipIf(ocn_remap_generator is None, 'the ocean_remap package is not installed')
+class test_remap_batches(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.tmp_dir, 'in.nc')
+        write_input(self.fn)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_batches(self, matrix_2d, matrix_3d, budget, max_steps=None, start=0, stop=None):
+        out = dict()
+        batches = []
+        def write(batch):
+            batches.append([(n, b, len(data)) for n, b, data in batch])
+            for n, b, data in batch:
+                out.setdefault(n, dict())
+                for k in range(len(data)):
+                    out[n][b + k] = data[k]
+        with nc.Dataset(self.fn, 'r') as f:
+            ocn_remap_generator.remap_batches(f, write, ['A', 'B', 'T', 'S'], matrix_2d, matrix_3d, 'lev',
+                                              budget, max_steps, start, stop)
+        return out, batches
+
+    def test_batch_steps(self):
+        """ test to see if the time levels of a batch fit the memory budget
+        """
+        level_bytes = 8 * 3 * 4 * 5
+        self.assertEqual(ocn_remap_generator.batch_steps(level_bytes, 2, 7, 4 * level_bytes * 2 * 3), 3)
+        self.assertEqual(ocn_remap_generator.batch_steps(level_bytes, 2, 7, 1), 1)
+        self.assertEqual(ocn_remap_generator.batch_steps(level_bytes, 2, 7, 1e12), 7)
+        self.assertEqual(ocn_remap_generator.batch_steps(level_bytes, 2, 7, 1e12, max_steps=2), 2)
+
+    def test_stacking(self):
+        """ test to see if every field gets its own remapped time levels back from the stacked batches
+        """
+        matrix_2d = Scale(2.0)
+        matrix_3d = Scale(3.0)
+        level_bytes = 8 * 3 * 4 * 5
+        out, batches = self.run_batches(matrix_2d, matrix_3d, 4 * level_bytes * 2 * 3)
+        self.assertEqual(batches[0], [('A', 0, 7), ('B', 0, 7)])
+        self.assertEqual([b for b in batches if b[0][0] == 'T'],
+                         [[('T', 0, 3), ('S', 0, 3)], [('T', 3, 3), ('S', 3, 3)], [('T', 6, 1), ('S', 6, 1)]])
+        self.assertEqual((matrix_2d.calls, matrix_3d.calls), (1, 3))
+        with nc.Dataset(self.fn, 'r') as f:
+            for n, factor in [('A', 2.0), ('B', 2.0), ('T', 3.0), ('S', 3.0)]:
+                self.assertEqual(sorted(out[n].keys()), list(range(7)))
+                for t in range(7):
+                    np.testing.assert_array_equal(out[n][t], f.variables[n][t] * factor)
+
+    def test_time_range(self):
+        """ test to see if only the time levels of a piece are remapped
+        """
+        out, batches = self.run_batches(Scale(1.0), Scale(1.0), 1e12, start=2, stop=5)
+        self.assertEqual(sorted(out['T'].keys()), [2, 3, 4])
+        with nc.Dataset(self.fn, 'r') as f:
+            np.testing.assert_array_equal(out['B'][4], f.variables['B'][4])
+
+    def test_type_error(self):
+        """ test to see if a field that can not be remapped is dropped and the others of its batch are written
+        """
+        with nc.Dataset(self.fn, 'a') as f:
+            f.variables['B'][3] = -1.0
+        out, batches = self.run_batches(Scale(2.0), Scale(3.0), 1e12, max_steps=4)
+        self.assertEqual(batches[0], [('A', 0, 4)])
+        self.assertEqual(batches[1], [('A', 4, 3), ('B', 4, 3)])
+        self.assertEqual(sorted(out['B'].keys()), [4, 5, 6])
+        with nc.Dataset(self.fn, 'r') as f:
+            np.testing.assert_array_equal(out['A'][2], f.variables['A'][2] * 2.0)
+            np.testing.assert_array_equal(out['B'][5], f.variables['B'][5] * 2.0)
+
+
+@unittest.skipIf(ocn_remap_generator is None, 'the ocean_remap package is not installed')
+class test_work_pieces(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        in_dir = os.path.join(self.tmp_dir, 'T', 'native_grid', 'v1')
+        os.makedirs(in_dir)
+        os.makedirs(os.path.join(self.tmp_dir, 'T', 'gr', 'v1'))
+        self.fn = os.path.join(in_dir, 'T_Omon.nc')
+        write_input(self.fn)
+        self.out_fn = ocn_remap_generator.output_name(self.fn)
+        self.dim_names = {'depth': 'lev', 'lat': 'lat', 'lon': 'lon'}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_work_pieces(self):
+        """ test to see if only the files above an even share are split and the pieces cover them
+        """
+        pieces = ocn_remap_generator.work_pieces({'a': (700, 7), 'b': (100, 10), 'c': (50, 1)}, 4)
+        self.assertEqual([(f, b, e, c) for f, b, e, p, n, c in pieces],
+                         [('a', 1, 3, 200), ('a', 3, 5, 200), ('a', 5, 7, 200), ('a', 0, 1, 100),
+                          ('b', 0, 10, 100), ('c', 0, 1, 50)])
+        self.assertEqual(set(n for f, b, e, p, n, c in pieces if f == 'a'), set([4]))
+        self.assertEqual(len(ocn_remap_generator.work_pieces({'a': (700, 7)}, 100)), 7)
+
+    def test_assign_pieces(self):
+        """ test to see if every piece goes to the least loaded rank
+        """
+        pieces = ocn_remap_generator.work_pieces({'a': (700, 7), 'b': (100, 10), 'c': (50, 1)}, 4)
+        assigned = ocn_remap_generator.assign_pieces(pieces, 2)
+        self.assertEqual([sum(piece[5] for piece in r) for r in assigned], [450, 400])
+        self.assertEqual(sorted(sum(assigned, [])), sorted(pieces))
+
+    def test_remap_piece(self):
+        """ test to see if the parts of a split file are stitched into the output of the whole file
+        """
+        matrix_2d, matrix_3d = Crop(2.0), Crop(3.0)
+        cost = ocn_remap_generator.file_cost(self.fn)
+        self.assertEqual(cost, (7 * 2 * 4 * 5 + 7 * 2 * 3 * 4 * 5, 7))
+        pieces = ocn_remap_generator.work_pieces({self.fn: cost}, 3)
+        self.assertEqual(len(pieces), 3)
+        for piece in pieces:
+            self.assertFalse(ocn_remap_generator.remap_piece(piece, matrix_2d, matrix_3d, self.dim_names, 1e12))
+        self.assertFalse(os.path.exists(self.out_fn))
+
+        os.remove(ocn_remap_generator.part_name(self.out_fn, 2))
+        self.assertFalse(ocn_remap_generator.stitch_pieces(self.fn, 3, 1))
+        ocn_remap_generator.clear_partial(self.out_fn)
+        self.assertEqual(os.listdir(os.path.dirname(self.out_fn)), [])
+
+        for piece in pieces:
+            ocn_remap_generator.remap_piece(piece, matrix_2d, matrix_3d, self.dim_names, 1e12)
+        self.assertTrue(ocn_remap_generator.stitch_pieces(self.fn, 3, 1))
+        self.assertEqual(os.listdir(os.path.dirname(self.out_fn)), [os.path.basename(self.out_fn)])
+        with nc.Dataset(self.fn, 'r') as f, nc.Dataset(self.out_fn, 'r') as out:
+            np.testing.assert_array_equal(out.variables['time'][:], f.variables['time'][:])
+            for n, factor in [('A', 2.0), ('B', 2.0), ('T', 3.0), ('S', 3.0)]:
+                np.testing.assert_array_equal(out.variables[n][:], f.variables[n][..., :2, :2] * factor)
+
+        os.remove(self.out_fn)
+        self.assertTrue(ocn_remap_generator.remap_piece((self.fn, 0, 7, 0, 1, cost[0]), matrix_2d, matrix_3d,
+                                                        self.dim_names, 1e12))
+        with nc.Dataset(self.fn, 'r') as f, nc.Dataset(self.out_fn, 'r') as out:
+            np.testing.assert_array_equal(out.variables['S'][:], f.variables['S'][..., :2, :2] * 3.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -51,7 +51,8 @@ setup(
     packages=['timeseries'],
     version=get_version(),
     scripts=['timeseries/cesm_tseries_generator.py',
-             'timeseries/chunking.py'],
+             'timeseries/chunking.py',
+             'timeseries/spec_scheduler.py'],
     #install_requires=get_requires(),
     #dependency_links=get_dependencies(),
     include_package_data=True,
@@ -29,12 +29,14 @@ import os
 import re
 import string
 import sys
+import time
 import traceback
 import warnings
 import xml.etree.ElementTree as ET
 
-from cesm_utils import cesmEnvLib
+from cesm_utils import cesmEnvLib, perfLib, catalogLib
 import chunking
+import spec_scheduler
 
 # import the MPI related modules
 from asaptools import partition, simplecomm, vprinter, timekeeper
@@ -63,6 +65,9 @@ def commandline_options():
     parser.add_argument('--standalone', action='store_true',
                         help='switch to indicate stand-alone post processing caseroot')
 
+    parser.add_argument('--plan-only', dest='plan_only', action='store_true',
+                        help='plan the chunks and print the estimated cost of each stream without converting or updating the log')
+
     options = parser.parse_args()
 
     # check to make sure CASEROOT is a valid, readable directory
@@ -70,34 +75,31 @@ def commandline_options():
         err_msg = 'cesm_tseries_generator.py ERROR: invalid option --caseroot {0}'.format(options.caseroot[0])
         raise OSError(err_msg)
 
-    return options.caseroot[0], options.debug, options.standalone, options.backtrace
+    return options.caseroot[0], options.debug, options.standalone, options.backtrace, options.plan_only
 
 #==============================================================================================
 # readArchiveXML - read the $CASEROOT/env_timeseries.xml file and build the pyReshaper classes
 #==============================================================================================
-def readArchiveXML(caseroot, input_rootdir, output_rootdir, casename, standalone, completechunk,
-                   generate_all, debug, debugMsg, comm, rank, size):
-    """ reads the $CASEROOT/env_timeseries.xml file and builds a fully defined list of
-         reshaper specifications to be passed to the pyReshaper tool.
+def readArchiveXML(caseroot, input_rootdir, output_rootdir, generate_all, debugMsg, rank):
+    """ reads the $CASEROOT/env_timeseries.xml file and builds the list of history streams
+         to convert.  The history files of each stream are scanned and turned into reshaper
+         specifications later by plan_stream, so scanning can overlap the conversions.
 
     Arguments:
     caseroot (string) - case root path
     input_rootdir (string) - rootdir to input raw history files
     output_rootdir (string) - rootdir to output single variable time series files
-    casename (string) - casename
-    standalone (boolean) - logical to indicate if postprocessing case is stand-alone or not
-    completechunk (boolean) - end on a ragid boundary if True.  Otherwise, do not create incomplete chunks if False
     generate_all (boolean) - generate timeseries for all streams if True.  Otherwise, use the tseries_create setting.
+
+    Returns:
+    streams (list) - one dictionary of XML settings per stream to convert
     """
-    specifiers = list()
+    streams = list()
     xml_tree = ET.ElementTree()
 
     # get path to env_timeseries.xml file
     env_timeseries = '{0}/env_timeseries.xml'.format(caseroot)
 
-    # read tseries log file to see if we've already started converting files, if so, where did we leave off
-    log = chunking.read_log('{0}/logs/ts_status.log'.format(caseroot))
-
     # check if the env_timeseries.xml file exists
     if ( not os.path.isfile(env_timeseries) ):
         err_msg = "cesm_tseries_generator.py ERROR: {0} does not exist.".format(env_timeseries)
@@ -152,8 +154,7 @@ def readArchiveXML(caseroot, input_rootdir, output_rootdir, casename, standalone
                             for variable in comp_archive_spec.findall("tseries_exclude_variables/variable"):
                                 exclude_list.append(variable.text)
 
-                        # get a list of all the input files for this stream from the archive location
-                        history_files = list()
+                        # the location of the input files for this stream in the archive
                         in_file_path = '/'.join( [input_rootdir,rootdir,subdir] )
 
                         # get XML tseries elements for chunking
@@ -166,88 +167,132 @@ def readArchiveXML(caseroot, input_rootdir, output_rootdir, casename, standalone
                         comp_name = comp
                         stream = file_extension.split('.[')[0]
 
-                        stream_dates,file_slices,cal,units,time_period_freq = chunking.get_input_dates(in_file_path+'/*'+file_extension+'*.nc', comm, rank, size)
-                        # check if the calendar attribute was read or not
-                        if cal is None or cal == "none":
-                            cal = default_calendar
-                        if rank == 0:
-                            debugMsg("calendar = {0}".format(cal), header=True, verbosity=1)
-
-                        # the tseries_tper should be set in using the time_period_freq global file attribute if it exists
-                        if time_period_freq is not None:
-                            tseries_tper = time_period_freq
-                        tseries_output_dir = '/'.join( [output_rootdir, rootdir, 'proc/tseries', tseries_tper] )
-                        if rank == 0:
-                            debugMsg("tseries_output_dir = {0}".format(tseries_output_dir), header=True, verbosity=1)
-
-                        if comp+stream not in log.keys():
-                            log[comp+stream] = {'slices':[],'index':0}
-                        ts_log_dates = log[comp+stream]['slices']
-                        index = log[comp+stream]['index']
-                        files,dates,index = chunking.get_chunks(tper, index, size_n, stream_dates, ts_log_dates, cal, units, completechunk, tseries_tper)
-                        for d in dates:
-                            log[comp+stream]['slices'].append(float(d))
-                        log[comp+stream]['index']=index
-                        for cn,cf in files.items():
-
-                            if rank == 0:
-                                if not os.path.exists(tseries_output_dir):
-                                    os.makedirs(tseries_output_dir)
-                            comm.sync()
-
-                            history_files = cf['fn']
-                            start_time_parts = cf['start']
-                            last_time_parts = cf['end']
-
-                            # create the tseries output prefix needs to end with a "."
-                            tseries_output_prefix = "{0}/{1}.{2}{3}.".format(tseries_output_dir,casename,comp_name,stream)
-                            if rank == 0:
-                                debugMsg("tseries_output_prefix = {0}".format(tseries_output_prefix), header=True, verbosity=1)
-
-                            # format the time series variable output suffix based on the
-                            # tseries_tper setting suffix needs to start with a "."
-                            freq_array = ["week","day","hour","min"]
-                            if "year" in tseries_tper:
-                                tseries_output_suffix = "."+start_time_parts[0]+"-"+last_time_parts[0]+".nc"
-                            elif "month" in tseries_tper:
-                                tseries_output_suffix = "."+start_time_parts[0]+start_time_parts[1]+"-"+last_time_parts[0]+last_time_parts[1]+".nc"
-                            elif "day" in tseries_tper:
-                                tseries_output_suffix = "."+start_time_parts[0]+start_time_parts[1]+start_time_parts[2]+"-"+last_time_parts[0]+last_time_parts[1]+last_time_parts[2]+".nc"
-                            elif any(freq_string in tseries_tper for freq_string in freq_array):
-                                tseries_output_suffix = "."+start_time_parts[0]+start_time_parts[1]+start_time_parts[2]+start_time_parts[3]+"-"+last_time_parts[0]+last_time_parts[1]+last_time_parts[2]+last_time_parts[3]+".nc"
-                            else:
-                                err_msg = "cesm_tseries_generator.py error: invalid tseries_tper = {0}.".format(tseries_tper)
-                                raise TypeError(err_msg)
-                            if rank == 0:
-                                debugMsg("tseries_output_suffix = {0}".format(tseries_output_suffix), header=True, verbosity=1)
-
-                            # get a reshaper specification object/
-                            spec = specification.create_specifier()
-
-                            # populate the spec object with data for this history stream
-                            spec.input_file_list = history_files
-                            spec.netcdf_format = tseries_output_format
-                            spec.output_file_prefix = tseries_output_prefix
-                            spec.output_file_suffix = tseries_output_suffix
-                            spec.time_variant_metadata = variable_list
-                            spec.exclude_list = exclude_list
-                            # setting the default backend; netCDF4 or pynio
-                            spec.backend = 'netCDF4'
-
-                            if rank == 0:
-                                debugMsg("specifier: comp_name = {0}".format(comp_name), header=True, verbosity=1)
-                                debugMsg("    input_file_list = {0}".format(spec.input_file_list), header=True, verbosity=1)
-                                debugMsg("    netcdf_format = {0}".format(spec.netcdf_format), header=True, verbosity=1)
-                                debugMsg("    output_file_prefix = {0}".format(spec.output_file_prefix), header=True, verbosity=1)
-                                debugMsg("    output_file_suffix = {0}".format(spec.output_file_suffix), header=True, verbosity=1)
-                                debugMsg("    time_variant_metadata = {0}".format(spec.time_variant_metadata), header=True, verbosity=1)
-                                debugMsg("    exclude_list = {0}".format(spec.exclude_list), header=True, verbosity=1)
-
-                            # append this spec to the list of specifiers
-                            specifiers.append(spec)
-    return specifiers,log
-
-def divide_comm(scomm, l_spec):
+                        streams.append({'comp': comp, 'rootdir': rootdir, 'stream': stream,
+                                        'file_extension': file_extension, 'in_file_path': in_file_path,
+                                        'output_rootdir': output_rootdir, 'default_calendar': default_calendar,
+                                        'tseries_output_format': tseries_output_format,
+                                        'variable_list': variable_list, 'exclude_list': exclude_list,
+                                        'tseries_tper': tseries_tper, 'tper': tper, 'size_n': size_n})
+    return streams
+
+#==============================================================================================
+# plan_stream - scan the history files of one stream and build its pyReshaper specifications
+#==============================================================================================
+def plan_stream(caseroot, s, log, casename, completechunk, debugMsg, comm, dry_run=False):
+    """ scans the history files of a stream from readArchiveXML and builds a fully defined list of
+         reshaper specifications to be passed to the pyReshaper tool.  All ranks of comm take part
+         in the scan.
+
+    Arguments:
+    caseroot (string) - case root path
+    s (dictionary) - the stream settings from readArchiveXML
+    log (dictionary) - the tseries log from chunking.read_log, updated for this stream
+    casename (string) - casename
+    completechunk (boolean) - end on a ragid boundary if True.  Otherwise, do not create incomplete chunks if False
+    comm (simplecomm) - the communicator scanning the stream
+    dry_run (boolean) - do not create the output directories if True
+
+    Returns:
+    specifiers (list) - reshaper specifications of this stream
+    spec_infos (list) - what the cost model needs to know about each specification
+    log_record (tuple) - the log record of the newly planned dates, None if nothing changed
+    """
+    specifiers = list()
+    spec_infos = list()
+    log_record = None
+    rank = comm.get_rank()
+    size = comm.get_size()
+
+    comp = s['comp']
+    comp_name = comp
+    stream = s['stream']
+    tseries_tper = s['tseries_tper']
+    exclude_list = s['exclude_list']
+
+    index_fn = '{0}/logs/ts_time_index.{1}{2}.json'.format(caseroot, comp, stream)
+    stream_times,cal,units,time_period_freq = chunking.get_input_dates(s['in_file_path']+'/*'+s['file_extension']+'*.nc',
+                                                                       comm, rank, size, index_fn=index_fn)
+    # check if the calendar attribute was read or not
+    if cal is None or cal == "none":
+        cal = s['default_calendar']
+    if rank == 0:
+        debugMsg("calendar = {0}".format(cal), header=True, verbosity=1)
+
+    # the tseries_tper should be set in using the time_period_freq global file attribute if it exists
+    if time_period_freq is not None:
+        tseries_tper = time_period_freq
+    tseries_output_dir = '/'.join( [s['output_rootdir'], s['rootdir'], 'proc/tseries', tseries_tper] )
+    if rank == 0:
+        debugMsg("tseries_output_dir = {0}".format(tseries_output_dir), header=True, verbosity=1)
+
+    if comp+stream not in log.keys():
+        log[comp+stream] = chunking.new_log_entry()
+    ts_log = log[comp+stream]
+    index = ts_log['index']
+    files,dates,index = chunking.get_chunks(s['tper'], index, s['size_n'], stream_times, ts_log, cal, units, completechunk, tseries_tper)
+    if len(dates) > 0 or index != ts_log['index']:
+        log_record = chunking.log_add(ts_log, comp+stream, dates, index, stream_times['time'])
+    for cn,cf in files.items():
+
+        if rank == 0 and not dry_run:
+            if not os.path.exists(tseries_output_dir):
+                os.makedirs(tseries_output_dir)
+        comm.sync()
+
+        history_files = cf['fn']
+        start_time_parts = cf['start']
+        last_time_parts = cf['end']
+
+        # create the tseries output prefix needs to end with a "."
+        tseries_output_prefix = "{0}/{1}.{2}{3}.".format(tseries_output_dir,casename,comp_name,stream)
+        if rank == 0:
+            debugMsg("tseries_output_prefix = {0}".format(tseries_output_prefix), header=True, verbosity=1)
+
+        # format the time series variable output suffix based on the
+        # tseries_tper setting suffix needs to start with a "."
+        freq_array = ["week","day","hour","min"]
+        if "year" in tseries_tper:
+            tseries_output_suffix = "."+start_time_parts[0]+"-"+last_time_parts[0]+".nc"
+        elif "month" in tseries_tper:
+            tseries_output_suffix = "."+start_time_parts[0]+start_time_parts[1]+"-"+last_time_parts[0]+last_time_parts[1]+".nc"
+        elif "day" in tseries_tper:
+            tseries_output_suffix = "."+start_time_parts[0]+start_time_parts[1]+start_time_parts[2]+"-"+last_time_parts[0]+last_time_parts[1]+last_time_parts[2]+".nc"
+        elif any(freq_string in tseries_tper for freq_string in freq_array):
+            tseries_output_suffix = "."+start_time_parts[0]+start_time_parts[1]+start_time_parts[2]+start_time_parts[3]+"-"+last_time_parts[0]+last_time_parts[1]+last_time_parts[2]+last_time_parts[3]+".nc"
+        else:
+            err_msg = "cesm_tseries_generator.py error: invalid tseries_tper = {0}.".format(tseries_tper)
+            raise TypeError(err_msg)
+        if rank == 0:
+            debugMsg("tseries_output_suffix = {0}".format(tseries_output_suffix), header=True, verbosity=1)
+
+        # get a reshaper specification object/
+        spec = specification.create_specifier()
+
+        # populate the spec object with data for this history stream
+        spec.input_file_list = history_files
+        spec.netcdf_format = s['tseries_output_format']
+        spec.output_file_prefix = tseries_output_prefix
+        spec.output_file_suffix = tseries_output_suffix
+        spec.time_variant_metadata = s['variable_list']
+        spec.exclude_list = exclude_list
+        # setting the default backend; netCDF4 or pynio
+        spec.backend = 'netCDF4'
+
+        if rank == 0:
+            debugMsg("specifier: comp_name = {0}".format(comp_name), header=True, verbosity=1)
+            debugMsg("    input_file_list = {0}".format(spec.input_file_list), header=True, verbosity=1)
+            debugMsg("    netcdf_format = {0}".format(spec.netcdf_format), header=True, verbosity=1)
+            debugMsg("    output_file_prefix = {0}".format(spec.output_file_prefix), header=True, verbosity=1)
+            debugMsg("    output_file_suffix = {0}".format(spec.output_file_suffix), header=True, verbosity=1)
+            debugMsg("    time_variant_metadata = {0}".format(spec.time_variant_metadata), header=True, verbosity=1)
+            debugMsg("    exclude_list = {0}".format(spec.exclude_list), header=True, verbosity=1)
+
+        # append this spec to the list of specifiers along with what the cost model needs to know about it
+        specifiers.append(spec)
+        spec_infos.append(spec_scheduler.spec_info(stream_times, history_files, exclude_list))
+    return specifiers,spec_infos,log_record
+
+def divide_comm(scomm, group_sizes):
 
     '''
     Divide the communicator into subcommunicators, leaving rank one to hand out reshaper jobs to run.
@@ -256,34 +301,28 @@ def divide_comm(scomm, l_spec):
 
     Input:
     scomm (simplecomm) - communicator to be divided (currently MIP_COMM_WORLD)
-    l_spec(int) - the number of reshaper specifiers(# of output stream and # of chunks)
+    group_sizes(list) - the number of ranks in each subcommunicator from spec_scheduler.plan_groups,
+                        these must add up to the communicator size less one for the global master
 
     Output:
     inter_comm(simplecomm) - this rank's subcommunicator it belongs to
     num_of_groups(int) - the total number of subcommunicators
     '''
-    min_procs_per_spec = 36
-    size = scomm.get_size()
     rank = scomm.get_rank()
-
-    if l_spec == 1:
-        num_of_groups = 1
-    else:
-        num_of_groups = size//min_procs_per_spec
-    if l_spec < num_of_groups:
-        num_of_groups = l_spec
+    num_of_groups = len(group_sizes)
 
     # the global master needs to be in its own subcommunicator
     # ideally it would not be in any, but the divide function
-    # requires all ranks to participate in the call
-    if rank == 0:
-        temp_color = 0
-    else:
-        temp_color = (rank % num_of_groups)+1
-    groups = []
-    for g in range(0,num_of_groups+1):
-        groups.append(g)
-    group = groups[temp_color]
+    # requires all ranks to participate in the call.
+    # the other ranks are split into consecutive blocks of the planned sizes
+    group = 0
+    if rank > 0:
+        last = 0
+        for g in range(0,num_of_groups):
+            last = last + group_sizes[g]
+            if rank <= last:
+                group = g+1
+                break
 
     inter_comm,multi_comm = scomm.divide(group)
 
@@ -293,9 +332,54 @@ def divide_comm(scomm, l_spec):
 # main
 #======
 
-def main(caseroot, standalone, scomm, rank, size, debug, debugMsg):
+def run_task(caseroot, task, streams, log, casename, completechunk, debug, debugMsg, inter_comm):
+    """ runs a task handed out by the global root on all ranks of a subcommunicator
+
+    Arguments:
+    task (tuple) - ('scan', stream index) or ('convert', specifier index, specifier)
+    inter_comm (simplecomm) - the subcommunicator running the task
+
+    Returns:
+    result (tuple) - ('planned', stream index, specifiers, spec_infos, log_record) or
+                     ('converted', (specifier index, subcommunicator size, seconds), headers of the
+                     files written, on the subcommunicator root only)
+    """
+    timing = perfLib.active()
+    if task[0] == 'scan':
+        s = streams[task[1]]
+        with timing.stage('scan', s['comp']+s['stream']):
+            specifiers,spec_infos,log_record = plan_stream(caseroot, s, log, casename,
+                                                           completechunk, debugMsg, inter_comm)
+        return ('planned', task[1], specifiers, spec_infos, log_record)
+
+    start = time.time()
+    spec = task[2]
+    with timing.stage('convert', spec.output_file_prefix+'*'+spec.output_file_suffix):
+        timing.add_files(read=spec.input_file_list)
+        # create the PyReshaper object - uncomment when multiple specifiers is allowed
+        reshpr = reshaper.create_reshaper(spec, serial=False, verbosity=debug, simplecomm=inter_comm)
+        # Run the conversion (slice-to-series) process
+        reshpr.convert()
+        timing.sync(inter_comm)
+    seconds = time.time()-start
+
+    # read the headers of the new time series files for the catalog the conform tool uses
+    headers = list()
+    if inter_comm.get_rank() == 0:
+        for fn in sorted(glob.glob(spec.output_file_prefix+'*'+spec.output_file_suffix)):
+            try:
+                headers.append(catalogLib.read_header(fn))
+            except (IOError, OSError) as error:
+                debugMsg('unable to read the header of {0}: {1}'.format(fn, error), header=True, verbosity=1)
+    return ('converted', (task[1], inter_comm.get_size(), seconds), headers)
+
+def main(caseroot, standalone, scomm, rank, size, debug, debugMsg, plan_only=False):
     """
     """
+    # record the time and I/O of each stage on every rank
+    timing = perfLib.Instrument('cesm_tseries_generator', scomm)
+    timing.start('setup')
+
     # initialize the CASEROOT environment dictionary
     cesmEnv = dict()
 
@@ -305,6 +389,8 @@ def main(caseroot, standalone, scomm, rank, size, debug, debugMsg):
 
     # initialize the specifiers list to contain the list of specifier classes
     specifiers = list()
+    spec_infos = list()
+    log_records = list()
 
     tseries_input_rootdir = cesmEnv['TIMESERIES_INPUT_ROOTDIR']
     tseries_output_rootdir = cesmEnv['TIMESERIES_OUTPUT_ROOTDIR']
@@ -315,68 +401,154 @@ def main(caseroot, standalone, scomm, rank, size, debug, debugMsg):
         completechunk = 1
     else:
         completechunk = 0
-    specifiers,log = readArchiveXML(caseroot, tseries_input_rootdir, tseries_output_rootdir,
-                                    case, standalone, completechunk, generate_all,
-                                    debug, debugMsg, scomm, rank, size)
-    scomm.sync()
 
-    # specifiers is a list of pyreshaper specification objects ready to pass to the reshaper
+    # read tseries log file to see if we've already started converting files, if so, where did we leave off
+    # the json ts_status.log from older versions is converted to the binary log the first time through
+    log_fn = '{0}/logs/ts_status.dat'.format(caseroot)
+    json_log_fn = '{0}/logs/ts_status.log'.format(caseroot)
+    if plan_only and not os.path.isfile(log_fn):
+        log = dict()
+        for record in chunking.read_json_log(json_log_fn):
+            chunking.apply_log_record(log, record)
+    else:
+        if rank == 0:
+            chunking.migrate_log(json_log_fn, log_fn)
+        scomm.sync()
+        log = chunking.read_log(log_fn)
+
+    streams = readArchiveXML(caseroot, tseries_input_rootdir, tseries_output_rootdir, generate_all, debugMsg, rank)
     if rank == 0:
-        debugMsg("# of Specifiers: "+str(len(specifiers)), header=True, verbosity=1)
+        debugMsg("# of Streams: "+str(len(streams)), header=True, verbosity=1)
 
-    if len(specifiers) > 0:
-        # setup subcommunicators to do streams and chunks in parallel
-        # everyone participates except for root
-        inter_comm, lsubcomms = divide_comm(scomm, len(specifiers))
+    min_procs_per_spec = 36
+    model_fn = '{0}/logs/ts_cost_model.json'.format(caseroot)
+    times_fn = '{0}/logs/ts_spec_times.json'.format(caseroot)
+    catalog_fn = '{0}/logs/tseries_catalog.db'.format(caseroot)
+    model = spec_scheduler.read_cost_model(model_fn)
+    timing.stop()
+
+    if plan_only:
+        # plan every stream on all ranks and estimate the cost from the calibrated model,
+        # assuming each chunk runs on a subcommunicator of min_procs_per_spec ranks.
+        # nothing is converted and the log is left alone
+        names = list()
+        estimates = list()
+        for s in streams:
+            l_specifiers,l_infos,log_record = plan_stream(caseroot, s, log, case, completechunk,
+                                                          debugMsg, scomm, dry_run=True)
+            names.append(s['comp']+s['stream'])
+            estimates.append(spec_scheduler.stream_estimate(l_infos, min_procs_per_spec, model))
+        if rank == 0:
+            print('Plan only - cost model {0} with {1} ranks per chunk'.format(model, min_procs_per_spec))
+            spec_scheduler.plan_report(names, estimates)
+        scomm.sync()
+        return 0
+
+    if len(streams) > 0:
+        # the specifiers are not known until their streams are scanned, so the subcommunicators are
+        # sized from the specifiers measured in the last run.  everyone participates except for root
+        sample = spec_scheduler.last_run(spec_scheduler.read_spec_times(times_fn))
+        group_sizes = spec_scheduler.plan_groups(sample, size-1, min_procs_per_spec, model, len(streams))
+        if rank == 0:
+            debugMsg("subcommunicator sizes {0}".format(group_sizes), header=True, verbosity=1)
+        with timing.wait():
+            inter_comm, lsubcomms = divide_comm(scomm, group_sizes)
         color = inter_comm.get_color()
         lsize = inter_comm.get_size()
         lrank = inter_comm.get_rank()
         debugMsg("rank {} color {} lsize {} lrank {}".format(rank, color, lsize, lrank))
-        GWORK_TAG = 10 # global comm mpi tag
+        GWORK_TAG = 40 # global comm mpi tag, the work is sent straight to the global rank of a subcomm root
         LWORK_TAG = 20 # local comm mpi tag
-        # global root - hands out specifiers to work on.  When complete, it must tell each subcomm all work is done.
+        RESULT_TAG = 30 # global comm mpi tag for the planned specifiers and measured times
+        # global root - hands out streams to scan and specifiers to convert as soon as their stream is planned.
+        # a subcomm that reports back gets the longest ready specifier, or the next stream if there is nothing
+        # to convert or too few subcomms are scanning.  When complete, it must tell each subcomm all work is done.
+        # simplecomm.ration can not address a given rank, so the tasks go through its mpi4py communicator
+        # to the subcomm root that reported, with a fixed tag that stays far below the MPI tag limit
         if rank == 0:
-            for i in range(0,len(specifiers)): # hand out all specifiers
-                scomm.ration(data=i, tag=GWORK_TAG)
-            for i in range(0,lsubcomms): # complete, signal this to all subcomms
-                scomm.ration(data=-99, tag=GWORK_TAG)
-
-        # subcomm root - performs the same tasks as other subcomm ranks, but also gets the specifier to work on and sends
-        # this information to all ranks within subcomm
+            timing.start('dispatch')
+            to_scan = list(range(len(streams)))
+            max_scanning = max(1, lsubcomms//2)
+            scanning = 0
+            ready = list()
+            idle = list()
+            spec_times = list()
+            stopped = 0
+            catalog = catalogLib.Catalog(catalog_fn)
+            while stopped < lsubcomms:
+                with timing.wait():
+                    r,(l_color,result) = scomm.collect(data=None, tag=RESULT_TAG)
+                if result is not None and result[0] == 'planned':
+                    scanning = scanning - 1
+                    for spec,info in zip(result[2], result[3]):
+                        ready.append(len(specifiers))
+                        specifiers.append(spec)
+                        spec_infos.append(info)
+                    if result[4] is not None:
+                        log_records.append(result[4])
+                elif result is not None:
+                    spec_times.append(result[1])
+                    catalog.add(result[2])
+                idle.append((l_color, r))
+
+                # serve the waiting subcomms, the biggest gets the longest specifier
+                idle.sort(key=lambda g: -group_sizes[g[0]-1])
+                while len(idle) > 0:
+                    if len(to_scan) > 0 and (len(ready) == 0 or scanning < max_scanning):
+                        task = ('scan', to_scan.pop(0))
+                        scanning = scanning + 1
+                    elif len(ready) > 0:
+                        i = spec_scheduler.pick_longest(ready, spec_infos, model)
+                        task = ('convert', i, specifiers[i])
+                    elif scanning > 0:
+                        break # wait for a stream to be planned
+                    else:
+                        task = -99
+                        stopped = stopped + 1
+                    scomm._comm.send(task, dest=idle.pop(0)[1], tag=GWORK_TAG)
+            catalog.close()
+            timing.stop()
+
+            debugMsg("# of Specifiers: "+str(len(specifiers)), header=True, verbosity=1)
+            if len(spec_times) > 0:
+                debugMsg("predicted and actual seconds per specifier", header=True, verbosity=1)
+                records = spec_scheduler.report(spec_infos, spec_times, model,
+                                                [spec.output_file_prefix for spec in specifiers])
+                spec_scheduler.save_spec_times(times_fn, model_fn, records, model)
+
+        # subcomm root - performs the same tasks as other subcomm ranks, but also reports the result of the
+        # last task, gets the next task to work on and sends this information to all ranks within subcomm
         elif (lrank == 0):
-            i = -999
-            while i != -99:
-                i = scomm.ration(tag=GWORK_TAG) # recv from global
-                debugMsg("i from ration {}".format(i))
+            result = None
+            while True:
+                with timing.wait():
+                    scomm.collect(data=(color, result), tag=RESULT_TAG)
+                    task = scomm._comm.recv(source=0, tag=GWORK_TAG) # recv from global
+                debugMsg("task from ration {}".format(task if task == -99 else task[:2]))
                 for x in range(1,lsize):
-                    inter_comm.ration(i, LWORK_TAG) # send to local ranks
-                if i != -99:
-                    # create the PyReshaper object - uncomment when multiple specifiers is allowed
-                    reshpr = reshaper.create_reshaper(specifiers[i], serial=False, verbosity=debug, simplecomm=inter_comm)
-                    # Run the conversion (slice-to-series) process
-                    reshpr.convert()
-                inter_comm.sync()
-
-        # all subcomm ranks - recv the specifier to work on and call the reshaper
+                    inter_comm.ration(task, LWORK_TAG) # send to local ranks
+                if task == -99:
+                    break
+                result = run_task(caseroot, task, streams, log, case, completechunk, debug, debugMsg, inter_comm)
+
+        # all subcomm ranks - recv the task to work on and run it
         else:
-            i = -999
-            while i != -99:
-                i = inter_comm.ration(tag=LWORK_TAG) # recv from local root
-                if i != -99:
-                    # create the PyReshaper object - uncomment when multiple specifiers is allowed
-                    reshpr = reshaper.create_reshaper(specifiers[i], serial=False, verbosity=debug, simplecomm=inter_comm)
-                    # Run the conversion (slice-to-series) process
-                    reshpr.convert()
-                inter_comm.sync()
+            with timing.wait():
+                task = inter_comm.ration(tag=LWORK_TAG) # recv from local root
+            while task != -99:
+                run_task(caseroot, task, streams, log, case, completechunk, debug, debugMsg, inter_comm)
+                with timing.wait():
+                    task = inter_comm.ration(tag=LWORK_TAG)
 
     if rank == 0:
         # Update system log with the dates that were just converted
         debugMsg('before chunking.write_log', header=True, verbosity=1)
-        chunking.write_log('{0}/logs/ts_status.log'.format(caseroot), log)
+        chunking.write_log(log_fn, log_records)
         debugMsg('after chunking.write_log', header=True, verbosity=1)
 
     debugMsg("call scomm sync")
-    scomm.sync()
+    timing.sync(scomm)
+    timing.write_summary('{0}/logs'.format(caseroot))
 
     return 0
 
@@ -391,7 +563,7 @@ if __name__ == "__main__":
     timer.start("Total Time")
 
     # get commandline options
-    caseroot, debug, standalone, backtrace = commandline_options()
+    caseroot, debug, standalone, backtrace, plan_only = commandline_options()
 
     # initialize global vprinter object for printing debug messages
     debugMsg = vprinter.VPrinter(header='', verbosity=0)
@@ -406,12 +578,15 @@ if __name__ == "__main__":
         debugMsg('Running on {0} cores'.format(size), header=True)
 
     try:
-        status = main(caseroot, standalone, scomm, rank, size, debug, debugMsg)
+        status = main(caseroot, standalone, scomm, rank, size, debug, debugMsg, plan_only)
         scomm.sync()
         timer.stop("Total Time")
         if rank == 0:
             print('************************************************************')
-            print('Successfully completed generating variable time-series files')
+            if plan_only:
+                print('Successfully completed planning variable time-series files')
+            else:
+                print('Successfully completed generating variable time-series files')
             print('Total Time: {0} seconds'.format(timer.get_time("Total Time")))
             print('************************************************************')
         sys.exit(0)
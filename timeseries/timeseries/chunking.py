@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-import glob, json, os
+import bisect, glob, json, os, struct, zlib
 import netCDF4 as nc
 import cf_units
 import datetime
@@ -31,171 +31,344 @@ def date2num(date, unit, calendar):
     num = cf_units.date2num(date, my_unit, calendar)
     return num/my_conversion
 
-def get_input_dates(glob_str, comm, rank, size):
+def scan_time_axis(fn):
 
     '''
-    Open up all of the files that match the search string and get
-    the dates within the files.  Also get the number of slices within
-    each file, what calendar it uses and the time unit.
+    Open a history file and read the metadata of its time axis
+
+    Input:
+    fn(string) - the history file to scan
+
+    Output:
+    entry(dictionary) - size and mtime of the file along with the time values,
+                        the first and last time bounds (None if the file has no
+                        bounds variable), calendar, units, the
+                        time_period_freq global attribute (None if not set) and
+                        the number of time variant variables
+    '''
+    st = os.stat(fn)
+    f = nc.Dataset(fn,"r")
+    all_t = f.variables['time']
+
+    att = {}
+    for a in all_t.ncattrs():
+        att[a] = all_t.__getattribute__(a)
+
+    bounds = None
+    if 'bounds' in att.keys():
+        b = f.variables[att['bounds']]
+        l = len(b)
+        bounds = [[float(b[0][0]), float(b[0][1])], [float(b[l-1][0]), float(b[l-1][1])]]
+
+    time_period_freq = None
+    if 'time_period_freq' in f.ncattrs():
+        time_period_freq = f.getncattr('time_period_freq')
+
+    nvars = 0
+    for name,var in f.variables.items():
+        if 'time' in var.dimensions and name != 'time' and name != att.get('bounds'):
+            nvars = nvars + 1
+
+    entry = {'size': st.st_size,
+             'mtime': st.st_mtime,
+             'time': [float(t) for t in all_t[:]],
+             'bounds': bounds,
+             'calendar': att.get('calendar'),
+             'units': att.get('units'),
+             'time_period_freq': time_period_freq,
+             'nvars': nvars}
+    f.close()
+
+    return entry
+
+
+def read_time_index(index_fn):
+
+    '''
+    Read in the json time index cache for a stream
+
+    Input:
+    index_fn(string) - the name of the time index file
+
+    Output:
+    index(dictionary) - will be empty if the file doesn't exist or can't be parsed,
+                        otherwise keys->history filename, values->entry from scan_time_axis
+    '''
+    if index_fn is None or not os.path.isfile(index_fn):
+        return {}
+    try:
+        with open(index_fn, 'r') as f:
+            index = json.load(f)
+    except ValueError:
+        print('WARNING: unable to parse time index {} - all files will be rescanned'.format(index_fn))
+        index = {}
+    return index
+
+
+def write_time_index(index_fn, index):
+
+    '''
+    Write the json time index cache for a stream.  The index is written to a
+    temporary file first and then renamed so a killed job never leaves a
+    truncated index behind.
+
+    Input:
+    index_fn(string) - the name of the time index file
+    index(dictionary) - keys->history filename, values->entry from scan_time_axis
+    '''
+    index_dir = os.path.dirname(index_fn)
+    if index_dir and not os.path.isdir(index_dir):
+        os.makedirs(index_dir)
+    tmp_fn = '{0}.tmp.{1}'.format(index_fn, os.getpid())
+    with open(tmp_fn, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_fn, index_fn)
+
+
+def is_current(entry, fn):
+
+    '''
+    Check if a time index entry still describes a file on disk
+
+    Input:
+    entry(dictionary) - entry from scan_time_axis, or None
+    fn(string) - the history filename the entry is for
+
+    Output:
+    True if the file size and modification time match the entry
+    '''
+    if entry is None or 'nvars' not in entry:
+        return False
+    try:
+        st = os.stat(fn)
+    except OSError:
+        return False
+    return entry.get('size') == st.st_size and entry.get('mtime') == st.st_mtime
+
+
+def build_stream_times(stream_files, index):
+
+    '''
+    Pack the time index entries of a stream into compact arrays
+
+    Input:
+    stream_files(list) - sorted list of the history files in the stream
+    index(dictionary) - keys->filename, values->entry from scan_time_axis
+
+    Output:
+    stream_times(dictionary) - 'files'->list of filenames,
+                               'time'->float64 array of the sorted time values of all slices,
+                               'file_index'->int32 array with the position in 'files' of each slice,
+                               'slices'->int32 array with the number of slices in each file,
+                               'bounds'->float64 array (nfiles,2,2) with the first and last
+                                         time bounds of each file (NaN if there are no bounds),
+                               'ref_time'->float64 array with the time used to date a file
+                                           without bounds,
+                               'size'->int64 array with the size in bytes of each file,
+                               'nvars'->int32 array with the number of time variant
+                                        variables in each file
+    '''
+    nfiles = len(stream_files)
+    slices = numpy.zeros(nfiles, dtype=numpy.int32)
+    bounds = numpy.full((nfiles,2,2), numpy.nan)
+    ref_time = numpy.zeros(nfiles)
+    file_size = numpy.zeros(nfiles, dtype=numpy.int64)
+    nvars = numpy.zeros(nfiles, dtype=numpy.int32)
+    for i,fn in enumerate(stream_files):
+        entry = index[fn]
+        slices[i] = len(entry['time'])
+        file_size[i] = entry['size']
+        nvars[i] = entry['nvars']
+        if entry['bounds'] is not None:
+            bounds[i] = entry['bounds']
+        # problem if time has only one value when units are common_year
+        if slices[i] > 1:
+            ref_time[i] = entry['time'][1]
+        elif slices[i] > 0:
+            ref_time[i] = entry['time'][0]
+
+    time = numpy.fromiter((t for fn in stream_files for t in index[fn]['time']),
+                          dtype=numpy.float64, count=int(slices.sum()))
+    file_index = numpy.repeat(numpy.arange(nfiles, dtype=numpy.int32), slices)
+
+    # sort by time, if a slice is found in more than one file keep the last file
+    order = numpy.argsort(time, kind='stable')
+    time = time[order]
+    file_index = file_index[order]
+    if len(time) > 0:
+        keep = numpy.append(time[1:] != time[:-1], True)
+        time = time[keep]
+        file_index = file_index[keep]
+
+    return {'files': list(stream_files),
+            'time': time,
+            'file_index': file_index,
+            'slices': slices,
+            'bounds': bounds,
+            'ref_time': ref_time,
+            'size': file_size,
+            'nvars': nvars}
+
+
+def get_input_dates(glob_str, comm, rank, size, index_fn=None):
+
+    '''
+    Get the dates within all of the files that match the search string.  Also
+    get the number of slices within each file, what calendar it uses and the
+    time unit.
+
+    If index_fn is given, the time metadata of each file is cached there keyed by
+    path, size and mtime.  Only files that are new or have changed since the
+    last scan are opened; rank 0 checks the index and the files that need
+    scanning are divided between all ranks.  The newly scanned entries are
+    gathered on rank 0 and the packed arrays are broadcast back to all ranks.
 
     Input:
     glob_str(string) - the search path to get files
+    index_fn(string) - the name of the time index cache file (optional)
 
     Output:
-    stream_dates(dictionary) - keys->date, values->the file where this slice is located
-    file_slices(dictionary) - keys->filename, values->the number of slices found in the file
+    stream_times(dictionary) - the time slices and the files they are in (see build_stream_times)
+                               along with the 'calendar', 'units' and 'time_period_freq' of the
+                               stream and 'file_id' to map a filename to its position in 'files'
     calendar(string) - the name of the calendar type (ie, noleap, ...)
     units(string) - the calendar unit (possibly in the form 'days since....')
     time_period_freq(string) - time_period_freq global attribute from first file
     '''
-    stream_files = glob.glob(glob_str)
-
-    stream_dates = {}
-    file_slices = {}
-    att = {}
+    stream_files = sorted(glob.glob(glob_str))
 
     if len(stream_files) < 1:
-        return stream_dates, file_slices, None, None, None
-
-    time_period_freq = None
-    first = True
-    stream_files_l = comm.partition(stream_files,func=partition.EqualLength(),involved=True)
-    for fn in sorted(stream_files_l):
+        stream_times = build_stream_times([], {})
+        stream_times['file_id'] = {}
+        return stream_times, None, None, None
+
+    # rank 0 finds the files that are not in the index or have changed
+    index = {}
+    to_scan = []
+    if rank == 0:
+        index = read_time_index(index_fn)
+        for fn in stream_files:
+            if not is_current(index.get(fn), fn):
+                to_scan.append(fn)
+        print('{} of {} files need to be scanned for time information'.format(len(to_scan), len(stream_files)))
+
+    # scan the new files in parallel
+    to_scan_l = comm.partition(to_scan, func=partition.EqualLength(), involved=True)
+    scanned = {}
+    for fn in to_scan_l:
         print("{}/{} opening {}".format(rank,size,fn))
-        # open file and get time dimension
-        f = nc.Dataset(fn,"r")
-        all_t = f.variables['time']
-        nc_atts = f.ncattrs()
-
-        # add the file name are how many slices it contains
-        file_slices[fn] = len(all_t)
-
-        # add all dates and which file they are located in
-        for t in all_t[:]:
-            stream_dates[t] = fn
-
-        # get all attributes of time in order to get cal and units
-        for a in all_t.ncattrs():
-            att[a] = all_t.__getattribute__(a)
-
-        # get the time_period_freq global attribute from the first file
-        if first:
-            try:
-                time_period_freq = f.getncattr('time_period_freq')
-                print( 'time_period_freq = {}'.format(time_period_freq))
-            except:
-                print('Global attribute time_period_freq not found - set to XML tseries_tper element')
-            first = False
-        f.close()
-
-    g_stream_dates = {}
-    g_file_slices = {}
-    calendar = "noleap"
-    units = "days since 0000-01-01 00:00:00"     
-    if size > 1:
-        T1 = 31
-        T2 = 32
-        T3 = 33
-        if rank==0:
-            g_stream_dates = stream_dates
-            g_file_slices = file_slices
-            g_att = att
-            for i in range(0,size-1):
-                r,l_stream_dates = comm.collect(data=None, tag=T1)
-                g_stream_dates.update(l_stream_dates)
-
-                r,l_file_slices = comm.collect(data=None, tag=T2)
-                g_file_slices.update(l_file_slices)
-
-                r,l_att = comm.collect(data=None, tag=T3)
-                g_att.update(l_att)
-
-            comm.partition(g_stream_dates, func=partition.Duplicate(), involved=True)
-            comm.partition(g_file_slices, func=partition.Duplicate(), involved=True)
-            comm.partition(g_att, func=partition.Duplicate(), involved=True)
-        else:
-            comm.collect(data=stream_dates, tag=T1)
-            comm.collect(data=file_slices, tag=T2)
-            comm.collect(data=att, tag=T3)
-
-            g_stream_dates = comm.partition(func=partition.Duplicate(), involved=True)
-            g_file_slices = comm.partition(func=partition.Duplicate(), involved=True)
-            g_att = comm.partition(func=partition.Duplicate(), involved=True)
-        if 'calendar' in g_att.keys():
-            calendar = g_att['calendar']
+        scanned[fn] = scan_time_axis(fn)
+
+    T1 = 31
+    if rank == 0:
+        index.update(scanned)
+        for i in range(0,size-1):
+            r,l_scanned = comm.collect(data=None, tag=T1)
+            index.update(l_scanned)
+        # drop files that have been removed from the archive since the last scan
+        stream_index = {}
+        for fn in stream_files:
+            stream_index[fn] = index[fn]
+        if index_fn is not None and len(to_scan) > 0:
+            write_time_index(index_fn, stream_index)
+
+        calendar = "noleap"
+        units = "days since 0000-01-01 00:00:00"
+        for fn in stream_files:
+            if stream_index[fn]['calendar'] is not None:
+                calendar = stream_index[fn]['calendar']
+            if stream_index[fn]['units'] is not None:
+                units = stream_index[fn]['units']
+        time_period_freq = stream_index[stream_files[0]]['time_period_freq']
+        if time_period_freq is not None:
+            print( 'time_period_freq = {}'.format(time_period_freq))
         else:
-            calendar = "noleap"
-        if 'units' in g_att.keys():
-            units = g_att['units']
-        else:
-            units = "days since 0000-01-01 00:00:00"
+            print('Global attribute time_period_freq not found - set to XML tseries_tper element')
+        stream_times = build_stream_times(stream_files, stream_index)
+        stream_times['calendar'] = calendar.lower()
+        stream_times['units'] = units
+        stream_times['time_period_freq'] = time_period_freq
+    elif size > 1:
+        comm.collect(data=scanned, tag=T1)
+        stream_times = None
+
+    stream_times = comm.partition(stream_times, func=partition.Duplicate(), involved=True)
+    stream_times['file_id'] = dict((fn,i) for i,fn in enumerate(stream_times['files']))
+
     comm.sync()
-    return g_stream_dates,g_file_slices,calendar.lower(),units,time_period_freq
+    return stream_times,stream_times['calendar'],stream_times['units'],stream_times['time_period_freq']
 
-def get_cesm_date(fn,tseries_tper,t=None):
+def get_cesm_date(fn,tseries_tper,t=None,stream_times=None):
 
     '''
-    Open a netcdf file and return its datestamp
+    Return the datestamp of a netcdf file
 
     Input:
     fn(string) - the filename to get date from
     t(string) - string indicating if the file is a beiginning or end (optional)
+    stream_times(dictionary) - stream time arrays from get_input_dates. The file
+                               is only opened if it is not in the stream (optional)
 
     Output:
     an array that includes year,month,day,hour is string format with correct number of digits
     '''
 
-    f = nc.Dataset(fn,"r")
-    all_t = f.variables['time']
-
-    att={}
-    for a in all_t.ncattrs():
-        att[a] = all_t.__getattribute__(a)
-
-    if ('bounds' in att.keys()):
+    if stream_times is not None and fn in stream_times['file_id']:
+        i = stream_times['file_id'][fn]
+        if numpy.isnan(stream_times['bounds'][i][0][0]):
+            bounds = None
+        else:
+            bounds = stream_times['bounds'][i]
+        ref_time = stream_times['ref_time'][i]
+        units = stream_times['units']
+        calendar = stream_times['calendar']
+        time_period_freq = stream_times['time_period_freq']
+    else:
+        entry = scan_time_axis(fn)
+        bounds = entry['bounds']
+        if len(entry['time']) > 1:
+            ref_time = entry['time'][1]
+        else:
+            ref_time = entry['time'][0]
+        units = entry['units']
+        calendar = entry['calendar']
+        time_period_freq = entry['time_period_freq']
+
+    if bounds is not None:
+        first = bounds[0]
+        last = bounds[-1]
         if t == 'b':
-           d = f.variables[att['bounds']][0][0]
+           d = first[0]
            # for the first lnd and rof file
            if ( -1.0 < d < 0.0):
                d = 0
         elif t == 'bb':
-           d = f.variables[att['bounds']][0][0]
+           d = first[0]
            # for the first lnd and rof file
            if ( -1.0 < d < 0.0):
                d = 0
            elif(d > 1):
-               d = f.variables[att['bounds']][0][1]
+               d = first[1]
         elif t == 'e':
-           l = len(f.variables[att['bounds']])
-           d = (f.variables[att['bounds']][l-1][1])-1
+           d = last[1]-1
         elif t == 'ee':
-           l = len(f.variables[att['bounds']])
-           d = (f.variables[att['bounds']][l-1][1])
+           d = last[1]
 
         # problem if global attr time_period_freq does not exist in the nc file
-        if 'time_period_freq' in f.ncattrs():
-            if 'month' in f.time_period_freq:
-                if t=='bb' or t=='b':
-                    d = (f.variables[att['bounds']][0][0] + f.variables[att['bounds']][0][1]) / 2
-                if t=='ee' or t=='e':
-                    l = len(f.variables[att['bounds']])
-                    d = (f.variables[att['bounds']][l-1][0]+f.variables[att['bounds']][l-1][1])/2
-        elif 'month' in tseries_tper:
+        if time_period_freq is not None:
+            freq = time_period_freq
+        else:
+            freq = tseries_tper
+        if 'month' in freq:
             if t=='bb' or t=='b':
-                d = (f.variables[att['bounds']][0][0] + f.variables[att['bounds']][0][1]) / 2
+                d = (first[0] + first[1]) / 2
             if t=='ee' or t=='e':
-                l = len(f.variables[att['bounds']])
-                d = (f.variables[att['bounds']][l-1][0]+f.variables[att['bounds']][l-1][1])/2
+                d = (last[0] + last[1]) / 2
 
     else:
-        # problem if time has only one value when units are common_year
-        try:
-            d = f.variables['time'][1]
-        except:
-            d = f.variables['time'][0]
+        d = ref_time
 
-    d1 = num2date(d,att['units'],att['calendar'].lower())
-    f.close()
+    d1 = num2date(float(d),units,calendar.lower())
 
     return [str(d1.year).zfill(4),str(d1.month).zfill(2),str(d1.day).zfill(2),str(d1.hour).zfill(2)]
 
@@ -232,7 +405,7 @@ def get_chunk_range(tper, size, start, cal, units):
 
     elif 'month' in tper: #month
         m2 = (int(d1.month)+(int(size)%12))
-        y2 = (int(d1.year)+(int(size)/12))
+        y2 = (int(d1.year)+(int(size)//12))
         if m2 > 12:
             y2 = y2 + 1
             m2 = m2 - 12
@@ -245,19 +418,24 @@ def get_chunk_range(tper, size, start, cal, units):
 
     return start, end
 
-def get_chunks(tper, index, size, stream_dates, ts_log_dates, cal, units, s, tseries_tper):
+def get_chunks(tper, index, size, stream_times, ts_log, cal, units, s, tseries_tper):
 
     '''
     Figure out what chunks there are to do for a particular CESM output stream
 
+    The chunk boundaries are found with a binary search over the sorted time
+    values of the stream, so the cost grows with the number of chunks rather than
+    the number of time slices.  The chunk start and end dates come from the
+    time bounds in stream_times and no history files are opened.
+
     Input:
     tper(string) - the time period to use when figuring out chunk size (year, month, day, hour)
     index(int) - an integer indicating which index in the tper and size list to start from.
                  this option gives users to specify different chunk sizes.
     size(int) - the size of the chunk used in coordination with tper
-    stream_dates(dictionary) - keys->date, values->the file where this slice is located
-    ts_log_dates(list) - a list of all of the dates that have been converted already - used to
-                         avoid duplication
+    stream_times(dictionary) - the time slices and the files they are in from get_input_dates
+    ts_log(dictionary) - the stream log entry from read_log with the time intervals that have been
+                         converted already - used to avoid duplication (None if there is none)
     cal(string) - the calendar to use to figure out chunk size
     units(string) - the units to use to figure out chunk size
     s(string) - flag to determine if we need to wait until we have all data before we create a chunk or
@@ -270,18 +448,15 @@ def get_chunks(tper, index, size, stream_dates, ts_log_dates, cal, units, s, tse
     index(int) - the last index to be used in the tper and size list
     '''
 
-    # remove the times in ts_log_dates from stream_dates because
+    # remove the times in ts_log from stream_times because
     # these have already been created
-    du = cf_units.Unit(units)
-    to_do = []
-    for d in sorted(stream_dates.keys()):
-        if d not in ts_log_dates:
-            to_do.append(d)
+    done = log_done(ts_log, stream_times['time'])
+    to_do = stream_times['time'][~done]
+    to_do_files = stream_times['file_index'][~done]
+    stream_files = stream_times['files']
 
     files = {}
     dates = []
-    i = 0
-    e = False
     chunk_n = 0
 
     tper_list = tper.split(",")
@@ -289,95 +464,361 @@ def get_chunks(tper, index, size, stream_dates, ts_log_dates, cal, units, s, tse
     if len(tper_list) != len(size_list):
         print('Error: The length of requested time periods for chunks does not match the length of requested chunk sizes {} {}'.format(tper_list, size_list))
 
-    if len(to_do)>1:
-        while e is False:
-            # get the new range
-            start,end = get_chunk_range(tper_list[index], size_list[index], to_do[i], cal, units)
-            if index != len(tper_list)-1:
-                index = index + 1
-            #walk through and map dates within this range to files
-            cfiles = []
-            cdates = []
-            while to_do[i] < end and e is False:
-                fn = stream_dates[to_do[i]]
-                if fn not in cfiles:
-                    cfiles.append(fn)
-                cdates.append(to_do[i])
-                i = i + 1
-                # am I passed the dates I have?  If so, exit loop and don't add to list.
-                # these will be converted when more data exists
-                if i >= len(to_do)-1:
-                    fn = stream_dates[to_do[i]]
-                    if fn not in cfiles:
-                        cfiles.append(fn)
-                    cdates.append(to_do[i])
-                    if s==1:
-                        print( '#################################')
-                        print( 'Not appending: ')
-                        print("{}".format(cfiles))
-                        print( 'dates:({})'.format(cdates))
-                        print( '#################################')
-                    else: # user indicated that they would like to end with an incomplete chunk
-                        files[chunk_n] = {}
-                        files[chunk_n]['fn'] = sorted(cfiles)
-                        if chunk_n > 0:
-                            files[chunk_n]['start'] = get_cesm_date(cfiles[0],tseries_tper,t='bb')
-                        else:
-                            files[chunk_n]['start'] = get_cesm_date(cfiles[0],tseries_tper,t='b')
-                        files[chunk_n]['end'] = get_cesm_date(cfiles[-1],tseries_tper,t='e')
-                        for cd in sorted(cdates):
-                            dates.append(cd)
-                    e = True
-            # Have a complete set.  Append file and date info.
-            if e is False:
-                files[chunk_n] = {}
-                s_cdates = sorted(cdates)
-                files[chunk_n]['fn'] = sorted(cfiles)
-                if chunk_n > 0:
-                    files[chunk_n]['start'] = get_cesm_date(cfiles[0],tseries_tper,t='bb')
-                else:
-                    files[chunk_n]['start'] = get_cesm_date(cfiles[0],tseries_tper,t='b')
-                files[chunk_n]['end'] = get_cesm_date(cfiles[-1],tseries_tper,t='ee')
-                for cd in sorted(cdates):
-                    dates.append(cd)
-            chunk_n = chunk_n+1
+    n = len(to_do)
+    i = 0
+    while n > 1 and i < n-1:
+        # get the new range
+        start,end = get_chunk_range(tper_list[index], size_list[index], to_do[i], cal, units)
+        if index != len(tper_list)-1:
+            index = index + 1
+
+        # the first slice at or past the end of this range starts the next chunk.
+        # once the range reaches the second to last slice we are passed the dates
+        # we have and the chunk is incomplete - it holds everything that is left
+        j = max(int(numpy.searchsorted(to_do, end, side='left')), i+1)
+        complete = j < n-1
+        if not complete:
+            j = n
+
+        # map the dates within this range to files, in the order they first appear
+        cfile_ids,first = numpy.unique(to_do_files[i:j], return_index=True)
+        cfiles = [stream_files[f] for f in cfile_ids[numpy.argsort(first)]]
+        cdates = to_do[i:j].tolist()
+
+        if not complete and s==1:
+            # these will be converted when more data exists
+            print( '#################################')
+            print( 'Not appending: ')
+            print("{}".format(cfiles))
+            print( 'dates:({})'.format(cdates))
+            print( '#################################')
+        else:
+            # a complete set or the user indicated that they would like to end with an
+            # incomplete chunk.  Append file and date info.
+            files[chunk_n] = {}
+            files[chunk_n]['fn'] = sorted(cfiles)
+            if chunk_n > 0:
+                files[chunk_n]['start'] = get_cesm_date(cfiles[0],tseries_tper,t='bb',stream_times=stream_times)
+            else:
+                files[chunk_n]['start'] = get_cesm_date(cfiles[0],tseries_tper,t='b',stream_times=stream_times)
+            if complete:
+                files[chunk_n]['end'] = get_cesm_date(cfiles[-1],tseries_tper,t='ee',stream_times=stream_times)
+            else:
+                files[chunk_n]['end'] = get_cesm_date(cfiles[-1],tseries_tper,t='e',stream_times=stream_times)
+            dates.extend(cdates)
+        chunk_n = chunk_n+1
+        i = j
 
     return files, dates, index
 
 
-def write_log(log_fn, log):
+LOG_MAGIC = b'CESMTSL\x01'
+LOG_NAME = struct.Struct('<H')
+LOG_DATA = struct.Struct('<idd')
+LOG_CRC = struct.Struct('<I')
 
+def pack_log_record(stream, index, lo, hi):
+
+    '''
+    Pack one progress record into the binary log format
+
+    Input:
+    stream(string) - the file stream (comp+stream) the record belongs to
+    index(int) - the next index to use for the size and tper lists
+    lo(float) - the first converted time value (NaN if only the index changed)
+    hi(float) - the last converted time value (NaN if only the index changed)
+
+    Output:
+    the record bytes - name length, name, index, lo, hi and a crc32 of all of them
+    '''
+    name = stream.encode('utf-8')
+    body = LOG_NAME.pack(len(name)) + name + LOG_DATA.pack(int(index), float(lo), float(hi))
+    return body + LOG_CRC.pack(zlib.crc32(body) & 0xffffffff)
+
+
+def read_log_records(log_fn):
+
+    '''
+    Read all of the complete records in a binary progress log.  Reading stops
+    at the first truncated or corrupt record, which is what a job killed while
+    appending leaves behind.
+
+    Input:
+    log_fn(string) - the name of the binary log file
+
+    Output:
+    records(list) - (stream, index, lo, hi) tuples in the order they were written
+    offset(int) - the file offset just past the last good record
+    '''
+    records = []
+    if not os.path.isfile(log_fn):
+        return records, 0
+    with open(log_fn, 'rb') as f:
+        buf = f.read()
+    if buf[:len(LOG_MAGIC)] != LOG_MAGIC:
+        err_msg = 'chunking.read_log_records ERROR: {0} is not a timeseries progress log'.format(log_fn)
+        raise OSError(err_msg)
+
+    offset = len(LOG_MAGIC)
+    while offset + LOG_NAME.size <= len(buf):
+        (n,) = LOG_NAME.unpack_from(buf, offset)
+        end = offset + LOG_NAME.size + n + LOG_DATA.size
+        if end + LOG_CRC.size > len(buf):
+            break
+        (crc,) = LOG_CRC.unpack_from(buf, end)
+        if crc != zlib.crc32(buf[offset:end]) & 0xffffffff:
+            break
+        stream = buf[offset+LOG_NAME.size:offset+LOG_NAME.size+n].decode('utf-8')
+        index,lo,hi = LOG_DATA.unpack_from(buf, offset+LOG_NAME.size+n)
+        records.append((stream, index, lo, hi))
+        offset = end + LOG_CRC.size
+
+    return records, offset
+
+
+def merge_interval(entry, lo, hi):
+
+    '''
+    Add the closed range [lo, hi] to the sorted, non-overlapping intervals of a
+    stream log entry, merging it with any intervals it overlaps
+
+    Input:
+    entry(dictionary) - stream log entry with 'lo' and 'hi' lists
+    lo(float) - start of the range
+    hi(float) - end of the range
     '''
-    Write (or append) a json file with the date stamps that have been coverted
-    and what tper and size list index to next start on.
+    i = bisect.bisect_left(entry['hi'], lo)
+    j = bisect.bisect_right(entry['lo'], hi)
+    if i < j:
+        lo = min(lo, entry['lo'][i])
+        hi = max(hi, entry['hi'][j-1])
+    entry['lo'][i:j] = [lo]
+    entry['hi'][i:j] = [hi]
+
+
+def new_log_entry():
+
+    '''
+    Return an empty stream log entry - no converted intervals and index 0
+    '''
+    return {'lo': [], 'hi': [], 'index': 0}
+
+
+def log_add(entry, stream, dates, index, times=None):
+
+    '''
+    Record the dates that have just been converted for a stream
+
+    If the stream times are given, the new range is also joined with the
+    neighbouring intervals when no time slice of the stream lies between them,
+    so the number of intervals stays small no matter how many runs there are.
+
+    Input:
+    entry(dictionary) - stream log entry to update
+    stream(string) - the file stream (comp+stream)
+    dates(list) - sorted time values that were converted
+    index(int) - the next index to use for the size and tper lists
+    times(array) - sorted time values of all of the slices in the stream (optional)
+
+    Output:
+    record(tuple) - (stream, index, lo, hi) to pass on to write_log
+    '''
+    entry['index'] = index
+    if len(dates) < 1:
+        return (stream, index, float('nan'), float('nan'))
+
+    lo = float(dates[0])
+    hi = float(dates[-1])
+    if times is not None:
+        i = bisect.bisect_left(entry['hi'], lo) - 1
+        if i >= 0 and numpy.searchsorted(times, lo, 'left') == numpy.searchsorted(times, entry['hi'][i], 'right'):
+            lo = entry['lo'][i]
+        j = bisect.bisect_right(entry['lo'], hi)
+        if j < len(entry['lo']) and numpy.searchsorted(times, entry['lo'][j], 'left') == numpy.searchsorted(times, hi, 'right'):
+            hi = entry['hi'][j]
+    merge_interval(entry, lo, hi)
+
+    return (stream, index, lo, hi)
+
+
+def log_done(entry, times):
+
+    '''
+    Check which time values fall inside the converted intervals of a stream
+
+    Input:
+    entry(dictionary) - stream log entry, or None if nothing has been converted
+    times(array) - time values to check
+
+    Output:
+    done(array) - True for each time value that has already been converted
+    '''
+    times = numpy.asarray(times, dtype=numpy.float64)
+    if entry is None or len(entry['lo']) < 1:
+        return numpy.zeros(times.shape, dtype=bool)
+    lo = numpy.asarray(entry['lo'])
+    hi = numpy.asarray(entry['hi'])
+    k = numpy.searchsorted(lo, times, side='right') - 1
+    done = k >= 0
+    done[done] = times[done] <= hi[k[done]]
+    return done
+
+
+def write_log(log_fn, records):
+
+    '''
+    Append progress records to the binary log file.
+
+    Any partial record left by an earlier crash is cut off before appending and
+    the file is synced before returning.  Once the file holds many more records
+    than merged intervals it is rewritten in compact form to a temporary file
+    that is renamed over the log, so readers only ever see a complete log.
 
     Input:
     log_fn(string) - the name of the log file to write to
-    log(dictionary) - keys->file streams, values->the dates that have been
-                         converted and next indexes to use for size and tper lists
+    records(list) - (stream, index, lo, hi) tuples from log_add
     '''
-    with open(log_fn, 'a+') as f:
-        json.dump(log, f)
-    f.close()
+    if len(records) < 1:
+        return
+    old_records,offset = read_log_records(log_fn)
+
+    log = {}
+    for record in old_records + list(records):
+        apply_log_record(log, record)
+    n_intervals = sum(len(e['lo']) + 1 for e in log.values())
+    n_records = len(old_records) + len(records)
+
+    if n_records > 256 and n_records > 4 * n_intervals:
+        compact = []
+        for stream,e in sorted(log.items()):
+            compact.append(pack_log_record(stream, e['index'], float('nan'), float('nan')))
+            for lo,hi in zip(e['lo'], e['hi']):
+                compact.append(pack_log_record(stream, e['index'], lo, hi))
+        tmp_fn = '{0}.tmp.{1}'.format(log_fn, os.getpid())
+        with open(tmp_fn, 'wb') as f:
+            f.write(LOG_MAGIC + b''.join(compact))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_fn, log_fn)
+        return
+
+    mode = 'r+b' if offset > 0 else 'wb'
+    with open(log_fn, mode) as f:
+        if offset > 0:
+            f.seek(offset)
+            f.truncate()
+        else:
+            f.write(LOG_MAGIC)
+        f.write(b''.join(pack_log_record(*r) for r in records))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def apply_log_record(log, record):
+
+    '''
+    Apply one (stream, index, lo, hi) record to an in memory log dictionary
+    '''
+    stream,index,lo,hi = record
+    if stream not in log:
+        log[stream] = new_log_entry()
+    log[stream]['index'] = index
+    if not math.isnan(lo):
+        merge_interval(log[stream], lo, hi)
 
 
 def read_log(log_fn):
 
     '''
-    Read in the json log file in order to know which files have already been converted
+    Read in the binary log file in order to know which time slices have already been converted
 
     Input:
-    log_fn(string) - the name of the log file to write to
+    log_fn(string) - the name of the log file to read
 
     Output:
     d(dictionary) - will be empty if it the file doesn't exist or contain a dictionary
-                    with keys->file streams, values->the dates that have been
-                    converted and next indexes to use for size and tper lists
-    '''
-    if os.path.isfile(log_fn):
-        with open(log_fn, 'r') as f:
-            d = json.load(f)
-        f.close()
-        return d
-    else:
-        return {}
+                    with keys->file streams, values->'lo' and 'hi' lists with the sorted
+                    converted time intervals and 'index', the next index to use for size and tper lists
+    '''
+    d = {}
+    records,offset = read_log_records(log_fn)
+    for record in records:
+        apply_log_record(d, record)
+    return d
+
+
+def read_json_log(json_log_fn):
+
+    '''
+    Read the old json ts_status.log as binary log records.  The converted slices
+    of each stream are turned into intervals, splitting where the gap between
+    slices is well over the typical spacing.
+
+    Input:
+    json_log_fn(string) - the name of the old json log file
+
+    Output:
+    records(list) - (stream, index, lo, hi) records, empty if there is no json log
+    '''
+    if not os.path.isfile(json_log_fn):
+        return []
+
+    # older versions appended a full json dump on every run, the last one is the most recent
+    with open(json_log_fn, 'r') as f:
+        text = f.read()
+    decoder = json.JSONDecoder()
+    old_log = {}
+    pos = 0
+    while pos < len(text):
+        if text[pos].isspace():
+            pos = pos + 1
+            continue
+        try:
+            old_log,pos = decoder.raw_decode(text, pos)
+        except ValueError:
+            print('WARNING: unable to parse {0} after offset {1}'.format(json_log_fn, pos))
+            break
+
+    records = []
+    for stream,e in sorted(old_log.items()):
+        records.append((stream, e.get('index', 0), float('nan'), float('nan')))
+        slices = numpy.unique(numpy.asarray(e.get('slices', []), dtype=numpy.float64))
+        if len(slices) < 1:
+            continue
+        breaks = []
+        if len(slices) > 1:
+            gaps = numpy.diff(slices)
+            breaks = numpy.nonzero(gaps > 1.5 * numpy.median(gaps))[0]
+        first = 0
+        for b in list(breaks) + [len(slices)-1]:
+            records.append((stream, e.get('index', 0), slices[first], slices[b]))
+            first = b + 1
+    return records
+
+
+def migrate_log(json_log_fn, log_fn):
+
+    '''
+    One time conversion of the old json ts_status.log to the binary log.  The
+    json log is renamed with a .migrated suffix once the binary log is in place.
+
+    Input:
+    json_log_fn(string) - the name of the old json log file
+    log_fn(string) - the name of the binary log file to create
+
+    Output:
+    True if a json log was migrated
+    '''
+    if os.path.isfile(log_fn) or not os.path.isfile(json_log_fn):
+        return False
+
+    records = read_json_log(json_log_fn)
+    tmp_fn = '{0}.tmp.{1}'.format(log_fn, os.getpid())
+    with open(tmp_fn, 'wb') as f:
+        f.write(LOG_MAGIC + b''.join(pack_log_record(*r) for r in records))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_fn, log_fn)
+    os.rename(json_log_fn, json_log_fn + '.migrated')
+    print('Migrated {0} to {1}'.format(json_log_fn, log_fn))
+    return True
@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+"""Cost model and scheduling of pyReshaper specifiers
+
+The cost of converting a specifier is estimated from the number of bytes in
+its input history files and the number of variables times the number of files
+(the reshaper opens every input file for every variable it writes).  The
+estimates are used to size the sub-communicators and to hand out the
+specifiers longest first.  The measured times are saved so the model can be
+refit for the machine the case runs on, and the specifiers of the last run
+are used to size the sub-communicators of the next one.
+__________________________
+Created on Oct, 2026
+
+@author: CSEG <cseg@cgd.ucar.edu>
+"""
+
+import json
+import os
+
+import numpy
+
+# default model - time per rank = t0 + (sec_per_byte * bytes + sec_per_var_file * nvars * nfiles) / ranks
+DEFAULT_MODEL = {'t0': 5.0,
+                 'sec_per_byte': 2.0e-8,
+                 'sec_per_var_file': 0.02}
+
+# number of runs of each specifier kept in the history and used for the fit
+HISTORY_RUNS = 10
+
+def read_cost_model(model_fn):
+
+    '''
+    Read the cost model coefficients, falling back on the defaults
+
+    Input:
+    model_fn(string) - the name of the json cost model file
+
+    Output:
+    model(dictionary) - keys->'t0', 'sec_per_byte' and 'sec_per_var_file'
+    '''
+    model = dict(DEFAULT_MODEL)
+    if model_fn is not None and os.path.isfile(model_fn):
+        try:
+            with open(model_fn, 'r') as f:
+                model.update(json.load(f))
+        except ValueError:
+            print('WARNING: unable to parse cost model {0} - using defaults'.format(model_fn))
+    return model
+
+
+def spec_info(stream_times, history_files, exclude_list):
+
+    '''
+    Collect what the cost model needs to know about a specifier from the
+    stream time index, without opening any files
+
+    Input:
+    stream_times(dictionary) - the stream time arrays from chunking.get_input_dates
+    history_files(list) - the input files of the specifier
+    exclude_list(list) - the variables excluded from the conversion
+
+    Output:
+    info(dictionary) - 'bytes' in, number of time series 'nvars' and number of input 'nfiles'
+    '''
+    ids = [stream_times['file_id'][fn] for fn in history_files]
+    nbytes = int(stream_times['size'][ids].sum())
+    nvars = max(int(stream_times['nvars'][ids].max()) - len(exclude_list), 1)
+    return {'bytes': nbytes, 'nvars': nvars, 'nfiles': len(history_files)}
+
+
+def predict_work(info, model):
+
+    '''
+    Predicted rank-seconds needed to convert a specifier, not counting t0
+    '''
+    return model['sec_per_byte'] * info['bytes'] + model['sec_per_var_file'] * info['nvars'] * info['nfiles']
+
+
+def predict_time(info, nranks, model):
+
+    '''
+    Predicted wall clock seconds to convert a specifier on nranks.  The
+    reshaper works in parallel over variables so ranks beyond the number of
+    variables do not help.
+    '''
+    return model['t0'] + predict_work(info, model) / max(min(nranks, info['nvars']), 1)
+
+
+def plan_groups(sample, nworkers, min_procs_per_spec, model, nstreams=None):
+
+    '''
+    Decide the sub-communicator sizes before the history files are scanned
+
+    The specifiers of a run are not known until their streams have been
+    planned, so the group sizes come from a sample - the specifiers measured
+    in the previous run.  The number of groups follows min_procs_per_spec as
+    before.  A sample smaller than that, such as a restart that converted a
+    single specifier, does not cut the number of groups below the number of
+    streams, which are scanned and converted at the same time.  The largest
+    sampled specifiers each seed a group, and the group sizes are
+    proportional to the predicted work of their seed, capped at the number of
+    variables in the seed.  The groups beyond the sample get the even share of
+    the ranks.  Ranks left over by the caps go to the groups that can still
+    use them.  Without a sample the ranks are split evenly.
+
+    Input:
+    sample(list) - spec_info dictionaries of recently converted specifiers, may be empty
+    nworkers(int) - the number of ranks available, not counting the global master
+    min_procs_per_spec(int) - the smallest typical group size
+    model(dictionary) - cost model coefficients
+    nstreams(int) - the number of streams to convert, None if not known
+
+    Output:
+    group_sizes(list) - the number of ranks in each group, biggest seed first
+    '''
+    if nworkers < 1:
+        return []
+    num_of_groups = max(nworkers // min_procs_per_spec, 1)
+    if len(sample) < 1:
+        return [nworkers // num_of_groups + (1 if g < nworkers % num_of_groups else 0) for g in range(num_of_groups)]
+    if nstreams is None:
+        nstreams = len(sample)
+    num_of_groups = min(num_of_groups, max(len(sample), nstreams, 1))
+
+    # the groups beyond the sample have no seed to cap them
+    seeds = sorted(sample, key=lambda info: -predict_work(info, model))[:num_of_groups]
+    nseeds = len(seeds)
+    even = nworkers // num_of_groups
+    caps = [info['nvars'] for info in seeds] + [nworkers] * (num_of_groups - nseeds)
+    seeded = nworkers - even * (num_of_groups - nseeds)
+    work = [predict_work(info, model) for info in seeds]
+    total = sum(work)
+    sizes = []
+    for g in range(nseeds):
+        if total > 0:
+            share = int(seeded * work[g] / total)
+        else:
+            share = seeded // nseeds
+        sizes.append(max(min(share, caps[g]), 1))
+    sizes.extend([even] * (num_of_groups - nseeds))
+
+    # trim if the minimum of one rank per group pushed us over
+    g = 0
+    while sum(sizes) > nworkers:
+        if sizes[g] > 1:
+            sizes[g] = sizes[g] - 1
+        g = (g + 1) % num_of_groups
+
+    # hand out the rest of the ranks to groups still below their variable count,
+    # biggest first, then to the biggest group
+    left = nworkers - sum(sizes)
+    while left > 0:
+        room = [g for g in range(num_of_groups) if sizes[g] < caps[g]]
+        if len(room) == 0:
+            sizes[0] = sizes[0] + left
+            break
+        for g in room:
+            if left == 0:
+                break
+            sizes[g] = sizes[g] + 1
+            left = left - 1
+
+    return sizes
+
+
+def pick_longest(ready, infos, model):
+
+    '''
+    Remove and return the specifier index in ready with the most predicted work
+    '''
+    i = max(ready, key=lambda k: (predict_work(infos[k], model), -k))
+    ready.remove(i)
+    return i
+
+
+def stream_estimate(infos, nranks, model):
+
+    '''
+    Summarize the planned specifiers of a stream for a dry run
+
+    Input:
+    infos(list) - spec_info dictionaries of the specifiers planned for the stream
+    nranks(int) - the size of the subcommunicator each specifier is expected to run on
+    model(dictionary) - cost model coefficients
+
+    Output:
+    estimate(dictionary) - number of 'chunks', input 'bytes', number of output 'files',
+                           largest number of time series variables 'nvars', predicted
+                           'core_hours' and the predicted seconds of the 'longest' chunk
+    '''
+    estimate = {'chunks': len(infos), 'bytes': 0, 'files': 0, 'nvars': 0,
+                'core_hours': 0.0, 'longest': 0.0}
+    for info in infos:
+        n = max(min(nranks, info['nvars']), 1)
+        seconds = predict_time(info, n, model)
+        estimate['bytes'] = estimate['bytes'] + info['bytes']
+        estimate['files'] = estimate['files'] + info['nvars']
+        estimate['nvars'] = max(estimate['nvars'], info['nvars'])
+        estimate['core_hours'] = estimate['core_hours'] + seconds * n / 3600.0
+        estimate['longest'] = max(estimate['longest'], seconds)
+    return estimate
+
+
+def plan_report(names, estimates):
+
+    '''
+    Print the dry run estimate of every stream and the totals
+
+    Input:
+    names(list) - the name of each stream
+    estimates(list) - stream_estimate dictionaries, one per stream
+    '''
+    print('{0:<20} {1:>7} {2:>16} {3:>8} {4:>8} {5:>11} {6:>12}'.format(
+        'stream', 'chunks', 'input bytes', 'files', 'nvars', 'core-hours', 'longest (s)'))
+    total = stream_estimate([], 1, DEFAULT_MODEL)
+    for name,e in zip(names, estimates):
+        print('{0:<20} {1:>7} {2:>16} {3:>8} {4:>8} {5:>11.2f} {6:>12.1f}'.format(
+            name, e['chunks'], e['bytes'], e['files'], e['nvars'], e['core_hours'], e['longest']))
+        for key in ['chunks', 'bytes', 'files', 'core_hours']:
+            total[key] = total[key] + e[key]
+        total['nvars'] = max(total['nvars'], e['nvars'])
+        total['longest'] = max(total['longest'], e['longest'])
+    print('{0:<20} {1:>7} {2:>16} {3:>8} {4:>8} {5:>11.2f} {6:>12.1f}'.format(
+        'total', total['chunks'], total['bytes'], total['files'], total['nvars'], total['core_hours'], total['longest']))
+    print('The run takes at least {0:.1f} seconds however many cores are used.'.format(total['longest']))
+
+
+def report(infos, spec_times, model, prefixes=None):
+
+    '''
+    Print the predicted and measured time of every converted specifier
+
+    Input:
+    infos(list) - spec_info dictionaries, one per specifier
+    spec_times(list) - (spec index, group size, seconds) tuples
+    model(dictionary) - cost model coefficients used for the predictions
+    prefixes(list) - output file prefix of each specifier, used as a label (optional)
+
+    Output:
+    records(list) - one dictionary per measured specifier to add to the history
+    '''
+    records = []
+    print('{0:>6} {1:>6} {2:>8} {3:>14} {4:>11} {5:>11}  {6}'.format('spec', 'ranks', 'nvars', 'bytes', 'predicted', 'actual', 'prefix'))
+    for i,nranks,seconds in sorted(spec_times):
+        info = infos[i]
+        predicted = predict_time(info, nranks, model)
+        label = prefixes[i] if prefixes is not None else ''
+        print('{0:>6} {1:>6} {2:>8} {3:>14} {4:>11.1f} {5:>11.1f}  {6}'.format(i, nranks, info['nvars'], info['bytes'], predicted, seconds, label))
+        records.append({'bytes': info['bytes'], 'nvars': info['nvars'], 'nfiles': info['nfiles'],
+                        'ranks': nranks, 'predicted': predicted, 'actual': seconds, 'prefix': label})
+    return records
+
+
+def fit_cost_model(records, model):
+
+    '''
+    Refit the cost model coefficients to measured specifier times with least squares.
+    The model is returned unchanged if there are too few records.
+
+    Input:
+    records(list) - measured specifier times from report
+    model(dictionary) - current cost model coefficients
+
+    Output:
+    model(dictionary) - new cost model coefficients, all kept positive
+    '''
+    if len(records) < 3:
+        return dict(model)
+    a = numpy.zeros((len(records), 3))
+    b = numpy.zeros(len(records))
+    for k,r in enumerate(records):
+        m = max(min(r['ranks'], r['nvars']), 1)
+        a[k] = [1.0, float(r['bytes']) / m, float(r['nvars'] * r['nfiles']) / m]
+        b[k] = r['actual']
+    # scale the columns so the bytes term doesn't swamp the fit
+    scale = numpy.maximum(numpy.abs(a).max(axis=0), 1.0e-30)
+    coef = numpy.linalg.lstsq(a / scale, b, rcond=None)[0] / scale
+    new_model = dict(model)
+    for key,c in zip(['t0', 'sec_per_byte', 'sec_per_var_file'], coef):
+        if c > 0:
+            new_model[key] = float(c)
+    return new_model
+
+
+def read_spec_times(times_fn):
+
+    '''
+    Read the history of measured specifier times
+
+    Input:
+    times_fn(string) - the name of the json file with all measured times
+
+    Output:
+    history(list) - records from report, each with the 'run' it was measured in
+    '''
+    history = []
+    if os.path.isfile(times_fn):
+        try:
+            with open(times_fn, 'r') as f:
+                history = json.load(f)
+        except ValueError:
+            print('WARNING: unable to parse {0} - starting a new history'.format(times_fn))
+    return history
+
+
+def last_run(history):
+
+    '''
+    Return the records of the most recent run in the history
+    '''
+    if len(history) < 1:
+        return []
+    run = max(r.get('run', 0) for r in history)
+    return [r for r in history if r.get('run', 0) == run]
+
+
+def trim_history(history, nruns=HISTORY_RUNS):
+
+    '''
+    Return the records of the last nruns runs of every specifier in the history,
+    the specifiers are told apart by their output file prefix
+    '''
+    runs = dict()
+    for r in history:
+        runs.setdefault(r.get('prefix', ''), set()).add(r.get('run', 0))
+    keep = dict((prefix, set(sorted(rs)[-nruns:])) for prefix,rs in runs.items())
+    return [r for r in history if r.get('run', 0) in keep[r.get('prefix', '')]]
+
+
+def save_spec_times(times_fn, model_fn, records, model):
+
+    '''
+    Append the measured specifier times to the json history file and write
+    the cost model refit to the history.  Only the last HISTORY_RUNS runs of
+    each specifier are kept, so the file and the fit do not grow without
+    bound.  Both files are replaced through a temporary file.
+
+    Input:
+    times_fn(string) - the name of the json file with all measured times
+    model_fn(string) - the name of the json cost model file
+    records(list) - measured specifier times from report
+    model(dictionary) - cost model coefficients used for this run
+    '''
+    history = read_spec_times(times_fn)
+    run = max([r.get('run', 0) for r in history] + [0]) + 1
+    for r in records:
+        r['run'] = run
+    history = trim_history(history + records)
+    new_model = fit_cost_model(history, model)
+
+    for fn,data in [(times_fn, history), (model_fn, new_model)]:
+        tmp_fn = '{0}.tmp.{1}'.format(fn, os.getpid())
+        with open(tmp_fn, 'w') as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_fn, fn)
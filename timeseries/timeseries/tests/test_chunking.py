@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+"""
+Unit test suite for the timeseries chunking module
+
+"""
+
+from __future__ import print_function
+
+import glob
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import netCDF4 as nc
+import numpy
+
+from asaptools import simplecomm
+from timeseries import chunking
+
+UNITS = 'days since 0001-01-01 00:00:00'
+
+def write_history(hist_dir, n_files, per_file, step, freq, calendar, prefix='case.cam.h0.'):
+    """ write n_files synthetic history files with per_file time slices each,
+        step days apart, with time_bnds and the time_period_freq attribute
+    """
+    t = 0.0
+    for i in range(n_files):
+        f = nc.Dataset('{0}/{1}{2:05d}.nc'.format(hist_dir, prefix, i), 'w')
+        f.createDimension('time', None)
+        f.createDimension('nbnd', 2)
+        tv = f.createVariable('time', 'f8', ('time',))
+        tv.units = UNITS
+        tv.calendar = calendar
+        tv.bounds = 'time_bnds'
+        tb = f.createVariable('time_bnds', 'f8', ('time', 'nbnd'))
+        for k in range(per_file):
+            tb[k] = [t, t + step]
+            tv[k] = t + step
+            t += step
+        f.time_period_freq = freq
+        f.close()
+
+def reference_chunks(tper, index, size, stream_dates, ts_log_dates, cal, units, s, tseries_tper):
+    """ the slice by slice chunk walk get_chunks used before the binary search
+        planner, reading the chunk dates from the history files
+    """
+    to_do = []
+    for d in sorted(stream_dates.keys()):
+        if d not in ts_log_dates:
+            to_do.append(d)
+
+    files = {}
+    dates = []
+    i = 0
+    e = False
+    chunk_n = 0
+    tper_list = tper.split(",")
+    size_list = size.split(",")
+    if len(to_do)>1:
+        while e is False:
+            start,end = chunking.get_chunk_range(tper_list[index], size_list[index], to_do[i], cal, units)
+            if index != len(tper_list)-1:
+                index = index + 1
+            cfiles = []
+            cdates = []
+            while to_do[i] < end and e is False:
+                fn = stream_dates[to_do[i]]
+                if fn not in cfiles:
+                    cfiles.append(fn)
+                cdates.append(to_do[i])
+                i = i + 1
+                if i >= len(to_do)-1:
+                    fn = stream_dates[to_do[i]]
+                    if fn not in cfiles:
+                        cfiles.append(fn)
+                    cdates.append(to_do[i])
+                    if s != 1:
+                        files[chunk_n] = {}
+                        files[chunk_n]['fn'] = sorted(cfiles)
+                        if chunk_n > 0:
+                            files[chunk_n]['start'] = chunking.get_cesm_date(cfiles[0],tseries_tper,t='bb')
+                        else:
+                            files[chunk_n]['start'] = chunking.get_cesm_date(cfiles[0],tseries_tper,t='b')
+                        files[chunk_n]['end'] = chunking.get_cesm_date(cfiles[-1],tseries_tper,t='e')
+                        dates.extend(sorted(cdates))
+                    e = True
+            if e is False:
+                files[chunk_n] = {}
+                files[chunk_n]['fn'] = sorted(cfiles)
+                if chunk_n > 0:
+                    files[chunk_n]['start'] = chunking.get_cesm_date(cfiles[0],tseries_tper,t='bb')
+                else:
+                    files[chunk_n]['start'] = chunking.get_cesm_date(cfiles[0],tseries_tper,t='b')
+                files[chunk_n]['end'] = chunking.get_cesm_date(cfiles[-1],tseries_tper,t='ee')
+                dates.extend(sorted(cdates))
+            chunk_n = chunk_n+1
+
+    return files, dates, index
+
+def memory_stream(n_slices, per_file, step, freq, calendar):
+    """ build stream_times for a stream without writing any files
+    """
+    stream_files = ['/archive/case.cam.h1.{0:06d}.nc'.format(i) for i in range(n_slices//per_file)]
+    index = {}
+    for i,fn in enumerate(stream_files):
+        b = numpy.arange(i*per_file, (i+1)*per_file) * step
+        index[fn] = {'time': (b + step).tolist(),
+                     'bounds': [[b[0], b[0]+step], [b[-1], b[-1]+step]],
+                     'calendar': calendar, 'units': UNITS, 'time_period_freq': freq,
+                     'size': 0, 'nvars': 1}
+    stream_times = chunking.build_stream_times(stream_files, index)
+    stream_times['calendar'] = calendar
+    stream_times['units'] = UNITS
+    stream_times['time_period_freq'] = freq
+    stream_times['file_id'] = dict((fn,i) for i,fn in enumerate(stream_files))
+    return stream_times
+
+
+class test_get_chunks(unittest.TestCase):
+
+    # name, files, slices per file, step in days, time_period_freq, chunk tper, chunk size
+    streams = [('monthly', 72, 1, 30.0, 'month_1', 'years', '1'),
+               ('monthly_multi', 72, 12, 30.0, 'month_1', 'years,years', '1,2'),
+               ('daily', 40, 10, 1.0, 'day_1', 'months', '1'),
+               ('hourly', 30, 24, 0.25, 'hour_6', 'days', '2')]
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.comm = simplecomm.create_comm(serial=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def compare(self, calendar):
+        for name,n_files,per_file,step,freq,tper,size in self.streams:
+            hist_dir = os.path.join(self.test_dir, calendar, name)
+            os.makedirs(hist_dir)
+            write_history(hist_dir, n_files, per_file, step, freq, calendar)
+            stream_times,cal,units,time_period_freq = chunking.get_input_dates(hist_dir+'/*.nc', self.comm, 0, 1)
+            self.assertEqual(cal, calendar)
+            self.assertEqual(time_period_freq, freq)
+
+            stream_dates = {}
+            for fn in sorted(glob.glob(hist_dir+'/*.nc')):
+                f = nc.Dataset(fn, 'r')
+                for t in f.variables['time'][:]:
+                    stream_dates[float(t)] = fn
+                f.close()
+
+            third = stream_times['time'][:len(stream_times['time'])//3].tolist()
+            for s in [0, 1]:
+                for ts_log_dates in [[], third]:
+                    ts_log = chunking.new_log_entry()
+                    chunking.log_add(ts_log, name, ts_log_dates, 0, stream_times['time'])
+                    files,dates,index = chunking.get_chunks(tper, 0, size, stream_times, ts_log,
+                                                            cal, units, s, freq)
+                    r_files,r_dates,r_index = reference_chunks(tper, 0, size, stream_dates, ts_log_dates,
+                                                               cal, units, s, freq)
+                    msg = '{0} {1} s={2} logged={3}'.format(calendar, name, s, len(ts_log_dates))
+                    self.assertEqual(files, r_files, msg)
+                    self.assertEqual(dates, r_dates, msg)
+                    self.assertEqual(index, r_index, msg)
+
+    def test_noleap(self):
+        """ test to see if the planner matches the slice by slice walk for noleap streams
+        """
+        self.compare('noleap')
+
+    def test_gregorian(self):
+        """ test to see if the planner matches the slice by slice walk for gregorian streams
+        """
+        self.compare('gregorian')
+
+    def test_monthly_years(self):
+        """ test to see if 3 years of monthly files give 2 complete yearly chunks and a partial one
+        """
+        hist_dir = os.path.join(self.test_dir, 'monthly')
+        os.makedirs(hist_dir)
+        write_history(hist_dir, 36, 1, 365.0/12, 'month_1', 'noleap')
+        stream_times,cal,units,time_period_freq = chunking.get_input_dates(hist_dir+'/*.nc', self.comm, 0, 1)
+        files,dates,index = chunking.get_chunks('years', 0, '1', stream_times, None, cal, units, 0, 'month_1')
+        self.assertEqual(len(files), 3)
+        self.assertEqual(len(files[0]['fn']), 12)
+        self.assertEqual(files[0]['start'], ['0001', '01', '16', '00'])
+        self.assertEqual(files[1]['fn'][0], os.path.join(hist_dir, 'case.cam.h0.00012.nc'))
+        self.assertEqual(len(dates), 36)
+
+        files,dates,index = chunking.get_chunks('years', 0, '1', stream_times, None, cal, units, 1, 'month_1')
+        self.assertEqual(len(files), 2)
+        self.assertEqual(len(dates), 24)
+
+    def test_nothing_to_do(self):
+        """ test to see if a stream that has been fully converted returns no chunks
+        """
+        stream_times = memory_stream(240, 24, 1.0/24, 'hour_1', 'noleap')
+        ts_log = chunking.new_log_entry()
+        chunking.log_add(ts_log, 'cam.h1', stream_times['time'], 0)
+        files,dates,index = chunking.get_chunks('days', 0, '1', stream_times, ts_log,
+                                                'noleap', UNITS, 0, 'hour_1')
+        self.assertEqual(files, {})
+        self.assertEqual(dates, [])
+
+    def test_hourly_100k(self):
+        """ test to see if planning a 100k slice hourly stream is fast
+        """
+        stream_times = memory_stream(100008, 24, 1.0/24, 'hour_1', 'noleap')
+        start = time.time()
+        files,dates,index = chunking.get_chunks('years', 0, '1', stream_times, None, 'noleap', UNITS, 0, 'hour_1')
+        self.assertLess(time.time() - start, 1.0)
+        self.assertEqual(len(files), 12)
+        self.assertEqual(len(dates), 100008)
+
+
+class test_get_input_dates(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.hist_dir = os.path.join(self.test_dir, 'hist')
+        os.makedirs(self.hist_dir)
+        self.index_fn = os.path.join(self.test_dir, 'logs', 'ts_time_index.cam.h0.json')
+        self.comm = simplecomm.create_comm(serial=True)
+        self.scanned = []
+        self.scan_time_axis = chunking.scan_time_axis
+        def counting_scan(fn):
+            self.scanned.append(fn)
+            return self.scan_time_axis(fn)
+        chunking.scan_time_axis = counting_scan
+
+    def tearDown(self):
+        chunking.scan_time_axis = self.scan_time_axis
+        shutil.rmtree(self.test_dir)
+
+    def test_index_reused(self):
+        """ test to see if files already in the time index are not opened again
+        """
+        write_history(self.hist_dir, 12, 1, 30.0, 'month_1', 'noleap')
+        first = chunking.get_input_dates(self.hist_dir+'/*.nc', self.comm, 0, 1, index_fn=self.index_fn)
+        self.assertEqual(len(self.scanned), 12)
+        self.assertTrue(os.path.isfile(self.index_fn))
+
+        self.scanned = []
+        second = chunking.get_input_dates(self.hist_dir+'/*.nc', self.comm, 0, 1, index_fn=self.index_fn)
+        self.assertEqual(self.scanned, [])
+        numpy.testing.assert_array_equal(first[0]['time'], second[0]['time'])
+        numpy.testing.assert_array_equal(first[0]['file_index'], second[0]['file_index'])
+        self.assertEqual(first[1:], second[1:])
+
+    def test_index_changed_file(self):
+        """ test to see if a new or rewritten file is rescanned
+        """
+        write_history(self.hist_dir, 12, 1, 30.0, 'month_1', 'noleap')
+        chunking.get_input_dates(self.hist_dir+'/*.nc', self.comm, 0, 1, index_fn=self.index_fn)
+
+        changed = os.path.join(self.hist_dir, 'case.cam.h0.00003.nc')
+        st = os.stat(changed)
+        os.utime(changed, (st.st_atime, st.st_mtime + 10))
+        self.scanned = []
+        stream_times,cal,units,time_period_freq = chunking.get_input_dates(self.hist_dir+'/*.nc', self.comm, 0, 1,
+                                                                           index_fn=self.index_fn)
+        self.assertEqual(self.scanned, [changed])
+        self.assertEqual(len(stream_times['time']), 12)
+        self.assertEqual(stream_times['file_index'].dtype, numpy.int32)
+
+    def test_cesm_date_from_index(self):
+        """ test to see if the dates from the time index match the dates read from the file
+        """
+        write_history(self.hist_dir, 3, 4, 1.0, 'day_1', 'noleap')
+        stream_times,cal,units,time_period_freq = chunking.get_input_dates(self.hist_dir+'/*.nc', self.comm, 0, 1)
+        for fn in stream_times['files']:
+            for t in ['b', 'bb', 'e', 'ee']:
+                self.assertEqual(chunking.get_cesm_date(fn, 'day_1', t=t, stream_times=stream_times),
+                                 chunking.get_cesm_date(fn, 'day_1', t=t))
+
+class test_log(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.log_fn = os.path.join(self.test_dir, 'ts_status.dat')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_round_trip(self):
+        """ test to see if the converted intervals and index are read back
+        """
+        times = numpy.arange(1.0, 101.0)
+        log = {}
+        log['cam.h0'] = chunking.new_log_entry()
+        records = [chunking.log_add(log['cam.h0'], 'cam.h0', times[:40], 1, times),
+                   chunking.log_add(log['cam.h0'], 'cam.h0', times[40:60], 2, times)]
+        chunking.write_log(self.log_fn, records)
+        d = chunking.read_log(self.log_fn)
+        self.assertEqual(d['cam.h0'], {'lo': [1.0], 'hi': [60.0], 'index': 2})
+        done = chunking.log_done(d['cam.h0'], [0.5, 1.0, 30.5, 60.0, 60.5])
+        self.assertEqual(done.tolist(), [False, True, True, True, False])
+        self.assertEqual(chunking.log_done(None, times).sum(), 0)
+
+    def test_truncated_record(self):
+        """ test to see if a partial record from a killed job is dropped and overwritten
+        """
+        chunking.write_log(self.log_fn, [('pop.h', 0, 1.0, 10.0)])
+        with open(self.log_fn, 'ab') as f:
+            f.write(chunking.pack_log_record('pop.h', 0, 11.0, 20.0)[:-3])
+        self.assertEqual(chunking.read_log(self.log_fn)['pop.h']['hi'], [10.0])
+
+        chunking.write_log(self.log_fn, [('pop.h', 0, 30.0, 40.0)])
+        d = chunking.read_log(self.log_fn)
+        self.assertEqual(d['pop.h']['lo'], [1.0, 30.0])
+        self.assertEqual(d['pop.h']['hi'], [10.0, 40.0])
+
+    def test_compaction(self):
+        """ test to see if a log with many records is rewritten in compact form
+        """
+        for i in range(300):
+            chunking.write_log(self.log_fn, [('cice.h', i, 0.0, float(i))])
+        records,offset = chunking.read_log_records(self.log_fn)
+        self.assertLess(len(records), 100)
+        d = chunking.read_log(self.log_fn)
+        self.assertEqual(d['cice.h'], {'lo': [0.0], 'hi': [299.0], 'index': 299})
+
+    def test_migrate(self):
+        """ test to see if the json log is converted to intervals
+        """
+        json_fn = os.path.join(self.test_dir, 'ts_status.log')
+        with open(json_fn, 'w') as f:
+            f.write('{"cam.h0": {"slices": [1.0, 2.0], "index": 0}}')
+            f.write('{"cam.h0": {"slices": [1.0, 2.0, 3.0, 4.0, 10.0, 11.0], "index": 1}, '
+                    '"clm2.h0": {"slices": [], "index": 0}}')
+        self.assertTrue(chunking.migrate_log(json_fn, self.log_fn))
+        self.assertFalse(os.path.isfile(json_fn))
+        self.assertFalse(chunking.migrate_log(json_fn, self.log_fn))
+        d = chunking.read_log(self.log_fn)
+        self.assertEqual(d['cam.h0'], {'lo': [1.0, 10.0], 'hi': [4.0, 11.0], 'index': 1})
+        self.assertEqual(d['clm2.h0'], {'lo': [], 'hi': [], 'index': 0})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Unit test suite for the timeseries specifier scheduler
+
+"""
+
+from __future__ import print_function
+
+import unittest
+
+from timeseries import spec_scheduler
+
+def info(nbytes, nvars, nfiles=12):
+    return {'bytes': nbytes, 'nvars': nvars, 'nfiles': nfiles}
+
+
+class test_plan_schedule(unittest.TestCase):
+
+    def setUp(self):
+        self.model = dict(spec_scheduler.DEFAULT_MODEL)
+
+    def test_longest_first(self):
+        """ test to see if the specifiers are handed out by predicted work
+        """
+        infos = [info(1e8, 10), info(5e10, 400), info(1e9, 40), info(1e9, 40)]
+        ready = [0, 1, 2, 3]
+        order = [spec_scheduler.pick_longest(ready, infos, self.model) for i in range(4)]
+        self.assertEqual(order, [1, 2, 3, 0])
+        self.assertEqual(ready, [])
+
+    def test_even_groups(self):
+        """ test to see if the ranks are split evenly without a sample of the last run
+        """
+        sizes = spec_scheduler.plan_groups([], 143, 36, self.model)
+        self.assertEqual(sizes, [48, 48, 47])
+        self.assertEqual(spec_scheduler.plan_groups([], 71, 36, self.model), [71])
+
+    def test_group_sizes(self):
+        """ test to see if the biggest specifier gets the biggest group and the
+            sizes add up to the number of workers
+        """
+        infos = [info(1e8, 10), info(5e10, 400), info(1e10, 100), info(1e9, 40)]
+        sizes = spec_scheduler.plan_groups(infos, 143, 36, self.model)
+        self.assertEqual(sum(sizes), 143)
+        self.assertEqual(len(sizes), 3)
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+        self.assertGreater(sizes[0], 3 * sizes[2])
+
+    def test_variable_cap(self):
+        """ test to see if a group is not given more ranks than its seed has variables
+            while another group can still use them
+        """
+        infos = [info(1e9, 200), info(5e10, 8)]
+        sizes = spec_scheduler.plan_groups(infos, 72, 36, self.model)
+        self.assertEqual(sizes, [8, 64])
+
+    def test_small_sample(self):
+        """ test to see if a sample of one specifier does not leave the other streams
+            to a single group and the groups beyond the sample get the even share
+        """
+        sizes = spec_scheduler.plan_groups([info(1e9, 10)], 143, 36, self.model, nstreams=5)
+        self.assertEqual(sizes, [10, 67, 66])
+        sizes = spec_scheduler.plan_groups([info(1e9, 10)], 1000, 36, self.model, nstreams=40)
+        self.assertEqual(len(sizes), 27)
+        self.assertEqual(sum(sizes), 1000)
+        self.assertEqual(sizes[0], 10)
+        self.assertEqual(spec_scheduler.plan_groups([info(1e9, 10)], 143, 36, self.model, nstreams=1), [143])
+
+    def test_last_run(self):
+        """ test to see if only the records of the most recent run are used as the sample
+        """
+        history = [dict(info(1e9, 10), run=1), dict(info(1e9, 20), run=2), dict(info(1e9, 30), run=2)]
+        self.assertEqual([r['nvars'] for r in spec_scheduler.last_run(history)], [20, 30])
+        self.assertEqual(spec_scheduler.last_run([]), [])
+
+    def test_trim_history(self):
+        """ test to see if only the last runs of each specifier are kept
+        """
+        history = [dict(info(1e9, 10), run=r, prefix='a') for r in range(1, 6)] + \
+                  [dict(info(1e9, 10), run=r, prefix='b') for r in [1, 4]]
+        kept = spec_scheduler.trim_history(history, nruns=2)
+        self.assertEqual([(r['prefix'], r['run']) for r in kept], [('a', 4), ('a', 5), ('b', 1), ('b', 4)])
+
+    def test_stream_estimate(self):
+        """ test to see if the dry run estimate adds up the chunks of a stream
+        """
+        model = {'t0': 0.0, 'sec_per_byte': 1.0e-9, 'sec_per_var_file': 0.0}
+        infos = [info(3.6e12, 10), info(7.2e12, 40)]
+        e = spec_scheduler.stream_estimate(infos, 36, model)
+        self.assertEqual(e['chunks'], 2)
+        self.assertEqual(e['bytes'], 1.08e13)
+        self.assertEqual(e['files'], 50)
+        self.assertEqual(e['nvars'], 40)
+        self.assertAlmostEqual(e['core_hours'], 3.0)
+        self.assertAlmostEqual(e['longest'], 360.0)
+
+    def test_fit(self):
+        """ test to see if the fit recovers the coefficients of exact measurements
+        """
+        truth = {'t0': 3.0, 'sec_per_byte': 4.0e-8, 'sec_per_var_file': 0.05}
+        records = []
+        for nbytes,nvars,nfiles,ranks in [(1e9, 100, 12, 36), (4e10, 400, 120, 72),
+                                          (2e8, 10, 365, 36), (6e9, 50, 24, 16)]:
+            i = info(nbytes, nvars, nfiles)
+            records.append({'bytes': nbytes, 'nvars': nvars, 'nfiles': nfiles, 'ranks': ranks,
+                            'actual': spec_scheduler.predict_time(i, ranks, truth)})
+        model = spec_scheduler.fit_cost_model(records, self.model)
+        for key in truth:
+            self.assertAlmostEqual(model[key] / truth[key], 1.0, places=6)
+
+if __name__ == '__main__':
+    unittest.main()